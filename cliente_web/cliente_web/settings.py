@@ -223,6 +223,10 @@ GESTION_API_URL = config('GESTION_API_URL', default='http://localhost:8001/api')
 GESTION_BASE_URL = config('GESTION_BASE_URL', default='http://localhost:8001')  # URL base del sistema de gestión (para media files)
 GESTION_API_TOKEN = config('GESTION_API_TOKEN', default='')  # Token de autenticación para la API
 
+# Caché en disco de las imágenes de radiografías servidas por el proxy (LRU por tamaño)
+RADIOGRAFIAS_CACHE_DIR = config('RADIOGRAFIAS_CACHE_DIR', default='')  # Vacío = directorio temporal del sistema
+RADIOGRAFIAS_CACHE_MAX_MB = config('RADIOGRAFIAS_CACHE_MAX_MB', default=500, cast=int)
+
 # Configuración de Email
 # Email de la clínica para enviar correos
 EMAIL_BACKEND = os.getenv('EMAIL_BACKEND', 'django.core.mail.backends.smtp.EmailBackend')
@@ -117,10 +117,30 @@ class Radiografia(models.Model):
     fecha_actualizacion = models.DateTimeField(blank=True, null=True)
     dentista_id = models.BigIntegerField(blank=True, null=True)
     cliente_id = models.BigIntegerField(blank=True, null=True)
+    # Derivadas generadas por el sistema de gestión (miniatura, vista previa, web)
+    imagen_miniatura = models.CharField(max_length=100, blank=True, null=True)
+    imagen_vista_previa = models.CharField(max_length=100, blank=True, null=True)
+    imagen_web = models.CharField(max_length=100, blank=True, null=True)
+    derivadas_estado = models.CharField(max_length=20, blank=True, null=True)
+    derivadas_info = models.JSONField(blank=True, null=True)
+
+    VARIANTES = {
+        'miniatura': 'imagen_miniatura',
+        'vista_previa': 'imagen_vista_previa',
+        'web': 'imagen_web',
+    }
 
     def __str__(self):
         tipo_display = dict(self.TIPO_CHOICES).get(self.tipo, self.tipo or 'Sin tipo')
         return f"Radiografía {tipo_display} - {self.paciente_nombre or self.paciente_email}"
+
+    def ruta_variante(self, variante=None):
+        """Ruta de la derivada pedida si está al día; si no, la de la imagen original"""
+        campo = self.VARIANTES.get(variante)
+        if campo and getattr(self, campo) and self.derivadas_estado == 'lista':
+            if (self.derivadas_info or {}).get('origen') == self.imagen:
+                return getattr(self, campo)
+        return self.imagen
     
     def get_tipo_display_value(self):
         """Retorna el tipo de radiografía formateado"""
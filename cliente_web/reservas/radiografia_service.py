@@ -0,0 +1,354 @@
+"""
+Proxy de imágenes de radiografías desde el sistema de gestión.
+
+- Reutiliza conexiones HTTP con una sesión compartida (pool de conexiones).
+- Transmite la imagen por bloques (StreamingHttpResponse) sin cargarla completa en memoria.
+- Guarda una copia en disco (caché LRU acotada por tamaño) identificada por la ruta de
+  la imagen y su fecha_actualizacion: si la radiografía cambia, cambia la clave.
+- Responde 304 a If-None-Match / If-Modified-Since sin consultar al sistema de gestión
+  y soporta peticiones Range (bytes=inicio-fin) para imágenes grandes.
+"""
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import tempfile
+import threading
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.parse import urljoin
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+import logging
+
+logger = logging.getLogger(__name__)
+
+TAMANO_BLOQUE = 64 * 1024
+TIMEOUT_GESTION = (5, 30)  # (conexión, lectura)
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def _obtener_session():
+    """Sesión HTTP compartida por el proceso (mantiene conexiones abiertas al sistema de gestión)"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=4,
+                    pool_maxsize=16,
+                    max_retries=Retry(total=2, connect=2, read=0, backoff_factor=0.2, allowed_methods=['GET', 'HEAD']),
+                )
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _session = session
+    return _session
+
+
+# ---------------------------------------------------------------------------
+# Caché en disco
+# ---------------------------------------------------------------------------
+
+def _directorio_cache():
+    directorio = getattr(settings, 'RADIOGRAFIAS_CACHE_DIR', None) or os.path.join(
+        tempfile.gettempdir(), 'cliente_web_radiografias'
+    )
+    os.makedirs(directorio, exist_ok=True)
+    return directorio
+
+
+def _tamano_maximo_cache():
+    return int(getattr(settings, 'RADIOGRAFIAS_CACHE_MAX_MB', 500)) * 1024 * 1024
+
+
+def clave_cache_radiografia(radiografia, ruta=None):
+    """Clave estable para la versión actual de la imagen (ruta + fecha de actualización)"""
+    version = radiografia.fecha_actualizacion or radiografia.fecha_carga
+    base = f"{(ruta or radiografia.imagen).strip()}|{version.isoformat() if version else ''}"
+    return hashlib.sha256(base.encode('utf-8')).hexdigest()
+
+
+def _rutas_cache(clave):
+    directorio = _directorio_cache()
+    return os.path.join(directorio, f'{clave}.bin'), os.path.join(directorio, f'{clave}.json')
+
+
+def _leer_cache(clave):
+    """Devuelve (ruta_archivo, metadatos) si la imagen está en caché"""
+    ruta_archivo, ruta_meta = _rutas_cache(clave)
+    try:
+        with open(ruta_meta, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        tamano = os.path.getsize(ruta_archivo)
+    except (OSError, ValueError):
+        return None, None
+    if tamano != meta.get('tamano'):
+        return None, None
+    # Marcar como usada recientemente (orden LRU por fecha de modificación)
+    try:
+        os.utime(ruta_archivo, None)
+    except OSError:
+        pass
+    return ruta_archivo, meta
+
+
+def _guardar_meta_cache(clave, ruta_temporal, content_type, tamano):
+    ruta_archivo, ruta_meta = _rutas_cache(clave)
+    os.replace(ruta_temporal, ruta_archivo)
+    with open(ruta_meta + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump({'content_type': content_type, 'tamano': tamano}, f)
+    os.replace(ruta_meta + '.tmp', ruta_meta)
+    _purgar_cache()
+
+
+def _purgar_cache():
+    """Elimina las imágenes menos usadas hasta dejar la caché bajo el 90% del máximo"""
+    maximo = _tamano_maximo_cache()
+    directorio = _directorio_cache()
+    archivos = []
+    total = 0
+    for entrada in os.scandir(directorio):
+        if entrada.name.endswith('.bin'):
+            try:
+                stat = entrada.stat()
+            except OSError:
+                continue
+            archivos.append((stat.st_mtime, stat.st_size, entrada.path))
+            total += stat.st_size
+    if total <= maximo:
+        return
+    objetivo = maximo * 0.9
+    for _, tamano, ruta in sorted(archivos):
+        if total <= objetivo:
+            break
+        for ruta_borrar in (ruta, ruta[:-4] + '.json'):
+            try:
+                os.remove(ruta_borrar)
+            except OSError:
+                pass
+        total -= tamano
+
+
+# ---------------------------------------------------------------------------
+# Cabeceras HTTP
+# ---------------------------------------------------------------------------
+
+def _detectar_content_type(content_type, ruta, primer_bloque):
+    if content_type and 'text' not in content_type.lower():
+        return content_type.split(';')[0].strip()
+    if primer_bloque[:8] == b'\x89PNG\r\n\x1a\n':
+        return 'image/png'
+    if primer_bloque[:2] == b'\xff\xd8':
+        return 'image/jpeg'
+    if primer_bloque[:6] in (b'GIF89a', b'GIF87a'):
+        return 'image/gif'
+    return mimetypes.guess_type(ruta)[0] or 'image/jpeg'
+
+
+def _parsear_range(cabecera, tamano):
+    """Interpreta 'bytes=inicio-fin' (un solo rango). Devuelve (inicio, fin) o None si no aplica"""
+    match = re.fullmatch(r'\s*bytes=(\d*)-(\d*)\s*', cabecera or '')
+    if not match or (not match.group(1) and not match.group(2)):
+        return None
+    if match.group(1):
+        inicio = int(match.group(1))
+        fin = int(match.group(2)) if match.group(2) else tamano - 1
+    else:
+        # Sufijo: últimos N bytes
+        inicio = max(tamano - int(match.group(2)), 0)
+        fin = tamano - 1
+    fin = min(fin, tamano - 1)
+    if inicio > fin:
+        return False
+    return inicio, fin
+
+
+def _no_modificada(request, etag, ultima_modificacion):
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match:
+        return etag in [valor.strip() for valor in if_none_match.split(',')] or if_none_match.strip() == '*'
+    if_modified_since = request.headers.get('If-Modified-Since')
+    if if_modified_since and ultima_modificacion:
+        try:
+            return ultima_modificacion.replace(microsecond=0) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _aplicar_cabeceras_cache(response, etag, ultima_modificacion, nombre_descarga):
+    response['ETag'] = etag
+    if ultima_modificacion:
+        response['Last-Modified'] = formatdate(ultima_modificacion.timestamp(), usegmt=True)
+    # Son datos clínicos del paciente: solo el navegador puede guardarlos
+    response['Cache-Control'] = 'private, max-age=3600'
+    response['Accept-Ranges'] = 'bytes'
+    if nombre_descarga:
+        response['Content-Disposition'] = f'attachment; filename="{nombre_descarga}"'
+    return response
+
+
+# ---------------------------------------------------------------------------
+# Lectura de archivos y del sistema de gestión
+# ---------------------------------------------------------------------------
+
+def _iterar_archivo(ruta, inicio=0, longitud=None):
+    with open(ruta, 'rb') as f:
+        f.seek(inicio)
+        restante = longitud
+        while restante is None or restante > 0:
+            bloque = f.read(TAMANO_BLOQUE if restante is None else min(TAMANO_BLOQUE, restante))
+            if not bloque:
+                break
+            if restante is not None:
+                restante -= len(bloque)
+            yield bloque
+
+
+def _iterar_y_guardar(primer_bloque, resto, respuesta_remota, clave, content_type):
+    """Transmite los bloques al cliente y, si la descarga termina completa, la deja en caché"""
+    directorio = _directorio_cache()
+    descriptor, ruta_temporal = tempfile.mkstemp(dir=directorio, suffix='.part')
+    completado = False
+    tamano = 0
+    try:
+        with os.fdopen(descriptor, 'wb') as archivo:
+            archivo.write(primer_bloque)
+            tamano += len(primer_bloque)
+            yield primer_bloque
+            for bloque in resto:
+                if not bloque:
+                    continue
+                archivo.write(bloque)
+                tamano += len(bloque)
+                yield bloque
+        completado = True
+    finally:
+        respuesta_remota.close()
+        if completado:
+            try:
+                _guardar_meta_cache(clave, ruta_temporal, content_type, tamano)
+            except OSError as e:
+                logger.warning(f"No se pudo guardar la radiografía en caché: {e}")
+        if os.path.exists(ruta_temporal):
+            try:
+                os.remove(ruta_temporal)
+            except OSError:
+                pass
+
+
+def urls_radiografia(imagen):
+    """URLs candidatas en el sistema de gestión para la ruta guardada en la radiografía"""
+    gestion_url = getattr(settings, 'GESTION_API_URL', 'http://localhost:8001')
+    base_url = gestion_url.replace('/api', '').rstrip('/')
+    ruta = imagen.strip()
+    if ruta.startswith('http://') or ruta.startswith('https://'):
+        return [ruta]
+    if ruta.startswith('media/'):
+        return [urljoin(base_url + '/', ruta)]
+    # Formato esperado: radiografias/2025/11/02/radiografia_1.png (se sirve bajo media/)
+    return [urljoin(base_url + '/', f"media/{ruta}"), urljoin(base_url + '/', ruta)]
+
+
+def servir_radiografia(request, radiografia, nombre_descarga=None, ruta=None):
+    """
+    Respuesta HTTP con la imagen de la radiografía (desde la caché en disco o el sistema
+    de gestión). Devuelve (response, error): response es None si no se pudo obtener.
+    `ruta` permite servir una derivada (ver Radiografia.ruta_variante) en vez del original.
+    """
+    ruta = ruta or radiografia.imagen
+    clave = clave_cache_radiografia(radiografia, ruta)
+    etag = f'"{clave[:32]}"'
+    ultima_modificacion = radiografia.fecha_actualizacion or radiografia.fecha_carga
+
+    # Validación condicional: el navegador ya tiene esta versión
+    if _no_modificada(request, etag, ultima_modificacion):
+        return _aplicar_cabeceras_cache(HttpResponse(status=304), etag, ultima_modificacion, None), None
+
+    cabecera_range = request.headers.get('Range')
+
+    ruta_archivo, meta = _leer_cache(clave)
+    if ruta_archivo:
+        tamano = meta['tamano']
+        rango = _parsear_range(cabecera_range, tamano) if cabecera_range else None
+        if rango is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{tamano}'
+            return response, None
+        if rango:
+            inicio, fin = rango
+            response = StreamingHttpResponse(
+                _iterar_archivo(ruta_archivo, inicio, fin - inicio + 1),
+                status=206,
+                content_type=meta['content_type'],
+            )
+            response['Content-Range'] = f'bytes {inicio}-{fin}/{tamano}'
+            response['Content-Length'] = str(fin - inicio + 1)
+        else:
+            response = StreamingHttpResponse(_iterar_archivo(ruta_archivo), content_type=meta['content_type'])
+            response['Content-Length'] = str(tamano)
+        return _aplicar_cabeceras_cache(response, etag, ultima_modificacion, nombre_descarga), None
+
+    session = _obtener_session()
+    ultimo_error = None
+    for url in urls_radiografia(ruta):
+        try:
+            cabeceras = {'Range': cabecera_range} if cabecera_range else {}
+            remota = session.get(url, timeout=TIMEOUT_GESTION, stream=True, allow_redirects=True, headers=cabeceras)
+        except requests.exceptions.ConnectionError as e:
+            ultimo_error = f"No se pudo conectar: {str(e)}"
+            continue
+        except requests.exceptions.Timeout as e:
+            ultimo_error = f"Timeout: {str(e)}"
+            continue
+        except Exception as e:
+            ultimo_error = f"Error: {str(e)}"
+            continue
+
+        if remota.status_code not in (200, 206):
+            ultimo_error = f"Status code: {remota.status_code}"
+            remota.close()
+            continue
+
+        bloques = remota.iter_content(chunk_size=TAMANO_BLOQUE)
+        primer_bloque = next(bloques, b'')
+        if not primer_bloque:
+            ultimo_error = "Contenido vacío"
+            remota.close()
+            continue
+
+        content_type = _detectar_content_type(remota.headers.get('Content-Type', ''), ruta, primer_bloque)
+
+        if remota.status_code == 206:
+            # Rango parcial pedido por el navegador: se transmite tal cual, sin guardar en caché
+            def _parcial(primer=primer_bloque, resto=bloques, respuesta=remota):
+                try:
+                    yield primer
+                    yield from resto
+                finally:
+                    respuesta.close()
+            response = StreamingHttpResponse(_parcial(), status=206, content_type=content_type)
+            for cabecera in ('Content-Range', 'Content-Length'):
+                if remota.headers.get(cabecera):
+                    response[cabecera] = remota.headers[cabecera]
+        else:
+            response = StreamingHttpResponse(
+                _iterar_y_guardar(primer_bloque, bloques, remota, clave, content_type),
+                content_type=content_type,
+            )
+            if remota.headers.get('Content-Length') and 'Content-Encoding' not in remota.headers:
+                response['Content-Length'] = remota.headers['Content-Length']
+        return _aplicar_cabeceras_cache(response, etag, ultima_modificacion, nombre_descarga), None
+
+    logger.error(
+        f"No se pudo cargar imagen radiografia_id={radiografia.id}, imagen={ruta}, "
+        f"último error={ultimo_error}"
+    )
+    return None, ultimo_error
@@ -22,6 +22,7 @@ from cuentas.models import PerfilCliente
 from .dentist_service import obtener_info_dentista, obtener_estadisticas_dentista, obtener_dentista_de_cita, obtener_todos_dentistas_activos
 from .servicio_service import obtener_tipo_servicio_de_cita
 from .documentos_models import Odontograma, Radiografia, ClienteDocumento
+from .radiografia_service import servir_radiografia
 from .servicios_models import TipoServicio
 
 @login_required
@@ -1090,41 +1091,12 @@ def descargar_radiografia(request, radiografia_id):
         messages.error(request, 'Esta radiografía no tiene imagen disponible.')
         return redirect('ver_radiografias')
     
-    # Intentar descargar desde el sistema de gestión
-    # Las imágenes están en formato: radiografias/2025/11/02/radiografia_1.png
-    # Necesitamos agregar media/ al inicio
-    gestion_url = getattr(settings, 'GESTION_API_URL', 'http://localhost:8001')
-    base_url = gestion_url.replace('/api', '').rstrip('/')
-    
-    # Determinar la ruta correcta según el formato
-    if radiografia.imagen.startswith('http://') or radiografia.imagen.startswith('https://'):
-        # URL completa
-        image_url = radiografia.imagen
-    elif radiografia.imagen.startswith('media/'):
-        # Ya incluye media/
-        image_url = urljoin(base_url + '/', radiografia.imagen)
-    else:
-        # Formato esperado: radiografias/2025/11/02/radiografia_1.png
-        # Agregar media/ al inicio
-        image_url = urljoin(base_url + '/', f"media/{radiografia.imagen}")
-    
-    try:
-        response = requests.get(image_url, timeout=10, stream=True)
-        if response.status_code == 200:
-            # Determinar tipo de contenido
-            content_type = response.headers.get('Content-Type', 'image/jpeg')
-            extension = '.jpg'
-            if 'png' in content_type.lower():
-                extension = '.png'
-            elif 'pdf' in content_type.lower():
-                extension = '.pdf'
-            
-            filename = f"radiografia_{radiografia_id}_{radiografia.get_tipo_display_value().replace(' ', '_')}{extension}"
-            response_http = HttpResponse(response.content, content_type=content_type)
-            response_http['Content-Disposition'] = f'attachment; filename="{filename}"'
-            return response_http
-    except Exception as e:
-        pass
+    # Transmitir la imagen desde la caché local o el sistema de gestión
+    extension = os.path.splitext(radiografia.imagen.strip())[1].lower() or '.jpg'
+    filename = f"radiografia_{radiografia_id}_{radiografia.get_tipo_display_value().replace(' ', '_')}{extension}"
+    response, error = servir_radiografia(request, radiografia, nombre_descarga=filename)
+    if response is not None:
+        return response
     
     # Si no se puede descargar, redirigir a ver la imagen
     messages.info(request, 'No se pudo descargar la imagen. Puedes verla en la galería.')
@@ -1937,73 +1909,15 @@ def ver_imagen_radiografia(request, radiografia_id):
     if not radiografia.imagen:
         return HttpResponse('Imagen no disponible', status=404)
     
-    # Obtener la imagen desde el sistema de gestión
-    gestion_url = getattr(settings, 'GESTION_API_URL', 'http://localhost:8001')
-    base_url = gestion_url.replace('/api', '').rstrip('/')
-    
-    # Construir URL de la imagen - probar múltiples formatos
-    image_path = radiografia.imagen.strip()
-    
-    # Rutas posibles para probar
-    possible_urls = []
-    
-    if image_path.startswith('http://') or image_path.startswith('https://'):
-        possible_urls.append(image_path)
-    elif image_path.startswith('media/'):
-        possible_urls.append(urljoin(base_url + '/', image_path))
-    else:
-        # Formato esperado: radiografias/2025/11/02/radiografia_1.png
-        # Agregar media/ al inicio
-        possible_urls.append(urljoin(base_url + '/', f"media/{image_path}"))
-        # También probar sin media/
-        possible_urls.append(urljoin(base_url + '/', image_path))
-    
-    # Intentar cada URL posible
-    last_error = None
-    for image_url in possible_urls:
-        try:
-            response = requests.get(image_url, timeout=10, stream=True, allow_redirects=True)
-            if response.status_code == 200:
-                content = response.content
-                # Verificar que tenga contenido válido
-                if content and len(content) > 100:  # Mínimo 100 bytes para ser una imagen válida
-                    # Determinar tipo de contenido
-                    content_type = response.headers.get('Content-Type', '')
-                    
-                    # Si no tiene content-type, intentar detectarlo por extensión o magic bytes
-                    if not content_type or 'text' in content_type.lower():
-                        # Detectar por extensión
-                        if image_path.lower().endswith('.png') or content[:8] == b'\x89PNG\r\n\x1a\n':
-                            content_type = 'image/png'
-                        elif image_path.lower().endswith('.jpg') or image_path.lower().endswith('.jpeg') or content[:2] == b'\xff\xd8':
-                            content_type = 'image/jpeg'
-                        elif image_path.lower().endswith('.gif') or content[:6] == b'GIF89a':
-                            content_type = 'image/gif'
-                        else:
-                            content_type = 'image/jpeg'  # Default
-                    
-                    http_response = HttpResponse(content, content_type=content_type)
-                    http_response['Cache-Control'] = 'public, max-age=3600'
-                    return http_response
-                else:
-                    last_error = f"Contenido vacío o muy pequeño ({len(content) if content else 0} bytes)"
-            else:
-                last_error = f"Status code: {response.status_code}"
-        except requests.exceptions.ConnectionError as e:
-            last_error = f"No se pudo conectar: {str(e)}"
-        except requests.exceptions.Timeout as e:
-            last_error = f"Timeout: {str(e)}"
-        except Exception as e:
-            last_error = f"Error: {str(e)}"
-            continue
-    
-    # Si ninguna URL funciona, log el error y retornar 404 con mensaje descriptivo
-    import logging
-    logger = logging.getLogger(__name__)
-    logger.error(f"No se pudo cargar imagen radiografia_id={radiografia_id}, imagen={image_path}, URLs probadas={possible_urls}, último error={last_error}")
+    # Transmitir la imagen (o la derivada pedida con ?variante=) desde la caché local o el sistema de gestión
+    ruta = radiografia.ruta_variante(request.GET.get('variante'))
+    response, last_error = servir_radiografia(request, radiografia, ruta=ruta)
+    if response is not None:
+        return response
     
     # Si el sistema de gestión no está corriendo, mostrar mensaje más claro
-    if last_error and 'Connection' in last_error:
+    if last_error and 'conectar' in last_error:
+        base_url = getattr(settings, 'GESTION_API_URL', 'http://localhost:8001').replace('/api', '').rstrip('/')
         error_msg = f'El sistema de gestión no está disponible en {base_url}. Por favor, inicia el sistema de gestión para poder ver las imágenes.'
     else:
         error_msg = f'No se pudo cargar la imagen. {last_error or "Error desconocido"}'
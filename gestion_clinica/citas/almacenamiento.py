@@ -0,0 +1,168 @@
+"""
+Almacenamiento deduplicado para los archivos clínicos.
+
+Los archivos se siguen guardando con su ruta de siempre (upload_to del FileField), de modo
+que URLs, `.path` y nombres de descarga no cambian. La diferencia es que el contenido
+vive una sola vez en MEDIA_ROOT/.blobs/<sha[:2]>/<sha[2:4]>/<sha256> y cada archivo es un
+enlace duro (hard link) a ese blob: subir diez veces el mismo PDF ocupa el espacio de uno.
+
+BlobArchivo lleva la cuenta de referencias de cada contenido y ReferenciaBlob indica a qué
+blob apunta cada archivo. Al eliminar un archivo se descuenta la referencia y el blob se
+borra cuando ya nadie lo usa.
+
+Si no se puede crear el enlace duro (blobs en otro sistema de archivos, o uno sin
+enlaces duros), el archivo se guarda como un archivo normal sin deduplicar y sin
+referencia a un blob, y se registra un error en el log: no se copia el contenido, que
+ocuparía el doble mientras la cuenta de referencias dice que se comparte. Con
+ALMACENAMIENTO_DEDUPLICADO=False los campos usan el almacenamiento por defecto de Django.
+
+Los archivos subidos antes de activar este almacenamiento se migran con:
+    python manage.py deduplicar_media
+"""
+import hashlib
+import logging
+import errno
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.db import transaction
+from django.db.models import F
+
+logger = logging.getLogger(__name__)
+
+DIRECTORIO_BLOBS = '.blobs'
+TAMANO_BLOQUE = 64 * 1024
+
+
+def ruta_blob(sha256):
+    return f'{DIRECTORIO_BLOBS}/{sha256[:2]}/{sha256[2:4]}/{sha256}'
+
+
+def calcular_sha256(ruta):
+    """SHA-256 y tamaño de un archivo en disco"""
+    digest = hashlib.sha256()
+    tamano = 0
+    with open(ruta, 'rb') as archivo:
+        for bloque in iter(lambda: archivo.read(TAMANO_BLOQUE), b''):
+            digest.update(bloque)
+            tamano += len(bloque)
+    return digest.hexdigest(), tamano
+
+
+def registrar_referencia(nombre, sha256, tamano):
+    """Registra que el archivo `nombre` usa el blob `sha256`"""
+    from .models import BlobArchivo, ReferenciaBlob
+
+    with transaction.atomic():
+        blob, _ = BlobArchivo.objects.get_or_create(
+            sha256=sha256,
+            defaults={'ruta': ruta_blob(sha256), 'tamano': tamano},
+        )
+        _, creada = ReferenciaBlob.objects.update_or_create(nombre=nombre, defaults={'blob': blob})
+        if creada:
+            BlobArchivo.objects.filter(pk=blob.pk).update(referencias=F('referencias') + 1)
+
+
+class AlmacenamientoDeduplicado(FileSystemStorage):
+    """FileSystemStorage que guarda cada contenido una sola vez (ver docstring del módulo)"""
+
+    def _save(self, name, content):
+        directorio_blobs = self.path(DIRECTORIO_BLOBS)
+        os.makedirs(directorio_blobs, exist_ok=True)
+
+        # Escribir a un temporal calculando el hash en la misma pasada
+        digest = hashlib.sha256()
+        tamano = 0
+        descriptor, ruta_temporal = tempfile.mkstemp(dir=directorio_blobs, prefix='subida-')
+        try:
+            with os.fdopen(descriptor, 'wb') as temporal:
+                for bloque in content.chunks():
+                    digest.update(bloque)
+                    tamano += len(bloque)
+                    temporal.write(bloque)
+            sha256 = digest.hexdigest()
+
+            ruta_contenido = self.path(ruta_blob(sha256))
+            os.makedirs(os.path.dirname(ruta_contenido), exist_ok=True)
+            blob_nuevo = not os.path.exists(ruta_contenido)
+            if blob_nuevo:
+                os.replace(ruta_temporal, ruta_contenido)
+                if self.file_permissions_mode is not None:
+                    os.chmod(ruta_contenido, self.file_permissions_mode)
+
+            deduplicado = True
+            while True:
+                ruta_destino = self.path(name)
+                os.makedirs(os.path.dirname(ruta_destino), exist_ok=True)
+                try:
+                    os.link(ruta_contenido, ruta_destino)
+                    break
+                except FileExistsError:
+                    # Otro proceso tomó el nombre entre get_available_name y ahora
+                    name = self.get_available_name(name)
+                except FileNotFoundError:
+                    # El blob se borró justo ahora (su última referencia se eliminó): restaurarlo
+                    if not os.path.exists(ruta_temporal):
+                        raise
+                    os.replace(ruta_temporal, ruta_contenido)
+                    blob_nuevo = True
+                except OSError as e:
+                    if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP, errno.EOPNOTSUPP):
+                        raise
+                    # Sin enlace duro no hay deduplicación: se guarda el contenido subido como
+                    # archivo normal (el blob recién creado se mueve, no se copia) y sin referencia
+                    logger.error(
+                        f'No se pudo crear el enlace duro {ruta_destino} -> {ruta_contenido} ({e}); '
+                        f'se guarda sin deduplicar. Revisar que MEDIA_ROOT y {DIRECTORIO_BLOBS} estén '
+                        f'en el mismo sistema de archivos.'
+                    )
+                    shutil.move(ruta_contenido if blob_nuevo else ruta_temporal, ruta_destino)
+                    deduplicado = False
+                    break
+        finally:
+            if os.path.exists(ruta_temporal):
+                os.remove(ruta_temporal)
+
+        if not deduplicado:
+            return name.replace('\\', '/')
+        try:
+            registrar_referencia(name, sha256, tamano)
+        except Exception as e:
+            # El archivo quedó guardado; `deduplicar_media` registrará la referencia
+            logger.error(f'No se pudo registrar el blob de {name}: {e}')
+        return name.replace('\\', '/')
+
+    def delete(self, name):
+        from .models import BlobArchivo, ReferenciaBlob
+
+        super().delete(name)
+        try:
+            with transaction.atomic():
+                referencia = ReferenciaBlob.objects.select_related('blob').filter(nombre=name).first()
+                if referencia is None:
+                    return
+                blob = BlobArchivo.objects.select_for_update().get(pk=referencia.blob_id)
+                referencia.delete()
+                if blob.referencias <= 1:
+                    blob.delete()
+                    super().delete(blob.ruta)
+                else:
+                    BlobArchivo.objects.filter(pk=blob.pk).update(referencias=F('referencias') - 1)
+        except Exception as e:
+            logger.error(f'No se pudo descontar la referencia del blob de {name}: {e}')
+
+
+_almacenamiento = None
+
+
+def almacenamiento_clinico():
+    """Almacenamiento de los FileField clínicos (se usa como `storage=` en los modelos)"""
+    global _almacenamiento
+    if not getattr(settings, 'ALMACENAMIENTO_DEDUPLICADO', True):
+        return default_storage
+    if _almacenamiento is None:
+        _almacenamiento = AlmacenamientoDeduplicado()
+    return _almacenamiento
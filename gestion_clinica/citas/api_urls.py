@@ -9,6 +9,8 @@ from .api_views import (
     api_historial_citas,
     api_odontogramas_cliente,
     api_radiografias_cliente,
+    api_imagen_anotada_radiografia,
+    api_linea_tiempo_cliente,
 )
 
 urlpatterns = [
@@ -23,6 +25,10 @@ urlpatterns = [
     # Endpoints de documentos
     path('documentos/odontogramas/', api_odontogramas_cliente, name='api_odontogramas_cliente'),
     path('documentos/radiografias/', api_radiografias_cliente, name='api_radiografias_cliente'),
+    path('documentos/radiografias/<int:radiografia_id>/imagen-anotada/', api_imagen_anotada_radiografia, name='api_imagen_anotada_radiografia'),
+    
+    # Línea de tiempo clínica
+    path('clientes/linea-tiempo/', api_linea_tiempo_cliente, name='api_linea_tiempo_cliente'),
     
     # Endpoints de evaluaciones
     path('evaluaciones/crear/', api_crear_evaluacion, name='api_crear_evaluacion'),
@@ -2,11 +2,37 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework import status, permissions
 from django.db.models import Q
+from django.http import HttpResponseRedirect
+from django.urls import reverse
+from django.utils.http import urlencode
 from .models import Cita
 from pacientes.models import Cliente
 from evaluaciones.models import Evaluacion
 from historial_clinico.models import Odontograma, Radiografia
 from .serializers import CitaSerializer, EvaluacionSerializer, ClienteSerializer, OdontogramaSerializer, RadiografiaSerializer
+from historial_clinico.anotaciones_radiografia import imagen_anotada_vigente, obtener_imagen_anotada
+from .linea_tiempo import (
+    POR_PAGINA as POR_PAGINA_LINEA_TIEMPO, TIPOS as TIPOS_LINEA_TIEMPO,
+    CursorInvalido, obtener_linea_tiempo, serializar_evento,
+)
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _url_imagen_anotada(request, radiografia, email):
+    """
+    URL de la imagen anotada para los listados. Si la imagen aplanada está al día se
+    entrega su URL; si la capa cambió desde la última vez, la URL del endpoint que la
+    genera al abrirla (así el listado no renderiza un PNG por radiografía).
+    """
+    imagen_anotada = imagen_anotada_vigente(radiografia)
+    if imagen_anotada:
+        return imagen_anotada.url
+    if not radiografia.tiene_anotaciones:
+        return None
+    url = reverse('api_imagen_anotada_radiografia', args=[radiografia.id])
+    return request.build_absolute_uri(f'{url}?{urlencode({"email": email})}')
 
 
 @api_view(['GET'])
@@ -304,7 +330,7 @@ def api_radiografias_cliente(request):
             "fecha_tomada": radiografia.fecha_tomada.isoformat() if hasattr(radiografia, 'fecha_tomada') and radiografia.fecha_tomada else None,
             "descripcion": getattr(radiografia, 'descripcion', None),
             "imagen_url": radiografia.imagen.url if hasattr(radiografia, 'imagen') and radiografia.imagen else None,
-            "imagen_anotada_url": radiografia.imagen_anotada.url if hasattr(radiografia, 'imagen_anotada') and radiografia.imagen_anotada else None,
+            "imagen_anotada_url": _url_imagen_anotada(request, radiografia, email),
         })
     
     return Response({
@@ -730,7 +756,7 @@ def api_radiografias_cliente(request):
             "fecha_tomada": radiografia.fecha_tomada.isoformat() if hasattr(radiografia, 'fecha_tomada') and radiografia.fecha_tomada else None,
             "descripcion": getattr(radiografia, 'descripcion', None),
             "imagen_url": radiografia.imagen.url if hasattr(radiografia, 'imagen') and radiografia.imagen else None,
-            "imagen_anotada_url": radiografia.imagen_anotada.url if hasattr(radiografia, 'imagen_anotada') and radiografia.imagen_anotada else None,
+            "imagen_anotada_url": _url_imagen_anotada(request, radiografia, email),
         })
     
     return Response({
@@ -1156,7 +1182,7 @@ def api_radiografias_cliente(request):
             "fecha_tomada": radiografia.fecha_tomada.isoformat() if hasattr(radiografia, 'fecha_tomada') and radiografia.fecha_tomada else None,
             "descripcion": getattr(radiografia, 'descripcion', None),
             "imagen_url": radiografia.imagen.url if hasattr(radiografia, 'imagen') and radiografia.imagen else None,
-            "imagen_anotada_url": radiografia.imagen_anotada.url if hasattr(radiografia, 'imagen_anotada') and radiografia.imagen_anotada else None,
+            "imagen_anotada_url": _url_imagen_anotada(request, radiografia, email),
         })
     
     return Response({
@@ -1582,7 +1608,7 @@ def api_radiografias_cliente(request):
             "fecha_tomada": radiografia.fecha_tomada.isoformat() if hasattr(radiografia, 'fecha_tomada') and radiografia.fecha_tomada else None,
             "descripcion": getattr(radiografia, 'descripcion', None),
             "imagen_url": radiografia.imagen.url if hasattr(radiografia, 'imagen') and radiografia.imagen else None,
-            "imagen_anotada_url": radiografia.imagen_anotada.url if hasattr(radiografia, 'imagen_anotada') and radiografia.imagen_anotada else None,
+            "imagen_anotada_url": _url_imagen_anotada(request, radiografia, email),
         })
     
     return Response({
@@ -1706,7 +1732,7 @@ def api_estadisticas_evaluaciones(request):
 
 from rest_framework import status, permissions
 from django.db.models import Q
-from .models import Cita
+from .models import Cita, publicar_evento_agenda
 from pacientes.models import Cliente
 from evaluaciones.models import Evaluacion
 from historial_clinico.models import Odontograma, Radiografia
@@ -1787,6 +1813,7 @@ def api_reservar_cita(request):
     cita.paciente_telefono = telefono
     cita.estado = 'reservada'
     cita.save()
+    publicar_evento_agenda(cita)
     
     return Response({
         "success": True,
@@ -2008,7 +2035,7 @@ def api_radiografias_cliente(request):
             "fecha_tomada": radiografia.fecha_tomada.isoformat() if hasattr(radiografia, 'fecha_tomada') and radiografia.fecha_tomada else None,
             "descripcion": getattr(radiografia, 'descripcion', None),
             "imagen_url": radiografia.imagen.url if hasattr(radiografia, 'imagen') and radiografia.imagen else None,
-            "imagen_anotada_url": radiografia.imagen_anotada.url if hasattr(radiografia, 'imagen_anotada') and radiografia.imagen_anotada else None,
+            "imagen_anotada_url": _url_imagen_anotada(request, radiografia, email),
         })
     
     return Response({
@@ -2018,6 +2045,134 @@ def api_radiografias_cliente(request):
     })
 
 
+@api_view(['GET'])
+@permission_classes([permissions.AllowAny])
+def api_linea_tiempo_cliente(request):
+    """
+    Obtiene la línea de tiempo clínica de un cliente (citas, odontogramas, radiografías,
+    planes, pagos, consentimientos y documentos), del evento más reciente al más antiguo.
+
+    Parámetros GET:
+    - email: Email del cliente (requerido)
+    - cursor: 'siguiente_cursor' de la respuesta anterior (opcional)
+    - por_pagina: Eventos por página (opcional, máximo 100)
+    - tipos: Tipos de evento separados por coma (opcional)
+
+    Retorna:
+    - 200: Página de eventos y cursor de la siguiente página (null si no hay más)
+    - 400: Email no proporcionado o cursor no válido
+    - 404: Cliente no encontrado
+    """
+    email = request.GET.get('email', '').strip()
+
+    if not email:
+        return Response(
+            {
+                "success": False,
+                "mensaje": "Debes proporcionar un email."
+            },
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    try:
+        cliente = Cliente.objects.get(email=email, activo=True)
+    except Cliente.DoesNotExist:
+        return Response(
+            {
+                "success": False,
+                "mensaje": "Cliente no encontrado."
+            },
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+    tipos = [tipo for tipo in request.GET.get('tipos', '').split(',') if tipo in TIPOS_LINEA_TIEMPO]
+    por_pagina = request.GET.get('por_pagina', '')
+    try:
+        pagina = obtener_linea_tiempo(
+            cliente,
+            cursor=request.GET.get('cursor') or None,
+            por_pagina=int(por_pagina) if por_pagina.isdigit() else POR_PAGINA_LINEA_TIEMPO,
+            tipos=tipos,
+        )
+    except CursorInvalido:
+        return Response(
+            {
+                "success": False,
+                "mensaje": "Cursor no válido."
+            },
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    return Response({
+        "success": True,
+        "eventos": [serializar_evento(evento) for evento in pagina['eventos']],
+        "siguiente_cursor": pagina['siguiente_cursor'],
+    })
+
+
+@api_view(['GET'])
+@permission_classes([permissions.AllowAny])
+def api_imagen_anotada_radiografia(request, radiografia_id):
+    """
+    Redirige a la imagen anotada de una radiografía, aplanando la capa de anotaciones
+    si cambió desde la última vez. Es la URL que entregan los listados cuando la imagen
+    anotada no está al día.
+
+    Parámetros GET:
+    - email: Email del cliente (requerido)
+
+    Retorna:
+    - 302: Redirección a la imagen anotada
+    - 400: Email no proporcionado
+    - 404: Radiografía no encontrada o sin anotaciones
+    - 500: No se pudo generar la imagen anotada
+    """
+    email = request.GET.get('email', '').strip()
+
+    if not email:
+        return Response(
+            {
+                "success": False,
+                "mensaje": "Debes proporcionar un email."
+            },
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    radiografia = Radiografia.objects.filter(
+        Q(cliente__email=email, cliente__activo=True) | Q(paciente_email=email),
+        id=radiografia_id,
+    ).first()
+    if radiografia is None:
+        return Response(
+            {
+                "success": False,
+                "mensaje": "Radiografía no encontrada."
+            },
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+    try:
+        imagen_anotada = obtener_imagen_anotada(radiografia)
+    except Exception as e:
+        logger.error(f'Error generando la imagen anotada de la radiografía {radiografia.id}: {e}')
+        return Response(
+            {
+                "success": False,
+                "mensaje": "No se pudo generar la imagen anotada."
+            },
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+    if not imagen_anotada:
+        return Response(
+            {
+                "success": False,
+                "mensaje": "La radiografía no tiene anotaciones."
+            },
+            status=status.HTTP_404_NOT_FOUND
+        )
+    return HttpResponseRedirect(imagen_anotada.url)
+
+
 @api_view(['POST'])
 @permission_classes([permissions.AllowAny])
 def api_crear_evaluacion(request):
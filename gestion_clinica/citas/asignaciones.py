@@ -0,0 +1,226 @@
+"""
+Mantenimiento de la relación dentista <-> paciente (modelo DentistaPaciente).
+
+Antes `Perfil.get_pacientes_asignados` recorría todas las citas del dentista y armaba
+varios diccionarios en Python (por cliente, por email, por email antiguo -> actual, por
+nombre), con consultas por cliente y por cita. Ahora esa información está materializada:
+
+- Cita.save() / Cita.delete() llaman a `actualizar_asignaciones_cita` cuando cambia el
+  dentista, el paciente, el estado o la fecha de la cita. Solo se recalculan las filas
+  afectadas (el par dentista/paciente anterior y el nuevo), con una agregación sobre las
+  citas de ese par.
+- `recalcular_asignaciones_cliente` recalcula todas las filas de un cliente (p.ej. al
+  reasignar en bloque sus citas a otro dentista).
+- `reconstruir_asignaciones` vuelve a calcular todo desde las citas (comando
+  `reconstruir_pacientes_dentista`). Hace falta después de cambios masivos que no pasan
+  por Cita.save(), como QuerySet.update() o el borrado de un cliente.
+- La migración 0053 llena la tabla al crearla, con una copia de esta lógica (si cambian
+  las reglas, hay que correr el comando en vez de tocar la migración).
+
+Qué paciente es el de una cita:
+1. su cliente, si la cita tiene uno;
+2. si no, el cliente cuyo email coincide (sin distinguir mayúsculas) con el de la cita;
+3. si no hay cliente, el email de la cita en minúsculas (paciente sin cliente).
+
+Las citas 'disponible' o sin datos del paciente no cuentan.
+
+Concurrencia: los recálculos borran e insertan las filas del par. Antes de hacerlo
+bloquean (select_for_update) la fila del cliente, o la del dentista si el paciente no
+tiene cliente. Así dos Cita.save() simultáneos del mismo paciente se ejecutan uno
+después del otro y el segundo INSERT no choca con las restricciones únicas.
+"""
+from django.db import transaction
+from django.db.models import Count, Max, Min, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce, Lower
+
+# Campos de la cita que afectan la relación
+CAMPOS_CITA = ('dentista_id', 'cliente_id', 'paciente_email', 'estado', 'fecha_hora')
+
+
+def datos_asignacion(cita):
+    """Valores de la cita que afectan la relación (sin disparar consultas por campos diferidos)"""
+    return tuple(cita.__dict__.get(campo) for campo in CAMPOS_CITA)
+
+
+def _citas_con_paciente():
+    from citas.models import Cita
+    from pacientes.models import Cliente
+
+    cliente_por_email = Cliente.objects.filter(email__iexact=OuterRef('paciente_email')).order_by('id').values('id')[:1]
+    return Cita.objects.filter(
+        dentista__isnull=False,
+    ).exclude(
+        estado='disponible',
+    ).filter(
+        Q(cliente__isnull=False) | (Q(paciente_email__isnull=False) & ~Q(paciente_email=''))
+    ).annotate(
+        cliente_resuelto=Coalesce('cliente_id', Subquery(cliente_por_email)),
+        email_normalizado=Lower('paciente_email'),
+    )
+
+
+def _filas(citas):
+    """Filas DentistaPaciente (sin guardar) calculadas desde un queryset de _citas_con_paciente()"""
+    from .models import DentistaPaciente
+
+    grupos = citas.order_by().values('dentista_id', 'cliente_resuelto', 'email_normalizado').annotate(
+        total=Count('id'),
+        completadas=Count('id', filter=Q(estado='completada')),
+        primera=Min('fecha_hora'),
+        ultima=Max('fecha_hora'),
+    )
+
+    filas = {}
+    for grupo in grupos:
+        # Las citas con cliente se agrupan solo por cliente, aunque tengan emails distintos
+        clave = (grupo['dentista_id'], grupo['cliente_resuelto'], None if grupo['cliente_resuelto'] else grupo['email_normalizado'])
+        fila = filas.get(clave)
+        if fila is None:
+            filas[clave] = DentistaPaciente(
+                dentista_id=clave[0],
+                cliente_id=clave[1],
+                paciente_email=clave[2] or '',
+                primera_cita=grupo['primera'],
+                ultima_cita=grupo['ultima'],
+                total_citas=grupo['total'],
+                citas_completadas=grupo['completadas'],
+            )
+            continue
+        fila.primera_cita = min(fila.primera_cita, grupo['primera'])
+        fila.ultima_cita = max(fila.ultima_cita, grupo['ultima'])
+        fila.total_citas += grupo['total']
+        fila.citas_completadas += grupo['completadas']
+
+    # Datos de contacto de los pacientes sin cliente: los de su cita más reciente
+    pendientes = {clave for clave in filas if clave[1] is None}
+    if pendientes:
+        recientes = citas.filter(cliente_resuelto__isnull=True).order_by('-fecha_hora').values(
+            'dentista_id', 'email_normalizado', 'paciente_nombre', 'paciente_telefono',
+        )
+        for cita in recientes.iterator():
+            clave = (cita['dentista_id'], None, cita['email_normalizado'])
+            if clave in pendientes:
+                filas[clave].paciente_nombre = (cita['paciente_nombre'] or '')[:150]
+                filas[clave].paciente_telefono = (cita['paciente_telefono'] or '')[:20]
+                pendientes.discard(clave)
+                if not pendientes:
+                    break
+    return list(filas.values())
+
+
+def _resolver_paciente(cliente_id, email):
+    """(cliente_id, email en minúsculas o None) según las reglas del módulo"""
+    from pacientes.models import Cliente
+
+    if cliente_id:
+        return cliente_id, None
+    email = (email or '').strip().lower()
+    if not email:
+        return None
+    cliente_id = Cliente.objects.filter(email__iexact=email).order_by('id').values_list('id', flat=True).first()
+    return (cliente_id, None) if cliente_id else (None, email)
+
+
+def _bloquear_par(dentista_id, cliente_id):
+    """Bloquea hasta el fin de la transacción la fila que serializa los recálculos del par"""
+    if cliente_id:
+        from pacientes.models import Cliente
+        list(Cliente.objects.select_for_update().filter(id=cliente_id).values_list('id', flat=True))
+    else:
+        from personal.models import Perfil
+        list(Perfil.objects.select_for_update().filter(id=dentista_id).values_list('id', flat=True))
+
+
+def recalcular_asignacion(dentista_id, cliente_id=None, email=None):
+    """Recalcula la fila de un par dentista/paciente (la crea, actualiza o elimina)"""
+    from pacientes.models import Cliente
+    from .models import DentistaPaciente
+
+    paciente = _resolver_paciente(cliente_id, email)
+    if not dentista_id or paciente is None:
+        return
+    cliente_id, email = paciente
+
+    citas = _citas_con_paciente().filter(dentista_id=dentista_id)
+    existentes = DentistaPaciente.objects.filter(dentista_id=dentista_id)
+    if cliente_id:
+        email_cliente = Cliente.objects.filter(id=cliente_id).values_list('email', flat=True).first() or ''
+        alcance = Q(cliente_id=cliente_id)
+        if email_cliente:
+            alcance |= Q(cliente__isnull=True, paciente_email__iexact=email_cliente)
+        citas = citas.filter(alcance)
+        existentes = existentes.filter(Q(cliente_id=cliente_id) | Q(cliente__isnull=True, paciente_email=email_cliente.lower()))
+    else:
+        citas = citas.filter(cliente__isnull=True, paciente_email__iexact=email)
+        existentes = existentes.filter(cliente__isnull=True, paciente_email=email)
+
+    with transaction.atomic():
+        _bloquear_par(dentista_id, cliente_id)
+        existentes.delete()
+        DentistaPaciente.objects.bulk_create(_filas(citas))
+
+
+def actualizar_asignaciones_cita(cita, anterior):
+    """
+    Llamado desde Cita.save()/delete(). `anterior` son los datos_asignacion() con que la
+    cita estaba guardada (None si es nueva); la cita eliminada se pasa con pk None.
+    """
+    actual = datos_asignacion(cita) if cita.pk else None
+    if actual == anterior:
+        return
+
+    pares = set()
+    for datos in (anterior, actual):
+        if datos and datos[0]:
+            dentista_id, cliente_id, email = datos[0], datos[1], datos[2]
+            pares.add((dentista_id, cliente_id, (email or '').strip().lower()))
+    # Siempre en el mismo orden, para que dos transacciones no se bloqueen mutuamente
+    for dentista_id, cliente_id, email in sorted(pares, key=lambda par: (par[1] or 0, par[0], par[2])):
+        recalcular_asignacion(dentista_id, cliente_id, email)
+
+
+def recalcular_asignaciones_cliente(cliente):
+    """Recalcula todas las filas de un cliente (con cualquier dentista)"""
+    from .models import DentistaPaciente
+
+    alcance = Q(cliente=cliente)
+    filas_existentes = Q(cliente=cliente)
+    if cliente.email:
+        alcance |= Q(cliente__isnull=True, paciente_email__iexact=cliente.email)
+        filas_existentes |= Q(cliente__isnull=True, paciente_email=cliente.email.lower())
+
+    with transaction.atomic():
+        # Las filas de un email pertenecen a este cliente (ver _resolver_paciente), así que basta su bloqueo
+        _bloquear_par(None, cliente.pk)
+        DentistaPaciente.objects.filter(filas_existentes).delete()
+        DentistaPaciente.objects.bulk_create(_filas(_citas_con_paciente().filter(alcance)))
+
+
+def reconstruir_asignaciones(dentistas=None, dry_run=False):
+    """
+    Recalcula la relación completa (o la de estos dentistas) desde las citas.
+
+    Retorna {'filas': n, 'creadas': n, 'eliminadas': n} comparando con lo que había.
+    """
+    from .models import DentistaPaciente
+
+    citas = _citas_con_paciente()
+    existentes = DentistaPaciente.objects.all()
+    if dentistas is not None:
+        citas = citas.filter(dentista__in=dentistas)
+        existentes = existentes.filter(dentista__in=dentistas)
+
+    filas = _filas(citas)
+    claves_nuevas = {(fila.dentista_id, fila.cliente_id, fila.paciente_email) for fila in filas}
+    claves_existentes = set(existentes.values_list('dentista_id', 'cliente_id', 'paciente_email'))
+    resumen = {
+        'filas': len(filas),
+        'creadas': len(claves_nuevas - claves_existentes),
+        'eliminadas': len(claves_existentes - claves_nuevas),
+    }
+    if not dry_run:
+        with transaction.atomic():
+            existentes.delete()
+            DentistaPaciente.objects.bulk_create(filas, batch_size=1000)
+    return resumen
+
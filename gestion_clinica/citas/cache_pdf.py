@@ -0,0 +1,162 @@
+"""
+Caché en disco de los PDFs generados con ReportLab (odontograma, presupuesto,
+consentimiento e inventario).
+
+Armar el documento (tablas, firmas en base64, marcas de agua) es lo más caro de estas
+exportaciones y se repetía en cada descarga aunque nada hubiera cambiado. Ahora cada PDF
+se guarda con una huella (SHA-256) de los datos con que se generó:
+
+- todas las columnas de la fila principal (odontograma, plan, consentimiento) y de las
+  filas relacionadas que se imprimen (cliente, dientes, citas pagadas, insumos),
+- la información de la clínica del encabezado,
+- la fecha de emisión que se imprime,
+- la versión de la plantilla (VERSION_PLANTILLAS).
+
+Si al volver a exportar la huella coincide, se sirve el archivo guardado; si cambió
+algo, la huella es otra y se genera el PDF de nuevo. Por eso no hace falta invalidar
+nada al editar: basta con que cambien los datos. Al modificar el diseño de un PDF hay
+que subir su número en VERSION_PLANTILLAS.
+
+Los PDFs que dicen "Generado por" (presupuesto, inventario) se guardan con una clave
+por usuario (`clave_generador`): recepción, el dentista y los lotes de documentos
+tienen cada uno su copia y no se pisan entre ellos.
+
+El nombre del archivo lleva la fecha de emisión. Al guardar se borran las copias del
+mismo documento de días anteriores; las del mismo día (otras versiones de los datos)
+se quedan hasta que las reemplace una copia de un día posterior.
+
+Los PDFs imprimen solo la fecha de emisión (sin hora): con la hora, una copia guardada
+mostraría la de la primera generación del día.
+
+Los archivos se guardan en PDF_CACHE_DIR (fuera de MEDIA_ROOT, no son públicos) y los
+comparten todos los workers. Con PDF_CACHE_ACTIVO=False siempre se regenera.
+"""
+import glob
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from datetime import date
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+VERSION_PLANTILLAS = {
+    'odontograma': 2,
+    'presupuesto': 2,
+    'consentimiento': 2,
+    'inventario': 2,
+}
+
+
+def _valores_fila(objeto):
+    """Valores de todas las columnas de una instancia (sin consultas adicionales)"""
+    if objeto is None:
+        return None
+    return [getattr(objeto, campo.attname) for campo in objeto._meta.concrete_fields]
+
+
+def _info_clinica():
+    try:
+        from configuracion.models import InformacionClinica
+        return _valores_fila(InformacionClinica.obtener_cacheada())
+    except Exception:
+        return None
+
+
+def calcular_huella(tipo, *partes):
+    datos = json.dumps([tipo, VERSION_PLANTILLAS[tipo], *partes], default=str, sort_keys=True)
+    return hashlib.sha256(datos.encode('utf-8')).hexdigest()
+
+
+def huella_odontograma(odontograma):
+    dientes = list(
+        odontograma.dientes.order_by('numero_diente').values_list(
+            'numero_diente', 'estado', 'caras', 'metadata', 'observaciones',
+            'fecha_tratamiento', 'costo_tratamiento',
+        )
+    )
+    return calcular_huella(
+        'odontograma', _valores_fila(odontograma), odontograma.dentista.nombre_completo, dientes, date.today(),
+    )
+
+
+def huella_presupuesto(plan):
+    # total_pagado / saldo_pendiente salen de los precios cobrados en las citas del plan
+    citas = list(plan.citas.order_by('id').values_list('id', 'precio_cobrado'))
+    return calcular_huella(
+        'presupuesto', _valores_fila(plan), _valores_fila(plan.cliente),
+        plan.dentista.nombre_completo, citas, _info_clinica(), date.today(),
+    )
+
+
+def huella_consentimiento(consentimiento):
+    dentista = consentimiento.dentista
+    return calcular_huella(
+        'consentimiento', _valores_fila(consentimiento), _valores_fila(consentimiento.cliente),
+        dentista.nombre_completo if dentista else None, _info_clinica(), date.today(),
+    )
+
+
+def huella_inventario(insumos):
+    filas = [
+        (_valores_fila(insumo), insumo.proveedor_principal.nombre if insumo.proveedor_principal_id else None)
+        for insumo in insumos
+    ]
+    # "Próximo a vencer" depende del día en que se genera
+    return calcular_huella('inventario', filas, date.today())
+
+
+def clave_generador(clave, perfil):
+    """Clave de un PDF que imprime quién lo generó: una copia por usuario"""
+    return f'{clave}-u{perfil.pk}'
+
+
+def _directorio(tipo):
+    base = getattr(settings, 'PDF_CACHE_DIR', None) or os.path.join(tempfile.gettempdir(), 'gestion_clinica_pdf')
+    return os.path.join(base, tipo)
+
+
+def _ruta(tipo, clave, huella):
+    return os.path.join(_directorio(tipo), f'{clave}-{date.today():%Y%m%d}-{huella}.pdf')
+
+
+def obtener_pdf_cacheado(tipo, clave, huella):
+    """Contenido del PDF guardado para esa huella, o None"""
+    if not getattr(settings, 'PDF_CACHE_ACTIVO', True):
+        return None
+    try:
+        with open(_ruta(tipo, clave, huella), 'rb') as archivo:
+            return archivo.read()
+    except FileNotFoundError:
+        return None
+    except OSError as e:
+        logger.warning(f'No se pudo leer el PDF en caché {tipo}/{clave}: {e}')
+        return None
+
+
+def guardar_pdf_cacheado(tipo, clave, huella, contenido):
+    """Guarda el PDF y borra las copias del mismo documento de días anteriores"""
+    if not getattr(settings, 'PDF_CACHE_ACTIVO', True):
+        return
+    directorio = _directorio(tipo)
+    ruta = _ruta(tipo, clave, huella)
+    try:
+        os.makedirs(directorio, exist_ok=True)
+        descriptor, ruta_temporal = tempfile.mkstemp(dir=directorio, suffix='.tmp')
+        with os.fdopen(descriptor, 'wb') as temporal:
+            temporal.write(contenido)
+        os.replace(ruta_temporal, ruta)
+        prefijo = os.path.join(directorio, f'{clave}-')
+        hoy = f'{date.today():%Y%m%d}'
+        for anterior in glob.glob(f'{glob.escape(prefijo)}*.pdf'):
+            # {clave}-{AAAAMMDD}-{huella}.pdf; lo que no tenga ese formato es de antes de
+            # que el nombre llevara la fecha
+            fecha, separador, huella_anterior = anterior[len(prefijo):].partition('-')
+            if len(fecha) == 8 and fecha.isdigit() and separador and '-' not in huella_anterior and fecha >= hoy:
+                continue
+            os.remove(anterior)
+    except OSError as e:
+        logger.warning(f'No se pudo guardar el PDF en caché {tipo}/{clave}: {e}')
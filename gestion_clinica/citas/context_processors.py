@@ -1,11 +1,12 @@
 from personal.models import Perfil
+from personal.cache_perfil import obtener_perfil
 from evaluaciones.models import Evaluacion
 
 def perfil_context(request):
     """Context processor para incluir información del perfil en todos los templates"""
     if request.user.is_authenticated:
         try:
-            perfil = Perfil.objects.get(user=request.user)
+            perfil = obtener_perfil(request)
             
             # Obtener contador de evaluaciones pendientes
             evaluaciones_pendientes_count = Evaluacion.objects.filter(estado='pendiente').count()
@@ -35,7 +36,7 @@ def info_clinica(request):
     """Context processor para incluir información de la clínica en todos los templates"""
     try:
         from configuracion.models import InformacionClinica
-        info = InformacionClinica.obtener()
+        info = InformacionClinica.obtener_cacheada()
         return {
             'info_clinica': info,
             'nombre_clinica': info.nombre_clinica or 'Clínica Dental San Felipe',
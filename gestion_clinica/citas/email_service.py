@@ -19,7 +19,7 @@ def _obtener_info_clinica():
     """
     try:
         from configuracion.models import InformacionClinica
-        info = InformacionClinica.obtener()
+        info = InformacionClinica.obtener_cacheada()
         nombre_clinica = info.nombre_clinica or "Clínica Dental San Felipe"
         if nombre_clinica == "Clínica Dental":
             nombre_clinica = "Clínica Dental San Felipe"
@@ -30,8 +30,7 @@ def verificar_permiso_plan_tratamiento(perfil, plan=None, cliente_id=None):
     
     # Dentistas solo pueden gestionar planes de sus clientes
     if perfil.es_dentista():
-        pacientes_dentista = perfil.get_pacientes_asignados()
-        clientes_ids = [p['id'] for p in pacientes_dentista if 'id' in p and isinstance(p['id'], int)]
+        clientes_ids = perfil.get_clientes_asignados_ids()
         
         if plan:
             # Verificar que el plan es del dentista y del cliente correcto
@@ -60,8 +59,7 @@ def obtener_clientes_permitidos(perfil):
     if perfil.es_administrativo():
         return Cliente.objects.filter(activo=True).order_by('nombre_completo')
     elif perfil.es_dentista():
-        pacientes_dentista = perfil.get_pacientes_asignados()
-        clientes_ids = [p['id'] for p in pacientes_dentista if 'id' in p and isinstance(p['id'], int)]
+        clientes_ids = perfil.get_clientes_asignados_ids()
         return Cliente.objects.filter(id__in=clientes_ids, activo=True).order_by('nombre_completo')
     else:
         return Cliente.objects.none()
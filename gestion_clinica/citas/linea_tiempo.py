@@ -0,0 +1,269 @@
+"""
+Línea de tiempo clínica de un paciente.
+
+Antes, para ver la historia de un paciente había que recorrer el perfil, las citas, las
+radiografías, los odontogramas, los planes y el gestor de documentos, y cada pantalla
+hacía sus propias consultas. Aquí se juntan en una sola consulta (UNION ALL) los eventos de:
+
+- Cita (fecha_hora), Odontograma (fecha_creacion), Radiografia (fecha_carga),
+- PlanTratamiento (creado_el), PagoTratamiento (fecha_registro),
+- ConsentimientoInformado (fecha_creacion) y DocumentoCliente (fecha_generacion).
+
+Cada rama de la unión devuelve las mismas columnas (tipo, objeto_id, fecha, titulo,
+estado, detalle, monto, dentista) y el resultado se ordena por (fecha, tipo, objeto_id)
+descendente, que es un orden total.
+
+La paginación es por cursor (keyset), no por OFFSET: el cursor codifica la última fila
+entregada y cada rama se filtra con "anterior a esa fila" antes de unirse, de modo que la
+base de datos usa los índices (cliente, fecha) de cada tabla y el costo de una página no
+crece con la antigüedad del paciente. Como el tipo es constante en cada rama, la condición
+(fecha, tipo, id) < cursor se reduce en cada una a una comparación sobre fecha (e id si
+la rama es del mismo tipo que el cursor).
+
+Las citas, odontogramas y radiografías antiguas pueden no tener cliente asociado; esas se
+incluyen por paciente_email, igual que en el perfil del cliente.
+"""
+from datetime import datetime
+
+from django.db.models import CharField, DecimalField, F, Q, Value
+from django.db.models.functions import Coalesce, Left
+from django.urls import reverse
+
+from pacientes.paginacion import CursorInvalido, codificar_cursor, decodificar_cursor
+
+# Tamaño de página por defecto y máximo
+POR_PAGINA = 25
+MAXIMO_POR_PAGINA = 100
+
+# Largo máximo del texto de detalle que se trae de la base de datos
+LARGO_DETALLE = 200
+
+PREFIJO = 'evento_'
+
+TIPOS = {
+    'cita': 'Cita',
+    'consentimiento': 'Consentimiento',
+    'documento': 'Documento',
+    'odontograma': 'Odontograma',
+    'pago': 'Pago',
+    'plan': 'Plan de Tratamiento',
+    'radiografia': 'Radiografía',
+}
+
+ICONOS = {
+    'cita': 'fa-calendar-check',
+    'consentimiento': 'fa-file-signature',
+    'documento': 'fa-file-pdf',
+    'odontograma': 'fa-tooth',
+    'pago': 'fa-money-bill-wave',
+    'plan': 'fa-clipboard-list',
+    'radiografia': 'fa-x-ray',
+}
+
+
+def _cursor_evento(evento):
+    return codificar_cursor(evento['fecha'].isoformat(), evento['tipo'], evento['objeto_id'])
+
+
+def _leer_cursor_evento(cursor):
+    """(fecha, tipo, objeto_id) de un cursor generado por _cursor_evento"""
+    fecha, tipo, objeto_id = decodificar_cursor(cursor, 3)
+    try:
+        fecha = datetime.fromisoformat(fecha)
+        objeto_id = int(objeto_id)
+    except ValueError as e:
+        raise CursorInvalido(f'Cursor no válido: {cursor}') from e
+    if tipo not in TIPOS:
+        raise CursorInvalido(f'Cursor no válido: {cursor}')
+    return fecha, tipo, objeto_id
+
+
+def _texto(valor):
+    return Value(valor, output_field=CharField())
+
+
+def _columnas(tipo, fecha, titulo, estado=None, detalle=None, monto=None, dentista=None):
+    """
+    Anotaciones comunes de una rama; todas las ramas deben tener las mismas columnas.
+    Llevan el prefijo PREFIJO para no chocar con campos del modelo (tipo, titulo, estado...).
+    """
+    return {
+        'tipo': _texto(tipo),
+        'objeto_id': F('id'),
+        'fecha': F(fecha),
+        'titulo': titulo,
+        'estado': F(estado) if estado else _texto(''),
+        'detalle': Left(detalle, LARGO_DETALLE) if detalle else _texto(''),
+        'monto': F(monto) if monto else Value(None, output_field=DecimalField(max_digits=10, decimal_places=2)),
+        'dentista': F(dentista) if dentista else _texto(''),
+    }
+
+
+def _ramas(cliente):
+    from citas.models import Cita
+    from historial_clinico.models import (
+        ConsentimientoInformado,
+        DocumentoCliente,
+        Odontograma,
+        PagoTratamiento,
+        PlanTratamiento,
+        Radiografia,
+    )
+
+    del_cliente = Q(cliente=cliente)
+    if cliente.email:
+        del_cliente |= Q(cliente__isnull=True, paciente_email=cliente.email)
+
+    return [
+        (Cita.objects.filter(del_cliente).exclude(estado='disponible'), _columnas(
+            'cita', 'fecha_hora',
+            titulo=Coalesce('tipo_servicio__nombre', 'tipo_consulta', _texto('Cita')),
+            estado='estado', detalle='notas', monto='precio_cobrado', dentista='dentista__nombre_completo',
+        )),
+        (Odontograma.objects.filter(del_cliente), _columnas(
+            'odontograma', 'fecha_creacion',
+            titulo=_texto('Odontograma'),
+            estado='estado_general', detalle='motivo_consulta', dentista='dentista__nombre_completo',
+        )),
+        (Radiografia.objects.filter(del_cliente), _columnas(
+            'radiografia', 'fecha_carga',
+            titulo=F('tipo'),
+            detalle='descripcion', dentista='dentista__nombre_completo',
+        )),
+        (PlanTratamiento.objects.filter(cliente=cliente), _columnas(
+            'plan', 'creado_el',
+            titulo=F('nombre'),
+            estado='estado', detalle='descripcion', monto='precio_final', dentista='dentista__nombre_completo',
+        )),
+        (PagoTratamiento.objects.filter(plan_tratamiento__cliente=cliente), _columnas(
+            'pago', 'fecha_registro',
+            titulo=F('plan_tratamiento__nombre'),
+            estado='metodo_pago', detalle='numero_comprobante', monto='monto',
+            dentista='plan_tratamiento__dentista__nombre_completo',
+        )),
+        (ConsentimientoInformado.objects.filter(cliente=cliente), _columnas(
+            'consentimiento', 'fecha_creacion',
+            titulo=F('titulo'),
+            estado='estado', detalle='tipo_procedimiento', dentista='dentista__nombre_completo',
+        )),
+        (DocumentoCliente.objects.filter(cliente=cliente), _columnas(
+            'documento', 'fecha_generacion',
+            titulo=F('titulo'),
+            estado='tipo', detalle='descripcion', dentista='generado_por__nombre_completo',
+        )),
+    ]
+
+
+def _anteriores_al_cursor(tipo, campo_fecha, cursor):
+    """Filtro (fecha, tipo, id) < cursor para una rama cuyo tipo es constante"""
+    fecha, tipo_cursor, objeto_id = cursor
+    if tipo < tipo_cursor:
+        return Q(**{f'{campo_fecha}__lte': fecha})
+    if tipo > tipo_cursor:
+        return Q(**{f'{campo_fecha}__lt': fecha})
+    return Q(**{f'{campo_fecha}__lt': fecha}) | Q(**{campo_fecha: fecha, 'id__lt': objeto_id})
+
+
+def obtener_linea_tiempo(cliente, cursor=None, por_pagina=POR_PAGINA, tipos=None):
+    """
+    Una página de eventos del paciente, del más reciente al más antiguo.
+
+    cursor: valor de 'siguiente_cursor' de la página anterior (o None para la primera).
+    tipos: limitar a estos tipos de evento (claves de TIPOS).
+
+    Retorna {'eventos': [...], 'siguiente_cursor': str | None}. Lanza CursorInvalido
+    si el cursor no se puede leer.
+    """
+    por_pagina = max(1, min(int(por_pagina), MAXIMO_POR_PAGINA))
+    posicion = _leer_cursor_evento(cursor) if cursor else None
+
+    consultas = []
+    for consulta, columnas in _ramas(cliente):
+        tipo = columnas['tipo'].value
+        if tipos and tipo not in tipos:
+            continue
+        if posicion:
+            consulta = consulta.filter(_anteriores_al_cursor(tipo, columnas['fecha'].name, posicion))
+        anotaciones = {PREFIJO + nombre: expresion for nombre, expresion in columnas.items()}
+        consultas.append(consulta.order_by().annotate(**anotaciones).values(*anotaciones))
+
+    if not consultas:
+        return {'eventos': [], 'siguiente_cursor': None}
+
+    union = consultas[0].union(*consultas[1:], all=True) if len(consultas) > 1 else consultas[0]
+    orden = [f'-{PREFIJO}fecha', f'-{PREFIJO}tipo', f'-{PREFIJO}objeto_id']
+    filas = list(union.order_by(*orden)[:por_pagina + 1])
+
+    etiquetas = _etiquetas()
+    eventos = [_evento(fila, etiquetas) for fila in filas[:por_pagina]]
+    return {
+        'eventos': eventos,
+        'siguiente_cursor': _cursor_evento(eventos[-1]) if len(filas) > por_pagina else None,
+    }
+
+
+def _etiquetas():
+    from citas.models import Cita
+    from historial_clinico.models import (
+        ConsentimientoInformado,
+        DocumentoCliente,
+        Odontograma,
+        PagoTratamiento,
+        PlanTratamiento,
+        Radiografia,
+    )
+    return {
+        'cita': {'estado': dict(Cita.ESTADO_CHOICES)},
+        'odontograma': {'estado': dict(Odontograma.CONDICION_CHOICES)},
+        'radiografia': {'titulo': dict(Radiografia.TIPO_RADIOGRAFIA_CHOICES)},
+        'plan': {'estado': dict(PlanTratamiento.ESTADO_CHOICES)},
+        'pago': {'estado': dict(PagoTratamiento.METODO_PAGO_CHOICES)},
+        'consentimiento': {
+            'estado': dict(ConsentimientoInformado.ESTADO_CHOICES),
+            'detalle': dict(ConsentimientoInformado._meta.get_field('tipo_procedimiento').choices),
+        },
+        'documento': {'estado': dict(DocumentoCliente.TIPO_DOCUMENTO_CHOICES)},
+    }
+
+
+def _evento(fila, etiquetas):
+    evento = {nombre[len(PREFIJO):]: valor for nombre, valor in fila.items()}
+    tipo = evento['tipo']
+    for campo, opciones in etiquetas[tipo].items():
+        evento[campo] = opciones.get(evento[campo], evento[campo])
+    evento['tipo_display'] = TIPOS[tipo]
+    evento['icono'] = ICONOS[tipo]
+    return evento
+
+
+def url_evento(evento):
+    """URL del panel de trabajadores donde se ve el detalle del evento (o None)"""
+    tipo, objeto_id = evento['tipo'], evento['objeto_id']
+    if tipo == 'odontograma':
+        return reverse('detalle_odontograma', args=[objeto_id])
+    if tipo == 'plan':
+        return reverse('detalle_plan_tratamiento', args=[objeto_id])
+    if tipo == 'consentimiento':
+        return reverse('detalle_consentimiento', args=[objeto_id])
+    if tipo == 'documento':
+        return reverse('descargar_documento', args=[objeto_id])
+    return None
+
+
+def serializar_evento(evento, con_url=False):
+    """Evento listo para JSON (fecha ISO, monto como número)"""
+    datos = {
+        'tipo': evento['tipo'],
+        'tipo_display': evento['tipo_display'],
+        'id': evento['objeto_id'],
+        'fecha': evento['fecha'].isoformat(),
+        'titulo': evento['titulo'],
+        'estado': evento['estado'],
+        'detalle': evento['detalle'],
+        'monto': float(evento['monto']) if evento['monto'] is not None else None,
+        'dentista': evento['dentista'],
+        'icono': evento['icono'],
+    }
+    if con_url:
+        datos['url'] = url_evento(evento)
+    return datos
@@ -0,0 +1,311 @@
+"""
+Generación de documentos PDF por lotes.
+
+Permite producir de una vez los presupuestos de muchos planes (p.ej. los de fin de mes)
+o todos los consentimientos pendientes, y entregarlos como un ZIP descargable o como un
+correo por paciente con todos sus documentos adjuntos.
+
+ReportLab es Python puro y consume CPU, así que con hilos no se gana nada por el GIL: los
+PDFs se generan en un pool de procesos (LOTES_DOCUMENTOS_PROCESOS) y el resultado se va
+agregando al ZIP / al correo del paciente a medida que llegan. Cada PDF pasa por la caché
+de citas/cache_pdf.py, de modo que los documentos que no cambiaron no se vuelven a armar.
+
+El lote se procesa en segundo plano (un hilo del proceso web, igual que las derivadas
+de radiografías) una vez confirmada la transacción que lo creó; la vista consulta el
+progreso en LoteDocumentos (procesados/total). Si el proceso se reinicia a mitad de un
+lote, `python manage.py procesar_lotes_documentos` lo retoma.
+
+Con LOTES_DOCUMENTOS_SINCRONO=True el lote se procesa dentro del request y sin pool de
+procesos (útil en desarrollo).
+"""
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+import zipfile
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+from django.conf import settings
+from django.core.files import File
+from django.db import close_old_connections, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Selecciones predefinidas: tipo -> {clave: (descripción, filtro)}
+SELECCIONES = {
+    'presupuestos': {
+        'activos': ('Planes aprobados y en progreso', {'estado__in': ['aprobado', 'en_progreso']}),
+        'pendientes_aprobacion': ('Planes pendientes de aprobación', {'estado': 'pendiente_aprobacion'}),
+    },
+    'consentimientos': {
+        'pendientes': ('Consentimientos pendientes de firma', {'estado': 'pendiente'}),
+    },
+}
+
+# Máximo de errores guardados en detalle_errores
+MAXIMO_DETALLE_ERRORES = 50
+
+_hilo_executor = None
+_hilo_executor_lock = threading.Lock()
+
+
+def _obtener_hilo():
+    """Un solo hilo de fondo: los lotes se procesan de a uno (cada uno ya usa varios procesos)"""
+    global _hilo_executor
+    with _hilo_executor_lock:
+        if _hilo_executor is None:
+            _hilo_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='lotes-documentos')
+        return _hilo_executor
+
+
+def _numero_procesos():
+    return max(1, getattr(settings, 'LOTES_DOCUMENTOS_PROCESOS', None) or min(4, os.cpu_count() or 1))
+
+
+def _modelo(tipo):
+    from historial_clinico.models import ConsentimientoInformado, PlanTratamiento
+    return PlanTratamiento if tipo == 'presupuestos' else ConsentimientoInformado
+
+
+def seleccionar_objetos(tipo, seleccion, ids=None):
+    """IDs a incluir: una selección predefinida (SELECCIONES) o una lista explícita de IDs"""
+    modelo = _modelo(tipo)
+    consulta = modelo.objects.filter(cliente__isnull=False)
+    if seleccion == 'ids':
+        consulta = consulta.filter(id__in=ids or [])
+    else:
+        consulta = consulta.filter(**SELECCIONES[tipo][seleccion][1])
+    return list(consulta.order_by('cliente_id', 'id').values_list('id', flat=True))
+
+
+def crear_lote(perfil, tipo, objetos, entrega='zip'):
+    """Crea el lote y lo programa para cuando se confirme la transacción"""
+    from .models import LoteDocumentos
+
+    lote = LoteDocumentos.objects.create(
+        tipo=tipo,
+        entrega=entrega,
+        objetos=list(objetos),
+        total=len(objetos),
+        creado_por=perfil,
+    )
+    encolar_lote(lote)
+    return lote
+
+
+def _inicializar_proceso():
+    import django
+    django.setup()
+
+
+def renderizar_documento(tipo, objeto_id, perfil_id):
+    """
+    Genera (o toma de la caché) el PDF de un plan o consentimiento. Se ejecuta en los
+    procesos del pool, por eso recibe IDs y devuelve solo datos serializables:
+    (objeto_id, nombre_archivo, contenido).
+    """
+    from personal.models import Perfil
+    from . import views
+
+    close_old_connections()
+    fecha = datetime.now().strftime('%Y%m%d')
+    if tipo == 'presupuestos':
+        plan = _modelo(tipo).objects.select_related('cliente', 'dentista').get(pk=objeto_id)
+        perfil = Perfil.objects.filter(pk=perfil_id).first() or plan.dentista
+        contenido = views.generar_pdf_presupuesto(plan, perfil)
+        nombre = f"presupuesto_{plan.id}_{plan.cliente.nombre_completo.replace(' ', '_')}_{fecha}.pdf"
+    else:
+        consentimiento = _modelo(tipo).objects.select_related('cliente', 'dentista').get(pk=objeto_id)
+        contenido = views.generar_pdf_consentimiento(consentimiento)
+        nombre = f"consentimiento_{consentimiento.id}_{consentimiento.titulo.replace(' ', '_')}_{fecha}.pdf"
+    return objeto_id, nombre.replace('/', '_'), contenido
+
+
+def _renderizar_todos(tipo, objetos, perfil_id):
+    """
+    Genera los PDFs en paralelo y los entrega a medida que terminan.
+    Produce (objeto_id, nombre, contenido, error).
+    """
+    procesos = _numero_procesos()
+    if procesos == 1 or len(objetos) == 1 or getattr(settings, 'LOTES_DOCUMENTOS_SINCRONO', False):
+        for objeto_id in objetos:
+            try:
+                yield (*renderizar_documento(tipo, objeto_id, perfil_id), None)
+            except Exception as e:
+                yield objeto_id, None, None, str(e)
+        return
+
+    # Los procesos nuevos abren sus propias conexiones; 'spawn' evita heredar locks del
+    # proceso web (que tiene otros hilos) como pasaría con fork
+    connections.close_all()
+    contexto = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=min(procesos, len(objetos)), mp_context=contexto,
+                             initializer=_inicializar_proceso) as pool:
+        futuros = {pool.submit(renderizar_documento, tipo, objeto_id, perfil_id): objeto_id for objeto_id in objetos}
+        for futuro in as_completed(futuros):
+            try:
+                yield (*futuro.result(), None)
+            except Exception as e:
+                yield futuros[futuro], None, None, str(e)
+
+
+def _registrar_progreso(lote, error=None):
+    from .models import LoteDocumentos
+
+    cambios = {'procesados': F('procesados') + 1}
+    if error:
+        cambios['errores'] = F('errores') + 1
+    LoteDocumentos.objects.filter(pk=lote.pk).update(**cambios)
+    if error and len(lote.detalle_errores) < MAXIMO_DETALLE_ERRORES:
+        lote.detalle_errores.append(error)
+        LoteDocumentos.objects.filter(pk=lote.pk).update(detalle_errores=lote.detalle_errores)
+
+
+def _registrar_error_correo(lote, cliente_id, motivo):
+    from .models import LoteDocumentos
+
+    if len(lote.detalle_errores) < MAXIMO_DETALLE_ERRORES:
+        lote.detalle_errores.append(f'Correo al cliente #{cliente_id}: {motivo}')
+        LoteDocumentos.objects.filter(pk=lote.pk).update(detalle_errores=lote.detalle_errores)
+
+
+def _enviar_correo_paciente(cliente, adjuntos, tipo):
+    from django.core.mail import EmailMultiAlternatives
+    from .email_service import _obtener_info_clinica
+
+    info = _obtener_info_clinica()
+    descripcion = 'presupuestos de tratamiento' if tipo == 'presupuestos' else 'consentimientos informados'
+    asunto = f"Sus documentos - {info['nombre']}"
+    mensaje_texto = (
+        f"Estimado/a {cliente.nombre_completo},\n\n"
+        f"Le enviamos adjuntos sus {descripcion} ({len(adjuntos)} documento(s)).\n\n"
+        "Por favor, revise cuidadosamente estos documentos. Si tiene alguna consulta, no dude en contactarnos.\n\n"
+        f"Saludos cordiales,\n{info['nombre']}"
+    )
+    mensaje_html = _html_correo_paciente(cliente, descripcion, adjuntos, info)
+    email = EmailMultiAlternatives(asunto, mensaje_texto, info['email'], [cliente.email])
+    email.attach_alternative(mensaje_html, 'text/html')
+    for nombre, contenido in adjuntos:
+        email.attach(nombre, contenido, 'application/pdf')
+    email.send()
+
+
+def _html_correo_paciente(cliente, descripcion, adjuntos, info):
+    from django.utils.html import escape
+
+    items = ''.join(f'<li style="margin-bottom: 6px;">{escape(nombre)}</li>' for nombre, _ in adjuntos)
+    return f"""
+    <div style="font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; max-width: 600px; margin: 0 auto; padding: 30px; color: #475569;">
+        <h2 style="color: #0f766e; margin-top: 0;">Estimado/a {escape(cliente.nombre_completo)},</h2>
+        <p style="line-height: 1.6;">Le enviamos adjuntos sus {descripcion}:</p>
+        <ul style="padding-left: 20px;">{items}</ul>
+        <p style="line-height: 1.6;">Por favor, revise cuidadosamente estos documentos. Si tiene alguna consulta, no dude en contactarnos.</p>
+        <p style="line-height: 1.6;">Saludos cordiales,<br><strong style="color: #0f766e;">{escape(info['nombre'])}</strong></p>
+    </div>
+    """
+
+
+def procesar_lote(lote_id):
+    """Procesa un lote pendiente. Devuelve True si se procesó."""
+    from pacientes.models import Cliente
+    from .models import LoteDocumentos
+
+    # Reclamar el lote: evita que dos hilos/procesos lo procesen a la vez
+    reclamados = LoteDocumentos.objects.filter(pk=lote_id, estado='pendiente').update(
+        estado='procesando', iniciado_el=timezone.now(), procesados=0, errores=0, correos_enviados=0,
+        detalle_errores=[],
+    )
+    if not reclamados:
+        return False
+    lote = LoteDocumentos.objects.get(pk=lote_id)
+
+    # Cliente de cada documento (para agrupar los correos por paciente)
+    cliente_por_objeto = dict(
+        _modelo(lote.tipo).objects.filter(id__in=lote.objetos).values_list('id', 'cliente_id')
+    )
+    faltantes = [objeto_id for objeto_id in lote.objetos if objeto_id not in cliente_por_objeto]
+    for objeto_id in faltantes:
+        _registrar_progreso(lote, f'#{objeto_id}: el documento ya no existe')
+    objetos = [objeto_id for objeto_id in lote.objetos if objeto_id in cliente_por_objeto]
+
+    pendientes_por_cliente = defaultdict(int)
+    for objeto_id in objetos:
+        pendientes_por_cliente[cliente_por_objeto[objeto_id]] += 1
+    clientes = Cliente.objects.in_bulk(list(pendientes_por_cliente))
+    adjuntos_por_cliente = defaultdict(list)
+
+    descriptor, ruta_zip = tempfile.mkstemp(suffix='.zip')
+    os.close(descriptor)
+    try:
+        with zipfile.ZipFile(ruta_zip, 'w', zipfile.ZIP_DEFLATED) as archivo_zip:
+            for objeto_id, nombre, contenido, error in _renderizar_todos(lote.tipo, objetos, lote.creado_por_id):
+                close_old_connections()
+                cliente_id = cliente_por_objeto[objeto_id]
+                cliente = clientes.get(cliente_id)
+                if error:
+                    logger.error(f'Lote {lote_id}: error generando el documento {objeto_id}: {error}')
+                    _registrar_progreso(lote, f'#{objeto_id}: {error}')
+                elif lote.entrega == 'zip':
+                    carpeta = f'{cliente.nombre_completo}_{cliente_id}'.replace('/', '_') if cliente else 'sin_cliente'
+                    archivo_zip.writestr(f'{carpeta}/{nombre}', contenido)
+                    _registrar_progreso(lote)
+                else:
+                    adjuntos_por_cliente[cliente_id].append((nombre, contenido))
+                    _registrar_progreso(lote)
+
+                # Correo por paciente apenas están todos sus documentos
+                pendientes_por_cliente[cliente_id] -= 1
+                if lote.entrega == 'correo' and pendientes_por_cliente[cliente_id] == 0:
+                    adjuntos = adjuntos_por_cliente.pop(cliente_id, [])
+                    if not adjuntos:
+                        continue
+                    if not (cliente and cliente.email):
+                        _registrar_error_correo(lote, cliente_id, 'el paciente no tiene email')
+                        continue
+                    try:
+                        _enviar_correo_paciente(cliente, adjuntos, lote.tipo)
+                        LoteDocumentos.objects.filter(pk=lote_id).update(correos_enviados=F('correos_enviados') + 1)
+                    except Exception as e:
+                        logger.error(f'Lote {lote_id}: error enviando correo al cliente {cliente_id}: {e}')
+                        _registrar_error_correo(lote, cliente_id, str(e))
+
+        if lote.entrega == 'zip':
+            with open(ruta_zip, 'rb') as contenido_zip:
+                lote.archivo_zip.save(f'lote_{lote.tipo}_{lote_id}.zip', File(contenido_zip), save=False)
+            LoteDocumentos.objects.filter(pk=lote_id).update(archivo_zip=lote.archivo_zip.name)
+        LoteDocumentos.objects.filter(pk=lote_id).update(estado='completado', terminado_el=timezone.now())
+    except Exception as e:
+        logger.error(f'Error procesando el lote de documentos {lote_id}: {e}')
+        LoteDocumentos.objects.filter(pk=lote_id).update(estado='error', terminado_el=timezone.now())
+        return False
+    finally:
+        os.remove(ruta_zip)
+    return True
+
+
+def _procesar_en_segundo_plano(lote_id):
+    close_old_connections()
+    try:
+        procesar_lote(lote_id)
+    except Exception as e:
+        logger.error(f'Error en el worker de lotes de documentos (lote {lote_id}): {e}')
+    finally:
+        close_old_connections()
+
+
+def encolar_lote(lote):
+    """Programa el procesamiento del lote cuando se confirme la transacción actual"""
+    lote_id = lote.pk
+
+    def _encolar():
+        if getattr(settings, 'LOTES_DOCUMENTOS_SINCRONO', False):
+            procesar_lote(lote_id)
+        else:
+            _obtener_hilo().submit(_procesar_en_segundo_plano, lote_id)
+
+    transaction.on_commit(_encolar)
@@ -0,0 +1,201 @@
+"""
+Comando de gestión para el barrido de integridad de citas.
+
+Reemplaza la limpieza que se hacía en cada carga de `citas_dia` (un LEFT JOIN sobre
+toda la tabla de citas). El barrido es incremental: solo revisa las citas con
+`actualizada_el` posterior a la marca de agua guardada en MarcaBarridoIntegridad,
+en lotes ordenados por (actualizada_el, id), y guarda la marca tras cada lote para
+poder reanudar si se interrumpe.
+
+Revisiones:
+1. Citas cuyo cliente_id apunta a un Cliente que ya no existe -> cliente = NULL
+2. Citas cuyo dentista_id apunta a un Perfil que ya no existe -> dentista = NULL
+3. Citas reservadas sin cliente ni datos de respaldo del paciente -> disponible
+
+Los cambios se aplican con update() (no modifican actualizada_el), así que las citas
+corregidas no vuelven a entrar en el siguiente barrido.
+
+Un cliente eliminado con SQL directo no modifica sus citas; para detectar esos casos
+ejecutar periódicamente con --completo (recorre toda la tabla desde el principio).
+
+Debe ejecutarse periódicamente (recomendado: cada 5-15 minutos con cron o el
+programador de tareas del servidor, y --completo una vez por semana).
+
+Uso:
+    python manage.py barrer_integridad
+    python manage.py barrer_integridad --dry-run     # Solo mostrar qué se corregiría
+    python manage.py barrer_integridad --completo    # Ignorar la marca de agua
+    python manage.py barrer_integridad --lote 1000   # Tamaño de lote
+"""
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from citas.models import Cita, MarcaBarridoIntegridad
+from pacientes.models import Cliente
+from personal.models import Perfil
+import logging
+
+logger = logging.getLogger(__name__)
+
+NOMBRE_BARRIDO = 'citas'
+
+# Las citas modificadas en el último minuto se dejan para el siguiente barrido:
+# una transacción en curso puede confirmar filas con actualizada_el anterior a "ahora"
+MARGEN_SEGURIDAD = timedelta(minutes=1)
+
+
+class Command(BaseCommand):
+    help = 'Revisa incrementalmente la integridad de las citas (referencias huérfanas y reservas sin paciente)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Solo mostrar qué se corregiría sin hacer cambios (no avanza la marca de agua)',
+        )
+        parser.add_argument(
+            '--completo',
+            action='store_true',
+            help='Revisar todas las citas ignorando la marca de agua',
+        )
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=500,
+            help='Número de citas revisadas por lote (por defecto: 500)',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        tamano_lote = max(options['lote'], 1)
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING('MODO DRY-RUN: No se harán cambios reales\n'))
+
+        marca, _ = MarcaBarridoIntegridad.objects.get_or_create(nombre=NOMBRE_BARRIDO)
+        if options['completo']:
+            marca_actualizacion, ultimo_id = None, 0
+            self.stdout.write('Barrido completo: se revisarán todas las citas.')
+        else:
+            marca_actualizacion, ultimo_id = marca.marca_actualizacion, marca.ultimo_id
+            if marca_actualizacion:
+                self.stdout.write(f'Revisando citas modificadas desde {timezone.localtime(marca_actualizacion).strftime("%d/%m/%Y %H:%M:%S")}')
+
+        limite = timezone.now() - MARGEN_SEGURIDAD
+        resumen = {
+            'revisadas': 0,
+            'lotes': 0,
+            'cliente_inexistente': [],
+            'dentista_inexistente': [],
+            'reservadas_sin_paciente': [],
+        }
+
+        while True:
+            citas = Cita.objects.filter(actualizada_el__lte=limite)
+            if marca_actualizacion is not None:
+                citas = citas.filter(
+                    Q(actualizada_el__gt=marca_actualizacion) |
+                    Q(actualizada_el=marca_actualizacion, id__gt=ultimo_id)
+                )
+            lote = list(
+                citas.order_by('actualizada_el', 'id').values(
+                    'id', 'actualizada_el', 'estado', 'cliente_id', 'dentista_id',
+                    'paciente_nombre', 'paciente_email', 'paciente_telefono',
+                )[:tamano_lote]
+            )
+            if not lote:
+                break
+
+            self._revisar_lote(lote, resumen, dry_run)
+            resumen['revisadas'] += len(lote)
+            resumen['lotes'] += 1
+            marca_actualizacion, ultimo_id = lote[-1]['actualizada_el'], lote[-1]['id']
+
+            if not dry_run:
+                marca.marca_actualizacion = marca_actualizacion
+                marca.ultimo_id = ultimo_id
+                marca.save(update_fields=['marca_actualizacion', 'ultimo_id'])
+
+        self._reportar(resumen, dry_run)
+
+        if not dry_run:
+            marca.ultima_ejecucion = timezone.now()
+            marca.resumen = {
+                'revisadas': resumen['revisadas'],
+                'cliente_inexistente': len(resumen['cliente_inexistente']),
+                'dentista_inexistente': len(resumen['dentista_inexistente']),
+                'reservadas_sin_paciente': len(resumen['reservadas_sin_paciente']),
+            }
+            marca.save(update_fields=['ultima_ejecucion', 'resumen'])
+
+    def _revisar_lote(self, lote, resumen, dry_run):
+        """Aplica las revisiones a un lote de citas (valores, no instancias)"""
+        # 1 y 2. Referencias a clientes/dentistas que ya no existen
+        clientes_ids = {fila['cliente_id'] for fila in lote if fila['cliente_id']}
+        dentistas_ids = {fila['dentista_id'] for fila in lote if fila['dentista_id']}
+        clientes_existentes = set(Cliente.objects.filter(id__in=clientes_ids).values_list('id', flat=True))
+        dentistas_existentes = set(Perfil.objects.filter(id__in=dentistas_ids).values_list('id', flat=True))
+
+        cliente_inexistente = [
+            fila['id'] for fila in lote
+            if fila['cliente_id'] and fila['cliente_id'] not in clientes_existentes
+        ]
+        dentista_inexistente = [
+            fila['id'] for fila in lote
+            if fila['dentista_id'] and fila['dentista_id'] not in dentistas_existentes
+        ]
+
+        # 3. Reservas que quedaron sin cliente y sin datos de respaldo del paciente
+        reservadas_sin_paciente = [
+            fila['id'] for fila in lote
+            if fila['estado'] == 'reservada'
+            and (not fila['cliente_id'] or fila['id'] in cliente_inexistente)
+            and not (fila['paciente_nombre'] or fila['paciente_email'] or fila['paciente_telefono'])
+        ]
+
+        resumen['cliente_inexistente'].extend(cliente_inexistente)
+        resumen['dentista_inexistente'].extend(dentista_inexistente)
+        resumen['reservadas_sin_paciente'].extend(reservadas_sin_paciente)
+
+        if dry_run:
+            return
+
+        with transaction.atomic():
+            if cliente_inexistente:
+                Cita.objects.filter(id__in=cliente_inexistente).update(cliente=None)
+            if dentista_inexistente:
+                Cita.objects.filter(id__in=dentista_inexistente).update(dentista=None)
+            if reservadas_sin_paciente:
+                Cita.objects.filter(id__in=reservadas_sin_paciente, estado='reservada').update(estado='disponible')
+
+    def _reportar(self, resumen, dry_run):
+        verbo = 'Se corregirían' if dry_run else 'Se corrigieron'
+        estilo = self.style.WARNING if dry_run else self.style.SUCCESS
+
+        self.stdout.write('\n' + '=' * 60)
+        self.stdout.write('RESUMEN:')
+        self.stdout.write(f'  - Citas revisadas: {resumen["revisadas"]:,} ({resumen["lotes"]} lote(s))')
+
+        revisiones = (
+            ('cliente_inexistente', 'cita(s) con cliente inexistente (cliente -> vacío)'),
+            ('dentista_inexistente', 'cita(s) con dentista inexistente (dentista -> vacío)'),
+            ('reservadas_sin_paciente', 'cita(s) reservada(s) sin paciente (-> disponible)'),
+        )
+        total_corregidas = 0
+        for clave, descripcion in revisiones:
+            ids = resumen[clave]
+            if not ids:
+                continue
+            total_corregidas += len(ids)
+            muestra = ', '.join(str(i) for i in ids[:20]) + (' ...' if len(ids) > 20 else '')
+            self.stdout.write(estilo(f'  - {verbo} {len(ids)} {descripcion}: IDs {muestra}'))
+            if not dry_run:
+                logger.info(f'Barrido de integridad: {len(ids)} {descripcion}')
+
+        if total_corregidas == 0:
+            self.stdout.write(self.style.SUCCESS('✓ No se encontraron problemas de integridad.'))
@@ -1,5 +1,6 @@
 from django.core.management.base import BaseCommand
 from django.contrib.auth.models import User
+from pacientes.busqueda import buscar_pacientes
 from pacientes.models import Cliente
 
 try:
@@ -10,10 +11,10 @@ except ImportError:
     PerfilCliente = None
 
 class Command(BaseCommand):
-    help = 'Busca un cliente específico por username o email'
+    help = 'Busca un cliente específico por username, email, nombre, RUT o teléfono'
 
     def add_arguments(self, parser):
-        parser.add_argument('busqueda', type=str, help='Username o email a buscar')
+        parser.add_argument('busqueda', type=str, help='Username, email, nombre, RUT o teléfono a buscar')
 
     def handle(self, *args, **options):
         busqueda = options['busqueda']
@@ -80,6 +81,19 @@ class Command(BaseCommand):
                 self.stdout.write(self.style.ERROR('   [NO ENCONTRADO] No existe Cliente con ese email'))
                 cliente = None
         
+        # 3b. Buscar por nombre, RUT o teléfono (columnas de búsqueda normalizadas)
+        if not user and not cliente:
+            self.stdout.write('\n' + self.style.WARNING('3b. BUSCANDO POR NOMBRE, RUT O TELÉFONO:'))
+            coincidencias = list(buscar_pacientes(busqueda, limite=20, solo_activos=False))
+            if not coincidencias:
+                self.stdout.write(self.style.ERROR('   [NO ENCONTRADO] Ningún Cliente coincide'))
+            for coincidencia in coincidencias:
+                estado = 'activo' if coincidencia.activo else 'inactivo'
+                self.stdout.write(
+                    f'   [ENCONTRADO] {coincidencia.nombre_completo} - {coincidencia.email} - '
+                    f'RUT: {coincidencia.rut or "No tiene"} - Tel: {coincidencia.telefono} - ID: {coincidencia.id} ({estado})'
+                )
+        
         # 4. Resumen
         self.stdout.write('\n' + self.style.SUCCESS('=== RESUMEN ==='))
         if user and perfil and not cliente:
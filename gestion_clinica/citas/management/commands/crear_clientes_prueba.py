@@ -1,5 +1,5 @@
 from django.core.management.base import BaseCommand
-from pacientes.models import Cliente
+from pacientes.importacion import importar_clientes
 from personal.models import Perfil
 from django.utils import timezone
 
@@ -44,28 +44,19 @@ class Command(BaseCommand):
         # Obtener el primer dentista disponible para asignar
         dentista = Perfil.objects.filter(rol='dentista', activo=True).first()
         
-        clientes_creados = 0
-        for datos_cliente in clientes_prueba:
-            # Verificar si el cliente ya existe
-            if not Cliente.objects.filter(email=datos_cliente['email']).exists():
-                cliente = Cliente.objects.create(
-                    nombre_completo=datos_cliente['nombre_completo'],
-                    email=datos_cliente['email'],
-                    telefono=datos_cliente['telefono'],
-                    notas=datos_cliente['notas'],
-                    dentista_asignado=dentista if dentista else None
-                )
-                clientes_creados += 1
-                self.stdout.write(
-                    self.style.SUCCESS(f'Cliente creado: {cliente.nombre_completo}')
-                )
-            else:
-                self.stdout.write(
-                    self.style.WARNING(f'Cliente ya existe: {datos_cliente["nombre_completo"]}')
-                )
+        resumen = importar_clientes(
+            list(enumerate(clientes_prueba, start=1)),
+            valores_nuevos={'dentista_asignado': dentista},
+        )
+        for error in resumen['errores']:
+            self.stdout.write(
+                self.style.ERROR(f'Error en {error["nombre"]}: {error["error"]}')
+            )
+        if resumen['omitidos']:
+            self.stdout.write(
+                self.style.WARNING(f'{resumen["omitidos"]} cliente(s) ya existían.')
+            )
 
         self.stdout.write(
-            self.style.SUCCESS(f'Se crearon {clientes_creados} clientes de prueba.')
+            self.style.SUCCESS(f'Se crearon {resumen["creados"]} clientes de prueba.')
         )
-
-
@@ -0,0 +1,130 @@
+"""
+Comando de gestión para migrar los archivos existentes al almacenamiento deduplicado.
+
+Recorre los archivos de los campos que usan AlmacenamientoDeduplicado (radiografías,
+PDFs de documentos y consentimientos, adjuntos de mensajes, imágenes de insumos),
+calcula su SHA-256 y:
+
+1. Si es el primer archivo con ese contenido, lo enlaza como blob (sin copiarlo).
+2. Si el contenido ya tiene blob, reemplaza el archivo por un enlace duro al blob y
+   el espacio del duplicado queda liberado.
+
+Los archivos ya registrados (subidos con el almacenamiento deduplicado) se omiten, así
+que el comando puede ejecutarse varias veces sin problema.
+
+Uso:
+    python manage.py deduplicar_media
+    python manage.py deduplicar_media --dry-run   # Solo calcular el espacio que se recuperaría
+"""
+
+import os
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import models
+
+from citas.almacenamiento import (
+    AlmacenamientoDeduplicado, calcular_sha256, registrar_referencia, ruta_blob,
+)
+from citas.models import ReferenciaBlob
+
+
+def _formatear_bytes(cantidad):
+    for unidad in ('B', 'KB', 'MB', 'GB'):
+        if cantidad < 1024 or unidad == 'GB':
+            return f'{cantidad:.1f} {unidad}' if unidad != 'B' else f'{cantidad} B'
+        cantidad /= 1024
+
+
+class Command(BaseCommand):
+    help = 'Deduplica por contenido (SHA-256) los archivos clínicos ya subidos y reporta el espacio recuperado'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Solo mostrar qué se deduplicaría sin modificar archivos',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        if dry_run:
+            self.stdout.write(self.style.WARNING('MODO DRY-RUN: No se harán cambios reales\n'))
+
+        campos = [
+            (modelo, campo)
+            for modelo in apps.get_models()
+            for campo in modelo._meta.get_fields()
+            if isinstance(campo, models.FileField) and isinstance(campo.storage, AlmacenamientoDeduplicado)
+        ]
+        if not campos:
+            self.stdout.write(self.style.WARNING('No hay campos con almacenamiento deduplicado (¿ALMACENAMIENTO_DEDUPLICADO=False?).'))
+            return
+
+        resumen = {'revisados': 0, 'registrados': 0, 'faltantes': 0, 'duplicados': 0, 'recuperado': 0, 'errores': 0}
+        registrados = set(ReferenciaBlob.objects.values_list('nombre', flat=True))
+        # En dry-run se simulan los blobs que se irían creando
+        blobs_simulados = set()
+
+        for modelo, campo in campos:
+            storage = campo.storage
+            nombres = (
+                modelo.objects.exclude(**{f'{campo.name}__isnull': True})
+                .exclude(**{campo.name: ''})
+                .order_by()
+                .values_list(campo.name, flat=True)
+                .distinct()
+            )
+            self.stdout.write(f'{modelo._meta.label}.{campo.name}...')
+            for nombre in nombres.iterator():
+                resumen['revisados'] += 1
+                if nombre in registrados:
+                    resumen['registrados'] += 1
+                    continue
+                ruta = storage.path(nombre)
+                if not os.path.isfile(ruta):
+                    resumen['faltantes'] += 1
+                    continue
+                try:
+                    self._deduplicar(storage, nombre, ruta, resumen, blobs_simulados, dry_run)
+                    registrados.add(nombre)
+                except OSError as e:
+                    resumen['errores'] += 1
+                    self.stdout.write(self.style.ERROR(f'  ✗ {nombre}: {e}'))
+
+        self._reportar(resumen, dry_run)
+
+    def _deduplicar(self, storage, nombre, ruta, resumen, blobs_simulados, dry_run):
+        sha256, tamano = calcular_sha256(ruta)
+        ruta_contenido = storage.path(ruta_blob(sha256))
+        existe_blob = os.path.exists(ruta_contenido) or sha256 in blobs_simulados
+
+        if existe_blob and not (os.path.exists(ruta_contenido) and os.path.samefile(ruta, ruta_contenido)):
+            resumen['duplicados'] += 1
+            resumen['recuperado'] += tamano
+            if not dry_run:
+                # Reemplazo atómico del duplicado por un enlace al blob
+                temporal = f'{ruta}.dedup'
+                os.link(ruta_contenido, temporal)
+                os.replace(temporal, ruta)
+        elif not existe_blob:
+            blobs_simulados.add(sha256)
+            if not dry_run:
+                os.makedirs(os.path.dirname(ruta_contenido), exist_ok=True)
+                os.link(ruta, ruta_contenido)
+
+        if not dry_run:
+            registrar_referencia(nombre, sha256, tamano)
+
+    def _reportar(self, resumen, dry_run):
+        verbo = 'Se recuperarían' if dry_run else 'Se recuperaron'
+        self.stdout.write('\n' + '=' * 60)
+        self.stdout.write('RESUMEN:')
+        self.stdout.write(f'  - Archivos revisados: {resumen["revisados"]:,}')
+        self.stdout.write(f'  - Ya deduplicados: {resumen["registrados"]:,}')
+        if resumen['faltantes']:
+            self.stdout.write(self.style.WARNING(f'  - Archivos que no existen en disco: {resumen["faltantes"]:,}'))
+        if resumen['errores']:
+            self.stdout.write(self.style.ERROR(f'  - Errores: {resumen["errores"]:,}'))
+        self.stdout.write(f'  - Duplicados encontrados: {resumen["duplicados"]:,}')
+        self.stdout.write(self.style.SUCCESS(f'  - {verbo} {_formatear_bytes(resumen["recuperado"])}'))
@@ -0,0 +1,158 @@
+"""
+Comando de gestión para detectar y fusionar pacientes (Cliente) duplicados.
+
+Recorre toda la tabla de clientes una vez, agrupa por claves de bloqueo (RUT, email,
+teléfono, palabras del nombre) y puntúa los pares que comparten alguna clave (ver
+pacientes/duplicados.py). Solo fusiona con --fusionar (los grupos de puntaje alto) o con
+--fusionar-par (un par revisado a mano).
+
+Uso:
+    python manage.py detectar_duplicados                              # Listar pares candidatos
+    python manage.py detectar_duplicados --minimo 60                  # Solo pares con puntaje >= 60
+    python manage.py detectar_duplicados --csv duplicados.csv         # Guardar los pares en CSV
+    python manage.py detectar_duplicados --fusionar --dry-run         # Mostrar qué se fusionaría
+    python manage.py detectar_duplicados --fusionar                   # Fusionar los de puntaje >= 80
+    python manage.py detectar_duplicados --fusionar-par 12 345        # Fusionar el 345 en el 12
+"""
+
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pacientes.duplicados import (
+    UMBRAL_CANDIDATO,
+    UMBRAL_FUSION_AUTOMATICA,
+    agrupar,
+    detectar_duplicados,
+    fusionar_clientes,
+)
+from pacientes.models import Cliente, RutDuplicado
+
+# Pares que se muestran en pantalla (el resto queda en el CSV)
+MAXIMO_PARES_EN_PANTALLA = 100
+
+
+class Command(BaseCommand):
+    help = 'Detecta pacientes duplicados y, opcionalmente, los fusiona'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--minimo',
+            type=int,
+            default=UMBRAL_CANDIDATO,
+            help=f'Puntaje mínimo de los pares informados (por defecto: {UMBRAL_CANDIDATO})',
+        )
+        parser.add_argument(
+            '--csv',
+            metavar='RUTA',
+            help='Guardar los pares candidatos en un archivo CSV',
+        )
+        parser.add_argument(
+            '--fusionar',
+            action='store_true',
+            help=f'Fusionar los pares con puntaje >= {UMBRAL_FUSION_AUTOMATICA}',
+        )
+        parser.add_argument(
+            '--fusionar-par',
+            nargs=2,
+            type=int,
+            metavar=('PRINCIPAL', 'DUPLICADO'),
+            help='Fusionar el cliente DUPLICADO en el cliente PRINCIPAL (IDs)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Solo mostrar qué se fusionaría sin hacer cambios',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        if dry_run:
+            self.stdout.write(self.style.WARNING('MODO DRY-RUN: No se harán cambios reales\n'))
+
+        if options['fusionar_par']:
+            self._fusionar_par(*options['fusionar_par'], dry_run)
+            return
+
+        total_clientes = Cliente.objects.count()
+        candidatos = detectar_duplicados(minimo=options['minimo'])
+        for candidato in candidatos[:MAXIMO_PARES_EN_PANTALLA]:
+            principal, duplicado = candidato['principal'], candidato['duplicado']
+            estilo = self.style.WARNING if candidato['puntaje'] >= UMBRAL_FUSION_AUTOMATICA else self.style.NOTICE
+            self.stdout.write(estilo(
+                f'[{candidato["puntaje"]:>3}] #{principal["id"]} {principal["nombre_completo"]} ({principal["email"]})'
+                f'  <-  #{duplicado["id"]} {duplicado["nombre_completo"]} ({duplicado["email"]})'
+                f'  coincide: {", ".join(candidato["motivos"])}'
+            ))
+        if len(candidatos) > MAXIMO_PARES_EN_PANTALLA:
+            self.stdout.write(f'... y {len(candidatos) - MAXIMO_PARES_EN_PANTALLA} par(es) más')
+
+        if options['csv']:
+            self._guardar_csv(candidatos, options['csv'])
+
+        automaticos = [candidato for candidato in candidatos if candidato['puntaje'] >= UMBRAL_FUSION_AUTOMATICA]
+        grupos = agrupar(automaticos) if options['fusionar'] else []
+        fusionados = 0
+        for principal, duplicados in grupos:
+            for duplicado in duplicados:
+                if dry_run:
+                    self.stdout.write(f'  Se fusionaría #{duplicado["id"]} en #{principal["id"]} {principal["nombre_completo"]}')
+                else:
+                    try:
+                        resumen = fusionar_clientes(Cliente(pk=principal['id']), Cliente(pk=duplicado['id']))
+                    except RutDuplicado as e:
+                        self.stdout.write(self.style.WARNING(f'  ✗ #{duplicado["id"]} no se fusionó en #{principal["id"]}: {e.message}'))
+                        continue
+                    self._mostrar_fusion(principal['id'], duplicado['id'], resumen)
+                fusionados += 1
+
+        self.stdout.write('\n' + '=' * 60)
+        self.stdout.write('RESUMEN:')
+        self.stdout.write(f'  - Clientes revisados: {total_clientes:,}')
+        self.stdout.write(f'  - Pares candidatos (puntaje >= {options["minimo"]}): {len(candidatos)}')
+        self.stdout.write(f'  - Pares de puntaje alto (>= {UMBRAL_FUSION_AUTOMATICA}): {len(automaticos)}')
+        if options['fusionar']:
+            verbo = 'Se fusionarían' if dry_run else 'Fusionados'
+            self.stdout.write(self.style.SUCCESS(f'  - {verbo}: {fusionados} cliente(s) en {len(grupos)} grupo(s)'))
+        elif automaticos:
+            self.stdout.write('  - Usa --fusionar para fusionar los pares de puntaje alto')
+
+    def _fusionar_par(self, principal_id, duplicado_id, dry_run):
+        clientes = Cliente.objects.in_bulk([principal_id, duplicado_id])
+        for cliente_id in (principal_id, duplicado_id):
+            if cliente_id not in clientes:
+                raise CommandError(f'No existe el cliente {cliente_id}')
+        if principal_id == duplicado_id:
+            raise CommandError('El principal y el duplicado deben ser clientes distintos')
+
+        principal, duplicado = clientes[principal_id], clientes[duplicado_id]
+        self.stdout.write(f'Principal: #{principal.id} {principal.nombre_completo} ({principal.email})')
+        self.stdout.write(f'Duplicado: #{duplicado.id} {duplicado.nombre_completo} ({duplicado.email})')
+        if dry_run:
+            return
+        try:
+            resumen = fusionar_clientes(principal, duplicado)
+        except RutDuplicado as e:
+            raise CommandError(e.message)
+        self._mostrar_fusion(principal_id, duplicado_id, resumen)
+
+    def _mostrar_fusion(self, principal_id, duplicado_id, resumen):
+        traspasados = ', '.join(f'{cantidad} {modelo}' for modelo, cantidad in resumen['traspasados'].items()) or 'nada'
+        self.stdout.write(self.style.SUCCESS(f'  ✓ #{duplicado_id} fusionado en #{principal_id}: {traspasados}'))
+        if resumen['campos']:
+            self.stdout.write(f'    Campos completados: {", ".join(resumen["campos"])}')
+        for modelo, cantidad in resumen['descartados'].items():
+            self.stdout.write(self.style.WARNING(f'    Descartados (el principal ya tenía): {cantidad} {modelo}'))
+
+    def _guardar_csv(self, candidatos, ruta):
+        with open(ruta, 'w', encoding='utf-8', newline='') as archivo:
+            escritor = csv.writer(archivo)
+            escritor.writerow(['puntaje', 'coincide', 'principal_id', 'principal_nombre', 'principal_email', 'duplicado_id', 'duplicado_nombre', 'duplicado_email'])
+            for candidato in candidatos:
+                principal, duplicado = candidato['principal'], candidato['duplicado']
+                escritor.writerow([
+                    candidato['puntaje'], ', '.join(candidato['motivos']),
+                    principal['id'], principal['nombre_completo'], principal['email'],
+                    duplicado['id'], duplicado['nombre_completo'], duplicado['email'],
+                ])
+        self.stdout.write(f'Pares guardados en {ruta}')
@@ -0,0 +1,95 @@
+"""
+Comando de gestión para importar pacientes masivamente desde un archivo CSV o XLSX.
+
+Columnas obligatorias: nombre, email y teléfono. Opcionales: RUT, fecha de nacimiento,
+alergias y notas (ver ENCABEZADOS en pacientes/importacion.py para los nombres aceptados).
+Las filas se validan todas antes de escribir y se guardan en lotes; las filas con error
+no detienen la importación y se informan al final (o en un CSV con --reporte).
+
+Uso:
+    python manage.py importar_clientes pacientes.xlsx
+    python manage.py importar_clientes pacientes.csv --dry-run              # Solo validar
+    python manage.py importar_clientes pacientes.csv --actualizar           # Actualizar los existentes
+    python manage.py importar_clientes pacientes.csv --reporte errores.csv  # Guardar errores por fila
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pacientes.importacion import TAMANO_LOTE, ArchivoInvalido, importar_clientes, leer_archivo, reporte_errores_csv
+
+# Errores que se muestran en pantalla (el resto queda en el reporte)
+MAXIMO_ERRORES_EN_PANTALLA = 50
+
+
+class Command(BaseCommand):
+    help = 'Importa pacientes desde un archivo CSV o XLSX'
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help='Ruta del archivo CSV o XLSX')
+        parser.add_argument(
+            '--actualizar',
+            action='store_true',
+            help='Actualizar los datos de los pacientes que ya existen (mismo email) en vez de omitirlos',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Solo validar el archivo y mostrar lo que se haría, sin guardar',
+        )
+        parser.add_argument(
+            '--reporte',
+            metavar='RUTA',
+            help='Guardar las filas con error en un archivo CSV',
+        )
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=TAMANO_LOTE,
+            help=f'Filas por lote de escritura (por defecto {TAMANO_LOTE})',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        if dry_run:
+            self.stdout.write(self.style.WARNING('MODO DRY-RUN: No se guardarán cambios\n'))
+        if options['lote'] < 1:
+            raise CommandError('--lote debe ser mayor que 0')
+
+        try:
+            with open(options['archivo'], 'rb') as archivo:
+                filas = leer_archivo(archivo, nombre=options['archivo'])
+        except OSError as e:
+            raise CommandError(f'No se pudo abrir el archivo: {e}')
+        except ArchivoInvalido as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(f'Filas leídas: {len(filas)}')
+        resumen = importar_clientes(
+            filas,
+            actualizar=options['actualizar'],
+            dry_run=dry_run,
+            tamano_lote=options['lote'],
+        )
+
+        for error in resumen['errores'][:MAXIMO_ERRORES_EN_PANTALLA]:
+            self.stdout.write(self.style.ERROR(f'  Fila {error["fila"]} ({error["email"] or error["nombre"]}): {error["error"]}'))
+        if len(resumen['errores']) > MAXIMO_ERRORES_EN_PANTALLA:
+            self.stdout.write(self.style.ERROR(f'  ... y {len(resumen["errores"]) - MAXIMO_ERRORES_EN_PANTALLA} error(es) más'))
+
+        if options['reporte'] and resumen['errores']:
+            with open(options['reporte'], 'w', encoding='utf-8', newline='') as reporte:
+                reporte.write(reporte_errores_csv(resumen))
+            self.stdout.write(f'Reporte de errores guardado en {options["reporte"]}')
+
+        self.stdout.write('\n' + '=' * 60)
+        self.stdout.write('RESUMEN:')
+        self.stdout.write(f'  - Filas procesadas: {resumen["filas"]}')
+        verbo = 'Se crearían' if dry_run else 'Creados'
+        self.stdout.write(self.style.SUCCESS(f'  - {verbo}: {resumen["creados"]} paciente(s)'))
+        verbo = 'Se actualizarían' if dry_run else 'Actualizados'
+        self.stdout.write(self.style.SUCCESS(f'  - {verbo}: {resumen["actualizados"]} paciente(s)'))
+        self.stdout.write(f'  - Omitidos (ya existían o sin cambios): {resumen["omitidos"]}')
+        if resumen['errores']:
+            self.stdout.write(self.style.ERROR(f'  - Filas con error: {len(resumen["errores"])}'))
+        else:
+            self.stdout.write(self.style.SUCCESS('  - Sin errores'))
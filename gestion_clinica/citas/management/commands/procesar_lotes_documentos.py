@@ -0,0 +1,121 @@
+"""
+Comando de gestión para procesar lotes de documentos PDF (ver citas/lotes_documentos.py).
+
+Los lotes creados desde el gestor de documentos se procesan en segundo plano dentro del
+proceso web; si éste se reinicia, el lote queda 'pendiente' o 'procesando' y este comando
+lo retoma. También permite crear un lote desde cron, p.ej. los presupuestos de fin de mes.
+
+Uso:
+    python manage.py procesar_lotes_documentos
+    python manage.py procesar_lotes_documentos --dry-run                 # Solo listar los lotes pendientes
+    python manage.py procesar_lotes_documentos --reintentar              # Retomar también los 'procesando' y 'error'
+    python manage.py procesar_lotes_documentos --ids 3 4                 # Solo estos lotes
+    python manage.py procesar_lotes_documentos --crear presupuestos activos --entrega correo
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from citas.lotes_documentos import SELECCIONES, procesar_lote, seleccionar_objetos
+from citas.models import LoteDocumentos
+
+
+class Command(BaseCommand):
+    help = 'Procesa los lotes de documentos PDF pendientes (o crea uno nuevo con --crear)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Solo mostrar qué lotes se procesarían sin generar documentos',
+        )
+        parser.add_argument(
+            '--reintentar',
+            action='store_true',
+            help="Volver a procesar los lotes que quedaron en 'procesando' o 'error'",
+        )
+        parser.add_argument(
+            '--ids',
+            nargs='+',
+            type=int,
+            help='Procesar solo los lotes con estos IDs',
+        )
+        parser.add_argument(
+            '--crear',
+            nargs=2,
+            metavar=('TIPO', 'SELECCION'),
+            help='Crear y procesar un lote nuevo. Tipos y selecciones: '
+                 + '; '.join(f'{tipo}: {", ".join(selecciones)}' for tipo, selecciones in SELECCIONES.items()),
+        )
+        parser.add_argument(
+            '--entrega',
+            choices=[valor for valor, _ in LoteDocumentos.ENTREGA_CHOICES],
+            default='zip',
+            help='Entrega del lote creado con --crear (por defecto: zip)',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        if dry_run:
+            self.stdout.write(self.style.WARNING('MODO DRY-RUN: No se generarán documentos\n'))
+
+        if options['crear']:
+            lotes = [self._crear(*options['crear'], options['entrega'], dry_run)]
+            if lotes[0] is None:
+                return
+        else:
+            estados = ['pendiente', 'procesando', 'error'] if options['reintentar'] else ['pendiente']
+            lotes = LoteDocumentos.objects.filter(estado__in=estados).order_by('creado_el')
+            if options['ids']:
+                lotes = lotes.filter(id__in=options['ids'])
+            lotes = list(lotes)
+
+        if not lotes:
+            self.stdout.write(self.style.SUCCESS('No hay lotes de documentos pendientes.'))
+            return
+
+        resumen = {'procesados': 0, 'documentos': 0, 'errores': 0, 'fallidos': 0}
+        for lote in lotes:
+            self.stdout.write(f'Lote #{lote.id or "nuevo"}: {lote.get_tipo_display()} ({lote.total} documentos, {lote.get_entrega_display()})')
+            if dry_run:
+                continue
+            if lote.estado != 'pendiente':
+                LoteDocumentos.objects.filter(pk=lote.pk).update(estado='pendiente')
+            if not procesar_lote(lote.id):
+                resumen['fallidos'] += 1
+                self.stdout.write(self.style.ERROR(f'  ✗ No se pudo procesar el lote #{lote.id}'))
+                continue
+            lote.refresh_from_db()
+            resumen['procesados'] += 1
+            resumen['documentos'] += lote.procesados - lote.errores
+            resumen['errores'] += lote.errores
+            detalle = f'  ✓ {lote.procesados - lote.errores} documento(s) generado(s)'
+            if lote.entrega == 'correo':
+                detalle += f', {lote.correos_enviados} correo(s) enviado(s)'
+            elif lote.archivo_zip:
+                detalle += f', ZIP: {lote.archivo_zip.name}'
+            self.stdout.write(self.style.SUCCESS(detalle))
+            for error in lote.detalle_errores:
+                self.stdout.write(self.style.WARNING(f'    - {error}'))
+
+        self.stdout.write('\n' + '=' * 60)
+        self.stdout.write('RESUMEN:')
+        self.stdout.write(f'  - Lotes encontrados: {len(lotes)}')
+        if not dry_run:
+            self.stdout.write(self.style.SUCCESS(f'  - Lotes procesados: {resumen["procesados"]}'))
+            self.stdout.write(f'  - Documentos generados: {resumen["documentos"]}')
+            if resumen['errores']:
+                self.stdout.write(self.style.WARNING(f'  - Documentos con error: {resumen["errores"]}'))
+            if resumen['fallidos']:
+                self.stdout.write(self.style.ERROR(f'  - Lotes fallidos: {resumen["fallidos"]}'))
+
+    def _crear(self, tipo, seleccion, entrega, dry_run):
+        if tipo not in SELECCIONES or seleccion not in SELECCIONES[tipo]:
+            raise CommandError(f'Selección no válida: {tipo} {seleccion}')
+        objetos = seleccionar_objetos(tipo, seleccion)
+        if not objetos:
+            self.stdout.write(self.style.WARNING(f'No hay documentos para "{SELECCIONES[tipo][seleccion][0]}".'))
+            return None
+        lote = LoteDocumentos(tipo=tipo, entrega=entrega, objetos=objetos, total=len(objetos))
+        if not dry_run:
+            lote.save()
+        return lote
@@ -0,0 +1,88 @@
+"""
+Comando de gestión para pronosticar el consumo de insumos y sugerir pedidos.
+
+Calcula para cada insumo la tasa de consumo, los días para agotarse (considerando las
+citas ya agendadas) y, si corresponde, la cantidad a reponer (ver inventario/pronostico.py).
+Guarda el consumo diario y los días para agotarse en cada insumo y reemplaza los pedidos
+sugeridos en borrador por uno nuevo por proveedor principal. Los borradores sugeridos que
+alguien editó se conservan y cuentan como pedidos.
+
+Debe ejecutarse una vez al día (recomendado: cada noche con cron o el programador de
+tareas del servidor).
+
+Uso:
+    python manage.py pronosticar_insumos
+    python manage.py pronosticar_insumos --dry-run       # Solo mostrar el pronóstico
+    python manage.py pronosticar_insumos --sin-pedidos   # Actualizar el pronóstico sin sugerir pedidos
+"""
+
+from django.core.management.base import BaseCommand
+
+from inventario.pronostico import HORIZONTE, generar_sugerencias, guardar_pronosticos, pronosticar
+
+# Insumos a reponer que se muestran en pantalla
+MAXIMO_INSUMOS_EN_PANTALLA = 50
+
+
+class Command(BaseCommand):
+    help = 'Pronostica el consumo de insumos y genera pedidos sugeridos en borrador'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Solo mostrar el pronóstico sin guardar nada ni crear pedidos',
+        )
+        parser.add_argument(
+            '--sin-pedidos',
+            action='store_true',
+            help='Guardar el pronóstico sin generar pedidos sugeridos',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING('MODO DRY-RUN: No se harán cambios reales\n'))
+
+        pronosticos = pronosticar()
+        a_reponer = sorted(
+            (p for p in pronosticos if p['cantidad_sugerida']),
+            key=lambda p: (p['dias_para_agotarse'] is None, p['dias_para_agotarse'] or 0),
+        )
+
+        for pronostico in a_reponer[:MAXIMO_INSUMOS_EN_PANTALLA]:
+            insumo = pronostico['insumo']
+            dias = pronostico['dias_para_agotarse']
+            agotamiento = f'se agota en {dias} día(s)' if dias is not None else f'alcanza para más de {HORIZONTE} días'
+            estilo = self.style.ERROR if dias is not None and dias <= 7 else self.style.WARNING
+            self.stdout.write(estilo(
+                f'  {insumo.nombre}: stock {insumo.cantidad_actual}, '
+                f'consumo {pronostico["tasa_diaria"]:.2f}/día, {agotamiento} '
+                f'-> pedir {pronostico["cantidad_sugerida"]} {insumo.unidad_medida}'
+            ))
+        if len(a_reponer) > MAXIMO_INSUMOS_EN_PANTALLA:
+            self.stdout.write(f'  ... y {len(a_reponer) - MAXIMO_INSUMOS_EN_PANTALLA} insumo(s) más')
+
+        resultado = None
+        if not dry_run:
+            guardar_pronosticos(pronosticos)
+            if not options['sin_pedidos']:
+                resultado = generar_sugerencias(pronosticos)
+
+        self.stdout.write('\n' + '=' * 60)
+        self.stdout.write('RESUMEN:')
+        self.stdout.write(f'  - Insumos pronosticados: {len(pronosticos)}')
+        agotandose = sum(1 for p in pronosticos if p['dias_para_agotarse'] is not None)
+        self.stdout.write(f'  - Se agotan dentro de {HORIZONTE} días: {agotandose}')
+        self.stdout.write(f'  - A reponer: {len(a_reponer)}')
+        if resultado is not None:
+            self.stdout.write(self.style.SUCCESS(f'  - Pedidos sugeridos creados: {len(resultado["pedidos"])}'))
+            for pedido in resultado['pedidos']:
+                self.stdout.write(f'      {pedido.numero_pedido} ({pedido.proveedor.nombre})')
+            if resultado['sin_proveedor']:
+                self.stdout.write(self.style.WARNING(
+                    f'  - Insumos a reponer sin proveedor principal: {len(resultado["sin_proveedor"])}'
+                ))
+                for pronostico in resultado['sin_proveedor']:
+                    self.stdout.write(f'      {pronostico["insumo"].nombre}')
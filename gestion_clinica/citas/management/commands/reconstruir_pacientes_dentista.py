@@ -0,0 +1,71 @@
+"""
+Comando de gestión para reconstruir la relación dentista-paciente (modelo DentistaPaciente).
+
+La relación se mantiene sola al guardar o eliminar citas (ver citas/asignaciones.py),
+pero los cambios masivos que no pasan por Cita.save() -QuerySet.update(), el borrado
+de un cliente, el barrido de integridad o cargas por SQL- pueden dejarla desfasada.
+Este comando la recalcula desde las citas.
+
+Debe ejecutarse al desplegar por primera vez (para poblar la tabla) y después
+periódicamente (recomendado: una vez por noche con cron o el programador de tareas).
+
+Uso:
+    python manage.py reconstruir_pacientes_dentista
+    python manage.py reconstruir_pacientes_dentista --dry-run         # Solo mostrar diferencias
+    python manage.py reconstruir_pacientes_dentista --dentista 3 7    # Solo estos dentistas
+"""
+
+from django.core.management.base import BaseCommand
+
+from citas.asignaciones import reconstruir_asignaciones
+from citas.models import DentistaPaciente
+from personal.models import Perfil
+
+
+class Command(BaseCommand):
+    help = 'Recalcula la relación dentista-paciente desde las citas'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Solo mostrar cuántas filas cambiarían sin modificar la tabla',
+        )
+        parser.add_argument(
+            '--dentista',
+            nargs='+',
+            type=int,
+            help='Reconstruir solo los pacientes de estos dentistas (IDs de Perfil)',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        if dry_run:
+            self.stdout.write(self.style.WARNING('MODO DRY-RUN: No se modificará la tabla\n'))
+
+        dentistas = None
+        if options['dentista']:
+            dentistas = list(Perfil.objects.filter(id__in=options['dentista'], rol='dentista'))
+            if not dentistas:
+                self.stdout.write(self.style.WARNING('No se encontraron dentistas con esos IDs.'))
+                return
+            for dentista in dentistas:
+                self.stdout.write(f'Dentista: {dentista.nombre_completo} (ID: {dentista.id})')
+
+        filas_antes = DentistaPaciente.objects.filter(dentista__in=dentistas).count() if dentistas else DentistaPaciente.objects.count()
+        resumen = reconstruir_asignaciones(dentistas=dentistas, dry_run=dry_run)
+
+        self.stdout.write('\n' + '=' * 60)
+        self.stdout.write('RESUMEN:')
+        self.stdout.write(f'  - Filas antes: {filas_antes}')
+        self.stdout.write(f'  - Filas calculadas desde las citas: {resumen["filas"]}')
+        if resumen['creadas'] or resumen['eliminadas']:
+            estilo = self.style.WARNING if dry_run else self.style.SUCCESS
+            verbo = 'Se agregarían' if dry_run else 'Agregadas'
+            self.stdout.write(estilo(f'  - {verbo}: {resumen["creadas"]} relación(es) nueva(s)'))
+            verbo = 'Se eliminarían' if dry_run else 'Eliminadas'
+            self.stdout.write(estilo(f'  - {verbo}: {resumen["eliminadas"]} relación(es) sin citas'))
+        else:
+            self.stdout.write(self.style.SUCCESS('  - Sin relaciones nuevas ni sobrantes'))
+        if not dry_run:
+            self.stdout.write(self.style.SUCCESS('  - Conteos y fechas recalculados'))
@@ -1,91 +1,103 @@
+"""
+Comando de gestión para sincronizar citas, clientes y perfiles del portal web.
+
+La sincronización es incremental (ver citas/sincronizacion_clientes.py): cada ejecución
+solo revisa las citas, clientes y perfiles del portal modificados desde la anterior, en
+lotes, y guarda su marca de agua tras cada lote para poder reanudar si se interrumpe.
+
+1. Perfiles nuevos del portal -> clientes
+2. Citas con email y sin cliente -> se vinculan al cliente (o se crea)
+3. Clientes modificados -> datos de contacto de sus citas pendientes y de su perfil web
+
+Debe ejecutarse periódicamente (recomendado: cada minuto con cron o el programador de
+tareas del servidor). Dos ejecuciones simultáneas no procesan el mismo lote.
+
+Uso:
+    python manage.py sincronizar_clientes
+    python manage.py sincronizar_clientes --dry-run     # Solo mostrar qué se haría
+    python manage.py sincronizar_clientes --completo    # Ignorar las marcas de agua
+    python manage.py sincronizar_clientes --lote 1000   # Tamaño de lote
+"""
+
 from django.core.management.base import BaseCommand
-from pacientes.models import Cliente
-from citas.models import Cita
-from django.db import transaction
+
+from citas.sincronizacion_clientes import (
+    TAMANO_LOTE,
+    sincronizar_citas,
+    sincronizar_clientes_modificados,
+    sincronizar_portal,
+)
+
+# Errores del portal que se muestran en pantalla
+MAXIMO_ERRORES_EN_PANTALLA = 20
+
 
 class Command(BaseCommand):
-    help = 'Sincroniza clientes desde las citas existentes hacia el modelo Cliente'
+    help = 'Sincroniza incrementalmente las citas, los clientes y los perfiles del portal web'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Solo mostrar qué se haría sin hacer cambios (no avanza las marcas de agua)',
+        )
+        parser.add_argument(
+            '--completo',
+            action='store_true',
+            help='Revisar todo ignorando las marcas de agua',
+        )
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=TAMANO_LOTE,
+            help=f'Número de filas por lote (por defecto: {TAMANO_LOTE})',
+        )
 
     def handle(self, *args, **options):
-        self.stdout.write(self.style.WARNING('Iniciando sincronización de clientes...'))
-        
-        # Obtener todas las citas que tienen información de paciente
-        citas_con_paciente = Cita.objects.filter(
-            paciente_email__isnull=False
-        ).exclude(
-            paciente_email=''
-        ).order_by('creada_el')
-        
-        clientes_creados = 0
-        clientes_actualizados = 0
-        clientes_vinculados = 0
-        
-        # Diccionario para rastrear emails procesados en esta ejecución
-        emails_procesados = {}
-        
-        with transaction.atomic():
-            for cita in citas_con_paciente:
-                email = cita.paciente_email
-                
-                # Si ya procesamos este email en esta ejecución, solo vincular la cita
-                if email in emails_procesados:
-                    cliente = emails_procesados[email]
-                    if not cita.cliente:
-                        cita.cliente = cliente
-                        cita.save(update_fields=['cliente'])
-                        clientes_vinculados += 1
-                    continue
-                
-                # Buscar o crear el cliente
-                cliente, created = Cliente.objects.get_or_create(
-                    email=email,
-                    defaults={
-                        'nombre_completo': cita.paciente_nombre or 'Sin nombre',
-                        'telefono': cita.paciente_telefono or '',
-                        'activo': True,
-                        'notas': f'Cliente sincronizado automáticamente desde cita {cita.id}'
-                    }
-                )
-                
-                # Guardar en el diccionario
-                emails_procesados[email] = cliente
-                
-                if created:
-                    clientes_creados += 1
-                    self.stdout.write(
-                        self.style.SUCCESS(f'✓ Cliente creado: {cliente.nombre_completo} ({cliente.email})')
-                    )
-                else:
-                    # Actualizar información si el cliente ya existe
-                    actualizado = False
-                    if not cliente.nombre_completo or cliente.nombre_completo == 'Sin nombre':
-                        cliente.nombre_completo = cita.paciente_nombre or 'Sin nombre'
-                        actualizado = True
-                    if not cliente.telefono and cita.paciente_telefono:
-                        cliente.telefono = cita.paciente_telefono
-                        actualizado = True
-                    
-                    if actualizado:
-                        cliente.save()
-                        clientes_actualizados += 1
-                        self.stdout.write(
-                            self.style.WARNING(f'↻ Cliente actualizado: {cliente.nombre_completo}')
-                        )
-                
-                # Vincular la cita con el cliente si no está vinculada
-                if not cita.cliente:
-                    cita.cliente = cliente
-                    cita.save(update_fields=['cliente'])
-                    clientes_vinculados += 1
-        
-        # Resumen
-        self.stdout.write('\n' + '='*60)
-        self.stdout.write(self.style.SUCCESS('✓ Sincronización completada'))
-        self.stdout.write('='*60)
-        self.stdout.write(f'Clientes creados:     {clientes_creados}')
-        self.stdout.write(f'Clientes actualizados: {clientes_actualizados}')
-        self.stdout.write(f'Citas vinculadas:      {clientes_vinculados}')
-        self.stdout.write(f'Total citas procesadas: {citas_con_paciente.count()}')
-        self.stdout.write('='*60)
+        dry_run = options['dry_run']
+        opciones = {
+            'tamano_lote': max(options['lote'], 1),
+            'dry_run': dry_run,
+            'completo': options['completo'],
+        }
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING('MODO DRY-RUN: No se harán cambios reales\n'))
+        if options['completo']:
+            self.stdout.write('Sincronización completa: se revisará todo.')
+
+        portal = sincronizar_portal(**opciones)
+        citas = sincronizar_citas(**opciones)
+        clientes = sincronizar_clientes_modificados(**opciones)
+
+        estilo = self.style.WARNING if dry_run else self.style.SUCCESS
+
+        self.stdout.write('\n' + '=' * 60)
+        self.stdout.write('RESUMEN:')
+
+        if portal is None:
+            self.stdout.write('  - Portal web: tabla de perfiles no disponible (omitido)')
+        else:
+            self.stdout.write(f'  - Perfiles del portal revisados: {portal["revisadas"]:,}')
+            verbo = 'Se crearían' if dry_run else 'Creados'
+            self.stdout.write(estilo(f'      {verbo}: {portal["creados"]} cliente(s)'))
+            verbo = 'Se actualizarían' if dry_run else 'Actualizados'
+            self.stdout.write(estilo(f'      {verbo}: {portal["actualizados"]} cliente(s)'))
+            if portal['errores']:
+                self.stdout.write(self.style.ERROR(f'      Perfiles con datos no válidos: {portal["errores"]}'))
+                for error in portal['detalle_errores'][:MAXIMO_ERRORES_EN_PANTALLA]:
+                    self.stdout.write(self.style.ERROR(f'        Perfil {error["fila"]} ({error["email"]}): {error["error"]}'))
 
+        self.stdout.write(f'  - Citas sin cliente revisadas: {citas["revisadas"]:,} ({citas["lotes"]} lote(s))')
+        verbo = 'Se vincularían' if dry_run else 'Vinculadas'
+        self.stdout.write(estilo(f'      {verbo}: {citas["citas_vinculadas"]} cita(s)'))
+        verbo = 'Se crearían' if dry_run else 'Creados'
+        self.stdout.write(estilo(f'      {verbo}: {citas["clientes_creados"]} cliente(s)'))
+        verbo = 'Se completarían' if dry_run else 'Completados'
+        self.stdout.write(estilo(f'      {verbo}: {citas["clientes_actualizados"]} cliente(s) sin nombre o teléfono'))
 
+        self.stdout.write(f'  - Clientes modificados revisados: {clientes["revisadas"]:,} ({clientes["lotes"]} lote(s))')
+        verbo = 'Se actualizarían' if dry_run else 'Actualizadas'
+        self.stdout.write(estilo(f'      {verbo}: {clientes["citas_actualizadas"]} cita(s) pendiente(s)'))
+        verbo = 'Se actualizarían' if dry_run else 'Actualizados'
+        self.stdout.write(estilo(f'      {verbo}: {clientes["perfiles_actualizados"]} perfil(es) del portal'))
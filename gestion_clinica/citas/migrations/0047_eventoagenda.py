@@ -0,0 +1,35 @@
+# Generated by Django 5.2.5 on 2026-10-18 21:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0046_fix_remaining_cliente_foreign_keys'),
+        ('personal', '0002_alter_perfil_telefono'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventoAgenda',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('reservada', 'Reservada'), ('en_espera', 'Paciente Llegó'), ('listo_para_atender', 'Listo para Atender'), ('en_progreso', 'En Progreso'), ('finalizada', 'Finalizada'), ('completada', 'Completada'), ('no_show', 'No Llegó'), ('cancelada', 'Cancelada'), ('reagendada', 'Reagendada'), ('actualizada', 'Actualizada')], max_length=20, verbose_name='Tipo de Evento')),
+                ('estado', models.CharField(max_length=20, verbose_name='Estado de la Cita')),
+                ('fecha_cita', models.DateTimeField(verbose_name='Fecha y Hora de la Cita')),
+                ('datos', models.JSONField(blank=True, default=dict, verbose_name='Datos del Evento')),
+                ('fecha_evento', models.DateTimeField(auto_now_add=True, verbose_name='Fecha del Evento')),
+                ('cita', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='eventos_agenda', to='citas.cita', verbose_name='Cita')),
+                ('dentista', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='eventos_agenda', to='personal.perfil', verbose_name='Dentista')),
+                ('realizado_por', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='eventos_agenda_realizados', to='personal.perfil', verbose_name='Realizado por')),
+            ],
+            options={
+                'verbose_name': 'Evento de Agenda',
+                'verbose_name_plural': 'Eventos de Agenda',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['fecha_evento'], name='citas_event_fecha_e_40a4cb_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.5 on 2026-10-18 21:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0047_eventoagenda'),
+        ('historial_clinico', '0012_agregar_documento_firmado_fisico'),
+        ('pacientes', '0003_add_user_field_to_cliente'),
+        ('personal', '0002_alter_perfil_telefono'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cita',
+            index=models.Index(fields=['dentista', 'fecha_hora'], name='citas_cita_dentista_fecha_idx'),
+        ),
+    ]
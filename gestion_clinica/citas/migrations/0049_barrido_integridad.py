@@ -0,0 +1,35 @@
+# Generated by Django 5.2.5 on 2026-10-18 21:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0048_cita_indice_dentista_fecha'),
+        ('historial_clinico', '0012_agregar_documento_firmado_fisico'),
+        ('pacientes', '0003_add_user_field_to_cliente'),
+        ('personal', '0002_alter_perfil_telefono'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MarcaBarridoIntegridad',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=50, unique=True, verbose_name='Nombre del Barrido')),
+                ('marca_actualizacion', models.DateTimeField(blank=True, null=True, verbose_name='Última Actualización Revisada')),
+                ('ultimo_id', models.PositiveIntegerField(default=0, verbose_name='Último ID Revisado')),
+                ('ultima_ejecucion', models.DateTimeField(blank=True, null=True, verbose_name='Última Ejecución')),
+                ('resumen', models.JSONField(blank=True, default=dict, verbose_name='Resumen de la Última Ejecución')),
+            ],
+            options={
+                'verbose_name': 'Marca de Barrido de Integridad',
+                'verbose_name_plural': 'Marcas de Barrido de Integridad',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='cita',
+            index=models.Index(fields=['actualizada_el', 'id'], name='citas_cita_actualizada_idx'),
+        ),
+    ]
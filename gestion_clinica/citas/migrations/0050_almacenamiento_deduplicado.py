@@ -0,0 +1,42 @@
+# Generated by Django 5.2.5 on 2026-10-18 21:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0049_barrido_integridad'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BlobArchivo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True, verbose_name='SHA-256')),
+                ('ruta', models.CharField(max_length=255, verbose_name='Ruta del Blob')),
+                ('tamano', models.BigIntegerField(default=0, verbose_name='Tamaño (bytes)')),
+                ('referencias', models.PositiveIntegerField(default=0, verbose_name='Referencias')),
+                ('creado_el', models.DateTimeField(auto_now_add=True, verbose_name='Creado el')),
+            ],
+            options={
+                'verbose_name': 'Blob de Archivo',
+                'verbose_name_plural': 'Blobs de Archivos',
+            },
+        ),
+        migrations.CreateModel(
+            name='ReferenciaBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=255, unique=True, verbose_name='Nombre del Archivo')),
+                ('creado_el', models.DateTimeField(auto_now_add=True, verbose_name='Creado el')),
+                ('blob', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archivos', to='citas.blobarchivo', verbose_name='Blob')),
+            ],
+            options={
+                'verbose_name': 'Referencia a Blob',
+                'verbose_name_plural': 'Referencias a Blobs',
+            },
+        ),
+    ]
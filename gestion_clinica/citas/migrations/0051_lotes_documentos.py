@@ -0,0 +1,40 @@
+# Generated by Django 5.2.5 on 2026-10-18 22:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0050_almacenamiento_deduplicado'),
+        ('personal', '0002_alter_perfil_telefono'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LoteDocumentos',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('presupuestos', 'Presupuestos de Tratamiento'), ('consentimientos', 'Consentimientos Informados')], max_length=20, verbose_name='Tipo de Documento')),
+                ('entrega', models.CharField(choices=[('zip', 'Archivo ZIP'), ('correo', 'Un correo por paciente')], default='zip', max_length=10, verbose_name='Entrega')),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('procesando', 'Procesando'), ('completado', 'Completado'), ('error', 'Error')], default='pendiente', max_length=20, verbose_name='Estado')),
+                ('objetos', models.JSONField(default=list, verbose_name='Objetos del Lote')),
+                ('total', models.PositiveIntegerField(default=0, verbose_name='Total de Documentos')),
+                ('procesados', models.PositiveIntegerField(default=0, verbose_name='Documentos Procesados')),
+                ('errores', models.PositiveIntegerField(default=0, verbose_name='Documentos con Error')),
+                ('detalle_errores', models.JSONField(blank=True, default=list, verbose_name='Detalle de Errores')),
+                ('correos_enviados', models.PositiveIntegerField(default=0, verbose_name='Correos Enviados')),
+                ('archivo_zip', models.FileField(blank=True, null=True, upload_to='documentos/lotes/%Y/%m/', verbose_name='Archivo ZIP')),
+                ('creado_el', models.DateTimeField(auto_now_add=True, verbose_name='Creado el')),
+                ('iniciado_el', models.DateTimeField(blank=True, null=True, verbose_name='Iniciado el')),
+                ('terminado_el', models.DateTimeField(blank=True, null=True, verbose_name='Terminado el')),
+                ('creado_por', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='lotes_documentos', to='personal.perfil', verbose_name='Creado por')),
+            ],
+            options={
+                'verbose_name': 'Lote de Documentos',
+                'verbose_name_plural': 'Lotes de Documentos',
+                'ordering': ['-creado_el'],
+            },
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.5 on 2026-10-18 22:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0051_lotes_documentos'),
+        ('historial_clinico', '0016_estadodiente_caras_metadata'),
+        ('pacientes', '0003_add_user_field_to_cliente'),
+        ('personal', '0002_alter_perfil_telefono'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cita',
+            index=models.Index(fields=['cliente', '-fecha_hora'], name='citas_cita_cliente_fecha_idx'),
+        ),
+    ]
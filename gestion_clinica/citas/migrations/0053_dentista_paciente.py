@@ -0,0 +1,108 @@
+# Generated by Django 5.2.5 on 2026-10-18 22:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Max, Min, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce, Lower
+
+
+def llenar_pacientes_dentista(apps, schema_editor):
+    """
+    Calcula la relación desde las citas existentes. Es una copia de
+    citas.asignaciones.reconstruir_asignaciones tal como era al crear esta migración.
+    """
+    Cita = apps.get_model('citas', 'Cita')
+    Cliente = apps.get_model('pacientes', 'Cliente')
+    DentistaPaciente = apps.get_model('citas', 'DentistaPaciente')
+
+    cliente_por_email = Cliente.objects.filter(email__iexact=OuterRef('paciente_email')).order_by('id').values('id')[:1]
+    citas = Cita.objects.filter(
+        dentista__isnull=False,
+    ).exclude(
+        estado='disponible',
+    ).filter(
+        Q(cliente__isnull=False) | (Q(paciente_email__isnull=False) & ~Q(paciente_email=''))
+    ).annotate(
+        cliente_resuelto=Coalesce('cliente_id', Subquery(cliente_por_email)),
+        email_normalizado=Lower('paciente_email'),
+    )
+    grupos = citas.order_by().values('dentista_id', 'cliente_resuelto', 'email_normalizado').annotate(
+        total=Count('id'),
+        completadas=Count('id', filter=Q(estado='completada')),
+        primera=Min('fecha_hora'),
+        ultima=Max('fecha_hora'),
+    )
+
+    filas = {}
+    for grupo in grupos:
+        # Las citas con cliente se agrupan solo por cliente, aunque tengan emails distintos
+        clave = (grupo['dentista_id'], grupo['cliente_resuelto'], None if grupo['cliente_resuelto'] else grupo['email_normalizado'])
+        fila = filas.get(clave)
+        if fila is None:
+            filas[clave] = DentistaPaciente(
+                dentista_id=clave[0],
+                cliente_id=clave[1],
+                paciente_email=clave[2] or '',
+                primera_cita=grupo['primera'],
+                ultima_cita=grupo['ultima'],
+                total_citas=grupo['total'],
+                citas_completadas=grupo['completadas'],
+            )
+            continue
+        fila.primera_cita = min(fila.primera_cita, grupo['primera'])
+        fila.ultima_cita = max(fila.ultima_cita, grupo['ultima'])
+        fila.total_citas += grupo['total']
+        fila.citas_completadas += grupo['completadas']
+
+    # Datos de contacto de los pacientes sin cliente: los de su cita más reciente
+    pendientes = {clave for clave in filas if clave[1] is None}
+    if pendientes:
+        recientes = citas.filter(cliente_resuelto__isnull=True).order_by('-fecha_hora').values(
+            'dentista_id', 'email_normalizado', 'paciente_nombre', 'paciente_telefono',
+        )
+        for cita in recientes.iterator():
+            clave = (cita['dentista_id'], None, cita['email_normalizado'])
+            if clave in pendientes:
+                filas[clave].paciente_nombre = (cita['paciente_nombre'] or '')[:150]
+                filas[clave].paciente_telefono = (cita['paciente_telefono'] or '')[:20]
+                pendientes.discard(clave)
+                if not pendientes:
+                    break
+
+    DentistaPaciente.objects.bulk_create(list(filas.values()), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0052_indices_linea_tiempo'),
+        ('pacientes', '0003_add_user_field_to_cliente'),
+        ('personal', '0002_alter_perfil_telefono'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DentistaPaciente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('paciente_email', models.EmailField(blank=True, default='', max_length=254, verbose_name='Email del Paciente')),
+                ('paciente_nombre', models.CharField(blank=True, default='', max_length=150, verbose_name='Nombre del Paciente')),
+                ('paciente_telefono', models.CharField(blank=True, default='', max_length=20, verbose_name='Teléfono del Paciente')),
+                ('primera_cita', models.DateTimeField(verbose_name='Primera Cita')),
+                ('ultima_cita', models.DateTimeField(verbose_name='Última Cita')),
+                ('total_citas', models.PositiveIntegerField(default=0, verbose_name='Total de Citas')),
+                ('citas_completadas', models.PositiveIntegerField(default=0, verbose_name='Citas Completadas')),
+                ('actualizado_el', models.DateTimeField(auto_now=True, verbose_name='Actualizado el')),
+                ('cliente', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='dentistas_asignados', to='pacientes.cliente', verbose_name='Cliente')),
+                ('dentista', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pacientes_con_citas', to='personal.perfil', verbose_name='Dentista')),
+            ],
+            options={
+                'verbose_name': 'Paciente de Dentista',
+                'verbose_name_plural': 'Pacientes de Dentistas',
+                'ordering': ['-ultima_cita'],
+                'indexes': [models.Index(fields=['dentista', '-ultima_cita'], name='citas_denti_dentist_50c7f0_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('cliente__isnull', False)), fields=('dentista', 'cliente'), name='dentista_paciente_cliente_unico'), models.UniqueConstraint(condition=models.Q(('cliente__isnull', True)), fields=('dentista', 'paciente_email'), name='dentista_paciente_email_unico')],
+            },
+        ),
+        migrations.RunPython(llenar_pacientes_dentista, migrations.RunPython.noop),
+    ]
@@ -5,6 +5,21 @@ from personal.models import Perfil
 # Importar modelo de auditoría
 from .models_auditoria import AuditoriaLog, registrar_auditoria
 
+# Importar bus de eventos de la agenda
+from .models_eventos import EventoAgenda, publicar_evento_agenda
+
+# Importar marca de agua del barrido de integridad
+from .models_integridad import MarcaBarridoIntegridad
+
+# Importar blobs del almacenamiento deduplicado de archivos
+from .models_almacenamiento import BlobArchivo, ReferenciaBlob
+
+# Importar lotes de generación de documentos PDF
+from .models_lotes import LoteDocumentos
+
+# Importar relación materializada dentista-paciente
+from .models_asignaciones import DentistaPaciente
+
 
 # Citas disponibles o tomadas
 class Cita(models.Model):
@@ -126,7 +141,38 @@ class Cita(models.Model):
         related_name='citas',
         verbose_name="Fase del Tratamiento"
     )
-    
+
+    class Meta:
+        # fecha_hora ya tiene índice por ser única; este cubre el feed del calendario filtrado por dentista
+        indexes = [
+            models.Index(fields=['dentista', 'fecha_hora'], name='citas_cita_dentista_fecha_idx'),
+            # Recorrido incremental del barrido de integridad (marca de agua sobre actualizada_el)
+            models.Index(fields=['actualizada_el', 'id'], name='citas_cita_actualizada_idx'),
+            # Historial del cliente (perfil y línea de tiempo clínica)
+            models.Index(fields=['cliente', '-fecha_hora'], name='citas_cita_cliente_fecha_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        # Datos con que está guardada, para saber si cambió la relación dentista-paciente
+        from .asignaciones import datos_asignacion
+        instancia._asignacion_guardada = datos_asignacion(instancia)
+        return instancia
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        from .asignaciones import actualizar_asignaciones_cita, datos_asignacion
+        actualizar_asignaciones_cita(self, getattr(self, '_asignacion_guardada', None))
+        self._asignacion_guardada = datos_asignacion(self)
+
+    def delete(self, *args, **kwargs):
+        anterior = getattr(self, '_asignacion_guardada', None)
+        resultado = super().delete(*args, **kwargs)
+        from .asignaciones import actualizar_asignaciones_cita
+        actualizar_asignaciones_cita(self, anterior)
+        return resultado
+
     @property
     def disponible(self):
         return self.estado == 'disponible'
@@ -0,0 +1,37 @@
+from django.db import models
+
+
+class BlobArchivo(models.Model):
+    """
+    Contenido único de un archivo subido, identificado por su SHA-256
+    (ver citas/almacenamiento.py). Varios archivos con el mismo contenido comparten
+    un solo blob en disco.
+    """
+
+    sha256 = models.CharField(max_length=64, unique=True, verbose_name="SHA-256")
+    ruta = models.CharField(max_length=255, verbose_name="Ruta del Blob")
+    tamano = models.BigIntegerField(default=0, verbose_name="Tamaño (bytes)")
+    referencias = models.PositiveIntegerField(default=0, verbose_name="Referencias")
+    creado_el = models.DateTimeField(auto_now_add=True, verbose_name="Creado el")
+
+    class Meta:
+        verbose_name = "Blob de Archivo"
+        verbose_name_plural = "Blobs de Archivos"
+
+    def __str__(self):
+        return f"{self.sha256[:12]} ({self.referencias} ref.)"
+
+
+class ReferenciaBlob(models.Model):
+    """Archivo guardado (nombre en el FileField) que apunta a un blob"""
+
+    nombre = models.CharField(max_length=255, unique=True, verbose_name="Nombre del Archivo")
+    blob = models.ForeignKey(BlobArchivo, on_delete=models.CASCADE, related_name='archivos', verbose_name="Blob")
+    creado_el = models.DateTimeField(auto_now_add=True, verbose_name="Creado el")
+
+    class Meta:
+        verbose_name = "Referencia a Blob"
+        verbose_name_plural = "Referencias a Blobs"
+
+    def __str__(self):
+        return f"{self.nombre} -> {self.blob.sha256[:12]}"
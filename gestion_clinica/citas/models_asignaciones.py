@@ -0,0 +1,76 @@
+from django.db import models
+from personal.models import Perfil
+from pacientes.models import Cliente
+
+
+class DentistaPaciente(models.Model):
+    """
+    Relación materializada dentista <-> paciente (ver citas/asignaciones.py).
+
+    Una fila por cada paciente que tuvo citas con el dentista, con la primera y última
+    cita y los conteos. Se mantiene al guardar o eliminar citas, de modo que "Mis
+    pacientes" y los filtros por pacientes vinculados son una consulta por índice en vez
+    de recorrer todas las citas del dentista.
+
+    Las citas antiguas sin cliente asociado se agrupan por email (en minúsculas) si no
+    existe un cliente con ese email; en ese caso `cliente` queda vacío y los datos de
+    contacto salen de la cita más reciente.
+    """
+
+    dentista = models.ForeignKey(
+        Perfil,
+        on_delete=models.CASCADE,
+        related_name='pacientes_con_citas',
+        verbose_name="Dentista"
+    )
+    cliente = models.ForeignKey(
+        Cliente,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='dentistas_asignados',
+        verbose_name="Cliente"
+    )
+
+    # Solo para pacientes sin cliente en el sistema
+    paciente_email = models.EmailField(blank=True, default='', verbose_name="Email del Paciente")
+    paciente_nombre = models.CharField(max_length=150, blank=True, default='', verbose_name="Nombre del Paciente")
+    paciente_telefono = models.CharField(max_length=20, blank=True, default='', verbose_name="Teléfono del Paciente")
+
+    primera_cita = models.DateTimeField(verbose_name="Primera Cita")
+    ultima_cita = models.DateTimeField(verbose_name="Última Cita")
+    total_citas = models.PositiveIntegerField(default=0, verbose_name="Total de Citas")
+    citas_completadas = models.PositiveIntegerField(default=0, verbose_name="Citas Completadas")
+
+    actualizado_el = models.DateTimeField(auto_now=True, verbose_name="Actualizado el")
+
+    class Meta:
+        verbose_name = "Paciente de Dentista"
+        verbose_name_plural = "Pacientes de Dentistas"
+        ordering = ['-ultima_cita']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['dentista', 'cliente'],
+                condition=models.Q(cliente__isnull=False),
+                name='dentista_paciente_cliente_unico',
+            ),
+            models.UniqueConstraint(
+                fields=['dentista', 'paciente_email'],
+                condition=models.Q(cliente__isnull=True),
+                name='dentista_paciente_email_unico',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['dentista', '-ultima_cita']),
+        ]
+
+    def __str__(self):
+        return f"{self.dentista.nombre_completo} - {self.nombre_completo}"
+
+    @property
+    def nombre_completo(self):
+        return self.cliente.nombre_completo if self.cliente_id else self.paciente_nombre
+
+    @property
+    def email(self):
+        return self.cliente.email if self.cliente_id else self.paciente_email
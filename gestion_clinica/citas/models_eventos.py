@@ -0,0 +1,134 @@
+from django.db import models
+from django.utils import timezone
+from personal.models import Perfil
+
+
+class EventoAgenda(models.Model):
+    """
+    Bus de eventos de la agenda respaldado en base de datos.
+
+    Cada cambio de estado de una cita (reserva, llegada, listo para atender, etc.)
+    queda registrado con un ID incremental. Las pantallas de recepción, dentistas y
+    box se suscriben al stream (SSE o long-poll) pidiendo los eventos posteriores al
+    último ID recibido, en lugar de volver a pedir todas las citas del día.
+
+    Al estar en la base de datos funciona con varios workers de gunicorn/uvicorn.
+    """
+
+    TIPO_CHOICES = (
+        ('reservada', 'Reservada'),
+        ('en_espera', 'Paciente Llegó'),
+        ('listo_para_atender', 'Listo para Atender'),
+        ('en_progreso', 'En Progreso'),
+        ('finalizada', 'Finalizada'),
+        ('completada', 'Completada'),
+        ('no_show', 'No Llegó'),
+        ('cancelada', 'Cancelada'),
+        ('reagendada', 'Reagendada'),
+        ('actualizada', 'Actualizada'),
+    )
+
+    cita = models.ForeignKey(
+        'citas.Cita',
+        on_delete=models.CASCADE,
+        related_name='eventos_agenda',
+        verbose_name="Cita"
+    )
+    tipo = models.CharField(max_length=20, choices=TIPO_CHOICES, verbose_name="Tipo de Evento")
+
+    # Copia del estado y del dentista al momento del evento (permite filtrar sin JOIN)
+    estado = models.CharField(max_length=20, verbose_name="Estado de la Cita")
+    dentista = models.ForeignKey(
+        Perfil,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='eventos_agenda',
+        verbose_name="Dentista"
+    )
+    fecha_cita = models.DateTimeField(verbose_name="Fecha y Hora de la Cita")
+
+    # Datos compactos para que el cliente actualice la tarjeta sin pedir la cita completa
+    datos = models.JSONField(default=dict, blank=True, verbose_name="Datos del Evento")
+
+    realizado_por = models.ForeignKey(
+        Perfil,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='eventos_agenda_realizados',
+        verbose_name="Realizado por"
+    )
+    fecha_evento = models.DateTimeField(auto_now_add=True, verbose_name="Fecha del Evento")
+
+    class Meta:
+        verbose_name = "Evento de Agenda"
+        verbose_name_plural = "Eventos de Agenda"
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['fecha_evento']),
+        ]
+
+    def __str__(self):
+        return f"#{self.id} {self.get_tipo_display()} - Cita {self.cita_id}"
+
+    def como_dict(self):
+        """Representación JSON del evento enviada a los clientes"""
+        return {
+            'id': self.id,
+            'tipo': self.tipo,
+            'tipo_display': self.get_tipo_display(),
+            'cita_id': self.cita_id,
+            'estado': self.estado,
+            'dentista_id': self.dentista_id,
+            'fecha_cita': timezone.localtime(self.fecha_cita).strftime('%Y-%m-%d %H:%M'),
+            'fecha_evento': self.fecha_evento.isoformat(),
+            **(self.datos or {}),
+        }
+
+
+def publicar_evento_agenda(cita, tipo=None, usuario=None):
+    """
+    Publica un evento de agenda para una cita recién guardada.
+
+    Args:
+        cita: Cita que cambió de estado (ya guardada)
+        tipo: Tipo de evento (por defecto se usa el estado actual de la cita)
+        usuario: Perfil que realizó la acción (opcional)
+    """
+    try:
+        tipo = tipo or cita.estado
+        if tipo not in dict(EventoAgenda.TIPO_CHOICES):
+            tipo = 'actualizada'
+
+        hora_llegada = timezone.localtime(cita.hora_llegada).strftime('%H:%M') if cita.hora_llegada else None
+        EventoAgenda.objects.create(
+            cita=cita,
+            tipo=tipo,
+            estado=cita.estado,
+            dentista_id=cita.dentista_id,
+            fecha_cita=cita.fecha_hora,
+            realizado_por=usuario,
+            datos={
+                'estado_display': cita.get_estado_display(),
+                'paciente_nombre': cita.paciente_nombre or '',
+                'hora_llegada': hora_llegada,
+            },
+        )
+
+        # Los eventos solo sirven para clientes conectados: purgar los antiguos de vez en cuando
+        import random
+        if random.randint(1, 200) == 1:
+            limpiar_eventos_agenda_antiguos()
+    except Exception as e:
+        # Un error publicando el evento no debe impedir el cambio de estado de la cita
+        import logging
+        logger = logging.getLogger(__name__)
+        logger.error(f"Error al publicar evento de agenda: {str(e)}")
+
+
+def limpiar_eventos_agenda_antiguos(dias=2):
+    """Elimina los eventos de agenda con más de `dias` días de antigüedad"""
+    from datetime import timedelta
+    fecha_limite = timezone.now() - timedelta(days=dias)
+    EventoAgenda.objects.filter(fecha_evento__lt=fecha_limite).delete()
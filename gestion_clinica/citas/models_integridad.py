@@ -0,0 +1,27 @@
+from django.db import models
+
+
+class MarcaBarridoIntegridad(models.Model):
+    """
+    Marca de agua del barrido de integridad (comando `barrer_integridad`).
+
+    Guarda hasta qué `actualizada_el` (y qué ID, para desempatar) se revisaron las
+    citas, de modo que cada ejecución solo recorre las filas modificadas desde la
+    anterior en lugar de toda la tabla.
+
+    También guarda las marcas de la sincronización incremental de clientes
+    (citas/sincronizacion_clientes.py), una fila por recorrido.
+    """
+
+    nombre = models.CharField(max_length=50, unique=True, verbose_name="Nombre del Barrido")
+    marca_actualizacion = models.DateTimeField(null=True, blank=True, verbose_name="Última Actualización Revisada")
+    ultimo_id = models.PositiveIntegerField(default=0, verbose_name="Último ID Revisado")
+    ultima_ejecucion = models.DateTimeField(null=True, blank=True, verbose_name="Última Ejecución")
+    resumen = models.JSONField(default=dict, blank=True, verbose_name="Resumen de la Última Ejecución")
+
+    class Meta:
+        verbose_name = "Marca de Barrido de Integridad"
+        verbose_name_plural = "Marcas de Barrido de Integridad"
+
+    def __str__(self):
+        return f"{self.nombre} ({self.marca_actualizacion or 'sin ejecutar'})"
@@ -0,0 +1,73 @@
+from django.db import models
+from personal.models import Perfil
+
+
+class LoteDocumentos(models.Model):
+    """
+    Generación en segundo plano de muchos PDFs a la vez (ver citas/lotes_documentos.py):
+    presupuestos de fin de mes, todos los consentimientos pendientes, etc. El resultado
+    se entrega como un ZIP descargable o como un correo por paciente.
+    """
+
+    TIPO_CHOICES = (
+        ('presupuestos', 'Presupuestos de Tratamiento'),
+        ('consentimientos', 'Consentimientos Informados'),
+    )
+
+    ENTREGA_CHOICES = (
+        ('zip', 'Archivo ZIP'),
+        ('correo', 'Un correo por paciente'),
+    )
+
+    ESTADO_CHOICES = (
+        ('pendiente', 'Pendiente'),
+        ('procesando', 'Procesando'),
+        ('completado', 'Completado'),
+        ('error', 'Error'),
+    )
+
+    tipo = models.CharField(max_length=20, choices=TIPO_CHOICES, verbose_name="Tipo de Documento")
+    entrega = models.CharField(max_length=10, choices=ENTREGA_CHOICES, default='zip', verbose_name="Entrega")
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='pendiente', verbose_name="Estado")
+
+    # IDs de los planes o consentimientos incluidos en el lote
+    objetos = models.JSONField(default=list, verbose_name="Objetos del Lote")
+
+    # Progreso
+    total = models.PositiveIntegerField(default=0, verbose_name="Total de Documentos")
+    procesados = models.PositiveIntegerField(default=0, verbose_name="Documentos Procesados")
+    errores = models.PositiveIntegerField(default=0, verbose_name="Documentos con Error")
+    detalle_errores = models.JSONField(default=list, blank=True, verbose_name="Detalle de Errores")
+    correos_enviados = models.PositiveIntegerField(default=0, verbose_name="Correos Enviados")
+
+    archivo_zip = models.FileField(upload_to='documentos/lotes/%Y/%m/', null=True, blank=True, verbose_name="Archivo ZIP")
+
+    creado_por = models.ForeignKey(
+        Perfil,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='lotes_documentos',
+        verbose_name="Creado por"
+    )
+    creado_el = models.DateTimeField(auto_now_add=True, verbose_name="Creado el")
+    iniciado_el = models.DateTimeField(null=True, blank=True, verbose_name="Iniciado el")
+    terminado_el = models.DateTimeField(null=True, blank=True, verbose_name="Terminado el")
+
+    class Meta:
+        verbose_name = "Lote de Documentos"
+        verbose_name_plural = "Lotes de Documentos"
+        ordering = ['-creado_el']
+
+    def __str__(self):
+        return f"Lote #{self.id} - {self.get_tipo_display()} ({self.procesados}/{self.total})"
+
+    @property
+    def porcentaje(self):
+        if not self.total:
+            return 100 if self.estado == 'completado' else 0
+        return int(self.procesados * 100 / self.total)
+
+    @property
+    def terminado(self):
+        return self.estado in ('completado', 'error')
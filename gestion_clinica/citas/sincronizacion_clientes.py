@@ -0,0 +1,320 @@
+"""
+Sincronización incremental entre las citas, los clientes (Cliente) y los perfiles del
+portal web (tabla cuentas_perfilcliente).
+
+Antes `sincronizar_clientes` recorría todas las citas con email en cada ejecución, dentro
+de una única transacción, con un get_or_create() y un save() por cita. Cada mes tardaba
+más y, entre ejecuciones nocturnas, los datos quedaban desfasados.
+
+Ahora hay tres recorridos, cada uno con su marca de agua (MarcaBarridoIntegridad), que
+solo revisan lo modificado desde la ejecución anterior:
+
+1. Citas -> Cliente (marca 'sincronizacion_citas', sobre Cita.actualizada_el): las citas
+   con email del paciente y sin cliente se vinculan al cliente con ese email; si no
+   existe, se crea con los datos de la cita. A un cliente existente solo se le completan
+   el nombre y el teléfono si los tiene vacíos.
+2. Cliente -> citas y portal (marca 'sincronizacion_clientes', sobre
+   Cliente.actualizado_el): los datos de contacto del cliente se copian a sus citas
+   pendientes (las pasadas conservan los datos con que se atendieron) y, si tiene usuario
+   web, a su perfil del portal.
+3. Portal -> Cliente (marca 'sincronizacion_portal'): los perfiles nuevos del portal se
+   importan como clientes (pacientes/importacion.py). La tabla del portal no tiene fecha
+   de modificación, así que la marca es su ID: solo se detectan perfiles nuevos; para
+   revisar también los existentes, usar completo=True.
+
+Cada lote se procesa en su propia transacción, que también avanza la marca. La fila de la
+marca queda bloqueada mientras tanto (select_for_update), así dos ejecuciones simultáneas
+no procesan el mismo lote. Las filas modificadas en el último minuto se dejan para la
+siguiente ejecución (una transacción en curso puede confirmar filas con fecha anterior a
+"ahora"). Los cambios se hacen con update()/bulk_update(): no modifican actualizada_el de
+las citas, de modo que no vuelven a entrar en el recorrido.
+
+Se usa desde el comando `sincronizar_clientes`, pensado para ejecutarse cada minuto.
+"""
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import F, OuterRef, Q, Subquery
+from django.utils import timezone
+
+from pacientes.importacion import clientes_por_email, importar_clientes
+from pacientes.models import Cliente
+
+from .asignaciones import recalcular_asignaciones_cliente
+from .models import Cita, MarcaBarridoIntegridad
+
+MARCA_CITAS = 'sincronizacion_citas'
+MARCA_CLIENTES = 'sincronizacion_clientes'
+MARCA_PORTAL = 'sincronizacion_portal'
+
+TAMANO_LOTE = 500
+
+MARGEN_SEGURIDAD = timedelta(minutes=1)
+
+TABLA_PORTAL = 'cuentas_perfilcliente'
+
+# Campos de contacto que se copian del cliente a su perfil del portal
+CAMPOS_PORTAL = ('nombre_completo', 'email', 'telefono')
+
+# Citas que conservan los datos del paciente con que se registraron
+ESTADOS_CERRADOS = ('disponible', 'cancelada', 'completada', 'finalizada', 'no_show')
+
+NOMBRE_POR_DEFECTO = 'Sin nombre'
+
+
+def portal_disponible():
+    """True si la tabla de perfiles del portal web está en esta base de datos"""
+    return TABLA_PORTAL in connection.introspection.table_names()
+
+
+def _recorrer(nombre, consulta, campo, procesar, resumen, tamano_lote, dry_run, completo):
+    """
+    Recorre `consulta` (un queryset de values()) en lotes ordenados por (campo, id) desde la
+    marca de agua `nombre`, llamando a procesar(lote, resumen, dry_run) con cada lote.
+    """
+    marca, _ = MarcaBarridoIntegridad.objects.get_or_create(nombre=nombre)
+    posicion = (None, 0) if completo else (marca.marca_actualizacion, marca.ultimo_id)
+    limite = timezone.now() - MARGEN_SEGURIDAD
+
+    while True:
+        with transaction.atomic():
+            if not dry_run:
+                marca = MarcaBarridoIntegridad.objects.select_for_update().get(pk=marca.pk)
+                if not completo:
+                    # Otra ejecución pudo haber avanzado la marca mientras esperábamos
+                    posicion = (marca.marca_actualizacion, marca.ultimo_id)
+
+            filas = consulta.filter(**{f'{campo}__lte': limite})
+            if posicion[0] is not None:
+                filas = filas.filter(Q(**{f'{campo}__gt': posicion[0]}) | Q(**{campo: posicion[0], 'id__gt': posicion[1]}))
+            lote = list(filas.order_by(campo, 'id')[:tamano_lote])
+            if not lote:
+                break
+
+            procesar(lote, resumen, dry_run)
+            resumen['revisadas'] += len(lote)
+            resumen['lotes'] += 1
+            posicion = (lote[-1][campo], lote[-1]['id'])
+            if not dry_run:
+                marca.marca_actualizacion, marca.ultimo_id = posicion
+                marca.save(update_fields=['marca_actualizacion', 'ultimo_id'])
+
+    if not dry_run:
+        _cerrar_marca(marca, resumen)
+    return resumen
+
+
+def _cerrar_marca(marca, resumen):
+    marca.ultima_ejecucion = timezone.now()
+    marca.resumen = {clave: valor for clave, valor in resumen.items() if isinstance(valor, int)}
+    marca.save(update_fields=['ultima_ejecucion', 'resumen'])
+
+
+# ============================================================================
+# 1. CITAS -> CLIENTE
+# ============================================================================
+
+def _procesar_citas(lote, resumen, dry_run):
+    # El lote viene ordenado por actualizada_el: para cada email manda la cita más reciente
+    por_email = {}
+    for cita in lote:
+        por_email[cita['paciente_email'].strip().lower()] = cita
+    existentes = clientes_por_email(por_email)
+
+    nuevos = []
+    completar = []
+    for email, cita in por_email.items():
+        cliente = existentes.get(email)
+        if cliente is None:
+            nuevos.append(Cliente(
+                nombre_completo=(cita['paciente_nombre'] or NOMBRE_POR_DEFECTO)[:150],
+                email=email,
+                telefono=cita['paciente_telefono'] or '',
+                activo=True,
+                notas=f'Cliente sincronizado automáticamente desde cita {cita["id"]}',
+            ))
+            continue
+        cambios = False
+        if cita['paciente_nombre'] and cliente.nombre_completo in ('', NOMBRE_POR_DEFECTO):
+            cliente.nombre_completo = cita['paciente_nombre'][:150]
+            cambios = True
+        if cita['paciente_telefono'] and not cliente.telefono:
+            cliente.telefono = cita['paciente_telefono']
+            cambios = True
+        if cambios:
+            completar.append(cliente)
+
+    resumen['citas_vinculadas'] += len(lote)
+    if dry_run:
+        resumen['clientes_creados'] += len(nuevos)
+        resumen['clientes_actualizados'] += len(completar)
+        return
+
+    if nuevos:
+        for cliente in nuevos:
+            cliente.normalizar_campos()
+        # Un cliente creado por otro proceso con el mismo email no es un error: se usa ese
+        Cliente.objects.bulk_create(nuevos, ignore_conflicts=True)
+        creados = clientes_por_email([cliente.email for cliente in nuevos])
+        resumen['clientes_creados'] += len(creados)
+    else:
+        creados = {}
+
+    if completar:
+        ahora = timezone.now()
+        for cliente in completar:
+            cliente.normalizar_campos()
+            cliente.actualizado_el = ahora
+        Cliente.objects.bulk_update(completar, ['nombre_completo', 'telefono', 'actualizado_el', *Cliente.CAMPOS_NORMALIZADOS])
+        resumen['clientes_actualizados'] += len(completar)
+
+    # Una sola sentencia vincula todas las citas del lote con el cliente de su email
+    cliente_por_email = Cliente.objects.filter(email__iexact=OuterRef('paciente_email')).order_by('-activo', 'id').values('id')[:1]
+    Cita.objects.filter(id__in=[cita['id'] for cita in lote], cliente__isnull=True).update(cliente_id=Subquery(cliente_por_email))
+
+    # Las citas de un paciente sin cliente se agrupaban por email en DentistaPaciente
+    for cliente in creados.values():
+        recalcular_asignaciones_cliente(cliente)
+
+
+def sincronizar_citas(tamano_lote=TAMANO_LOTE, dry_run=False, completo=False):
+    """Vincula a un cliente (creándolo si hace falta) las citas modificadas que tienen email y no cliente"""
+    citas = Cita.objects.filter(
+        cliente__isnull=True,
+        paciente_email__isnull=False,
+    ).exclude(
+        paciente_email='',
+    ).exclude(
+        # Un horario liberado puede conservar el email de un cliente eliminado
+        estado='disponible',
+    ).values('id', 'actualizada_el', 'paciente_nombre', 'paciente_email', 'paciente_telefono')
+
+    resumen = {'revisadas': 0, 'lotes': 0, 'citas_vinculadas': 0, 'clientes_creados': 0, 'clientes_actualizados': 0}
+    return _recorrer(MARCA_CITAS, citas, 'actualizada_el', _procesar_citas, resumen, tamano_lote, dry_run, completo)
+
+
+# ============================================================================
+# 2. CLIENTE -> CITAS Y PORTAL
+# ============================================================================
+
+def _actualizar_citas_clientes(ids, resumen, dry_run):
+    """Copia nombre, email y teléfono de los clientes a sus citas pendientes que difieren"""
+    citas = Cita.objects.filter(
+        cliente_id__in=ids,
+        fecha_hora__gte=timezone.now(),
+    ).exclude(
+        estado__in=ESTADOS_CERRADOS,
+    ).filter(
+        ~Q(paciente_nombre=F('cliente__nombre_completo'))
+        | ~Q(paciente_email=F('cliente__email'))
+        | ~Q(paciente_telefono=F('cliente__telefono'))
+    )
+    if dry_run:
+        resumen['citas_actualizadas'] += citas.count()
+        return
+    cliente = Cliente.objects.filter(pk=OuterRef('cliente_id'))
+    resumen['citas_actualizadas'] += citas.update(
+        paciente_nombre=Subquery(cliente.values('nombre_completo')[:1]),
+        paciente_email=Subquery(cliente.values('email')[:1]),
+        paciente_telefono=Subquery(cliente.values('telefono')[:1]),
+    )
+
+
+def _actualizar_perfiles_portal(clientes, resumen, dry_run):
+    """Copia los datos de contacto de los clientes con usuario web a su perfil del portal"""
+    por_usuario = {cliente['user_id']: cliente for cliente in clientes if cliente['user_id']}
+    if not por_usuario:
+        return
+    marcadores = ', '.join(['%s'] * len(por_usuario))
+    columnas = ', '.join(CAMPOS_PORTAL)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT user_id, {columnas} FROM {TABLA_PORTAL} WHERE user_id IN ({marcadores})',
+            list(por_usuario),
+        )
+        perfiles = cursor.fetchall()
+
+        cambios = []
+        for user_id, *valores in perfiles:
+            cliente = por_usuario[user_id]
+            nuevos = [cliente[campo] or '' for campo in CAMPOS_PORTAL]
+            if [valor or '' for valor in valores] != nuevos:
+                cambios.append(nuevos + [user_id])
+
+        resumen['perfiles_actualizados'] += len(cambios)
+        if cambios and not dry_run:
+            asignaciones = ', '.join(f'{campo} = %s' for campo in CAMPOS_PORTAL)
+            cursor.executemany(f'UPDATE {TABLA_PORTAL} SET {asignaciones} WHERE user_id = %s', cambios)
+
+
+def sincronizar_clientes_modificados(tamano_lote=TAMANO_LOTE, dry_run=False, completo=False):
+    """Propaga los datos de contacto de los clientes modificados a sus citas pendientes y al portal"""
+    con_portal = portal_disponible()
+
+    def procesar(lote, resumen, dry_run):
+        _actualizar_citas_clientes([cliente['id'] for cliente in lote], resumen, dry_run)
+        if con_portal:
+            _actualizar_perfiles_portal(lote, resumen, dry_run)
+
+    clientes = Cliente.objects.values('id', 'actualizado_el', 'user_id', *CAMPOS_PORTAL)
+    resumen = {'revisadas': 0, 'lotes': 0, 'citas_actualizadas': 0, 'perfiles_actualizados': 0}
+    return _recorrer(MARCA_CLIENTES, clientes, 'actualizado_el', procesar, resumen, tamano_lote, dry_run, completo)
+
+
+# ============================================================================
+# 3. PORTAL -> CLIENTE
+# ============================================================================
+
+def sincronizar_portal(tamano_lote=TAMANO_LOTE, dry_run=False, completo=False):
+    """
+    Importa como clientes los perfiles del portal creados desde la última ejecución.
+    Nombre y teléfono del portal reemplazan los del cliente con el mismo email; RUT, fecha
+    de nacimiento y alergias solo se completan si el cliente no los tiene.
+    Retorna None si la tabla del portal no está en esta base de datos.
+    """
+    if not portal_disponible():
+        return None
+
+    marca, _ = MarcaBarridoIntegridad.objects.get_or_create(nombre=MARCA_PORTAL)
+    ultimo_id = 0 if completo else marca.ultimo_id
+    resumen = {'revisadas': 0, 'lotes': 0, 'creados': 0, 'actualizados': 0, 'errores': 0}
+
+    while True:
+        with transaction.atomic():
+            if not dry_run:
+                marca = MarcaBarridoIntegridad.objects.select_for_update().get(pk=marca.pk)
+                if not completo:
+                    ultimo_id = marca.ultimo_id
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'SELECT id, nombre_completo, email, telefono, rut, fecha_nacimiento, alergias '
+                    f'FROM {TABLA_PORTAL} WHERE id > %s ORDER BY id LIMIT %s',
+                    [ultimo_id, tamano_lote],
+                )
+                perfiles = cursor.fetchall()
+            if not perfiles:
+                break
+
+            filas = [
+                (perfil_id, {
+                    'nombre_completo': nombre, 'email': email, 'telefono': telefono, 'rut': rut,
+                    'fecha_nacimiento': fecha_nacimiento, 'alergias': alergias,
+                    'notas': f'Cliente sincronizado desde la web (perfil {perfil_id})',
+                })
+                for perfil_id, nombre, email, telefono, rut, fecha_nacimiento, alergias in perfiles
+            ]
+            importados = importar_clientes(filas, actualizar=True, sobrescribir={'nombre_completo', 'telefono'}, dry_run=dry_run)
+            resumen['creados'] += importados['creados']
+            resumen['actualizados'] += importados['actualizados']
+            resumen['errores'] += len(importados['errores'])
+            resumen.setdefault('detalle_errores', []).extend(importados['errores'])
+            resumen['revisadas'] += len(perfiles)
+            resumen['lotes'] += 1
+            ultimo_id = perfiles[-1][0]
+            if not dry_run:
+                marca.ultimo_id = ultimo_id
+                marca.save(update_fields=['ultimo_id'])
+
+    if not dry_run:
+        _cerrar_marca(marca, resumen)
+    return resumen
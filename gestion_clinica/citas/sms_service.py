@@ -164,7 +164,7 @@ def _obtener_info_clinica():
     """
     try:
         from configuracion.models import InformacionClinica
-        info = InformacionClinica.obtener()
+        info = InformacionClinica.obtener_cacheada()
         return {
             'nombre': info.nombre_clinica or "Clínica Dental",
             'direccion': info.direccion or "",
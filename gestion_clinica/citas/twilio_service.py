@@ -64,7 +64,7 @@ def _obtener_info_clinica():
     """
     try:
         from configuracion.models import InformacionClinica
-        info = InformacionClinica.obtener()
+        info = InformacionClinica.obtener_cacheada()
         nombre_clinica = info.nombre_clinica or "Clínica Dental San Felipe"
         # Asegurar que use "Clínica Dental San Felipe" si está vacío o es el predeterminado
         if nombre_clinica == "Clínica Dental":
@@ -8,6 +8,8 @@ from . import views_inventario
 from . import views_dashboard
 from . import views_reportes
 from . import views_auditoria
+from . import views_eventos
+from . import views_lotes
 
 urlpatterns = [
     # Auth trabajadores
@@ -20,12 +22,17 @@ urlpatterns = [
     path('panel/citas-dia-ajax/', views.obtener_citas_dia_ajax, name='obtener_citas_dia_ajax'),
     path('obtener_cita/<int:cita_id>/', views.obtener_cita, name='obtener_cita'),
     
+    # Eventos de agenda en tiempo real (SSE + long-poll de respaldo)
+    path('agenda/eventos/stream/', views_eventos.stream_eventos_agenda, name='stream_eventos_agenda'),
+    path('agenda/eventos/', views_eventos.eventos_agenda_long_poll, name='eventos_agenda_long_poll'),
+    
     # Gestión de citas con navbar lateral
     path('citas/dia/', views.citas_dia, name='citas_dia'),
     path('citas/disponibles/', views.citas_disponibles, name='citas_disponibles'),
     path('citas/tomadas/', views.citas_tomadas, name='citas_tomadas'),
     path('citas/completadas/', views.citas_completadas, name='citas_completadas'),
     path('citas/calendario/', views.calendario_citas, name='calendario_citas'),
+    path('citas/calendario/eventos/', views.calendario_citas_eventos, name='calendario_citas_eventos'),
     path('dashboard/', views.dashboard, name='dashboard'),
     path('dashboard-dentista/', views.dashboard_dentista, name='dashboard_dentista'),
     path('dashboard-reportes/', views_dashboard.dashboard_reportes, name='dashboard_reportes'),
@@ -63,6 +70,7 @@ urlpatterns = [
     # Gestión de insumos
     path('gestor_insumos/', views.gestor_insumos, name='gestor_insumos'),
     path('inventario/', views_inventario.gestor_inventario_unificado, name='gestor_inventario_unificado'),
+    path('inventario/seccion/<str:seccion>/', views_inventario.seccion_inventario, name='seccion_inventario'),
     path('agregar_insumo/', views.agregar_insumo, name='agregar_insumo'),
     path('editar_insumo/<int:insumo_id>/', views.editar_insumo, name='editar_insumo'),
     path('eliminar_insumo/<int:insumo_id>/', views.eliminar_insumo, name='eliminar_insumo'),
@@ -184,14 +192,17 @@ urlpatterns = [
     path('clientes/validar-username/', views.validar_username, name='validar_username'),
     path('clientes/validar-email/', views.validar_email, name='validar_email'),
     path('clientes/buscar-por-email/', views.buscar_cliente_por_email, name='buscar_cliente_por_email'),
+    path('clientes/autocompletar/', views.buscar_clientes_autocomplete, name='buscar_clientes_autocomplete'),
     path('clientes/validar-rut/', views.validar_rut, name='validar_rut'),
     path('clientes/validar-telefono/', views.validar_telefono, name='validar_telefono'),
     path('clientes/crear/', views.crear_cliente_presencial, name='crear_cliente_presencial'),
+    path('clientes/importar/', views.importar_clientes_archivo, name='importar_clientes_archivo'),
     path('clientes/sincronizar-web/', views.sincronizar_cliente_web, name='sincronizar_cliente_web'),
     path('clientes/<int:cliente_id>/', views.perfil_cliente, name='perfil_cliente'),
     path('clientes/<int:cliente_id>/editar/', views.editar_cliente, name='editar_cliente'),
     path('clientes/<int:cliente_id>/obtener/', views.obtener_cliente, name='obtener_cliente'),
     path('clientes/<int:cliente_id>/citas/', views.obtener_citas_cliente, name='obtener_citas_cliente'),
+    path('clientes/<int:cliente_id>/linea-tiempo/', views.linea_tiempo_cliente, name='linea_tiempo_cliente'),
     path('clientes/<int:cliente_id>/toggle-estado/', views.toggle_estado_cliente, name='toggle_estado_cliente'),
     path('clientes/<int:cliente_id>/eliminar/', views.eliminar_cliente, name='eliminar_cliente'),
     
@@ -199,6 +210,9 @@ urlpatterns = [
     path('documentos/', views.gestor_documentos, name='gestor_documentos'),
     path('documentos/<int:documento_id>/descargar/', views.descargar_documento, name='descargar_documento'),
     path('documentos/<int:documento_id>/enviar-correo/', views.enviar_documento_correo, name='enviar_documento_correo'),
+    path('documentos/lotes/crear/', views_lotes.crear_lote_documentos, name='crear_lote_documentos'),
+    path('documentos/lotes/<int:lote_id>/estado/', views_lotes.estado_lote_documentos, name='estado_lote_documentos'),
+    path('documentos/lotes/<int:lote_id>/descargar/', views_lotes.descargar_lote_documentos, name='descargar_lote_documentos'),
     path('planes-tratamiento/<int:plan_id>/exportar-pdf/', views.exportar_presupuesto_pdf, name='exportar_presupuesto_pdf'),
     
     # Auditoría
@@ -6,6 +6,7 @@ para mantener consistencia en las validaciones.
 """
 from django.contrib.auth.models import User
 from pacientes.models import Cliente
+from pacientes.rut import normalizar_rut
 import logging
 
 logger = logging.getLogger(__name__)
@@ -72,25 +73,19 @@ def validar_rut_cliente(rut, cliente_excluido=None):
     if not rut:
         return False, None
     
-    rut = rut.strip()
-    
-    # Limpiar el RUT (quitar puntos y guiones)
-    rut_limpio = rut.replace('.', '').replace('-', '').upper()
-    
-    # Validar formato básico
-    if not rut_limpio[:-1].isdigit() or len(rut_limpio) < 8:
+    # Normalizar y validar el dígito verificador una sola vez (ver pacientes/rut.py)
+    rut_normalizado = normalizar_rut(rut)
+    if not rut_normalizado:
         return False, "El formato del RUT no es válido"
     
-    # Buscar en Cliente activo (comparar RUTs normalizados)
-    query = Cliente.objects.filter(activo=True).exclude(rut__isnull=True).exclude(rut='')
+    # Búsqueda por el índice de rut_normalizado
+    query = Cliente.objects.filter(activo=True, rut_normalizado=rut_normalizado)
     if cliente_excluido:
         query = query.exclude(id=cliente_excluido.id)
     
-    for cliente in query:
-        if cliente.rut:
-            rut_cliente_limpio = cliente.rut.replace('.', '').replace('-', '').upper()
-            if rut_cliente_limpio == rut_limpio:
-                return True, f"Ya existe un cliente activo con ese RUT: {cliente.nombre_completo}"
+    nombre = query.values_list('nombre_completo', flat=True).first()
+    if nombre is not None:
+        return True, f"Ya existe un cliente activo con ese RUT: {nombre}"
     
     return False, None
 
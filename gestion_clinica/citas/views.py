@@ -4,7 +4,7 @@ from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib import messages
 from django.http import HttpResponse, JsonResponse
 from django.utils import timezone
-from django.db.models import Count, Q, F, Sum, Avg
+from django.db.models import Count, Q, F, Sum, Avg, Min
 from datetime import datetime, timedelta
 from decimal import Decimal, InvalidOperation
 from django.contrib.auth.views import LoginView
@@ -28,12 +28,35 @@ from reportlab.lib import colors
 from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
 from io import BytesIO
 
-from .models import Cita, TipoServicio, HorarioDentista
+from .models import Cita, TipoServicio, HorarioDentista, LoteDocumentos, publicar_evento_agenda
+from .lotes_documentos import SELECCIONES as SELECCIONES_LOTE
 from personal.models import Perfil
-from pacientes.models import Cliente
-from inventario.models import Insumo, MovimientoInsumo
+from personal.cache_perfil import obtener_perfil
+from personal.decorators import perfil_requerido, rol_requerido
+from pacientes.models import Cliente, RutDuplicado
+from pacientes.busqueda import buscar_pacientes, coincide_busqueda, filtro_busqueda
+from pacientes.rut import normalizar_rut
+from pacientes.paginacion import CursorInvalido, paginar_clientes
+from inventario.models import Insumo, LoteInsumo, MovimientoInsumo
+from inventario.stock import StockInsuficiente, aplicar_movimiento, aplicar_movimientos
 from historial_clinico.models import Odontograma, EstadoDiente, Radiografia, PlanTratamiento, FaseTratamiento, ItemTratamiento, PagoTratamiento, DocumentoCliente, ConsentimientoInformado, PlantillaConsentimiento
-from django.db.models import Prefetch
+from historial_clinico.derivadas_radiografia import encolar_derivadas, eliminar_derivadas
+from .cache_pdf import (
+    clave_generador, guardar_pdf_cacheado, huella_consentimiento, huella_inventario, huella_odontograma,
+    huella_presupuesto, obtener_pdf_cacheado,
+)
+from historial_clinico.odontograma_datos import dientes_para_plantilla, guardar_dientes_odontograma, leer_datos_formulario
+from .asignaciones import recalcular_asignaciones_cliente
+from .linea_tiempo import (
+    POR_PAGINA as LINEA_TIEMPO_POR_PAGINA, TIPOS as LINEA_TIEMPO_TIPOS,
+    obtener_linea_tiempo, serializar_evento,
+)
+from historial_clinico.anotaciones_radiografia import (
+    ConflictoAnotaciones, aplicar_cambios_anotaciones, limpiar_anotaciones,
+    obtener_imagen_anotada, serializar_anotaciones,
+)
+from django.db.models import Exists, OuterRef, Prefetch
+from django.db.models.functions import Upper
 from proveedores.models import Proveedor, SolicitudInsumo
 from evaluaciones.models import Evaluacion
 from finanzas.models import IngresoManual, EgresoManual
@@ -224,7 +247,7 @@ class TrabajadorLoginView(LoginView):
     def get_success_url(self):
         # Redirigir según rol del trabajador
         try:
-            perfil = Perfil.objects.get(user=self.request.user)
+            perfil = obtener_perfil(self.request)
             if perfil.activo:
                 # Si es dentista, redirigir al dashboard de dentista
                 if perfil.es_dentista():
@@ -265,7 +288,7 @@ def panel_trabajador(request):
 def obtener_citas_dia_ajax(request):
     """Vista AJAX que devuelve las citas del día en formato JSON para actualización automática"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.activo:
             return JsonResponse({'error': 'Cuenta desactivada'}, status=403)
     except Perfil.DoesNotExist:
@@ -328,7 +351,7 @@ def obtener_citas_dia_ajax(request):
 @login_required
 def agregar_hora(request):
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'No tienes permisos para agregar horas.')
             return redirect('panel_trabajador')
@@ -766,7 +789,7 @@ def agregar_hora(request):
 @login_required
 def editar_cita(request, cita_id):
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'No tienes permisos para editar citas.')
             return redirect('panel_trabajador')
@@ -859,6 +882,7 @@ def editar_cita(request, cita_id):
             
             cita.notas = notas
             cita.save()
+            publicar_evento_agenda(cita, usuario=perfil)
             
             # Registrar en auditoría
             cliente_info = cita.cliente.nombre_completo if cita.cliente else cita.paciente_nombre or "Sin cliente"
@@ -920,7 +944,7 @@ def editar_cita(request, cita_id):
 @login_required
 def cancelar_cita_admin(request, cita_id):
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
     except Perfil.DoesNotExist:
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
             from django.http import JsonResponse
@@ -955,6 +979,7 @@ def cancelar_cita_admin(request, cita_id):
             return redirect('panel_trabajador')
     
     if cita.cancelar():
+        publicar_evento_agenda(cita, usuario=perfil)
         # Enviar notificaciones de cancelación por WhatsApp, SMS y correo electrónico
         try:
             from citas.mensajeria_service import enviar_notificaciones_cancelacion_cita
@@ -1008,7 +1033,7 @@ def marcar_no_show(request, cita_id):
     SOLO DISPONIBLE PARA ADMINISTRATIVOS
     """
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
                 from django.http import JsonResponse
@@ -1047,6 +1072,7 @@ def marcar_no_show(request, cita_id):
     cita.estado = 'no_show'
     cita.motivo_no_asistencia = motivo_no_asistencia
     cita.save()
+    publicar_evento_agenda(cita, usuario=perfil)
     
     mensaje = f'Cita marcada como "No Show" para {cita.paciente_nombre or "Sin nombre"} ({cita.fecha_hora.strftime("%d/%m/%Y %H:%M")}). Motivo registrado en el historial.'
     
@@ -1066,7 +1092,7 @@ def marcar_listo_para_atender(request, cita_id):
     SOLO DISPONIBLE PARA DENTISTAS (el dentista asignado a la cita)
     """
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_dentista():
             if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
                 from django.http import JsonResponse
@@ -1101,6 +1127,7 @@ def marcar_listo_para_atender(request, cita_id):
     # Cambiar estado
     cita.estado = 'listo_para_atender'
     cita.save()
+    publicar_evento_agenda(cita, usuario=perfil)
     
     mensaje = f'Cita marcada como "Listo para Atender". La recepcionista será notificada para pasar al paciente.'
     
@@ -1120,7 +1147,7 @@ def iniciar_atencion(request, cita_id):
     SOLO DISPONIBLE PARA DENTISTAS (el dentista asignado a la cita)
     """
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_dentista():
             if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
                 from django.http import JsonResponse
@@ -1155,6 +1182,7 @@ def iniciar_atencion(request, cita_id):
     # Cambiar estado
     cita.estado = 'en_progreso'
     cita.save()
+    publicar_evento_agenda(cita, usuario=perfil)
     
     mensaje = f'Atención iniciada para {cita.paciente_nombre or "el paciente"}.'
     
@@ -1174,7 +1202,7 @@ def finalizar_atencion(request, cita_id):
     SOLO DISPONIBLE PARA DENTISTAS (el dentista asignado a la cita)
     """
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_dentista():
             if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
                 from django.http import JsonResponse
@@ -1209,6 +1237,7 @@ def finalizar_atencion(request, cita_id):
     # Cambiar estado
     cita.estado = 'finalizada'
     cita.save()
+    publicar_evento_agenda(cita, usuario=perfil)
     
     mensaje = f'Atención finalizada. El paciente puede dirigirse a recepción para pagar.'
     
@@ -1228,7 +1257,7 @@ def completar_cita_recepcion(request, cita_id):
     SOLO DISPONIBLE PARA ADMINISTRATIVOS
     """
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
                 from django.http import JsonResponse
@@ -1287,6 +1316,7 @@ def completar_cita_recepcion(request, cita_id):
     # Cambiar estado
     cita.estado = 'completada'
     cita.save()
+    publicar_evento_agenda(cita, usuario=perfil)
     
     # Registrar en auditoría
     registrar_auditoria(
@@ -1318,7 +1348,7 @@ def marcar_llegada(request, cita_id):
     SOLO DISPONIBLE PARA ADMINISTRATIVOS
     """
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
                 from django.http import JsonResponse
@@ -1349,6 +1379,7 @@ def marcar_llegada(request, cita_id):
     cita.estado = 'en_espera'
     cita.hora_llegada = timezone.now()
     cita.save()
+    publicar_evento_agenda(cita, usuario=perfil)
     
     mensaje = f'Paciente {cita.paciente_nombre or "Sin nombre"} marcado como "En Espera". Hora de llegada: {cita.hora_llegada.strftime("%H:%M")}.'
     
@@ -1368,7 +1399,7 @@ def marcar_no_llego(request, cita_id):
     SOLO DISPONIBLE PARA ADMINISTRATIVOS
     """
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
                 from django.http import JsonResponse
@@ -1408,6 +1439,7 @@ def marcar_no_llego(request, cita_id):
     cita.estado = 'no_show'
     cita.motivo_no_asistencia = motivo_no_asistencia
     cita.save()
+    publicar_evento_agenda(cita, usuario=perfil)
     
     mensaje = f'Cita marcada como "No Llegó" para {cita.paciente_nombre or "Sin nombre"} ({cita.fecha_hora.strftime("%d/%m/%Y %H:%M")}). Motivo registrado en el historial del cliente.'
     
@@ -1426,7 +1458,7 @@ def reagendar_cita(request, cita_id):
     SOLO DISPONIBLE PARA ADMINISTRATIVOS
     """
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
                 from django.http import JsonResponse
@@ -1574,6 +1606,7 @@ def reagendar_cita(request, cita_id):
         if dentista:
             cita.dentista = dentista
         cita.save()
+        publicar_evento_agenda(cita, tipo='reagendada', usuario=perfil)
         
         mensaje = f'Cita reagendada de {fecha_hora_anterior.strftime("%d/%m/%Y %H:%M")} a {nueva_fecha_hora.strftime("%d/%m/%Y %H:%M")}.'
         if dentista and dentista != dentista_anterior:
@@ -1610,7 +1643,7 @@ def confirmar_cita(request, cita_id):
     SOLO DISPONIBLE PARA ADMINISTRATIVOS (recepcionistas)
     """
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'No tienes permisos para confirmar citas. Solo el personal administrativo puede realizar esta acción.')
             return redirect('panel_trabajador')
@@ -1628,6 +1661,7 @@ def confirmar_cita(request, cita_id):
     # Cambiar a estado confirmada
     cita.estado = 'confirmada'
     cita.save()
+    publicar_evento_agenda(cita, usuario=perfil)
     
     messages.success(request, f'✅ Cita del {cita.fecha_hora.strftime("%d/%m/%Y a las %H:%M")} confirmada exitosamente.')
     return redirect('panel_trabajador')
@@ -1641,7 +1675,7 @@ def completar_cita(request, cita_id):
     Los dentistas NO pueden completar sus propias citas
     """
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'No tienes permisos para completar citas. Solo el personal administrativo puede realizar esta acción.')
             return redirect('panel_trabajador')
@@ -1771,6 +1805,7 @@ def completar_cita(request, cita_id):
         if cita.completar():
             # Guardar los campos adicionales
             cita.save()
+            publicar_evento_agenda(cita, usuario=perfil)
             
             mensaje = f'✅ Cita del {cita.fecha_hora.strftime("%d/%m/%Y a las %H:%M")} marcada como completada exitosamente.'
             if cita.precio_cobrado:
@@ -1902,7 +1937,7 @@ def ajustar_precio_cita(request, cita_id):
     Solo permite modificar precio y notas, nada más
     """
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'No tienes permisos para ajustar precios de citas. Solo el personal administrativo puede realizar esta acción.')
             return redirect('panel_trabajador')
@@ -1967,7 +2002,7 @@ def ajustar_precio_cita(request, cita_id):
 @login_required
 def eliminar_cita(request, cita_id):
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
                 from django.http import JsonResponse
@@ -2031,7 +2066,7 @@ def eliminar_cita(request, cita_id):
 def citas_dia(request):
     """Vista para citas del día con navbar lateral"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.activo:
             messages.error(request, 'Tu cuenta está desactivada.')
             return redirect('login')
@@ -2058,9 +2093,7 @@ def citas_dia(request):
     # Aplicar filtro de búsqueda si existe
     if search_query:
         citas_hoy = citas_hoy.filter(
-            Q(cliente__nombre_completo__icontains=search_query) |
-            Q(cliente__email__icontains=search_query) |
-            Q(cliente__telefono__icontains=search_query) |
+            filtro_busqueda(search_query, prefijo='cliente__') |
             Q(paciente_nombre__icontains=search_query) |
             Q(paciente_email__icontains=search_query) |
             Q(tipo_servicio__nombre__icontains=search_query) |
@@ -2071,22 +2104,6 @@ def citas_dia(request):
     
     citas_hoy = citas_hoy.order_by('fecha_hora')
     
-    # Limpiar referencias inválidas
-    from pacientes.models import Cliente
-    from django.db import connection
-    with connection.cursor() as cursor:
-        cursor.execute("""
-            SELECT c.id 
-            FROM citas_cita c
-            LEFT JOIN pacientes_cliente p ON c.cliente_id = p.id
-            WHERE c.cliente_id IS NOT NULL 
-            AND p.id IS NULL
-        """)
-        citas_con_cliente_invalido = [row[0] for row in cursor.fetchall()]
-    
-    if citas_con_cliente_invalido:
-        Cita.objects.filter(id__in=citas_con_cliente_invalido).update(cliente=None)
-    
     # Obtener información de fichas
     from historial_clinico.models import Odontograma
     odontogramas = Odontograma.objects.filter(cita__isnull=False).select_related('cita')
@@ -2127,7 +2144,6 @@ def citas_dia(request):
     # Obtener datos necesarios
     dentistas = Perfil.objects.filter(rol='dentista', activo=True).select_related('user')
     servicios_activos = TipoServicio.objects.filter(activo=True).order_by('categoria', 'nombre')
-    clientes = Cliente.objects.filter(activo=True).order_by('nombre_completo')
     
     context = {
         'perfil': perfil,
@@ -2135,7 +2151,6 @@ def citas_dia(request):
         'estadisticas': estadisticas,
         'dentistas': dentistas,
         'servicios_activos': servicios_activos,
-        'clientes': clientes,
         'es_admin': es_admin,
         'seccion_activa': 'dia',
         'search_query': search_query,
@@ -2147,7 +2162,7 @@ def citas_dia(request):
 def citas_disponibles(request):
     """Vista para citas disponibles con navbar lateral"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.activo:
             messages.error(request, 'Tu cuenta está desactivada.')
             return redirect('login')
@@ -2208,8 +2223,6 @@ def citas_disponibles(request):
     # Obtener datos necesarios
     dentistas = Perfil.objects.filter(rol='dentista', activo=True).select_related('user')
     servicios_activos = TipoServicio.objects.filter(activo=True).order_by('categoria', 'nombre')
-    from pacientes.models import Cliente
-    clientes = Cliente.objects.filter(activo=True).order_by('nombre_completo')
     
     context = {
         'perfil': perfil,
@@ -2217,7 +2230,6 @@ def citas_disponibles(request):
         'estadisticas': estadisticas,
         'dentistas': dentistas,
         'servicios_activos': servicios_activos,
-        'clientes': clientes,
         'es_admin': es_admin,
         'seccion_activa': 'disponibles',
         'search_query': search_query,
@@ -2229,7 +2241,7 @@ def citas_disponibles(request):
 @login_required
 def citas_tomadas(request):
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         # Verificar permisos pero no redirigir a panel_trabajador para evitar bucles
         es_admin = perfil.es_administrativo()
         if not es_admin:
@@ -2300,8 +2312,6 @@ def citas_tomadas(request):
     # Obtener datos necesarios
     dentistas = Perfil.objects.filter(rol='dentista', activo=True).select_related('user')
     servicios_activos = TipoServicio.objects.filter(activo=True).order_by('categoria', 'nombre')
-    from pacientes.models import Cliente
-    clientes = Cliente.objects.filter(activo=True).order_by('nombre_completo')
     
     context = {
         'perfil': perfil,
@@ -2309,7 +2319,6 @@ def citas_tomadas(request):
         'estadisticas': estadisticas,
         'dentistas': dentistas,
         'servicios_activos': servicios_activos,
-        'clientes': clientes,
         'es_admin': es_admin,
         'seccion_activa': 'tomadas',
         'search_query': search_query,
@@ -2321,7 +2330,7 @@ def citas_tomadas(request):
 @login_required
 def citas_completadas(request):
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         # Verificar permisos pero no redirigir a panel_trabajador para evitar bucles
         es_admin = perfil.es_administrativo()
         if not es_admin:
@@ -2384,8 +2393,6 @@ def citas_completadas(request):
     # Obtener datos necesarios
     dentistas = Perfil.objects.filter(rol='dentista', activo=True).select_related('user')
     servicios_activos = TipoServicio.objects.filter(activo=True).order_by('categoria', 'nombre')
-    from pacientes.models import Cliente
-    clientes = Cliente.objects.filter(activo=True).order_by('nombre_completo')
 
     context = {
         'perfil': perfil,
@@ -2393,7 +2400,6 @@ def citas_completadas(request):
         'estadisticas': estadisticas,
         'dentistas': dentistas,
         'servicios_activos': servicios_activos,
-        'clientes': clientes,
         'es_admin': es_admin,
         'seccion_activa': 'completadas',
         'search_query': search_query,
@@ -2404,7 +2410,7 @@ def citas_completadas(request):
 def calendario_citas(request):
     """Vista para calendario general con navbar lateral"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.activo:
             messages.error(request, 'Tu cuenta está desactivada.')
             return redirect('login')
@@ -2419,22 +2425,10 @@ def calendario_citas(request):
     # Filtro de búsqueda (opcional para el calendario)
     search_query = request.GET.get('search', '').strip()
     
-    # Obtener todas las citas para el calendario (con filtro si existe)
-    citas_calendario = Cita.objects.all().select_related('tipo_servicio', 'dentista', 'cliente').order_by('fecha_hora')
-    
-    # Aplicar filtro de búsqueda si existe
-    if search_query:
-        citas_calendario = citas_calendario.filter(
-            Q(cliente__nombre_completo__icontains=search_query) |
-            Q(cliente__email__icontains=search_query) |
-            Q(cliente__telefono__icontains=search_query) |
-            Q(paciente_nombre__icontains=search_query) |
-            Q(paciente_email__icontains=search_query) |
-            Q(tipo_servicio__nombre__icontains=search_query) |
-            Q(tipo_consulta__icontains=search_query) |
-            Q(dentista__nombre_completo__icontains=search_query) |
-            Q(notas__icontains=search_query)
-        )
+    # Filtro por dentista (las citas se cargan por rango desde calendario_citas_eventos)
+    dentista_filtro = request.GET.get('dentista', '').strip()
+    if not dentista_filtro.isdigit():
+        dentista_filtro = ''
     
     # Estadísticas
     estadisticas = {
@@ -2446,22 +2440,131 @@ def calendario_citas(request):
     # Obtener datos necesarios
     dentistas = Perfil.objects.filter(rol='dentista', activo=True).select_related('user')
     servicios_activos = TipoServicio.objects.filter(activo=True).order_by('categoria', 'nombre')
-    from pacientes.models import Cliente
-    clientes = Cliente.objects.filter(activo=True).order_by('nombre_completo')
     
     context = {
         'perfil': perfil,
         'estadisticas': estadisticas,
         'dentistas': dentistas,
         'servicios_activos': servicios_activos,
-        'clientes': clientes,
         'es_admin': True,
         'seccion_activa': 'calendario',
         'search_query': search_query,
-        'citas_calendario': citas_calendario,
+        'dentista_filtro': dentista_filtro,
     }
     return render(request, 'citas/citas/gestor_citas_base.html', context)
 
+
+# Colores de las citas en el calendario según estado
+COLORES_ESTADO_CALENDARIO = {
+    'disponible': '#10b981',
+    'reservada': '#3b82f6',
+    'confirmada': '#3b82f6',
+    'en_espera': '#f59e0b',
+    'en_progreso': '#8b5cf6',
+    'completada': '#14b8a6',
+    'no_show': '#ef4444',
+    'cancelada': '#9ca3af',
+}
+
+# Rango máximo (en días) que puede pedir el calendario en una sola consulta
+MAX_DIAS_FEED_CALENDARIO = 62
+
+
+def _parsear_fecha_feed(valor):
+    """Convierte el parámetro start/end de FullCalendar (fecha o fecha-hora ISO) a datetime aware"""
+    from django.utils.dateparse import parse_datetime, parse_date
+    valor = (valor or '').strip().replace(' ', '+')
+    fecha = parse_datetime(valor)
+    if fecha is None:
+        solo_fecha = parse_date(valor[:10])
+        if solo_fecha is None:
+            return None
+        fecha = datetime.combine(solo_fecha, datetime.min.time())
+    if timezone.is_naive(fecha):
+        fecha = timezone.make_aware(fecha)
+    return fecha
+
+
+@rol_requerido('administrativo', mensaje='No tienes permisos para ver el calendario.')
+def calendario_citas_eventos(request):
+    """
+    Feed JSON del calendario general. FullCalendar lo pide por cada semana o mes visible
+    enviando start/end; solo se devuelven las citas de ese rango con los campos que se muestran.
+    
+    Parámetros GET:
+    - start, end: rango visible (obligatorios, máximo MAX_DIAS_FEED_CALENDARIO días)
+    - dentista: ID del dentista (opcional)
+    - search: texto a buscar (opcional)
+    """
+    inicio = _parsear_fecha_feed(request.GET.get('start'))
+    fin = _parsear_fecha_feed(request.GET.get('end'))
+    if not inicio or not fin or fin <= inicio:
+        return JsonResponse({'error': 'Rango de fechas inválido.'}, status=400)
+    if (fin - inicio).days > MAX_DIAS_FEED_CALENDARIO:
+        return JsonResponse({'error': f'El rango no puede superar {MAX_DIAS_FEED_CALENDARIO} días.'}, status=400)
+    
+    citas = Cita.objects.filter(fecha_hora__gte=inicio, fecha_hora__lt=fin)
+    
+    dentista_id = request.GET.get('dentista', '').strip()
+    if dentista_id.isdigit():
+        citas = citas.filter(dentista_id=int(dentista_id))
+    
+    search_query = request.GET.get('search', '').strip()
+    if search_query:
+        citas = citas.filter(
+            Q(cliente__nombre_completo__icontains=search_query) |
+            Q(cliente__email__icontains=search_query) |
+            Q(cliente__telefono__icontains=search_query) |
+            Q(paciente_nombre__icontains=search_query) |
+            Q(paciente_email__icontains=search_query) |
+            Q(tipo_servicio__nombre__icontains=search_query) |
+            Q(tipo_consulta__icontains=search_query) |
+            Q(dentista__nombre_completo__icontains=search_query) |
+            Q(notas__icontains=search_query)
+        )
+    
+    # Proyección compacta: solo las columnas que usa el calendario
+    filas = citas.order_by('fecha_hora').values(
+        'id', 'fecha_hora', 'estado', 'notas', 'precio_cobrado', 'tipo_consulta',
+        'paciente_nombre', 'paciente_telefono',
+        'cliente__nombre_completo', 'cliente__telefono',
+        'tipo_servicio__nombre', 'tipo_servicio__duracion_estimada', 'tipo_servicio__precio_base',
+        'dentista__nombre_completo',
+    )
+    
+    eventos = []
+    for fila in filas:
+        fecha_local = timezone.localtime(fila['fecha_hora'])
+        paciente = fila['cliente__nombre_completo'] or fila['paciente_nombre']
+        servicio = fila['tipo_servicio__nombre'] or fila['tipo_consulta']
+        duracion = fila['tipo_servicio__duracion_estimada']
+        precio = fila['precio_cobrado'] or fila['tipo_servicio__precio_base']
+        
+        evento = {
+            'id': str(fila['id']),
+            'title': (paciente or 'Disponible') + (f' - {servicio}' if servicio else ''),
+            'start': fecha_local.strftime('%Y-%m-%dT%H:%M:%S'),
+            'color': COLORES_ESTADO_CALENDARIO.get(fila['estado'], '#6b7280'),
+            'textColor': '#ffffff',
+            'classNames': ['cita-calendario', f"estado-{fila['estado']}"],
+            'extendedProps': {
+                'estado': fila['estado'],
+                'paciente': paciente or 'Sin asignar',
+                'telefono': (fila['cliente__telefono'] if fila['cliente__nombre_completo'] else fila['paciente_telefono']) or '',
+                'servicio': servicio or 'Sin servicio',
+                'dentista': fila['dentista__nombre_completo'] or 'Sin asignar',
+                'precio': int(precio) if precio else None,
+                'duracion': f'{duracion} min' if duracion else '',
+                'notas': fila['notas'] or '',
+                'cita_id': fila['id'],
+            },
+        }
+        if duracion:
+            evento['end'] = (fecha_local + timedelta(minutes=duracion)).strftime('%Y-%m-%dT%H:%M:%S')
+        eventos.append(evento)
+    
+    return JsonResponse(eventos, safe=False)
+
 # Registrar nuevo trabajador con protección de seguridad
 @never_cache
 @csrf_protect
@@ -2523,7 +2626,7 @@ def registro_trabajador(request):
 @login_required
 def editar_perfil(request):
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
     except Perfil.DoesNotExist:
         messages.error(request, 'No tienes un perfil de trabajador válido.')
         return redirect('login')
@@ -2544,7 +2647,7 @@ def editar_perfil(request):
 def dashboard(request):
     """Vista principal del Dashboard - Página de inicio del sistema"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.activo:
             messages.error(request, 'Tu cuenta está desactivada.')
             return redirect('login')
@@ -2716,7 +2819,7 @@ def dashboard(request):
 def dashboard_dentista(request):
     """Vista de inicio específica para dentistas con accesos rápidos"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.activo:
             messages.error(request, 'Tu cuenta está desactivada.')
             return redirect('login')
@@ -2800,7 +2903,7 @@ def dashboard_dentista(request):
 @login_required
 def todas_las_citas(request):
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'No tienes permisos para ver todas las citas.')
             return redirect('panel_trabajador')
@@ -2839,11 +2942,15 @@ def todas_las_citas(request):
     
     return render(request, 'citas/citas/todas_las_citas.html', context)
 
+# Clientes del portal web sin sincronizar que se muestran en la primera página del gestor
+MAXIMO_CLIENTES_WEB_PAGINA = 10
+
+
 # Gestor de Clientes - solo administrativos
 @login_required
 def gestor_clientes(request):
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'No tienes permisos para gestionar clientes.')
             return redirect('panel_trabajador')
@@ -2859,13 +2966,8 @@ def gestor_clientes(request):
     
     # Aplicar filtros de búsqueda
     if search:
-        from django.db.models import Q
-        clientes_query = clientes_query.filter(
-            Q(nombre_completo__icontains=search) |
-            Q(email__icontains=search) |
-            Q(telefono__icontains=search) |
-            Q(rut__icontains=search)  # Búsqueda por RUT
-        )
+        # Nombre sin tildes, email, RUT o teléfono sobre columnas normalizadas (ver pacientes/busqueda.py)
+        clientes_query = clientes_query.filter(filtro_busqueda(search))
     
     # Aplicar filtro de estado
     if estado == 'activo':
@@ -2873,72 +2975,71 @@ def gestor_clientes(request):
     elif estado == 'inactivo':
         clientes_query = clientes_query.filter(activo=False)
     
-    # Anotar cada cliente con el número de citas, odontogramas y radiografías
-    from django.db.models import Count, Max
+    # Página actual por cursor (ver pacientes/paginacion.py); los conteos de citas, fichas
+    # y radiografías son subconsultas que solo se calculan para los clientes de la página
+    despues = request.GET.get('despues', '')
+    antes = request.GET.get('antes', '')
+    ultima = request.GET.get('ultima') == '1'
     try:
-        # Intentar anotar con todas las relaciones
-        clientes_query = clientes_query.annotate(
-            total_citas=Count('citas', distinct=True)
-        )
-        # Intentar agregar odontogramas y radiografias si las relaciones existen
-        try:
-            from historial_clinico.models import Odontograma, Radiografia
-            clientes_query = clientes_query.annotate(
-                total_odontogramas=Count('odontogramas', distinct=True),
-                total_radiografias=Count('radiografias', distinct=True),
-                ultima_cita_fecha=Max('citas__fecha_hora')
-            )
-        except:
-            # Si falla, solo usar total_citas
-            pass
-    except Exception as e:
-        # Si hay error con las anotaciones, usar consulta sin anotaciones
-        pass
-    
-    # Obtener emails de clientes ya existentes para no duplicar
-    emails_existentes = set(clientes_query.values_list('email', flat=True))
-    
-    # Obtener clientes registrados desde cliente_web que no tienen Cliente en gestion_clinica
+        pagina = paginar_clientes(clientes_query.con_contadores(), despues=despues, antes=antes, ultima=ultima)
+    except CursorInvalido:
+        despues = antes = ''
+        ultima = False
+        pagina = paginar_clientes(clientes_query.con_contadores())
+    total_filtrado = clientes_query.count()
+    
+    # Clientes registrados desde cliente_web que todavía no tienen Cliente en gestion_clinica
+    # (el comando sincronizar_clientes los importa; mientras tanto se muestran los primeros
+    # MAXIMO_CLIENTES_WEB_PAGINA en la primera página)
     clientes_web = []
+    total_clientes_web = 0
     try:
-        from django.contrib.auth.models import User
         from cuentas.models import PerfilCliente
         
-        # Obtener todos los PerfilCliente
-        perfiles_web = PerfilCliente.objects.all()
+        # UPPER(email) usa el índice cliente_email_upper_idx
+        perfiles_web = PerfilCliente.objects.exclude(
+            Exists(Cliente.objects.annotate(email_mayusculas=Upper('email')).filter(
+                email_mayusculas=Upper(OuterRef('email'))
+            ))
+        ).exclude(email__isnull=True).exclude(email='').select_related('user')
         
         # Filtrar por búsqueda si existe
         if search:
-            from django.db.models import Q
             perfiles_web = perfiles_web.filter(
                 Q(nombre_completo__icontains=search) |
                 Q(email__icontains=search) |
                 Q(telefono__icontains=search) |
                 Q(rut__icontains=search)
             )
-        
-        # Solo incluir los que NO tienen Cliente asociado (por email)
-        for perfil in perfiles_web:
-            if perfil.email and perfil.email not in emails_existentes:
+        # Los perfiles sin usuario cuentan como activos
+        if estado == 'activo':
+            perfiles_web = perfiles_web.filter(Q(user__isnull=True) | Q(user__is_active=True))
+        elif estado == 'inactivo':
+            perfiles_web = perfiles_web.filter(user__is_active=False)
+        total_clientes_web = perfiles_web.count()
+        
+        if pagina['es_primera'] and not (despues or antes or ultima):
+            for perfil_web in perfiles_web.order_by('nombre_completo')[:MAXIMO_CLIENTES_WEB_PAGINA]:
+                activo = perfil_web.user.is_active if perfil_web.user else True
                 # Crear un objeto similar a Cliente para la vista
                 cliente_web = type('ClienteWeb', (), {
-                    'id': f'web_{perfil.id}',
-                    'nombre_completo': perfil.nombre_completo,
-                    'email': perfil.email,
-                    'telefono': perfil.telefono,
-                    'rut': perfil.rut or '',
-                    'fecha_nacimiento': perfil.fecha_nacimiento,
-                    'alergias': perfil.alergias or '',
-                    'fecha_registro': perfil.user.date_joined if perfil.user else None,
-                    'activo': perfil.user.is_active if perfil.user else True,
-                    'tiene_alergias': perfil.tiene_alergias,
-                    'edad': perfil.edad,
-                    'total_citas': 0,  # Se puede calcular después si es necesario
+                    'id': f'web_{perfil_web.id}',
+                    'nombre_completo': perfil_web.nombre_completo,
+                    'email': perfil_web.email,
+                    'telefono': perfil_web.telefono,
+                    'rut': perfil_web.rut or '',
+                    'fecha_nacimiento': perfil_web.fecha_nacimiento,
+                    'alergias': perfil_web.alergias or '',
+                    'fecha_registro': perfil_web.user.date_joined if perfil_web.user else None,
+                    'activo': activo,
+                    'tiene_alergias': perfil_web.tiene_alergias,
+                    'edad': perfil_web.edad,
+                    'total_citas': 0,
                     'total_odontogramas': 0,
                     'total_radiografias': 0,
                     'es_de_web': True,  # Marca para identificar que viene de cliente_web
-                    'user_id': perfil.user.id if perfil.user else None,
-                    'username': perfil.user.username if perfil.user else None,
+                    'user_id': perfil_web.user.id if perfil_web.user else None,
+                    'username': perfil_web.user.username if perfil_web.user else None,
                 })()
                 clientes_web.append(cliente_web)
     except ImportError:
@@ -2946,46 +3047,17 @@ def gestor_clientes(request):
         pass
     except Exception as e:
         # Si hay error, registrar pero continuar
-        import logging
-        logger = logging.getLogger(__name__)
         logger.warning(f"Error al obtener clientes de cliente_web: {e}")
     
-    # Convertir QuerySet a lista para poder combinar
-    clientes_list = list(clientes_query)
-    
-    # Agregar clientes de web
-    clientes_list.extend(clientes_web)
-    
-    # Ordenar por nombre
-    clientes_list.sort(key=lambda x: x.nombre_completo.lower())
-    
-    # Aplicar filtro de estado a clientes_web también
-    if estado == 'activo':
-        clientes_list = [c for c in clientes_list if getattr(c, 'activo', True)]
-    elif estado == 'inactivo':
-        clientes_list = [c for c in clientes_list if not getattr(c, 'activo', True)]
-    
-    # Paginación - 10 registros por página
-    paginator = Paginator(clientes_list, 10)
-    page = request.GET.get('page', 1)
-    
-    try:
-        clientes = paginator.page(page)
-    except PageNotAnInteger:
-        clientes = paginator.page(1)
-    except EmptyPage:
-        clientes = paginator.page(paginator.num_pages)
-    
-    # Estadísticas (incluyendo clientes de web)
-    total_clientes = Cliente.objects.count() + len(clientes_web)
-    clientes_con_citas_count = Cliente.objects.filter(citas__isnull=False).distinct().count()
+    clientes = clientes_web + pagina['clientes']
     
-    # Calcular clientes nuevos (últimos 30 días)
-    fecha_limite = timezone.now() - timedelta(days=30)
-    clientes_nuevos = Cliente.objects.filter(fecha_registro__gte=fecha_limite).count()
-    
-    # Calcular clientes con alergias
-    clientes_con_alergias = Cliente.objects.exclude(alergias__isnull=True).exclude(alergias='').exclude(alergias__iexact='ninguna').count()
+    # Estadísticas en una sola consulta
+    resumen_clientes = Cliente.objects.aggregate(
+        total=Count('id'),
+        con_citas=Count('id', filter=Exists(Cita.objects.filter(cliente=OuterRef('pk')))),
+        nuevos=Count('id', filter=Q(fecha_registro__gte=timezone.now() - timedelta(days=30))),
+        con_alergias=Count('id', filter=Q(alergias__isnull=False) & ~Q(alergias='') & ~Q(alergias__iexact='ninguna')),
+    )
     
     # Datos adicionales para panel derecho
     # Clientes recientes (últimos 5 registrados)
@@ -3000,12 +3072,12 @@ def gestor_clientes(request):
     ).select_related('cliente', 'tipo_servicio', 'dentista').order_by('fecha_hora')[:5]
     
     estadisticas = {
-        'total_clientes': total_clientes,
-        'clientes_con_citas': clientes_con_citas_count,
-        'clientes_gestion': Cliente.objects.count(),
-        'clientes_web': len(clientes_web),
-        'clientes_nuevos': clientes_nuevos,
-        'clientes_con_alergias': clientes_con_alergias,
+        'total_clientes': resumen_clientes['total'] + total_clientes_web,
+        'clientes_con_citas': resumen_clientes['con_citas'],
+        'clientes_gestion': resumen_clientes['total'],
+        'clientes_web': total_clientes_web,
+        'clientes_nuevos': resumen_clientes['nuevos'],
+        'clientes_con_alergias': resumen_clientes['con_alergias'],
     }
     
     context = {
@@ -3017,6 +3089,9 @@ def gestor_clientes(request):
         'es_admin': True,
         'clientes_recientes': clientes_recientes,
         'citas_proximas': citas_proximas,
+        'pagina': pagina,
+        'total_filtrado': total_filtrado + len(clientes_web),
+        'clientes_web_ocultos': total_clientes_web - len(clientes_web) if clientes_web else 0,
     }
     
     return render(request, 'citas/clientes/gestor_clientes.html', context)
@@ -3026,7 +3101,7 @@ def gestor_clientes(request):
 def exportar_excel_clientes(request):
     """Exporta la lista de clientes a un archivo Excel con diseño mejorado"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'No tienes permisos para exportar clientes.')
             return redirect('gestor_clientes')
@@ -3288,7 +3363,7 @@ def exportar_excel_clientes(request):
 @login_required
 def gestor_insumos(request):
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'No tienes permisos para gestionar insumos.')
             return redirect('panel_trabajador')
@@ -3368,7 +3443,7 @@ def gestor_insumos(request):
 @login_required
 def agregar_insumo(request):
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'No tienes permisos para agregar insumos.')
             return redirect('gestor_inventario_unificado')
@@ -3523,32 +3598,44 @@ def agregar_insumo(request):
                         }
                         return render(request, 'citas/insumos/agregar_insumo.html', context)
                 
-                insumo = Insumo.objects.create(
-                    nombre=nombre,
-                    categoria=categoria,
-                    descripcion=descripcion,
-                    imagen=imagen,
-                    cantidad_actual=cantidad_actual,
-                    cantidad_minima=cantidad_minima,
-                    unidad_medida=unidad_medida,
-                    precio_unitario=precio_unitario,
-                    proveedor_principal=proveedor_principal,
-                    fecha_vencimiento=fecha_vencimiento_obj,
-                    ubicacion=ubicacion,
-                    notas=notas,
-                    creado_por=perfil
-                )
+                # El insumo y su movimiento de stock inicial se guardan juntos o no se guarda ninguno
+                with transaction.atomic():
+                    insumo = Insumo.objects.create(
+                        nombre=nombre,
+                        categoria=categoria,
+                        descripcion=descripcion,
+                        imagen=imagen,
+                        cantidad_actual=cantidad_actual,
+                        cantidad_minima=cantidad_minima,
+                        unidad_medida=unidad_medida,
+                        precio_unitario=precio_unitario,
+                        proveedor_principal=proveedor_principal,
+                        fecha_vencimiento=fecha_vencimiento_obj,
+                        ubicacion=ubicacion,
+                        notas=notas,
+                        creado_por=perfil
+                    )
                 
-                # Crear movimiento inicial
-                MovimientoInsumo.objects.create(
-                    insumo=insumo,
-                    tipo='entrada',
-                    cantidad=cantidad_actual,
-                    cantidad_anterior=0,
-                    cantidad_nueva=cantidad_actual,
-                    motivo='Stock inicial',
-                    realizado_por=perfil
-                )
+                    # El stock inicial queda como el primer lote del insumo
+                    lote_inicial = None
+                    if cantidad_actual > 0:
+                        lote_inicial = LoteInsumo.objects.create(
+                            insumo=insumo,
+                            cantidad=cantidad_actual,
+                            fecha_vencimiento=fecha_vencimiento_obj
+                        )
+                
+                    # Crear movimiento inicial
+                    MovimientoInsumo.objects.create(
+                        insumo=insumo,
+                        lote=lote_inicial,
+                        tipo='entrada',
+                        cantidad=cantidad_actual,
+                        cantidad_anterior=0,
+                        cantidad_nueva=cantidad_actual,
+                        motivo='Stock inicial',
+                        realizado_por=perfil
+                    )
                 
                 success_msg = f'✅ Insumo "{nombre}" agregado correctamente con {cantidad_actual} {unidad_medida} de stock inicial.'
                 
@@ -3585,11 +3672,19 @@ def agregar_insumo(request):
     
     return render(request, 'citas/insumos/agregar_insumo.html', context)
 
+class StockModificado(Exception):
+    """El stock cambió entre que se abrió el formulario de edición y se guardó"""
+
+    def __init__(self, stock_actual):
+        self.stock_actual = stock_actual
+        super().__init__(f'El stock cambió (ahora {stock_actual})')
+
+
 # Editar insumo
 @login_required
 def editar_insumo(request, insumo_id):
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'No tienes permisos para editar insumos.')
             return redirect('gestor_inventario_unificado')
@@ -3599,10 +3694,13 @@ def editar_insumo(request, insumo_id):
     insumo = get_object_or_404(Insumo, id=insumo_id)
     
     if request.method == 'POST':
+        fecha_vencimiento_anterior = insumo.fecha_vencimiento
         insumo.nombre = request.POST.get('nombre')
         insumo.categoria = request.POST.get('categoria')
         insumo.descripcion = request.POST.get('descripcion', '')
-        insumo.cantidad_actual = int(request.POST.get('cantidad_actual', 0))
+        cantidad_formulario = int(request.POST.get('cantidad_actual', 0))
+        cantidad_original = request.POST.get('cantidad_original', '')
+        cantidad_original = int(cantidad_original) if cantidad_original.isdigit() else insumo.cantidad_actual
         insumo.cantidad_minima = int(request.POST.get('cantidad_minima', 1))
         insumo.unidad_medida = request.POST.get('unidad_medida', 'unidad')
         precio_unitario_str = request.POST.get('precio_unitario')
@@ -3652,9 +3750,39 @@ def editar_insumo(request, insumo_id):
             insumo.imagen = nueva_imagen
         
         try:
-            insumo.save()
+            with transaction.atomic():
+                # El stock no se sobrescribe con el valor leído al abrir el formulario (pisaría
+                # los consumos registrados mientras tanto): solo si el usuario cambió la
+                # cantidad se registra como ajuste en el libro de stock (ver inventario/stock.py),
+                # y si el stock también cambió desde que abrió el formulario se le pide revisarla
+                stock_actual = Insumo.objects.select_for_update().values_list('cantidad_actual', flat=True).get(id=insumo.id)
+                ajustar_stock = cantidad_formulario != cantidad_original
+                if ajustar_stock and stock_actual != cantidad_original:
+                    raise StockModificado(stock_actual)
+                insumo.save(update_fields=[
+                    'nombre', 'categoria', 'descripcion', 'cantidad_minima', 'unidad_medida',
+                    'precio_unitario', 'proveedor_principal', 'fecha_vencimiento', 'ubicacion',
+                    'notas', 'imagen', 'actualizado_el',
+                ])
+                # El vencimiento del formulario corresponde al stock sin lote informado; el
+                # del insumo sigue siendo el más próximo de sus lotes
+                lotes = insumo.lotes.filter(cantidad__gt=0)
+                if insumo.fecha_vencimiento != fecha_vencimiento_anterior:
+                    lotes.filter(codigo='').update(fecha_vencimiento=insumo.fecha_vencimiento)
+                if ajustar_stock and cantidad_formulario != stock_actual:
+                    aplicar_movimiento(insumo, 'ajuste', cantidad_formulario, 'Ajuste desde edición del insumo', realizado_por=perfil)
+                elif insumo.fecha_vencimiento != fecha_vencimiento_anterior and lotes.exists():
+                    insumo.fecha_vencimiento = lotes.aggregate(proximo=Min('fecha_vencimiento'))['proximo']
+                    insumo.save(update_fields=['fecha_vencimiento'])
             messages.success(request, f'✅ Insumo "{insumo.nombre}" actualizado correctamente.')
             return redirect(reverse('gestor_inventario_unificado') + '?seccion=insumos')
+        except StockModificado as e:
+            insumo.cantidad_actual = e.stock_actual
+            messages.error(
+                request,
+                f'El stock de "{insumo.nombre}" cambió mientras editabas (ahora {e.stock_actual} {insumo.unidad_medida}). '
+                'Revisa la cantidad y vuelve a guardar; los demás cambios no se guardaron.'
+            )
         except Exception as e:
             messages.error(request, f'Error al actualizar insumo: {e}')
     
@@ -3675,7 +3803,7 @@ def editar_insumo(request, insumo_id):
 @login_required
 def movimiento_insumo(request, insumo_id):
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'No tienes permisos para realizar movimientos de stock.')
             return redirect('gestor_inventario_unificado')
@@ -3689,40 +3817,33 @@ def movimiento_insumo(request, insumo_id):
         cantidad = int(request.POST.get('cantidad', 0))
         motivo = request.POST.get('motivo', '')
         observaciones = request.POST.get('observaciones', '')
+        # Lote y vencimiento (solo para entradas)
+        lote = request.POST.get('lote', '').strip()
+        fecha_vencimiento = None
+        if request.POST.get('fecha_vencimiento'):
+            try:
+                fecha_vencimiento = datetime.strptime(request.POST['fecha_vencimiento'], '%Y-%m-%d').date()
+            except ValueError:
+                messages.error(request, 'La fecha de vencimiento no es válida.')
+                return redirect(reverse('gestor_inventario_unificado') + '?seccion=insumos')
         
         if cantidad <= 0:
             messages.error(request, 'La cantidad debe ser mayor a 0.')
             return redirect(reverse('gestor_inventario_unificado') + '?seccion=insumos')
         
-        cantidad_anterior = insumo.cantidad_actual
-        
         try:
-            if tipo == 'entrada':
-                insumo.cantidad_actual += cantidad
-            elif tipo == 'salida':
-                if cantidad > insumo.cantidad_actual:
-                    messages.error(request, 'No hay suficiente stock disponible.')
-                    return redirect(reverse('gestor_inventario_unificado') + '?seccion=insumos')
-                insumo.cantidad_actual -= cantidad
-            elif tipo == 'ajuste':
-                insumo.cantidad_actual = cantidad
-            
-            insumo.save()
-            
-            # Crear movimiento
-            MovimientoInsumo.objects.create(
-                insumo=insumo,
-                tipo=tipo,
-                cantidad=cantidad,
-                cantidad_anterior=cantidad_anterior,
-                cantidad_nueva=insumo.cantidad_actual,
-                motivo=motivo,
-                observaciones=observaciones,
-                realizado_por=perfil
+            # El stock se actualiza con bloqueo de fila y las salidas se descuentan por
+            # lote en orden de vencimiento (ver inventario/stock.py)
+            aplicar_movimiento(
+                insumo, tipo, cantidad, motivo, observaciones=observaciones, realizado_por=perfil,
+                lote=lote, fecha_vencimiento=fecha_vencimiento
             )
             
             messages.success(request, f'✅ Movimiento de stock realizado correctamente.')
             return redirect(reverse('gestor_inventario_unificado') + '?seccion=insumos')
+        except StockInsuficiente:
+            messages.error(request, 'No hay suficiente stock disponible.')
+            return redirect(reverse('gestor_inventario_unificado') + '?seccion=insumos')
         except Exception as e:
             messages.error(request, f'Error al realizar movimiento: {e}')
     
@@ -3740,7 +3861,7 @@ def movimiento_insumo(request, insumo_id):
 def eliminar_insumo(request, insumo_id):
     """Vista para eliminar un insumo"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'No tienes permisos para eliminar insumos.')
             return redirect(reverse('gestor_inventario_unificado') + '?seccion=insumos')
@@ -3768,7 +3889,7 @@ def eliminar_insumo(request, insumo_id):
 @login_required
 def historial_movimientos(request):
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'No tienes permisos para ver el historial de movimientos.')
             return redirect('gestor_inventario_unificado')
@@ -3810,7 +3931,7 @@ def historial_movimientos(request):
 @login_required
 def gestor_personal(request):
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'No tienes permisos para gestionar personal.')
             return redirect('panel_trabajador')
@@ -3913,7 +4034,7 @@ def gestor_personal(request):
 @login_required
 def agregar_personal(request):
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'No tienes permisos para agregar personal.')
             return redirect('gestor_personal')
@@ -4071,7 +4192,7 @@ def agregar_personal(request):
 @login_required
 def editar_personal(request, personal_id):
     try:
-        perfil_admin = Perfil.objects.get(user=request.user)
+        perfil_admin = obtener_perfil(request)
         if not perfil_admin.es_administrativo():
             messages.error(request, 'No tienes permisos para editar personal.')
             return redirect('gestor_personal')
@@ -4247,7 +4368,7 @@ def editar_personal(request, personal_id):
 @login_required
 def eliminar_personal(request, personal_id):
     try:
-        perfil_admin = Perfil.objects.get(user=request.user)
+        perfil_admin = obtener_perfil(request)
         if not perfil_admin.es_administrativo():
             messages.error(request, 'No tienes permisos para eliminar personal.')
             return redirect('gestor_personal')
@@ -4300,7 +4421,7 @@ def toggle_estado_personal(request, personal_id):
     También desactiva/activa su cuenta de usuario web si existe
     """
     try:
-        perfil_admin = Perfil.objects.get(user=request.user)
+        perfil_admin = obtener_perfil(request)
         if not perfil_admin.es_administrativo():
             return JsonResponse({
                 'success': False,
@@ -4358,7 +4479,7 @@ def toggle_estado_personal(request, personal_id):
 @login_required
 def calendario_personal(request):
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_dentista():
             messages.error(request, 'Solo los dentistas pueden acceder al calendario personal.')
             return redirect('panel_trabajador')
@@ -4439,7 +4560,7 @@ def calendario_personal(request):
 def obtener_perfil_json(request):
     """Vista AJAX para obtener información del perfil en JSON"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         
         # Obtener estadísticas según el rol
         if perfil.es_dentista():
@@ -4500,7 +4621,7 @@ def obtener_perfil_json(request):
 @login_required
 def mi_perfil(request):
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_dentista():
             messages.error(request, 'No tienes permisos para acceder a esta página.')
             return redirect('panel_trabajador')
@@ -4526,7 +4647,7 @@ def mi_perfil(request):
 @login_required
 def asignar_dentista_cita(request, cita_id):
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'No tienes permisos para asignar dentistas.')
             return redirect('panel_trabajador')
@@ -4566,7 +4687,7 @@ def asignar_dentista_cita(request, cita_id):
 @login_required
 def mis_citas_dentista(request):
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_dentista():
             messages.error(request, 'No tienes permisos para acceder a esta función.')
             return redirect('panel_trabajador')
@@ -4684,7 +4805,7 @@ def tomar_cita_dentista(request, cita_id):
 @login_required
 def exportar_insumos_pdf(request):
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'No tienes permisos para exportar insumos.')
             return redirect('gestor_inventario_unificado')
@@ -4693,186 +4814,196 @@ def exportar_insumos_pdf(request):
         return redirect('login')
 
     # Obtener todos los insumos
-    insumos = Insumo.objects.all().order_by('categoria', 'nombre')
-    
-    # Crear el buffer para el PDF
-    buffer = BytesIO()
-    
-    # Crear el documento PDF
-    doc = SimpleDocTemplate(
-        buffer,
-        pagesize=A4,
-        rightMargin=72,
-        leftMargin=72,
-        topMargin=72,
-        bottomMargin=18
-    )
-    
-    # Estilos
-    styles = getSampleStyleSheet()
+    insumos = Insumo.objects.select_related('proveedor_principal').order_by('categoria', 'nombre')
+    
+    def construir_pdf():
+        """Arma el PDF con ReportLab (solo si no está en caché)"""
+        # Crear el buffer para el PDF
+        buffer = BytesIO()
+    
+        # Crear el documento PDF
+        doc = SimpleDocTemplate(
+            buffer,
+            pagesize=A4,
+            rightMargin=72,
+            leftMargin=72,
+            topMargin=72,
+            bottomMargin=18
+        )
     
-    # Estilo personalizado para el título
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=24,
-        spaceAfter=30,
-        alignment=TA_CENTER,
-        textColor=colors.HexColor('#3b82f6')
-    )
+        # Estilos
+        styles = getSampleStyleSheet()
+    
+        # Estilo personalizado para el título
+        title_style = ParagraphStyle(
+            'CustomTitle',
+            parent=styles['Heading1'],
+            fontSize=24,
+            spaceAfter=30,
+            alignment=TA_CENTER,
+            textColor=colors.HexColor('#3b82f6')
+        )
     
-    # Estilo para subtítulos
-    subtitle_style = ParagraphStyle(
-        'CustomSubtitle',
-        parent=styles['Heading2'],
-        fontSize=14,
-        spaceAfter=12,
-        alignment=TA_LEFT,
-        textColor=colors.HexColor('#1e293b')
-    )
+        # Estilo para subtítulos
+        subtitle_style = ParagraphStyle(
+            'CustomSubtitle',
+            parent=styles['Heading2'],
+            fontSize=14,
+            spaceAfter=12,
+            alignment=TA_LEFT,
+            textColor=colors.HexColor('#1e293b')
+        )
     
-    # Estilo para información de la clínica
-    info_style = ParagraphStyle(
-        'InfoStyle',
-        parent=styles['Normal'],
-        fontSize=10,
-        alignment=TA_CENTER,
-        textColor=colors.HexColor('#64748b')
-    )
+        # Estilo para información de la clínica
+        info_style = ParagraphStyle(
+            'InfoStyle',
+            parent=styles['Normal'],
+            fontSize=10,
+            alignment=TA_CENTER,
+            textColor=colors.HexColor('#64748b')
+        )
     
-    # Contenido del PDF
-    story = []
+        # Contenido del PDF
+        story = []
     
-    # Título principal
-    title = Paragraph("INVENTARIO DE INSUMOS", title_style)
-    story.append(title)
+        # Título principal
+        title = Paragraph("INVENTARIO DE INSUMOS", title_style)
+        story.append(title)
     
-    # Información de la clínica y fecha
-    clinic_info = Paragraph(
-        f"<b>Clínica Dental</b><br/>"
-        f"Reporte generado el: {datetime.now().strftime('%d/%m/%Y a las %H:%M')}<br/>"
-        f"Generado por: {perfil.nombre_completo}",
-        info_style
-    )
-    story.append(clinic_info)
-    story.append(Spacer(1, 20))
+        # Información de la clínica y fecha
+        clinic_info = Paragraph(
+            f"<b>Clínica Dental</b><br/>"
+            f"Reporte generado el: {datetime.now().strftime('%d/%m/%Y')}<br/>"
+            f"Generado por: {perfil.nombre_completo}",
+            info_style
+        )
+        story.append(clinic_info)
+        story.append(Spacer(1, 20))
     
-    # Estadísticas generales
-    total_insumos = insumos.count()
-    stock_bajo = insumos.filter(cantidad_actual__lte=F('cantidad_minima')).count()
-    agotados = insumos.filter(estado='agotado').count()
+        # Estadísticas generales
+        total_insumos = insumos.count()
+        stock_bajo = insumos.filter(cantidad_actual__lte=F('cantidad_minima')).count()
+        agotados = insumos.filter(estado='agotado').count()
     
-    stats_text = f"""
-    <b>ESTADÍSTICAS GENERALES:</b><br/>
-    • Total de insumos: {total_insumos}<br/>
-    • Stock bajo: {stock_bajo}<br/>
-    • Agotados: {agotados}
-    """
-    stats_para = Paragraph(stats_text, subtitle_style)
-    story.append(stats_para)
-    story.append(Spacer(1, 20))
+        stats_text = f"""
+        <b>ESTADÍSTICAS GENERALES:</b><br/>
+        • Total de insumos: {total_insumos}<br/>
+        • Stock bajo: {stock_bajo}<br/>
+        • Agotados: {agotados}
+        """
+        stats_para = Paragraph(stats_text, subtitle_style)
+        story.append(stats_para)
+        story.append(Spacer(1, 20))
     
-    # Agrupar insumos por categoría
-    categorias = {}
-    for insumo in insumos:
-        categoria = insumo.get_categoria_display()
-        if categoria not in categorias:
-            categorias[categoria] = []
-        categorias[categoria].append(insumo)
-    
-    # Crear tabla para cada categoría
-    for categoria, insumos_categoria in categorias.items():
-        # Subtítulo de categoría
-        categoria_title = Paragraph(f"<b>{categoria.upper()}</b>", subtitle_style)
-        story.append(categoria_title)
-        story.append(Spacer(1, 10))
-        
-        # Crear tabla de insumos
-        table_data = [
-            ['Nombre', 'Stock Actual', 'Stock Mínimo', 'Estado', 'Proveedor', 'Ubicación']
-        ]
-        
-        for insumo in insumos_categoria:
-            # Determinar estado visual
-            if insumo.estado == 'agotado':
-                estado = "AGOTADO"
-            elif insumo.stock_bajo:
-                estado = "STOCK BAJO"
-            elif insumo.proximo_vencimiento:
-                estado = "PRÓXIMO A VENCER"
-            else:
-                estado = "DISPONIBLE"
-            
-            table_data.append([
-                insumo.nombre,
-                f"{insumo.cantidad_actual} {insumo.unidad_medida}",
-                f"{insumo.cantidad_minima} {insumo.unidad_medida}",
-                estado,
-                insumo.proveedor or "N/A",
-                insumo.ubicacion or "N/A"
-            ])
+        # Agrupar insumos por categoría
+        categorias = {}
+        for insumo in insumos:
+            categoria = insumo.get_categoria_display()
+            if categoria not in categorias:
+                categorias[categoria] = []
+            categorias[categoria].append(insumo)
+    
+        # Crear tabla para cada categoría
+        for categoria, insumos_categoria in categorias.items():
+            # Subtítulo de categoría
+            categoria_title = Paragraph(f"<b>{categoria.upper()}</b>", subtitle_style)
+            story.append(categoria_title)
+            story.append(Spacer(1, 10))
         
-        # Crear tabla
-        table = Table(table_data, colWidths=[2*inch, 1*inch, 1*inch, 1*inch, 1.5*inch, 1*inch])
+            # Crear tabla de insumos
+            table_data = [
+                ['Nombre', 'Stock Actual', 'Stock Mínimo', 'Estado', 'Proveedor', 'Ubicación']
+            ]
         
-        # Estilo de la tabla
-        table.setStyle(TableStyle([
-            # Encabezados
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#3b82f6')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            for insumo in insumos_categoria:
+                # Determinar estado visual
+                if insumo.estado == 'agotado':
+                    estado = "AGOTADO"
+                elif insumo.stock_bajo:
+                    estado = "STOCK BAJO"
+                elif insumo.proximo_vencimiento:
+                    estado = "PRÓXIMO A VENCER"
+                else:
+                    estado = "DISPONIBLE"
+            
+                table_data.append([
+                    insumo.nombre,
+                    f"{insumo.cantidad_actual} {insumo.unidad_medida}",
+                    f"{insumo.cantidad_minima} {insumo.unidad_medida}",
+                    estado,
+                    insumo.proveedor_principal.nombre if insumo.proveedor_principal else (insumo.proveedor_texto or "N/A"),
+                    insumo.ubicacion or "N/A"
+                ])
+        
+            # Crear tabla
+            table = Table(table_data, colWidths=[2*inch, 1*inch, 1*inch, 1*inch, 1.5*inch, 1*inch])
+        
+            # Estilo de la tabla
+            table.setStyle(TableStyle([
+                # Encabezados
+                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#3b82f6')),
+                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                ('FONTSIZE', (0, 0), (-1, 0), 10),
+                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
             
-            # Filas de datos
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 1), (-1, -1), 8),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+                # Filas de datos
+                ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+                ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+                ('FONTSIZE', (0, 1), (-1, -1), 8),
+                ('GRID', (0, 0), (-1, -1), 1, colors.black),
+                ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
             
-            # Colores de estado
-            ('TEXTCOLOR', (3, 1), (3, -1), colors.black),
-        ]))
-        
-        # Aplicar colores de estado
-        for i, insumo in enumerate(insumos_categoria, 1):
-            if insumo.estado == 'agotado':
-                table.setStyle(TableStyle([
-                    ('TEXTCOLOR', (3, i), (3, i), colors.red),
-                ]))
-            elif insumo.stock_bajo:
-                table.setStyle(TableStyle([
-                    ('TEXTCOLOR', (3, i), (3, i), colors.orange),
-                ]))
-            elif insumo.proximo_vencimiento:
-                table.setStyle(TableStyle([
-                    ('TEXTCOLOR', (3, i), (3, i), colors.red),
-                ]))
-            else:
-                table.setStyle(TableStyle([
-                    ('TEXTCOLOR', (3, i), (3, i), colors.green),
-                ]))
+                # Colores de estado
+                ('TEXTCOLOR', (3, 1), (3, -1), colors.black),
+            ]))
+        
+            # Aplicar colores de estado
+            for i, insumo in enumerate(insumos_categoria, 1):
+                if insumo.estado == 'agotado':
+                    table.setStyle(TableStyle([
+                        ('TEXTCOLOR', (3, i), (3, i), colors.red),
+                    ]))
+                elif insumo.stock_bajo:
+                    table.setStyle(TableStyle([
+                        ('TEXTCOLOR', (3, i), (3, i), colors.orange),
+                    ]))
+                elif insumo.proximo_vencimiento:
+                    table.setStyle(TableStyle([
+                        ('TEXTCOLOR', (3, i), (3, i), colors.red),
+                    ]))
+                else:
+                    table.setStyle(TableStyle([
+                        ('TEXTCOLOR', (3, i), (3, i), colors.green),
+                    ]))
         
-        story.append(table)
-        story.append(Spacer(1, 20))
+            story.append(table)
+            story.append(Spacer(1, 20))
     
-    # Pie de página
-    footer_text = f"""
-    <i>Este reporte fue generado automáticamente por el sistema de gestión de la clínica dental.<br/>
-    Para más información, consulte el sistema en línea.</i>
-    """
-    footer_para = Paragraph(footer_text, info_style)
-    story.append(Spacer(1, 30))
-    story.append(footer_para)
+        # Pie de página
+        footer_text = f"""
+        <i>Este reporte fue generado automáticamente por el sistema de gestión de la clínica dental.<br/>
+        Para más información, consulte el sistema en línea.</i>
+        """
+        footer_para = Paragraph(footer_text, info_style)
+        story.append(Spacer(1, 30))
+        story.append(footer_para)
     
-    # Construir el PDF
-    doc.build(story)
+        # Construir el PDF
+        doc.build(story)
     
-    # Obtener el contenido del buffer
-    pdf_content = buffer.getvalue()
-    buffer.close()
+        # Obtener el contenido del buffer
+        pdf_content = buffer.getvalue()
+        buffer.close()
+        return pdf_content
+    
+    # Servir desde la caché si los datos no cambiaron desde la última generación
+    huella = huella_inventario(insumos)
+    pdf_content = obtener_pdf_cacheado('inventario', clave_generador('insumos', perfil), huella)
+    if pdf_content is None:
+        pdf_content = construir_pdf()
+        guardar_pdf_cacheado('inventario', clave_generador('insumos', perfil), huella, pdf_content)
     
     # Crear respuesta HTTP
     response = HttpResponse(content_type='application/pdf')
@@ -4895,7 +5026,7 @@ def custom_logout(request):
 def gestionar_pacientes(request):
     """Vista principal para que los dentistas gestionen sus pacientes"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_dentista():
             messages.error(request, 'Solo los dentistas pueden gestionar pacientes.')
             return redirect('panel_trabajador')
@@ -4914,9 +5045,7 @@ def gestionar_pacientes(request):
     if search:
         pacientes = [
             paciente for paciente in pacientes
-            if (search.lower() in paciente['nombre_completo'].lower() or
-                search.lower() in paciente['email'].lower() or
-                search.lower() in paciente['telefono'].lower())
+            if coincide_busqueda(search, paciente['nombre_completo'], paciente['email'], paciente['telefono'])
         ]
     
     if estado == 'activo':
@@ -4952,7 +5081,7 @@ def estadisticas_paciente_json(request, paciente_id):
     from django.http import JsonResponse
     
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_dentista():
             return JsonResponse({'success': False, 'message': 'Solo los dentistas pueden ver estadísticas de pacientes.'}, status=403)
     except Perfil.DoesNotExist:
@@ -5018,7 +5147,7 @@ def estadisticas_paciente_json(request, paciente_id):
 def estadisticas_pacientes(request):
     """Vista para mostrar estadísticas detalladas de los pacientes del dentista"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_dentista():
             messages.error(request, 'Solo los dentistas pueden ver estadísticas de pacientes.')
             return redirect('panel_trabajador')
@@ -5085,7 +5214,7 @@ def estadisticas_pacientes(request):
 def asignar_dentista_cliente(request, cliente_id):
     """Vista para que los administrativos asignen un dentista a un cliente"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'Solo los administrativos pueden asignar dentistas a clientes.')
             return redirect('panel_trabajador')
@@ -5112,6 +5241,7 @@ def asignar_dentista_cliente(request, cliente_id):
                 # También actualizar las citas del cliente
                 Cita.objects.filter(cliente=cliente).update(dentista=dentista)
                 Cita.objects.filter(paciente_email=cliente.email).update(dentista=dentista)
+                recalcular_asignaciones_cliente(cliente)
                 
                 messages.success(request, f'Dentista {dentista.nombre_completo} asignado correctamente al cliente {cliente.nombre_completo}.')
                 return redirect('gestor_clientes')
@@ -5125,6 +5255,7 @@ def asignar_dentista_cliente(request, cliente_id):
             # También remover de las citas del cliente
             Cita.objects.filter(cliente=cliente).update(dentista=None)
             Cita.objects.filter(paciente_email=cliente.email).update(dentista=None)
+            recalcular_asignaciones_cliente(cliente)
             
             messages.success(request, f'Dentista removido del cliente {cliente.nombre_completo}.')
             return redirect('gestor_clientes')
@@ -5148,7 +5279,7 @@ def asignar_dentista_cliente(request, cliente_id):
 def listar_odontogramas(request):
     """Vista para listar todos los odontogramas del dentista"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_dentista():
             messages.error(request, 'Solo los dentistas pueden acceder a los odontogramas.')
             return redirect('panel_trabajador')
@@ -5251,7 +5382,7 @@ def listar_odontogramas(request):
 def crear_odontograma(request):
     """Vista para crear un nuevo odontograma"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_dentista():
             messages.error(request, 'Solo los dentistas pueden crear odontogramas.')
             return redirect('panel_trabajador')
@@ -5358,64 +5489,12 @@ def crear_odontograma(request):
                 )
                 
                 # Procesar datos del odontograma interactivo
-                odontograma_data = request.POST.get('odontograma_data', '')
-                odontograma_data_extended = request.POST.get('odontograma_data_extended', '')
-                
-                if odontograma_data:
-                    try:
-                        import json
-                        dientes_data = json.loads(odontograma_data)
-                        extended_data = {}
-                        
-                        # Cargar datos extendidos si existen
-                        if odontograma_data_extended:
-                            try:
-                                extended_data = json.loads(odontograma_data_extended)
-                            except:
-                                extended_data = {}
-                        
-                        for numero_diente, caras_data in dientes_data.items():
-                            # Determinar el estado general del diente
-                            estados = list(caras_data.values())
-                            if 'ausente' in estados:
-                                estado_general_diente = 'ausente'
-                            elif 'caries' in estados:
-                                estado_general_diente = 'caries'
-                            elif 'obturado' in estados:
-                                estado_general_diente = 'obturado'
-                            elif 'corona' in estados:
-                                estado_general_diente = 'corona'
-                            elif 'endodoncia' in estados:
-                                estado_general_diente = 'endodoncia'
-                            elif 'protesis' in estados:
-                                estado_general_diente = 'protesis'
-                            elif 'implante' in estados:
-                                estado_general_diente = 'implante'
-                            elif 'fractura' in estados:
-                                estado_general_diente = 'fractura'
-                            elif 'sellante' in estados:
-                                estado_general_diente = 'sellante'
-                            else:
-                                estado_general_diente = 'sano'
-                            
-                            # Preparar observaciones con datos extendidos
-                            observaciones_data = {
-                                'caras': caras_data
-                            }
-                            
-                            # Agregar metadata (diagnóstico y procedimiento) si existe
-                            if numero_diente in extended_data:
-                                observaciones_data['metadata'] = extended_data[numero_diente]
-                            
-                            # Crear estado del diente
-                            EstadoDiente.objects.create(
-                                odontograma=odontograma,
-                                numero_diente=int(numero_diente),
-                                estado=estado_general_diente,
-                                observaciones=f"Datos del odontograma interactivo: {json.dumps(observaciones_data)}"
-                            )
-                    except (json.JSONDecodeError, ValueError) as e:
-                        messages.warning(request, f'Error al procesar datos del odontograma: {str(e)}')
+                try:
+                    dientes_data, extended_data = leer_datos_formulario(request.POST)
+                    if dientes_data:
+                        guardar_dientes_odontograma(odontograma, dientes_data, extended_data, nuevo=True)
+                except ValueError as e:
+                    messages.warning(request, f'Error al procesar datos del odontograma: {str(e)}')
                 
                 # Procesar insumos utilizados
                 insumos_ids = request.POST.getlist('insumo_id[]')
@@ -5423,6 +5502,7 @@ def crear_odontograma(request):
                 
                 insumos_procesados = 0
                 insumos_errores = []
+                consumos = []
                 
                 for i, insumo_id in enumerate(insumos_ids):
                     # Saltar si el ID está vacío o es solo espacios
@@ -5439,50 +5519,42 @@ def crear_odontograma(request):
                         try:
                             cantidad = int(cantidad_str)
                             if cantidad > 0:
-                                # Obtener el insumo
-                                from inventario.models import Insumo, MovimientoInsumo
-                                from historial_clinico.models import InsumoOdontograma
-                                insumo = Insumo.objects.get(id=insumo_id)
-                                
-                                # Verificar que haya suficiente stock
-                                if insumo.cantidad_actual >= cantidad:
-                                    # Crear registro de insumo utilizado
-                                    InsumoOdontograma.objects.create(
-                                        odontograma=odontograma,
-                                        insumo=insumo,
-                                        cantidad_utilizada=cantidad
-                                    )
-                                    
-                                    # Actualizar cantidad del insumo
-                                    cantidad_anterior = insumo.cantidad_actual
-                                    insumo.cantidad_actual -= cantidad
-                                    
-                                    # Actualizar estado si se agotó
-                                    if insumo.cantidad_actual == 0:
-                                        insumo.estado = 'agotado'
-                                    
-                                    insumo.save()
-                                    
-                                    # Crear movimiento de insumo
-                                    MovimientoInsumo.objects.create(
-                                        insumo=insumo,
-                                        tipo='salida',
-                                        cantidad=cantidad,
-                                        cantidad_anterior=cantidad_anterior,
-                                        cantidad_nueva=insumo.cantidad_actual,
-                                        motivo=f'Uso en odontograma - Paciente: {paciente_nombre}',
-                                        observaciones=f'Odontograma ID: {odontograma.id}',
-                                        realizado_por=perfil
-                                    )
-                                    
-                                    insumos_procesados += 1
-                                else:
-                                    insumos_errores.append(f'{insumo.nombre}: Stock insuficiente (disponible: {insumo.cantidad_actual}, solicitado: {cantidad})')
-                        except Insumo.DoesNotExist:
-                            insumos_errores.append(f'Insumo con ID {insumo_id} no encontrado')
+                                consumos.append({
+                                    'insumo': int(insumo_id),
+                                    'tipo': 'salida',
+                                    'cantidad': cantidad,
+                                    'motivo': f'Uso en odontograma - Paciente: {paciente_nombre}',
+                                    'observaciones': f'Odontograma ID: {odontograma.id}',
+                                })
                         except (ValueError, TypeError):
                             insumos_errores.append(f'Cantidad inválida para el insumo')
                 
+                # Todos los insumos del procedimiento se descuentan en una sola llamada
+                # (ver inventario/stock.py); los que no tienen stock suficiente se omiten
+                if consumos:
+                    from historial_clinico.models import InsumoOdontograma
+                    existentes = set(Insumo.objects.filter(id__in=[c['insumo'] for c in consumos]).values_list('id', flat=True))
+                    for consumo in consumos:
+                        if consumo['insumo'] not in existentes:
+                            insumos_errores.append(f"Insumo con ID {consumo['insumo']} no encontrado")
+                    consumos = [c for c in consumos if c['insumo'] in existentes]
+                    with transaction.atomic():
+                        resultado = aplicar_movimientos(consumos, realizado_por=perfil, parcial=True)
+                        # Una salida que toca varios lotes son varios movimientos del mismo insumo
+                        utilizado = {}
+                        for movimiento in resultado['movimientos']:
+                            utilizado[movimiento.insumo_id] = utilizado.get(movimiento.insumo_id, 0) + movimiento.cantidad
+                        InsumoOdontograma.objects.bulk_create([
+                            InsumoOdontograma(
+                                odontograma=odontograma,
+                                insumo_id=insumo_id,
+                                cantidad_utilizada=cantidad
+                            )
+                            for insumo_id, cantidad in utilizado.items()
+                        ])
+                    insumos_procesados = len(utilizado)
+                    insumos_errores.extend(str(error) for error in resultado['rechazados'])
+                
                 # Si la cita estaba en "en_progreso" o "listo_para_atender", cambiar automáticamente a "finalizada"
                 if cita_obj.estado in ['en_progreso', 'listo_para_atender']:
                     cita_obj.estado = 'finalizada'
@@ -5653,7 +5725,7 @@ def crear_odontograma(request):
 def detalle_odontograma(request, odontograma_id):
     """Vista para ver los detalles de un odontograma específico"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not (perfil.es_dentista() or perfil.es_administrativo()):
             messages.error(request, 'Solo los dentistas y administrativos pueden ver odontogramas.')
             return redirect('panel_trabajador')
@@ -5722,6 +5794,7 @@ def detalle_odontograma(request, odontograma_id):
         'odontograma': odontograma,
         'estados_dientes': estados_dientes,
         'dientes_dict': dientes_dict,
+        'dientes_odontograma': dientes_para_plantilla(estados_dientes),
         'numeros_dientes': numeros_dientes_adultos,
         'estados_diente': Odontograma.ESTADO_DIENTE_CHOICES,
         'es_dentista': perfil.es_dentista(),
@@ -5736,7 +5809,7 @@ def detalle_odontograma(request, odontograma_id):
 def editar_odontograma(request, odontograma_id):
     """Vista para editar un odontograma existente"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_dentista():
             messages.error(request, 'Solo los dentistas pueden editar odontogramas.')
             # Redirigir de vuelta a la vista de detalle del odontograma para mostrar el mensaje
@@ -5792,67 +5865,12 @@ def editar_odontograma(request, odontograma_id):
         try:
             odontograma.save()
             # Procesar datos interactivos si vienen del formulario de edición
-            odontograma_data = request.POST.get('odontograma_data', '')
-            odontograma_data_extended = request.POST.get('odontograma_data_extended', '')
-            
-            if odontograma_data:
-                try:
-                    import json
-                    dientes_data = json.loads(odontograma_data)
-                    extended_data = {}
-                    
-                    # Cargar datos extendidos si existen
-                    if odontograma_data_extended:
-                        try:
-                            extended_data = json.loads(odontograma_data_extended)
-                        except:
-                            extended_data = {}
-                    
-                    from django.db import transaction
-                    with transaction.atomic():
-                        for numero_diente, caras_data in dientes_data.items():
-                            estados = list(caras_data.values())
-                            if 'ausente' in estados:
-                                estado_general_diente = 'perdido'
-                            elif 'caries' in estados:
-                                estado_general_diente = 'cariado'
-                            elif 'obturado' in estados:
-                                estado_general_diente = 'obturado'
-                            elif 'corona' in estados:
-                                estado_general_diente = 'corona'
-                            elif 'endodoncia' in estados:
-                                estado_general_diente = 'endodoncia'
-                            elif 'protesis' in estados:
-                                estado_general_diente = 'protesis'
-                            elif 'implante' in estados:
-                                estado_general_diente = 'implante'
-                            elif 'fractura' in estados:
-                                estado_general_diente = 'extraccion' if 'extraccion' in estados else 'cariado'
-                            elif 'sellante' in estados:
-                                estado_general_diente = 'obturado'
-                            else:
-                                estado_general_diente = 'sano'
-                            
-                            # Preparar observaciones con datos extendidos
-                            observaciones_data = {
-                                'caras': caras_data
-                            }
-                            
-                            # Agregar metadata (diagnóstico y procedimiento) si existe
-                            if numero_diente in extended_data:
-                                observaciones_data['metadata'] = extended_data[numero_diente]
-                            
-                            # Upsert EstadoDiente
-                            estado_obj, _ = EstadoDiente.objects.get_or_create(
-                                odontograma=odontograma,
-                                numero_diente=int(numero_diente),
-                                defaults={'estado': estado_general_diente}
-                            )
-                            estado_obj.estado = estado_general_diente
-                            estado_obj.observaciones = f"Datos del odontograma interactivo: {json.dumps(observaciones_data)}"
-                            estado_obj.save()
-                except Exception as e:
-                    messages.warning(request, f'Error al procesar datos del odontograma: {str(e)}')
+            try:
+                dientes_data, extended_data = leer_datos_formulario(request.POST)
+                if dientes_data:
+                    guardar_dientes_odontograma(odontograma, dientes_data, extended_data)
+            except Exception as e:
+                messages.warning(request, f'Error al procesar datos del odontograma: {str(e)}')
 
             messages.success(request, 'Odontograma actualizado correctamente.')
             # Obtener paciente_id para redirigir a Mis Pacientes
@@ -5898,6 +5916,7 @@ def editar_odontograma(request, odontograma_id):
         'perfil': perfil,
         'odontograma': odontograma,
         'condiciones': Odontograma.CONDICION_CHOICES,
+        'dientes_odontograma': dientes_para_plantilla(odontograma.dientes.all()),
         'es_dentista': True,
         'citas_disponibles': citas_disponibles,
         'paciente_id': paciente_id
@@ -5910,7 +5929,7 @@ def editar_odontograma(request, odontograma_id):
 def actualizar_diente(request, odontograma_id, numero_diente):
     """Vista para actualizar el estado de un diente específico"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_dentista():
             messages.error(request, 'Solo los dentistas pueden actualizar estados de dientes.')
             # Redirigir de vuelta a la vista de detalle del odontograma
@@ -5996,7 +6015,7 @@ def actualizar_diente(request, odontograma_id, numero_diente):
 def eliminar_odontograma(request, odontograma_id):
     """Vista para eliminar un odontograma"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_dentista():
             messages.error(request, 'Solo los dentistas pueden eliminar odontogramas.')
             # Redirigir de vuelta a la vista de detalle del odontograma
@@ -6037,7 +6056,7 @@ def eliminar_odontograma(request, odontograma_id):
 def exportar_odontograma_pdf(request, odontograma_id):
     """Vista para exportar un odontograma a PDF"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         # Permitir tanto a dentistas como a administrativos
         if not (perfil.es_dentista() or perfil.es_administrativo()):
             messages.error(request, 'No tienes permisos para exportar odontogramas.')
@@ -6058,192 +6077,142 @@ def exportar_odontograma_pdf(request, odontograma_id):
     # Crear diccionario de dientes para facilitar el acceso
     dientes_dict = {diente.numero_diente: diente for diente in estados_dientes}
     
-    # Función para extraer datos del odontograma interactivo desde observaciones
+    # Condición por cara guardada por el odontograma interactivo
     def get_tooth_interactive_data(estado_diente):
-        """Extrae los datos de las caras del odontograma interactivo desde observaciones"""
-        if not estado_diente or not estado_diente.observaciones:
+        """Devuelve las caras del odontograma interactivo del diente (o None si no tiene)"""
+        if not estado_diente or not estado_diente.caras:
             return None
-        if estado_diente.observaciones.startswith('Datos del odontograma interactivo: '):
-            try:
-                import json
-                json_str = estado_diente.observaciones.replace('Datos del odontograma interactivo: ', '')
-                data = json.loads(json_str)
-                # Si tiene estructura con 'caras', devolver las caras directamente
-                if isinstance(data, dict) and 'caras' in data:
-                    return data['caras']
-                # Si es directamente un diccionario de caras, devolverlo
-                elif isinstance(data, dict):
-                    return data
-                return None
-            except:
-                return None
-        return None
-    
-    # Crear el buffer para el PDF
-    buffer = BytesIO()
+        return estado_diente.caras
+    
+    def construir_pdf():
+        """Arma el PDF con ReportLab (solo si no está en caché)"""
+        # Crear el buffer para el PDF
+        buffer = BytesIO()
+    
+        # Crear el documento PDF con márgenes mejorados
+        doc = SimpleDocTemplate(
+            buffer,
+            pagesize=A4,
+            rightMargin=25,
+            leftMargin=25,
+            topMargin=40,
+            bottomMargin=30
+        )
     
-    # Crear el documento PDF con márgenes mejorados
-    doc = SimpleDocTemplate(
-        buffer,
-        pagesize=A4,
-        rightMargin=25,
-        leftMargin=25,
-        topMargin=40,
-        bottomMargin=30
-    )
+        # Estilos mejorados
+        styles = getSampleStyleSheet()
     
-    # Estilos mejorados
-    styles = getSampleStyleSheet()
-    
-    # Estilo personalizado para el título principal
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=18,
-        spaceAfter=10,
-        alignment=TA_CENTER,
-        textColor=colors.HexColor('#1e293b'),
-        fontName='Helvetica-Bold'
-    )
-    
-    # Estilo para subtítulos con color turquesa
-    subtitle_style = ParagraphStyle(
-        'CustomSubtitle',
-        parent=styles['Heading2'],
-        fontSize=11,
-        spaceAfter=8,
-        spaceBefore=12,
-        alignment=TA_LEFT,
-        textColor=colors.HexColor('#1e293b'),
-        fontName='Helvetica-Bold',
-        borderColor=colors.HexColor('#14b8a6'),
-        borderWidth=1,
-        borderPadding=6,
-        backColor=colors.HexColor('#f0fdfa')
-    )
+        # Estilo personalizado para el título principal
+        title_style = ParagraphStyle(
+            'CustomTitle',
+            parent=styles['Heading1'],
+            fontSize=18,
+            spaceAfter=10,
+            alignment=TA_CENTER,
+            textColor=colors.HexColor('#1e293b'),
+            fontName='Helvetica-Bold'
+        )
     
-    # Estilo para información de la clínica
-    info_style = ParagraphStyle(
-        'InfoStyle',
-        parent=styles['Normal'],
-        fontSize=8,
-        alignment=TA_CENTER,
-        textColor=colors.HexColor('#64748b')
-    )
+        # Estilo para subtítulos con color turquesa
+        subtitle_style = ParagraphStyle(
+            'CustomSubtitle',
+            parent=styles['Heading2'],
+            fontSize=11,
+            spaceAfter=8,
+            spaceBefore=12,
+            alignment=TA_LEFT,
+            textColor=colors.HexColor('#1e293b'),
+            fontName='Helvetica-Bold',
+            borderColor=colors.HexColor('#14b8a6'),
+            borderWidth=1,
+            borderPadding=6,
+            backColor=colors.HexColor('#f0fdfa')
+        )
     
-    # Estilo para texto normal
-    normal_style = ParagraphStyle(
-        'NormalCompact',
-        parent=styles['Normal'],
-        fontSize=9,
-        spaceAfter=4,
-        alignment=TA_LEFT,
-        leading=12
-    )
+        # Estilo para información de la clínica
+        info_style = ParagraphStyle(
+            'InfoStyle',
+            parent=styles['Normal'],
+            fontSize=8,
+            alignment=TA_CENTER,
+            textColor=colors.HexColor('#64748b')
+        )
     
-    # Estilo para texto de secciones
-    section_text_style = ParagraphStyle(
-        'SectionText',
-        parent=styles['Normal'],
-        fontSize=9,
-        spaceAfter=6,
-        alignment=TA_LEFT,
-        leading=13,
-        textColor=colors.HexColor('#374151')
-    )
+        # Estilo para texto normal
+        normal_style = ParagraphStyle(
+            'NormalCompact',
+            parent=styles['Normal'],
+            fontSize=9,
+            spaceAfter=4,
+            alignment=TA_LEFT,
+            leading=12
+        )
     
-    # Contenido del PDF
-    story = []
+        # Estilo para texto de secciones
+        section_text_style = ParagraphStyle(
+            'SectionText',
+            parent=styles['Normal'],
+            fontSize=9,
+            spaceAfter=6,
+            alignment=TA_LEFT,
+            leading=13,
+            textColor=colors.HexColor('#374151')
+        )
     
-    # Título principal con diseño mejorado
-    title = Paragraph("<b>FICHA ODONTOLÓGICA</b>", title_style)
-    story.append(title)
+        # Contenido del PDF
+        story = []
     
-    # Información de la clínica y fecha
-    clinic_info = Paragraph(
-        f"<b>Clínica Dental</b> | Fecha de Emisión: {datetime.now().strftime('%d/%m/%Y %H:%M')}",
-        info_style
-    )
-    story.append(clinic_info)
-    story.append(Spacer(1, 12))
+        # Título principal con diseño mejorado
+        title = Paragraph("<b>FICHA ODONTOLÓGICA</b>", title_style)
+        story.append(title)
     
-    # Nota introductoria breve para el paciente con color turquesa
-    nota_intro = Paragraph(
-        "<b>NOTA:</b><br/>"
-        "Este documento contiene el registro de su salud dental. "
-        "El odontograma muestra la condición de cada diente. "
-        "Consulte la leyenda al final para entender los símbolos y colores.",
-        ParagraphStyle(
-            'NotaIntro',
-            parent=styles['Normal'],
-            fontSize=8,
-            spaceAfter=10,
-            alignment=TA_LEFT,
-            textColor=colors.HexColor('#374151'),
-            leading=12,
-            leftIndent=0,
-            rightIndent=0,
-            backColor=colors.HexColor('#f0fdfa'),
-            borderPadding=8,
-            borderColor=colors.HexColor('#14b8a6'),
-            borderWidth=1
+        # Información de la clínica y fecha
+        clinic_info = Paragraph(
+            f"<b>Clínica Dental</b> | Fecha de Emisión: {datetime.now().strftime('%d/%m/%Y')}",
+            info_style
         )
-    )
-    story.append(nota_intro)
-    story.append(Spacer(1, 12))
+        story.append(clinic_info)
+        story.append(Spacer(1, 12))
     
-    # Sección: Información del Paciente
-    paciente_title = Paragraph("<b>INFORMACIÓN DEL PACIENTE</b>", subtitle_style)
-    story.append(paciente_title)
+        # Nota introductoria breve para el paciente con color turquesa
+        nota_intro = Paragraph(
+            "<b>NOTA:</b><br/>"
+            "Este documento contiene el registro de su salud dental. "
+            "El odontograma muestra la condición de cada diente. "
+            "Consulte la leyenda al final para entender los símbolos y colores.",
+            ParagraphStyle(
+                'NotaIntro',
+                parent=styles['Normal'],
+                fontSize=8,
+                spaceAfter=10,
+                alignment=TA_LEFT,
+                textColor=colors.HexColor('#374151'),
+                leading=12,
+                leftIndent=0,
+                rightIndent=0,
+                backColor=colors.HexColor('#f0fdfa'),
+                borderPadding=8,
+                borderColor=colors.HexColor('#14b8a6'),
+                borderWidth=1
+            )
+        )
+        story.append(nota_intro)
+        story.append(Spacer(1, 12))
     
-    # Tabla de información del paciente (solo datos esenciales)
-    paciente_data = [
-        ['Nombre:', odontograma.paciente_nombre],
-        ['Email:', odontograma.paciente_email],
-        ['Teléfono:', odontograma.paciente_telefono or 'No especificado']
-    ]
-    if odontograma.paciente_fecha_nacimiento:
-        paciente_data.append(['Fecha de Nacimiento:', odontograma.paciente_fecha_nacimiento.strftime('%d/%m/%Y')])
-    paciente_table = Table(paciente_data, colWidths=[2*inch, 4.5*inch])
-    paciente_table_style = TableStyle([
-        ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#f0fdfa')),
-        ('TEXTCOLOR', (0, 0), (0, -1), colors.HexColor('#1e293b')),
-        ('TEXTCOLOR', (1, 0), (1, -1), colors.HexColor('#374151')),
-        ('ALIGN', (0, 0), (0, -1), 'LEFT'),
-        ('ALIGN', (1, 0), (1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 0), (-1, -1), 9),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#ccfbf1')),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('LEFTPADDING', (0, 0), (-1, -1), 8),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 8),
-        ('TOPPADDING', (0, 0), (-1, -1), 6),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-    ])
-    paciente_table.setStyle(paciente_table_style)
-    story.append(paciente_table)
-    story.append(Spacer(1, 12))
+        # Sección: Información del Paciente
+        paciente_title = Paragraph("<b>INFORMACIÓN DEL PACIENTE</b>", subtitle_style)
+        story.append(paciente_title)
     
-    # Sección: Información Clínica
-    clinica_title = Paragraph("<b>INFORMACIÓN CLÍNICA</b>", subtitle_style)
-    story.append(clinica_title)
-    
-    # Motivo de consulta (solo si existe)
-    if odontograma.motivo_consulta:
-        motivo_text = Paragraph(f"<b>Motivo de Consulta:</b> {odontograma.motivo_consulta}", section_text_style)
-        story.append(motivo_text)
-        story.append(Spacer(1, 4))
-    
-    # Estado e higiene en tabla (solo si hay datos)
-    estado_data = []
-    if odontograma.higiene_oral:
-        estado_data.append(['Higiene Oral:', odontograma.get_higiene_oral_display()])
-    if odontograma.estado_general:
-        estado_data.append(['Estado General:', odontograma.get_estado_general_display()])
-    if estado_data:
-        estado_table = Table(estado_data, colWidths=[2*inch, 4.5*inch])
-        estado_table_style = TableStyle([
+        # Tabla de información del paciente (solo datos esenciales)
+        paciente_data = [
+            ['Nombre:', odontograma.paciente_nombre],
+            ['Email:', odontograma.paciente_email],
+            ['Teléfono:', odontograma.paciente_telefono or 'No especificado']
+        ]
+        if odontograma.paciente_fecha_nacimiento:
+            paciente_data.append(['Fecha de Nacimiento:', odontograma.paciente_fecha_nacimiento.strftime('%d/%m/%Y')])
+        paciente_table = Table(paciente_data, colWidths=[2*inch, 4.5*inch])
+        paciente_table_style = TableStyle([
             ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#f0fdfa')),
             ('TEXTCOLOR', (0, 0), (0, -1), colors.HexColor('#1e293b')),
             ('TEXTCOLOR', (1, 0), (1, -1), colors.HexColor('#374151')),
@@ -6259,552 +6228,598 @@ def exportar_odontograma_pdf(request, odontograma_id):
             ('TOPPADDING', (0, 0), (-1, -1), 6),
             ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
         ])
-        estado_table.setStyle(estado_table_style)
-        story.append(estado_table)
-        story.append(Spacer(1, 6))
-    
-    # Antecedentes médicos (solo si existe)
-    if odontograma.antecedentes_medicos:
-        antecedentes_text = Paragraph(f"<b>Antecedentes Médicos:</b> {odontograma.antecedentes_medicos}", section_text_style)
-        story.append(antecedentes_text)
-        story.append(Spacer(1, 4))
-    
-    # Alergias (solo si existe)
-    if odontograma.alergias:
-        alergias_text = Paragraph(f"<b>Alergias:</b> {odontograma.alergias}", section_text_style)
-        story.append(alergias_text)
-        story.append(Spacer(1, 4))
-    
-    # Medicamentos actuales (solo si existe)
-    if odontograma.medicamentos_actuales:
-        medicamentos_text = Paragraph(f"<b>Medicamentos Actuales:</b> {odontograma.medicamentos_actuales}", section_text_style)
-        story.append(medicamentos_text)
-        story.append(Spacer(1, 6))
+        paciente_table.setStyle(paciente_table_style)
+        story.append(paciente_table)
+        story.append(Spacer(1, 12))
     
-    # Sección: Odontograma Visual
-    odontograma_title = Paragraph("<b>ODONTOGRAMA DENTAL</b>", subtitle_style)
-    story.append(odontograma_title)
-    
-    # Explicación clara del odontograma
-    explicacion_odontograma = Paragraph(
-        "<b>¿Cómo leer este odontograma?</b><br/>"
-        "La boca se divide en 4 cuadrantes (superior derecho, superior izquierdo, inferior izquierdo, inferior derecho). "
-        "Cada diente tiene un número único según la numeración internacional (FDI). "
-        "Los símbolos y colores indican el estado de cada diente. Consulte la leyenda al final para entender cada símbolo.",
-        ParagraphStyle(
-            'ExplicacionOdontograma',
-            parent=styles['Normal'],
-            fontSize=9,
-            spaceAfter=8,
-            alignment=TA_LEFT,
-            textColor=colors.HexColor('#374151'),
-            leading=13,
-            leftIndent=0,
-            backColor=colors.HexColor('#f0fdfa'),
-            borderPadding=8,
-            borderColor=colors.HexColor('#ccfbf1'),
-            borderWidth=1
+        # Sección: Información Clínica
+        clinica_title = Paragraph("<b>INFORMACIÓN CLÍNICA</b>", subtitle_style)
+        story.append(clinica_title)
+    
+        # Motivo de consulta (solo si existe)
+        if odontograma.motivo_consulta:
+            motivo_text = Paragraph(f"<b>Motivo de Consulta:</b> {odontograma.motivo_consulta}", section_text_style)
+            story.append(motivo_text)
+            story.append(Spacer(1, 4))
+    
+        # Estado e higiene en tabla (solo si hay datos)
+        estado_data = []
+        if odontograma.higiene_oral:
+            estado_data.append(['Higiene Oral:', odontograma.get_higiene_oral_display()])
+        if odontograma.estado_general:
+            estado_data.append(['Estado General:', odontograma.get_estado_general_display()])
+        if estado_data:
+            estado_table = Table(estado_data, colWidths=[2*inch, 4.5*inch])
+            estado_table_style = TableStyle([
+                ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#f0fdfa')),
+                ('TEXTCOLOR', (0, 0), (0, -1), colors.HexColor('#1e293b')),
+                ('TEXTCOLOR', (1, 0), (1, -1), colors.HexColor('#374151')),
+                ('ALIGN', (0, 0), (0, -1), 'LEFT'),
+                ('ALIGN', (1, 0), (1, -1), 'LEFT'),
+                ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+                ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
+                ('FONTSIZE', (0, 0), (-1, -1), 9),
+                ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#ccfbf1')),
+                ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+                ('LEFTPADDING', (0, 0), (-1, -1), 8),
+                ('RIGHTPADDING', (0, 0), (-1, -1), 8),
+                ('TOPPADDING', (0, 0), (-1, -1), 6),
+                ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+            ])
+            estado_table.setStyle(estado_table_style)
+            story.append(estado_table)
+            story.append(Spacer(1, 6))
+    
+        # Antecedentes médicos (solo si existe)
+        if odontograma.antecedentes_medicos:
+            antecedentes_text = Paragraph(f"<b>Antecedentes Médicos:</b> {odontograma.antecedentes_medicos}", section_text_style)
+            story.append(antecedentes_text)
+            story.append(Spacer(1, 4))
+    
+        # Alergias (solo si existe)
+        if odontograma.alergias:
+            alergias_text = Paragraph(f"<b>Alergias:</b> {odontograma.alergias}", section_text_style)
+            story.append(alergias_text)
+            story.append(Spacer(1, 4))
+    
+        # Medicamentos actuales (solo si existe)
+        if odontograma.medicamentos_actuales:
+            medicamentos_text = Paragraph(f"<b>Medicamentos Actuales:</b> {odontograma.medicamentos_actuales}", section_text_style)
+            story.append(medicamentos_text)
+            story.append(Spacer(1, 6))
+    
+        # Sección: Odontograma Visual
+        odontograma_title = Paragraph("<b>ODONTOGRAMA DENTAL</b>", subtitle_style)
+        story.append(odontograma_title)
+    
+        # Explicación clara del odontograma
+        explicacion_odontograma = Paragraph(
+            "<b>¿Cómo leer este odontograma?</b><br/>"
+            "La boca se divide en 4 cuadrantes (superior derecho, superior izquierdo, inferior izquierdo, inferior derecho). "
+            "Cada diente tiene un número único según la numeración internacional (FDI). "
+            "Los símbolos y colores indican el estado de cada diente. Consulte la leyenda al final para entender cada símbolo.",
+            ParagraphStyle(
+                'ExplicacionOdontograma',
+                parent=styles['Normal'],
+                fontSize=9,
+                spaceAfter=8,
+                alignment=TA_LEFT,
+                textColor=colors.HexColor('#374151'),
+                leading=13,
+                leftIndent=0,
+                backColor=colors.HexColor('#f0fdfa'),
+                borderPadding=8,
+                borderColor=colors.HexColor('#ccfbf1'),
+                borderWidth=1
+            )
         )
-    )
-    story.append(explicacion_odontograma)
-    story.append(Spacer(1, 6))
-    
-    # Función para obtener color según estado
-    def get_tooth_color(estado):
-        # Asegurarse de que estado sea un string
-        if not isinstance(estado, str):
-            if isinstance(estado, dict):
-                return colors.HexColor('#f3f4f6')  # Gris claro por defecto
-            estado = str(estado) if estado else 'sano'
-        
-        color_map = {
-            'sano': colors.HexColor('#10b981'),      # Verde
-            'cariado': colors.HexColor('#dc2626'),    # Rojo
-            'caries': colors.HexColor('#dc2626'),     # Rojo
-            'obturado': colors.HexColor('#f59e0b'),  # Amarillo
-            'corona': colors.HexColor('#fbbf24'),    # Dorado
-            'perdido': colors.HexColor('#6b7280'),   # Gris
-            'ausente': colors.HexColor('#6b7280'),    # Gris
-            'endodoncia': colors.HexColor('#0ea5e9'), # Azul
-            'protesis': colors.HexColor('#8b5cf6'),  # Púrpura
-            'implante': colors.HexColor('#06b6d4'),  # Cian
-            'sellante': colors.HexColor('#84cc16'),   # Verde claro
-            'fractura': colors.HexColor('#ef4444'),  # Rojo oscuro
-            'extraccion': colors.HexColor('#991b1b'), # Rojo muy oscuro
-        }
-        return color_map.get(estado.lower() if estado else 'sano', colors.HexColor('#f3f4f6'))  # Gris claro por defecto
-    
-    # Función para obtener el estado principal del diente (considerando datos interactivos)
-    def get_tooth_main_state(numero_diente):
-        estado_diente = dientes_dict.get(numero_diente)
-        if not estado_diente:
-            return 'sano', None
-        
-        # Intentar obtener datos interactivos
-        interactive_data = get_tooth_interactive_data(estado_diente)
-        
-        if interactive_data:
-            # Si hay datos interactivos, determinar el estado principal
-            estados = list(interactive_data.values())
-            if 'ausente' in estados or 'perdido' in estados:
-                return 'ausente', interactive_data
-            elif 'caries' in estados or 'cariado' in estados:
-                return 'caries', interactive_data
-            elif 'obturado' in estados:
-                return 'obturado', interactive_data
-            elif 'corona' in estados:
-                return 'corona', interactive_data
-            elif 'endodoncia' in estados:
-                return 'endodoncia', interactive_data
-            elif 'protesis' in estados:
-                return 'protesis', interactive_data
-            elif 'implante' in estados:
-                return 'implante', interactive_data
-            elif 'fractura' in estados:
-                return 'fractura', interactive_data
-            elif 'sellante' in estados:
-                return 'sellante', interactive_data
-            else:
-                return 'sano', interactive_data
-        
-        # Si no hay datos interactivos, usar el estado general
-        # Asegurarse de que siempre devolvamos un string
-        estado = estado_diente.estado
-        if isinstance(estado, dict):
-            # Si el estado es un diccionario, usar 'sano' por defecto
-            return 'sano', None
-        return str(estado) if estado else 'sano', None
-    
-    # Función para obtener símbolo según estado
-    def get_tooth_symbol(estado):
-        # Asegurarse de que estado sea un string
-        if not isinstance(estado, str):
-            if isinstance(estado, dict):
-                return '?'
-            estado = str(estado) if estado else 'sano'
-        
-        symbol_map = {
-            'sano': '✓',
-            'caries': '●',
-            'cariado': '●',
-            'obturado': '■',
-            'corona': '◊',
-            'perdido': '✕',
-            'ausente': '✕',
-            'endodoncia': '◐',
-            'protesis': '◈',
-            'implante': '◉',
-            'sellante': '◯',
-            'fractura': '◢',
-            'extraccion': '✕',
-        }
-        return symbol_map.get(estado.lower() if estado else 'sano', '?')
-    
-    # Función para obtener texto del diente (simplificado - solo número y símbolo principal)
-    def get_tooth_display(numero_diente, estado_val, interactive_data):
-        # Mostrar solo número de diente y símbolo principal - sin duplicar información
-        symbol = get_tooth_symbol(estado_val)
-        return f"{numero_diente}\n{symbol}"
-    
-    # Crear estructura del odontograma anatómico
-    odontograma_data = []
-    
-    # Encabezado con nombres de dientes (más claro)
-    header_row = ['CUADRANTE', 'Molar 3', 'Molar 2', 'Molar 1', 'Premolar 2', 'Premolar 1', 'Canino', 'Incisivo 2', 'Incisivo 1']
-    odontograma_data.append(header_row)
-    
-    # Cuadrante Superior Derecho (vista del paciente)
-    superior_derecho = ['SUPERIOR\nDERECHO']
-    for numero in [18, 17, 16, 15, 14, 13, 12, 11]:
-        estado_val, interactive_data = get_tooth_main_state(numero)
-        display_text = get_tooth_display(numero, estado_val, interactive_data)
-        superior_derecho.append(display_text)
-    odontograma_data.append(superior_derecho)
-    
-    # Cuadrante Superior Izquierdo (vista del paciente)
-    superior_izquierdo = ['SUPERIOR\nIZQUIERDO']
-    for numero in [21, 22, 23, 24, 25, 26, 27, 28]:
-        estado_val, interactive_data = get_tooth_main_state(numero)
-        display_text = get_tooth_display(numero, estado_val, interactive_data)
-        superior_izquierdo.append(display_text)
-    odontograma_data.append(superior_izquierdo)
-    
-    # Separador visual
-    odontograma_data.append(['─' * 10, '─' * 10, '─' * 10, '─' * 10, '─' * 10, '─' * 10, '─' * 10, '─' * 10, '─' * 10])
-    
-    # Cuadrante Inferior Izquierdo (vista del paciente)
-    inferior_izquierdo = ['INFERIOR\nIZQUIERDO']
-    for numero in [38, 37, 36, 35, 34, 33, 32, 31]:
-        estado_val, interactive_data = get_tooth_main_state(numero)
-        display_text = get_tooth_display(numero, estado_val, interactive_data)
-        inferior_izquierdo.append(display_text)
-    odontograma_data.append(inferior_izquierdo)
-    
-    # Cuadrante Inferior Derecho (vista del paciente)
-    inferior_derecho = ['INFERIOR\nDERECHO']
-    for numero in [41, 42, 43, 44, 45, 46, 47, 48]:
-        estado_val, interactive_data = get_tooth_main_state(numero)
-        display_text = get_tooth_display(numero, estado_val, interactive_data)
-        inferior_derecho.append(display_text)
-    odontograma_data.append(inferior_derecho)
-    
-    # Crear tabla del odontograma mejorada (con más espacio para legibilidad)
-    odontograma_table = Table(odontograma_data, colWidths=[1*inch, 0.75*inch, 0.75*inch, 0.75*inch, 0.75*inch, 0.75*inch, 0.75*inch, 0.75*inch, 0.75*inch])
-    
-    # Estilo de la tabla del odontograma mejorada con colores turquesa
-    table_style = TableStyle([
-        # Encabezado con color turquesa
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#14b8a6')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 10),
-        ('TOPPADDING', (0, 0), (-1, 0), 10),
-        
-        # Cuadrantes - colores turquesa diferenciados
-        ('BACKGROUND', (0, 1), (0, 1), colors.HexColor('#14b8a6')),  # Sup Der
-        ('BACKGROUND', (0, 2), (0, 2), colors.HexColor('#0d9488')),  # Sup Izq
-        ('BACKGROUND', (0, 4), (0, 4), colors.HexColor('#5eead4')),  # Inf Izq
-        ('BACKGROUND', (0, 5), (0, 5), colors.HexColor('#2dd4bf')),  # Inf Der
-        
-        # Texto de cuadrantes
-        ('TEXTCOLOR', (0, 1), (0, 5), colors.white),
-        ('FONTNAME', (0, 1), (0, 5), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 1), (0, 5), 8),
-        
-        # Dientes - texto más grande y legible
-        ('FONTNAME', (1, 1), (-1, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (1, 1), (-1, -1), 10),
-        ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#14b8a6')),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('TOPPADDING', (1, 1), (-1, -1), 8),
-        ('BOTTOMPADDING', (1, 1), (-1, -1), 8),
-        ('LEFTPADDING', (1, 1), (-1, -1), 6),
-        ('RIGHTPADDING', (1, 1), (-1, -1), 6),
-    ])
+        story.append(explicacion_odontograma)
+        story.append(Spacer(1, 6))
     
-    # Aplicar colores específicos a dientes según su estado
-    for row_idx in range(1, len(odontograma_data)):
-        if row_idx == 3:  # Fila separadora
-            continue
-        
-        for col_idx in range(1, len(odontograma_data[row_idx])):
-            # Determinar el número del diente
-            if row_idx == 1:  # Superior derecho
-                tooth_nums = [18, 17, 16, 15, 14, 13, 12, 11]
-            elif row_idx == 2:  # Superior izquierdo
-                tooth_nums = [21, 22, 23, 24, 25, 26, 27, 28]
-            elif row_idx == 4:  # Inferior izquierdo
-                tooth_nums = [38, 37, 36, 35, 34, 33, 32, 31]
-            elif row_idx == 5:  # Inferior derecho
-                tooth_nums = [41, 42, 43, 44, 45, 46, 47, 48]
-            else:
-                continue
-            
-            if col_idx - 1 < len(tooth_nums):
-                tooth_num = tooth_nums[col_idx - 1]
-                estado_val, interactive_data = get_tooth_main_state(tooth_num)
-                color = get_tooth_color(estado_val)
-                table_style.add('BACKGROUND', (col_idx, row_idx), (col_idx, row_idx), color)
-                # Usar texto blanco solo si el color es oscuro
-                if estado_val in ['ausente', 'perdido', 'caries', 'cariado', 'fractura', 'extraccion']:
-                    table_style.add('TEXTCOLOR', (col_idx, row_idx), (col_idx, row_idx), colors.white)
+        # Función para obtener color según estado
+        def get_tooth_color(estado):
+            # Asegurarse de que estado sea un string
+            if not isinstance(estado, str):
+                if isinstance(estado, dict):
+                    return colors.HexColor('#f3f4f6')  # Gris claro por defecto
+                estado = str(estado) if estado else 'sano'
+        
+            color_map = {
+                'sano': colors.HexColor('#10b981'),      # Verde
+                'cariado': colors.HexColor('#dc2626'),    # Rojo
+                'caries': colors.HexColor('#dc2626'),     # Rojo
+                'obturado': colors.HexColor('#f59e0b'),  # Amarillo
+                'corona': colors.HexColor('#fbbf24'),    # Dorado
+                'perdido': colors.HexColor('#6b7280'),   # Gris
+                'ausente': colors.HexColor('#6b7280'),    # Gris
+                'endodoncia': colors.HexColor('#0ea5e9'), # Azul
+                'protesis': colors.HexColor('#8b5cf6'),  # Púrpura
+                'implante': colors.HexColor('#06b6d4'),  # Cian
+                'sellante': colors.HexColor('#84cc16'),   # Verde claro
+                'fractura': colors.HexColor('#ef4444'),  # Rojo oscuro
+                'extraccion': colors.HexColor('#991b1b'), # Rojo muy oscuro
+            }
+            return color_map.get(estado.lower() if estado else 'sano', colors.HexColor('#f3f4f6'))  # Gris claro por defecto
+    
+        # Función para obtener el estado principal del diente (considerando datos interactivos)
+        def get_tooth_main_state(numero_diente):
+            estado_diente = dientes_dict.get(numero_diente)
+            if not estado_diente:
+                return 'sano', None
+        
+            # Intentar obtener datos interactivos
+            interactive_data = get_tooth_interactive_data(estado_diente)
+        
+            if interactive_data:
+                # Si hay datos interactivos, determinar el estado principal
+                estados = list(interactive_data.values())
+                if 'ausente' in estados or 'perdido' in estados:
+                    return 'ausente', interactive_data
+                elif 'caries' in estados or 'cariado' in estados:
+                    return 'caries', interactive_data
+                elif 'obturado' in estados:
+                    return 'obturado', interactive_data
+                elif 'corona' in estados:
+                    return 'corona', interactive_data
+                elif 'endodoncia' in estados:
+                    return 'endodoncia', interactive_data
+                elif 'protesis' in estados:
+                    return 'protesis', interactive_data
+                elif 'implante' in estados:
+                    return 'implante', interactive_data
+                elif 'fractura' in estados:
+                    return 'fractura', interactive_data
+                elif 'sellante' in estados:
+                    return 'sellante', interactive_data
                 else:
-                    table_style.add('TEXTCOLOR', (col_idx, row_idx), (col_idx, row_idx), colors.HexColor('#1e293b'))
-    
-    # Estilo para la fila separadora con color turquesa
-    table_style.add('BACKGROUND', (0, 3), (-1, 3), colors.HexColor('#ccfbf1'))
-    table_style.add('TEXTCOLOR', (0, 3), (-1, 3), colors.HexColor('#64748b'))
-    table_style.add('FONTSIZE', (0, 3), (-1, 3), 6)
-    
-    odontograma_table.setStyle(table_style)
-    story.append(odontograma_table)
-    story.append(Spacer(1, 12))
-    
-    # Resumen de estado dental
-    estados_count = {}
-    for diente in estados_dientes:
-        estado_val, interactive_data = get_tooth_main_state(diente.numero_diente)
-        estados_count[estado_val] = estados_count.get(estado_val, 0) + 1
-    
-    if estados_count:
-        resumen_title = Paragraph("<b>RESUMEN DEL ESTADO DENTAL</b>", subtitle_style)
-        story.append(resumen_title)
-        
-        resumen_data = [['Estado Dental', 'Cantidad', 'Explicación']]
-        estado_descriptions = {
-            'sano': 'Diente en perfecto estado, sin problemas',
-            'caries': 'Diente con caries que necesita tratamiento',
-            'obturado': 'Diente ya tratado con empaste',
-            'corona': 'Diente con corona o funda protectora',
-            'ausente': 'Diente que falta o fue extraído',
-            'endodoncia': 'Diente con tratamiento de conducto (nervio tratado)',
-            'protesis': 'Diente con prótesis o funda',
-            'implante': 'Diente reemplazado con implante dental',
-            'sellante': 'Diente con sellante preventivo',
-            'fractura': 'Diente con fractura o grieta',
-        }
+                    return 'sano', interactive_data
         
-        for estado, cantidad in sorted(estados_count.items(), key=lambda x: x[1], reverse=True):
-            desc = estado_descriptions.get(estado, 'Estado dental')
-            # Capitalizar primera letra y el resto en minúsculas
-            estado_display = estado.capitalize().replace('_', ' ')
-            resumen_data.append([estado_display, str(cantidad), desc])
-        
-        resumen_table = Table(resumen_data, colWidths=[1.8*inch, 1*inch, 3.7*inch])
-        resumen_style = TableStyle([
+            # Si no hay datos interactivos, usar el estado general
+            # Asegurarse de que siempre devolvamos un string
+            estado = estado_diente.estado
+            if isinstance(estado, dict):
+                # Si el estado es un diccionario, usar 'sano' por defecto
+                return 'sano', None
+            return str(estado) if estado else 'sano', None
+    
+        # Función para obtener símbolo según estado
+        def get_tooth_symbol(estado):
+            # Asegurarse de que estado sea un string
+            if not isinstance(estado, str):
+                if isinstance(estado, dict):
+                    return '?'
+                estado = str(estado) if estado else 'sano'
+        
+            symbol_map = {
+                'sano': '✓',
+                'caries': '●',
+                'cariado': '●',
+                'obturado': '■',
+                'corona': '◊',
+                'perdido': '✕',
+                'ausente': '✕',
+                'endodoncia': '◐',
+                'protesis': '◈',
+                'implante': '◉',
+                'sellante': '◯',
+                'fractura': '◢',
+                'extraccion': '✕',
+            }
+            return symbol_map.get(estado.lower() if estado else 'sano', '?')
+    
+        # Función para obtener texto del diente (simplificado - solo número y símbolo principal)
+        def get_tooth_display(numero_diente, estado_val, interactive_data):
+            # Mostrar solo número de diente y símbolo principal - sin duplicar información
+            symbol = get_tooth_symbol(estado_val)
+            return f"{numero_diente}\n{symbol}"
+    
+        # Crear estructura del odontograma anatómico
+        odontograma_data = []
+    
+        # Encabezado con nombres de dientes (más claro)
+        header_row = ['CUADRANTE', 'Molar 3', 'Molar 2', 'Molar 1', 'Premolar 2', 'Premolar 1', 'Canino', 'Incisivo 2', 'Incisivo 1']
+        odontograma_data.append(header_row)
+    
+        # Cuadrante Superior Derecho (vista del paciente)
+        superior_derecho = ['SUPERIOR\nDERECHO']
+        for numero in [18, 17, 16, 15, 14, 13, 12, 11]:
+            estado_val, interactive_data = get_tooth_main_state(numero)
+            display_text = get_tooth_display(numero, estado_val, interactive_data)
+            superior_derecho.append(display_text)
+        odontograma_data.append(superior_derecho)
+    
+        # Cuadrante Superior Izquierdo (vista del paciente)
+        superior_izquierdo = ['SUPERIOR\nIZQUIERDO']
+        for numero in [21, 22, 23, 24, 25, 26, 27, 28]:
+            estado_val, interactive_data = get_tooth_main_state(numero)
+            display_text = get_tooth_display(numero, estado_val, interactive_data)
+            superior_izquierdo.append(display_text)
+        odontograma_data.append(superior_izquierdo)
+    
+        # Separador visual
+        odontograma_data.append(['─' * 10, '─' * 10, '─' * 10, '─' * 10, '─' * 10, '─' * 10, '─' * 10, '─' * 10, '─' * 10])
+    
+        # Cuadrante Inferior Izquierdo (vista del paciente)
+        inferior_izquierdo = ['INFERIOR\nIZQUIERDO']
+        for numero in [38, 37, 36, 35, 34, 33, 32, 31]:
+            estado_val, interactive_data = get_tooth_main_state(numero)
+            display_text = get_tooth_display(numero, estado_val, interactive_data)
+            inferior_izquierdo.append(display_text)
+        odontograma_data.append(inferior_izquierdo)
+    
+        # Cuadrante Inferior Derecho (vista del paciente)
+        inferior_derecho = ['INFERIOR\nDERECHO']
+        for numero in [41, 42, 43, 44, 45, 46, 47, 48]:
+            estado_val, interactive_data = get_tooth_main_state(numero)
+            display_text = get_tooth_display(numero, estado_val, interactive_data)
+            inferior_derecho.append(display_text)
+        odontograma_data.append(inferior_derecho)
+    
+        # Crear tabla del odontograma mejorada (con más espacio para legibilidad)
+        odontograma_table = Table(odontograma_data, colWidths=[1*inch, 0.75*inch, 0.75*inch, 0.75*inch, 0.75*inch, 0.75*inch, 0.75*inch, 0.75*inch, 0.75*inch])
+    
+        # Estilo de la tabla del odontograma mejorada con colores turquesa
+        table_style = TableStyle([
+            # Encabezado con color turquesa
             ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#14b8a6')),
             ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
             ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
             ('FONTSIZE', (0, 0), (-1, 0), 10),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('ALIGN', (1, 0), (1, -1), 'CENTER'),
-            ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 1), (-1, -1), 9),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#ccfbf1')),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 10),
+            ('TOPPADDING', (0, 0), (-1, 0), 10),
+        
+            # Cuadrantes - colores turquesa diferenciados
+            ('BACKGROUND', (0, 1), (0, 1), colors.HexColor('#14b8a6')),  # Sup Der
+            ('BACKGROUND', (0, 2), (0, 2), colors.HexColor('#0d9488')),  # Sup Izq
+            ('BACKGROUND', (0, 4), (0, 4), colors.HexColor('#5eead4')),  # Inf Izq
+            ('BACKGROUND', (0, 5), (0, 5), colors.HexColor('#2dd4bf')),  # Inf Der
+        
+            # Texto de cuadrantes
+            ('TEXTCOLOR', (0, 1), (0, 5), colors.white),
+            ('FONTNAME', (0, 1), (0, 5), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 1), (0, 5), 8),
+        
+            # Dientes - texto más grande y legible
+            ('FONTNAME', (1, 1), (-1, -1), 'Helvetica-Bold'),
+            ('FONTSIZE', (1, 1), (-1, -1), 10),
+            ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#14b8a6')),
             ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-            ('TOPPADDING', (0, 0), (-1, -1), 6),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-            ('LEFTPADDING', (0, 0), (-1, -1), 8),
-            ('RIGHTPADDING', (0, 0), (-1, -1), 8),
-            ('ROWBACKGROUNDS', (1, 1), (-1, -1), [colors.white, colors.HexColor('#f0fdfa')]),
+            ('TOPPADDING', (1, 1), (-1, -1), 8),
+            ('BOTTOMPADDING', (1, 1), (-1, -1), 8),
+            ('LEFTPADDING', (1, 1), (-1, -1), 6),
+            ('RIGHTPADDING', (1, 1), (-1, -1), 6),
         ])
+    
+        # Aplicar colores específicos a dientes según su estado
+        for row_idx in range(1, len(odontograma_data)):
+            if row_idx == 3:  # Fila separadora
+                continue
         
-        # Colorear la columna de cantidad según el estado
-        row_idx = 1
-        for estado, cantidad in sorted(estados_count.items(), key=lambda x: x[1], reverse=True):
-            color = get_tooth_color(estado)
-            resumen_style.add('BACKGROUND', (1, row_idx), (1, row_idx), color)
-            if estado in ['ausente', 'perdido', 'caries', 'cariado', 'fractura', 'extraccion']:
-                resumen_style.add('TEXTCOLOR', (1, row_idx), (1, row_idx), colors.white)
-            else:
-                resumen_style.add('TEXTCOLOR', (1, row_idx), (1, row_idx), colors.HexColor('#1e293b'))
-            row_idx += 1
-        
-        resumen_table.setStyle(resumen_style)
-        story.append(resumen_table)
-        story.append(Spacer(1, 12))
+            for col_idx in range(1, len(odontograma_data[row_idx])):
+                # Determinar el número del diente
+                if row_idx == 1:  # Superior derecho
+                    tooth_nums = [18, 17, 16, 15, 14, 13, 12, 11]
+                elif row_idx == 2:  # Superior izquierdo
+                    tooth_nums = [21, 22, 23, 24, 25, 26, 27, 28]
+                elif row_idx == 4:  # Inferior izquierdo
+                    tooth_nums = [38, 37, 36, 35, 34, 33, 32, 31]
+                elif row_idx == 5:  # Inferior derecho
+                    tooth_nums = [41, 42, 43, 44, 45, 46, 47, 48]
+                else:
+                    continue
+            
+                if col_idx - 1 < len(tooth_nums):
+                    tooth_num = tooth_nums[col_idx - 1]
+                    estado_val, interactive_data = get_tooth_main_state(tooth_num)
+                    color = get_tooth_color(estado_val)
+                    table_style.add('BACKGROUND', (col_idx, row_idx), (col_idx, row_idx), color)
+                    # Usar texto blanco solo si el color es oscuro
+                    if estado_val in ['ausente', 'perdido', 'caries', 'cariado', 'fractura', 'extraccion']:
+                        table_style.add('TEXTCOLOR', (col_idx, row_idx), (col_idx, row_idx), colors.white)
+                    else:
+                        table_style.add('TEXTCOLOR', (col_idx, row_idx), (col_idx, row_idx), colors.HexColor('#1e293b'))
     
-    # Sección: Detalle de Caras de Dientes (si hay datos interactivos)
-    dientes_con_caras = []
-    for diente in estados_dientes:
-        interactive_data = get_tooth_interactive_data(diente)
-        if interactive_data and isinstance(interactive_data, dict):
-            caras_afectadas = {}
-            for cara, condicion in interactive_data.items():
-                if isinstance(condicion, str) and condicion != 'sano':
-                    caras_afectadas[cara] = condicion
-            
-            if caras_afectadas:
-                dientes_con_caras.append({
-                    'numero': diente.numero_diente,
-                    'caras': caras_afectadas
-                })
+        # Estilo para la fila separadora con color turquesa
+        table_style.add('BACKGROUND', (0, 3), (-1, 3), colors.HexColor('#ccfbf1'))
+        table_style.add('TEXTCOLOR', (0, 3), (-1, 3), colors.HexColor('#64748b'))
+        table_style.add('FONTSIZE', (0, 3), (-1, 3), 6)
     
-    if dientes_con_caras:
-        detalle_caras_title = Paragraph("<b>DETALLE DE CARAS DE DIENTES</b>", subtitle_style)
-        story.append(detalle_caras_title)
-        
-        # Explicación sobre las caras
-        explicacion_caras = Paragraph(
-            "Esta sección muestra qué cara específica de cada diente tiene una condición. "
-            "Las caras son: Oclusal (O) - superficie de masticación, Vestibular (V) - lado externo, "
-            "Lingual (L) - lado interno, Mesial (M) - lado anterior, Distal (D) - lado posterior.",
-            ParagraphStyle(
-                'ExplicacionCaras',
-                parent=styles['Normal'],
-                fontSize=8,
-                spaceAfter=6,
-                alignment=TA_LEFT,
-                textColor=colors.HexColor('#64748b'),
-                leading=11
-            )
-        )
-        story.append(explicacion_caras)
-        story.append(Spacer(1, 4))
-        
-        # Crear tabla de detalles de caras (solo 3 columnas, sin duplicar)
-        detalle_caras_data = [['Diente', 'Cara', 'Condición']]
-        
-        cara_nombres_completos = {
-            'oclusal': 'Oclusal (O)',
-            'vestibular': 'Vestibular (V)',
-            'lingual': 'Lingual (L)',
-            'mesial': 'Mesial (M)',
-            'distal': 'Distal (D)'
-        }
+        odontograma_table.setStyle(table_style)
+        story.append(odontograma_table)
+        story.append(Spacer(1, 12))
+    
+        # Resumen de estado dental
+        estados_count = {}
+        for diente in estados_dientes:
+            estado_val, interactive_data = get_tooth_main_state(diente.numero_diente)
+            estados_count[estado_val] = estados_count.get(estado_val, 0) + 1
+    
+        if estados_count:
+            resumen_title = Paragraph("<b>RESUMEN DEL ESTADO DENTAL</b>", subtitle_style)
+            story.append(resumen_title)
+        
+            resumen_data = [['Estado Dental', 'Cantidad', 'Explicación']]
+            estado_descriptions = {
+                'sano': 'Diente en perfecto estado, sin problemas',
+                'caries': 'Diente con caries que necesita tratamiento',
+                'obturado': 'Diente ya tratado con empaste',
+                'corona': 'Diente con corona o funda protectora',
+                'ausente': 'Diente que falta o fue extraído',
+                'endodoncia': 'Diente con tratamiento de conducto (nervio tratado)',
+                'protesis': 'Diente con prótesis o funda',
+                'implante': 'Diente reemplazado con implante dental',
+                'sellante': 'Diente con sellante preventivo',
+                'fractura': 'Diente con fractura o grieta',
+            }
         
-        estado_nombres = {
-            'sano': 'Sano',
-            'caries': 'Caries',
-            'cariado': 'Cariado',
-            'obturado': 'Obturado',
-            'corona': 'Corona',
-            'ausente': 'Ausente',
-            'endodoncia': 'Endodoncia',
-            'protesis': 'Prótesis',
-            'implante': 'Implante',
-            'sellante': 'Sellante',
-            'fractura': 'Fractura',
-            'perdido': 'Perdido',
-            'extraccion': 'Extracción'
-        }
+            for estado, cantidad in sorted(estados_count.items(), key=lambda x: x[1], reverse=True):
+                desc = estado_descriptions.get(estado, 'Estado dental')
+                # Capitalizar primera letra y el resto en minúsculas
+                estado_display = estado.capitalize().replace('_', ' ')
+                resumen_data.append([estado_display, str(cantidad), desc])
         
-        # Crear filas con información de caras (una fila por cara afectada)
-        for diente_info in dientes_con_caras:
-            numero_diente = diente_info['numero']
-            for cara, condicion in diente_info['caras'].items():
-                cara_nombre = cara_nombres_completos.get(cara, cara.capitalize())
-                condicion_nombre = estado_nombres.get(condicion, condicion.capitalize())
-                detalle_caras_data.append([str(numero_diente), cara_nombre, condicion_nombre])
-        
-        if len(detalle_caras_data) > 1:  # Si hay al menos una fila de datos
-            detalle_caras_table = Table(detalle_caras_data, colWidths=[0.8*inch, 1.8*inch, 2.9*inch])
-            detalle_caras_style = TableStyle([
+            resumen_table = Table(resumen_data, colWidths=[1.8*inch, 1*inch, 3.7*inch])
+            resumen_style = TableStyle([
                 ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#14b8a6')),
                 ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
                 ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 9),
+                ('FONTSIZE', (0, 0), (-1, 0), 10),
                 ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                ('ALIGN', (0, 1), (0, -1), 'CENTER'),  # Número de diente centrado
+                ('ALIGN', (1, 0), (1, -1), 'CENTER'),
                 ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-                ('FONTSIZE', (0, 1), (-1, -1), 8),
+                ('FONTSIZE', (0, 1), (-1, -1), 9),
                 ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#ccfbf1')),
                 ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
                 ('TOPPADDING', (0, 0), (-1, -1), 6),
                 ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-                ('LEFTPADDING', (0, 0), (-1, -1), 6),
-                ('RIGHTPADDING', (0, 0), (-1, -1), 6),
+                ('LEFTPADDING', (0, 0), (-1, -1), 8),
+                ('RIGHTPADDING', (0, 0), (-1, -1), 8),
                 ('ROWBACKGROUNDS', (1, 1), (-1, -1), [colors.white, colors.HexColor('#f0fdfa')]),
             ])
-            
-            # Colorear la columna de condición según el estado
+        
+            # Colorear la columna de cantidad según el estado
             row_idx = 1
-            for fila in detalle_caras_data[1:]:
-                if len(fila) >= 3 and fila[2]:
-                    condicion = fila[2].lower()
-                    color = get_tooth_color(condicion)
-                    detalle_caras_style.add('BACKGROUND', (2, row_idx), (2, row_idx), color)
-                    if condicion in ['ausente', 'perdido', 'caries', 'cariado', 'fractura', 'extraccion']:
-                        detalle_caras_style.add('TEXTCOLOR', (2, row_idx), (2, row_idx), colors.white)
-                    else:
-                        detalle_caras_style.add('TEXTCOLOR', (2, row_idx), (2, row_idx), colors.HexColor('#1e293b'))
+            for estado, cantidad in sorted(estados_count.items(), key=lambda x: x[1], reverse=True):
+                color = get_tooth_color(estado)
+                resumen_style.add('BACKGROUND', (1, row_idx), (1, row_idx), color)
+                if estado in ['ausente', 'perdido', 'caries', 'cariado', 'fractura', 'extraccion']:
+                    resumen_style.add('TEXTCOLOR', (1, row_idx), (1, row_idx), colors.white)
+                else:
+                    resumen_style.add('TEXTCOLOR', (1, row_idx), (1, row_idx), colors.HexColor('#1e293b'))
                 row_idx += 1
-            
-            detalle_caras_table.setStyle(detalle_caras_style)
-            story.append(detalle_caras_table)
+        
+            resumen_table.setStyle(resumen_style)
+            story.append(resumen_table)
             story.append(Spacer(1, 12))
     
-    # Leyenda de símbolos resumida y compacta
-    leyenda_title = Paragraph("<b>GUÍA DE SÍMBOLOS</b>", ParagraphStyle(
-        'LeyendaTitle',
-        parent=styles['Normal'],
-        fontSize=9,
-        spaceAfter=4,
-        alignment=TA_LEFT,
-        textColor=colors.HexColor('#1e293b'),
-        fontName='Helvetica-Bold'
-    ))
-    story.append(leyenda_title)
+        # Sección: Detalle de Caras de Dientes (si hay datos interactivos)
+        dientes_con_caras = []
+        for diente in estados_dientes:
+            interactive_data = get_tooth_interactive_data(diente)
+            if interactive_data and isinstance(interactive_data, dict):
+                caras_afectadas = {}
+                for cara, condicion in interactive_data.items():
+                    if isinstance(condicion, str) and condicion != 'sano':
+                        caras_afectadas[cara] = condicion
+            
+                if caras_afectadas:
+                    dientes_con_caras.append({
+                        'numero': diente.numero_diente,
+                        'caras': caras_afectadas
+                    })
     
-    # Leyenda compacta en formato de lista simple
-    leyenda_texto = (
-        "<b>✓</b> Sano | <b>●</b> Caries | <b>■</b> Obturado | <b>◊</b> Corona | <b>✕</b> Ausente | "
-        "<b>◐</b> Endodoncia | <b>◈</b> Prótesis | <b>◉</b> Implante | <b>◯</b> Sellante | <b>◢</b> Fractura"
-    )
+        if dientes_con_caras:
+            detalle_caras_title = Paragraph("<b>DETALLE DE CARAS DE DIENTES</b>", subtitle_style)
+            story.append(detalle_caras_title)
+        
+            # Explicación sobre las caras
+            explicacion_caras = Paragraph(
+                "Esta sección muestra qué cara específica de cada diente tiene una condición. "
+                "Las caras son: Oclusal (O) - superficie de masticación, Vestibular (V) - lado externo, "
+                "Lingual (L) - lado interno, Mesial (M) - lado anterior, Distal (D) - lado posterior.",
+                ParagraphStyle(
+                    'ExplicacionCaras',
+                    parent=styles['Normal'],
+                    fontSize=8,
+                    spaceAfter=6,
+                    alignment=TA_LEFT,
+                    textColor=colors.HexColor('#64748b'),
+                    leading=11
+                )
+            )
+            story.append(explicacion_caras)
+            story.append(Spacer(1, 4))
+        
+            # Crear tabla de detalles de caras (solo 3 columnas, sin duplicar)
+            detalle_caras_data = [['Diente', 'Cara', 'Condición']]
+        
+            cara_nombres_completos = {
+                'oclusal': 'Oclusal (O)',
+                'vestibular': 'Vestibular (V)',
+                'lingual': 'Lingual (L)',
+                'mesial': 'Mesial (M)',
+                'distal': 'Distal (D)'
+            }
+        
+            estado_nombres = {
+                'sano': 'Sano',
+                'caries': 'Caries',
+                'cariado': 'Cariado',
+                'obturado': 'Obturado',
+                'corona': 'Corona',
+                'ausente': 'Ausente',
+                'endodoncia': 'Endodoncia',
+                'protesis': 'Prótesis',
+                'implante': 'Implante',
+                'sellante': 'Sellante',
+                'fractura': 'Fractura',
+                'perdido': 'Perdido',
+                'extraccion': 'Extracción'
+            }
+        
+            # Crear filas con información de caras (una fila por cara afectada)
+            for diente_info in dientes_con_caras:
+                numero_diente = diente_info['numero']
+                for cara, condicion in diente_info['caras'].items():
+                    cara_nombre = cara_nombres_completos.get(cara, cara.capitalize())
+                    condicion_nombre = estado_nombres.get(condicion, condicion.capitalize())
+                    detalle_caras_data.append([str(numero_diente), cara_nombre, condicion_nombre])
+        
+            if len(detalle_caras_data) > 1:  # Si hay al menos una fila de datos
+                detalle_caras_table = Table(detalle_caras_data, colWidths=[0.8*inch, 1.8*inch, 2.9*inch])
+                detalle_caras_style = TableStyle([
+                    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#14b8a6')),
+                    ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+                    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                    ('FONTSIZE', (0, 0), (-1, 0), 9),
+                    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+                    ('ALIGN', (0, 1), (0, -1), 'CENTER'),  # Número de diente centrado
+                    ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+                    ('FONTSIZE', (0, 1), (-1, -1), 8),
+                    ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#ccfbf1')),
+                    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+                    ('TOPPADDING', (0, 0), (-1, -1), 6),
+                    ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+                    ('LEFTPADDING', (0, 0), (-1, -1), 6),
+                    ('RIGHTPADDING', (0, 0), (-1, -1), 6),
+                    ('ROWBACKGROUNDS', (1, 1), (-1, -1), [colors.white, colors.HexColor('#f0fdfa')]),
+                ])
+            
+                # Colorear la columna de condición según el estado
+                row_idx = 1
+                for fila in detalle_caras_data[1:]:
+                    if len(fila) >= 3 and fila[2]:
+                        condicion = fila[2].lower()
+                        color = get_tooth_color(condicion)
+                        detalle_caras_style.add('BACKGROUND', (2, row_idx), (2, row_idx), color)
+                        if condicion in ['ausente', 'perdido', 'caries', 'cariado', 'fractura', 'extraccion']:
+                            detalle_caras_style.add('TEXTCOLOR', (2, row_idx), (2, row_idx), colors.white)
+                        else:
+                            detalle_caras_style.add('TEXTCOLOR', (2, row_idx), (2, row_idx), colors.HexColor('#1e293b'))
+                    row_idx += 1
+            
+                detalle_caras_table.setStyle(detalle_caras_style)
+                story.append(detalle_caras_table)
+                story.append(Spacer(1, 12))
     
-    leyenda_parrafo = Paragraph(
-        leyenda_texto,
-        ParagraphStyle(
-            'LeyendaCompacta',
+        # Leyenda de símbolos resumida y compacta
+        leyenda_title = Paragraph("<b>GUÍA DE SÍMBOLOS</b>", ParagraphStyle(
+            'LeyendaTitle',
             parent=styles['Normal'],
-            fontSize=7,
-            spaceAfter=6,
+            fontSize=9,
+            spaceAfter=4,
             alignment=TA_LEFT,
-            textColor=colors.HexColor('#374151'),
-            leading=10,
-            backColor=colors.HexColor('#f0fdfa'),
-            borderPadding=6,
-            borderColor=colors.HexColor('#ccfbf1'),
-            borderWidth=1
+            textColor=colors.HexColor('#1e293b'),
+            fontName='Helvetica-Bold'
+        ))
+        story.append(leyenda_title)
+    
+        # Leyenda compacta en formato de lista simple
+        leyenda_texto = (
+            "<b>✓</b> Sano | <b>●</b> Caries | <b>■</b> Obturado | <b>◊</b> Corona | <b>✕</b> Ausente | "
+            "<b>◐</b> Endodoncia | <b>◈</b> Prótesis | <b>◉</b> Implante | <b>◯</b> Sellante | <b>◢</b> Fractura"
         )
-    )
-    story.append(leyenda_parrafo)
-    story.append(Spacer(1, 8))
     
-    # Sección: Plan de Tratamiento y Observaciones
-    if odontograma.plan_tratamiento or odontograma.observaciones:
-        plan_title = Paragraph("<b>PLAN DE TRATAMIENTO Y RECOMENDACIONES</b>", subtitle_style)
-        story.append(plan_title)
-        
-        # Nota breve sobre el plan de tratamiento
-        nota_plan = Paragraph(
-            "Plan de tratamiento y recomendaciones:",
+        leyenda_parrafo = Paragraph(
+            leyenda_texto,
             ParagraphStyle(
-                'NotaPlan',
+                'LeyendaCompacta',
                 parent=styles['Normal'],
-                fontSize=8,
-                spaceAfter=4,
+                fontSize=7,
+                spaceAfter=6,
                 alignment=TA_LEFT,
-                textColor=colors.HexColor('#64748b'),
-                leading=11
+                textColor=colors.HexColor('#374151'),
+                leading=10,
+                backColor=colors.HexColor('#f0fdfa'),
+                borderPadding=6,
+                borderColor=colors.HexColor('#ccfbf1'),
+                borderWidth=1
             )
         )
-        story.append(nota_plan)
-        story.append(Spacer(1, 2))
-        
-        plan_data = []
-        if odontograma.plan_tratamiento:
-            plan_data.append(['Plan de Tratamiento:', odontograma.plan_tratamiento])
-        
-        if odontograma.observaciones:
-            plan_data.append(['Observaciones:', odontograma.observaciones])
-        
-        if plan_data:
-            plan_table = Table(plan_data, colWidths=[2*inch, 4.5*inch])
-            plan_table_style = TableStyle([
-                ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#f0fdfa')),
-                ('TEXTCOLOR', (0, 0), (0, -1), colors.HexColor('#1e293b')),
-                ('TEXTCOLOR', (1, 0), (1, -1), colors.HexColor('#374151')),
-                ('ALIGN', (0, 0), (0, -1), 'LEFT'),
-                ('ALIGN', (1, 0), (1, -1), 'LEFT'),
-                ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-                ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
-                ('FONTSIZE', (0, 0), (-1, -1), 9),
-                ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#ccfbf1')),
-                ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-                ('LEFTPADDING', (0, 0), (-1, -1), 8),
-                ('RIGHTPADDING', (0, 0), (-1, -1), 8),
-                ('TOPPADDING', (0, 0), (-1, -1), 6),
-                ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-            ])
-            plan_table.setStyle(plan_table_style)
-            story.append(plan_table)
-            story.append(Spacer(1, 10))
+        story.append(leyenda_parrafo)
+        story.append(Spacer(1, 8))
     
-    # Información del sistema (footer)
-    system_info = Paragraph(
-        f"<b>Odontólogo responsable:</b> Dr. {odontograma.dentista.nombre_completo} | "
-        f"<b>Fecha de creación:</b> {odontograma.fecha_creacion.strftime('%d/%m/%Y %H:%M')} | "
-        f"<b>Última actualización:</b> {odontograma.fecha_actualizacion.strftime('%d/%m/%Y %H:%M')}",
-        ParagraphStyle(
-            'SystemInfo',
-            parent=styles['Normal'],
-            fontSize=7,
-            alignment=TA_CENTER,
-            textColor=colors.HexColor('#64748b'),
-            spaceBefore=12
+        # Sección: Plan de Tratamiento y Observaciones
+        if odontograma.plan_tratamiento or odontograma.observaciones:
+            plan_title = Paragraph("<b>PLAN DE TRATAMIENTO Y RECOMENDACIONES</b>", subtitle_style)
+            story.append(plan_title)
+        
+            # Nota breve sobre el plan de tratamiento
+            nota_plan = Paragraph(
+                "Plan de tratamiento y recomendaciones:",
+                ParagraphStyle(
+                    'NotaPlan',
+                    parent=styles['Normal'],
+                    fontSize=8,
+                    spaceAfter=4,
+                    alignment=TA_LEFT,
+                    textColor=colors.HexColor('#64748b'),
+                    leading=11
+                )
+            )
+            story.append(nota_plan)
+            story.append(Spacer(1, 2))
+        
+            plan_data = []
+            if odontograma.plan_tratamiento:
+                plan_data.append(['Plan de Tratamiento:', odontograma.plan_tratamiento])
+        
+            if odontograma.observaciones:
+                plan_data.append(['Observaciones:', odontograma.observaciones])
+        
+            if plan_data:
+                plan_table = Table(plan_data, colWidths=[2*inch, 4.5*inch])
+                plan_table_style = TableStyle([
+                    ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#f0fdfa')),
+                    ('TEXTCOLOR', (0, 0), (0, -1), colors.HexColor('#1e293b')),
+                    ('TEXTCOLOR', (1, 0), (1, -1), colors.HexColor('#374151')),
+                    ('ALIGN', (0, 0), (0, -1), 'LEFT'),
+                    ('ALIGN', (1, 0), (1, -1), 'LEFT'),
+                    ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+                    ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
+                    ('FONTSIZE', (0, 0), (-1, -1), 9),
+                    ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#ccfbf1')),
+                    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+                    ('LEFTPADDING', (0, 0), (-1, -1), 8),
+                    ('RIGHTPADDING', (0, 0), (-1, -1), 8),
+                    ('TOPPADDING', (0, 0), (-1, -1), 6),
+                    ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+                ])
+                plan_table.setStyle(plan_table_style)
+                story.append(plan_table)
+                story.append(Spacer(1, 10))
+    
+        # Información del sistema (footer)
+        system_info = Paragraph(
+            f"<b>Odontólogo responsable:</b> Dr. {odontograma.dentista.nombre_completo} | "
+            f"<b>Fecha de creación:</b> {odontograma.fecha_creacion.strftime('%d/%m/%Y %H:%M')} | "
+            f"<b>Última actualización:</b> {odontograma.fecha_actualizacion.strftime('%d/%m/%Y %H:%M')}",
+            ParagraphStyle(
+                'SystemInfo',
+                parent=styles['Normal'],
+                fontSize=7,
+                alignment=TA_CENTER,
+                textColor=colors.HexColor('#64748b'),
+                spaceBefore=12
+            )
         )
-    )
-    story.append(system_info)
+        story.append(system_info)
     
-    # Construir el PDF
-    doc.build(story)
+        # Construir el PDF
+        doc.build(story)
     
-    # Obtener el contenido del buffer
-    pdf_content = buffer.getvalue()
-    buffer.close()
+        # Obtener el contenido del buffer
+        pdf_content = buffer.getvalue()
+        buffer.close()
+        return pdf_content
+    
+    # Servir desde la caché si los datos no cambiaron desde la última generación
+    huella = huella_odontograma(odontograma)
+    pdf_content = obtener_pdf_cacheado('odontograma', odontograma.id, huella)
+    if pdf_content is None:
+        pdf_content = construir_pdf()
+        guardar_pdf_cacheado('odontograma', odontograma.id, huella, pdf_content)
     
     # Crear o actualizar el documento en la base de datos
     try:
@@ -6846,29 +6861,20 @@ def exportar_odontograma_pdf(request, odontograma_id):
     return response
 
 
-# Vista para exportar presupuesto/tratamiento a PDF
-@login_required
-def exportar_presupuesto_pdf(request, plan_id):
-    """Vista para exportar un plan de tratamiento (presupuesto) a PDF"""
-    try:
-        perfil = Perfil.objects.get(user=request.user)
-        if not (perfil.es_dentista() or perfil.es_administrativo()):
-            messages.error(request, 'No tienes permisos para exportar presupuestos.')
-            return redirect('panel_trabajador')
-    except Perfil.DoesNotExist:
-        messages.error(request, 'No tienes permisos para acceder a esta función.')
-        return redirect('login')
-
-    # Obtener el plan de tratamiento
-    if perfil.es_administrativo():
-        plan = get_object_or_404(PlanTratamiento, id=plan_id)
-    else:
-        plan = get_object_or_404(PlanTratamiento, id=plan_id, dentista=perfil)
+def generar_pdf_presupuesto(plan, perfil):
+    """
+    PDF del presupuesto del plan (bytes). Se sirve desde la caché de PDFs si los datos
+    no cambiaron (ver citas/cache_pdf.py). Lo usan la exportación y los lotes de documentos.
+    """
+    huella = huella_presupuesto(plan)
+    pdf_content = obtener_pdf_cacheado('presupuesto', clave_generador(plan.id, perfil), huella)
+    if pdf_content is not None:
+        return pdf_content
     
     # Obtener información de la clínica
     try:
         from configuracion.models import InformacionClinica
-        info_clinica = InformacionClinica.obtener()
+        info_clinica = InformacionClinica.obtener_cacheada()
         nombre_clinica = info_clinica.nombre_clinica
         direccion_clinica = info_clinica.direccion
         telefono_clinica = info_clinica.telefono
@@ -6881,7 +6887,7 @@ def exportar_presupuesto_pdf(request, plan_id):
     
     # Crear el buffer para el PDF
     buffer = BytesIO()
-    
+
     # Crear el documento PDF
     doc = SimpleDocTemplate(
         buffer,
@@ -6891,10 +6897,10 @@ def exportar_presupuesto_pdf(request, plan_id):
         topMargin=40,
         bottomMargin=30
     )
-    
+
     # Estilos base de ReportLab
     styles = getSampleStyleSheet()
-    
+
     # Paleta de colores (turquesa)
     primary_color = colors.HexColor('#14b8a6')  # turquesa principal
     primary_dark = colors.HexColor('#0f766e')
@@ -6902,7 +6908,7 @@ def exportar_presupuesto_pdf(request, plan_id):
     soft_bg_alt = colors.HexColor('#e0f2f1')
     gray_text = colors.HexColor('#64748b')
     dark_text = colors.HexColor('#0f172a')
-    
+
     # Estilo para el título principal
     title_style = ParagraphStyle(
         'PresupuestoTitle',
@@ -6913,7 +6919,7 @@ def exportar_presupuesto_pdf(request, plan_id):
         textColor=primary_dark,
         fontName='Helvetica-Bold'
     )
-    
+
     # Estilo para subtítulos
     subtitle_style = ParagraphStyle(
         'PresupuestoSubtitle',
@@ -6925,7 +6931,7 @@ def exportar_presupuesto_pdf(request, plan_id):
         textColor=primary_dark,
         fontName='Helvetica-Bold'
     )
-    
+
     # Estilo para información de la clínica
     clinic_info_style = ParagraphStyle(
         'ClinicInfo',
@@ -6934,7 +6940,7 @@ def exportar_presupuesto_pdf(request, plan_id):
         alignment=TA_CENTER,
         textColor=gray_text
     )
-    
+
     # Estilo para texto normal
     normal_style = ParagraphStyle(
         'NormalPresupuesto',
@@ -6944,10 +6950,10 @@ def exportar_presupuesto_pdf(request, plan_id):
         alignment=TA_LEFT,
         leading=14
     )
-    
+
     # Contenido del PDF
     story = []
-    
+
     # Encabezado con información de la clínica
     header_text = f"<b>{nombre_clinica}</b><br/>"
     if direccion_clinica:
@@ -6959,30 +6965,30 @@ def exportar_presupuesto_pdf(request, plan_id):
     header = Paragraph(header_text, clinic_info_style)
     story.append(header)
     story.append(Spacer(1, 12))
-    
+
     # Título principal
     title = Paragraph("<b>PRESUPUESTO DE TRATAMIENTO</b>", title_style)
     story.append(title)
-    
+
     # Información de fecha y número
     fecha_info = Paragraph(
-        f"Fecha de Emisión: {datetime.now().strftime('%d/%m/%Y %H:%M')} | Presupuesto N° {plan.id}",
+        f"Fecha de Emisión: {datetime.now().strftime('%d/%m/%Y')} | Presupuesto N° {plan.id}",
         clinic_info_style
     )
     story.append(fecha_info)
     story.append(Spacer(1, 16))
-    
+
     # Sección: Información del Paciente
     paciente_title = Paragraph("<b>INFORMACIÓN DEL PACIENTE</b>", subtitle_style)
     story.append(paciente_title)
-    
+
     paciente_data = [
         ['Nombre Completo:', plan.cliente.nombre_completo],
         ['RUT:', plan.cliente.rut or 'No especificado'],
         ['Email:', plan.cliente.email or 'No especificado'],
         ['Teléfono:', plan.cliente.telefono or 'No especificado'],
     ]
-    
+
     paciente_table = Table(paciente_data, colWidths=[2 * inch, 4.5 * inch])
     paciente_table_style = TableStyle([
         ('BACKGROUND', (0, 0), (0, -1), soft_bg),
@@ -7003,47 +7009,47 @@ def exportar_presupuesto_pdf(request, plan_id):
     paciente_table.setStyle(paciente_table_style)
     story.append(paciente_table)
     story.append(Spacer(1, 12))
-    
+
     # Sección: Información del Tratamiento
     tratamiento_title = Paragraph("<b>INFORMACIÓN DEL TRATAMIENTO</b>", subtitle_style)
     story.append(tratamiento_title)
-    
+
     tratamiento_info = [
         ['Nombre del Plan:', plan.nombre],
         ['Dentista:', plan.dentista.nombre_completo],
         ['Estado:', plan.get_estado_display()],
     ]
-    
+
     if plan.fecha_inicio_estimada:
         tratamiento_info.append(['Fecha Inicio Estimada:', plan.fecha_inicio_estimada.strftime('%d/%m/%Y')])
     if plan.fecha_fin_estimada:
         tratamiento_info.append(['Fecha Fin Estimada:', plan.fecha_fin_estimada.strftime('%d/%m/%Y')])
     if plan.citas_estimadas:
         tratamiento_info.append(['Citas Estimadas:', str(plan.citas_estimadas)])
-    
+
     tratamiento_table = Table(tratamiento_info, colWidths=[2 * inch, 4.5 * inch])
     tratamiento_table.setStyle(paciente_table_style)
     story.append(tratamiento_table)
     story.append(Spacer(1, 12))
-    
+
     # Diagnóstico y Objetivo
     if plan.diagnostico:
         diagnostico_text = Paragraph(f"<b>Diagnóstico:</b><br/>{plan.diagnostico}", normal_style)
         story.append(diagnostico_text)
         story.append(Spacer(1, 8))
-    
+
     if plan.objetivo:
         objetivo_text = Paragraph(f"<b>Objetivo del Tratamiento:</b><br/>{plan.objetivo}", normal_style)
         story.append(objetivo_text)
         story.append(Spacer(1, 12))
-    
+
     # Sección: Detalle del Tratamiento (Fases e Items)
     # Nota: la gestión de fases y pagos se ha simplificado en el sistema,
     # por lo que esta sección se omite del PDF para mantener un diseño limpio.
     # Sección: Resumen Financiero
     resumen_title = Paragraph("<b>RESUMEN FINANCIERO</b>", subtitle_style)
     story.append(resumen_title)
-    
+
     resumen_data = [
         ['Presupuesto Total:', f"${plan.presupuesto_total:,.0f}"],
         ['Descuento:', f"${plan.descuento:,.0f}"],
@@ -7051,7 +7057,7 @@ def exportar_presupuesto_pdf(request, plan_id):
         ['Total Pagado:', f"${plan.total_pagado:,.0f}"],
         ['Saldo Pendiente:', f"${plan.saldo_pendiente:,.0f}"],
     ]
-    
+
     resumen_table = Table(resumen_data, colWidths=[2.5 * inch, 4 * inch])
     resumen_table_style = TableStyle([
         ('BACKGROUND', (0, 0), (0, -1), soft_bg_alt),
@@ -7074,9 +7080,9 @@ def exportar_presupuesto_pdf(request, plan_id):
     resumen_table.setStyle(resumen_table_style)
     story.append(resumen_table)
     story.append(Spacer(1, 12))
-    
+
     # Historial de Pagos (se omite en la versión actual del presupuesto para mantener el enfoque en el resumen financiero)
-    
+
     # Notas
     if plan.notas_paciente:
         notas_title = Paragraph("<b>NOTAS PARA EL PACIENTE</b>", subtitle_style)
@@ -7084,18 +7090,42 @@ def exportar_presupuesto_pdf(request, plan_id):
         notas_text = Paragraph(plan.notas_paciente, normal_style)
         story.append(notas_text)
         story.append(Spacer(1, 12))
-    
+
     # Footer
-    footer_text = f"<b>Generado por:</b> {perfil.nombre_completo} | <b>Fecha:</b> {datetime.now().strftime('%d/%m/%Y %H:%M')}"
+    footer_text = f"<b>Generado por:</b> {perfil.nombre_completo} | <b>Fecha:</b> {datetime.now().strftime('%d/%m/%Y')}"
     footer = Paragraph(footer_text, clinic_info_style)
     story.append(footer)
-    
+
     # Construir el PDF
     doc.build(story)
-    
+
     # Obtener el contenido del buffer
     pdf_content = buffer.getvalue()
     buffer.close()
+    guardar_pdf_cacheado('presupuesto', clave_generador(plan.id, perfil), huella, pdf_content)
+    return pdf_content
+
+
+# Vista para exportar presupuesto/tratamiento a PDF
+@login_required
+def exportar_presupuesto_pdf(request, plan_id):
+    """Vista para exportar un plan de tratamiento (presupuesto) a PDF"""
+    try:
+        perfil = obtener_perfil(request)
+        if not (perfil.es_dentista() or perfil.es_administrativo()):
+            messages.error(request, 'No tienes permisos para exportar presupuestos.')
+            return redirect('panel_trabajador')
+    except Perfil.DoesNotExist:
+        messages.error(request, 'No tienes permisos para acceder a esta función.')
+        return redirect('login')
+
+    # Obtener el plan de tratamiento
+    if perfil.es_administrativo():
+        plan = get_object_or_404(PlanTratamiento, id=plan_id)
+    else:
+        plan = get_object_or_404(PlanTratamiento, id=plan_id, dentista=perfil)
+    
+    pdf_content = generar_pdf_presupuesto(plan, perfil)
     
     # Crear o actualizar el documento en la base de datos
     documento, created = DocumentoCliente.objects.get_or_create(
@@ -7126,7 +7156,7 @@ def exportar_presupuesto_pdf(request, plan_id):
 def gestor_documentos(request):
     """Vista para gestionar documentos de clientes (solo administradores)"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'Solo los administrativos pueden gestionar documentos.')
             return redirect('panel_trabajador')
@@ -7216,6 +7246,8 @@ def gestor_documentos(request):
         'total_documentos': total_documentos,
         'documentos_por_tipo': documentos_por_tipo,
         'clientes': clientes,
+        'selecciones_lote': SELECCIONES_LOTE,
+        'entregas_lote': LoteDocumentos.ENTREGA_CHOICES,
     }
     
     return render(request, 'citas/documentos/gestor_documentos.html', context)
@@ -7225,7 +7257,7 @@ def gestor_documentos(request):
 def descargar_documento(request, documento_id):
     """Vista para descargar un documento"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'No tienes permisos para descargar documentos.')
             return redirect('panel_trabajador')
@@ -7266,7 +7298,7 @@ def enviar_documento_correo(request, documento_id):
         return JsonResponse({'error': 'Método no permitido'}, status=405)
     
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             return JsonResponse({'error': 'No tienes permisos para enviar documentos.'}, status=403)
     except Perfil.DoesNotExist:
@@ -7323,7 +7355,7 @@ def enviar_documento_correo(request, documento_id):
         # Obtener información de la clínica
         try:
             from configuracion.models import InformacionClinica
-            info_clinica = InformacionClinica.obtener()
+            info_clinica = InformacionClinica.obtener_cacheada()
             nombre_clinica = info_clinica.nombre_clinica
             email_clinica = info_clinica.email or getattr(settings, 'DEFAULT_FROM_EMAIL', 'miclinicacontacto@gmail.com')
             direccion_clinica = info_clinica.direccion or ''
@@ -7386,7 +7418,7 @@ def enviar_consentimiento_por_correo(request, consentimiento_id):
         return JsonResponse({'error': 'Método no permitido'}, status=405)
     
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             return JsonResponse({'error': 'No tienes permisos para enviar consentimientos.'}, status=403)
     except Perfil.DoesNotExist:
@@ -7418,7 +7450,7 @@ def enviar_consentimiento_por_correo(request, consentimiento_id):
         # Obtener información de la clínica
         try:
             from configuracion.models import InformacionClinica
-            info_clinica = InformacionClinica.obtener()
+            info_clinica = InformacionClinica.obtener_cacheada()
             nombre_clinica = info_clinica.nombre_clinica
             email_clinica = info_clinica.email or getattr(settings, 'DEFAULT_FROM_EMAIL', 'miclinicacontacto@gmail.com')
             direccion_clinica = info_clinica.direccion or ''
@@ -7487,7 +7519,7 @@ def enviar_consentimiento_por_correo(request, consentimiento_id):
 def gestor_consentimientos(request):
     """Vista principal para gestionar consentimientos informados"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'Solo los administrativos pueden gestionar consentimientos.')
             return redirect('panel_trabajador')
@@ -7579,7 +7611,7 @@ def gestor_consentimientos(request):
 def crear_consentimiento(request):
     """Vista para crear un nuevo consentimiento informado"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'Solo los administrativos pueden crear consentimientos.')
             return redirect('gestor_consentimientos')
@@ -7732,7 +7764,7 @@ def crear_consentimiento(request):
 def crear_consentimiento_desde_plan(request, plan_id):
     """Vista para crear un consentimiento informado desde un plan de tratamiento"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.activo:
             messages.error(request, 'Tu cuenta está desactivada.')
             return redirect('login')
@@ -7744,8 +7776,7 @@ def crear_consentimiento_desde_plan(request, plan_id):
     if perfil.es_administrativo():
         plan = get_object_or_404(PlanTratamiento, id=plan_id)
     elif perfil.es_dentista():
-        pacientes_dentista = perfil.get_pacientes_asignados()
-        clientes_ids = [p['id'] for p in pacientes_dentista if 'id' in p and isinstance(p['id'], int)]
+        clientes_ids = perfil.get_clientes_asignados_ids()
         plan = get_object_or_404(
             PlanTratamiento,
             id=plan_id,
@@ -7884,7 +7915,7 @@ def crear_consentimiento_desde_plan(request, plan_id):
 def editar_consentimiento(request, consentimiento_id):
     """Vista para editar un consentimiento informado"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'Solo los administrativos pueden editar consentimientos.')
             return redirect('gestor_consentimientos')
@@ -7945,7 +7976,7 @@ def editar_consentimiento(request, consentimiento_id):
 def detalle_consentimiento(request, consentimiento_id):
     """Vista para ver el detalle de un consentimiento"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not (perfil.es_administrativo() or perfil.es_dentista()):
             messages.error(request, 'No tienes permisos para ver consentimientos.')
             return redirect('panel_trabajador')
@@ -8055,7 +8086,7 @@ def firmar_consentimiento(request, consentimiento_id):
         return JsonResponse({'error': 'Método no permitido'}, status=405)
     
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         # Permitir tanto administrativos como dentistas para firma presencial
         if not (perfil.es_administrativo() or perfil.es_dentista()):
             return JsonResponse({'error': 'No tienes permisos para firmar consentimientos.'}, status=403)
@@ -8108,24 +8139,20 @@ def firmar_consentimiento(request, consentimiento_id):
         return JsonResponse({'error': f'Error al firmar el consentimiento: {str(e)}'}, status=500)
 
 
-@login_required
-def exportar_consentimiento_pdf(request, consentimiento_id):
-    """Vista para exportar un consentimiento informado a PDF"""
-    try:
-        perfil = Perfil.objects.get(user=request.user)
-        if not (perfil.es_dentista() or perfil.es_administrativo()):
-            messages.error(request, 'No tienes permisos para exportar consentimientos.')
-            return redirect('panel_trabajador')
-    except Perfil.DoesNotExist:
-        messages.error(request, 'No tienes permisos para acceder a esta función.')
-        return redirect('login')
-    
-    consentimiento = get_object_or_404(ConsentimientoInformado, id=consentimiento_id)
+def generar_pdf_consentimiento(consentimiento):
+    """
+    PDF del consentimiento informado (bytes). Se sirve desde la caché de PDFs si los datos
+    no cambiaron (ver citas/cache_pdf.py). Lo usan la exportación y los lotes de documentos.
+    """
+    huella = huella_consentimiento(consentimiento)
+    pdf_content = obtener_pdf_cacheado('consentimiento', consentimiento.id, huella)
+    if pdf_content is not None:
+        return pdf_content
     
     # Obtener información de la clínica
     try:
         from configuracion.models import InformacionClinica
-        info_clinica = InformacionClinica.obtener()
+        info_clinica = InformacionClinica.obtener_cacheada()
         nombre_clinica = info_clinica.nombre_clinica
         direccion_clinica = info_clinica.direccion
         telefono_clinica = info_clinica.telefono
@@ -8138,31 +8165,31 @@ def exportar_consentimiento_pdf(request, consentimiento_id):
     
     # Crear el buffer para el PDF
     buffer = BytesIO()
-    
+
     # Función para convertir firma base64 a imagen de ReportLab
     def convertir_firma_base64_a_imagen(firma_base64, max_width=3*inch, max_height=1*inch):
         """Convierte una firma en formato base64 a una imagen de ReportLab"""
         if not firma_base64:
             return None
-        
+    
         try:
             import base64
             from io import BytesIO
             from PIL import Image as PILImage
-            
+        
             # Verificar si es una cadena base64
             if not isinstance(firma_base64, str):
                 return None
-            
+        
             # Si no empieza con data:image, asumir que es solo base64
             if firma_base64.startswith('data:image'):
                 # Extraer solo la parte base64
                 firma_base64 = firma_base64.split(',')[1] if ',' in firma_base64 else firma_base64
-            
+        
             # Decodificar base64
             imagen_bytes = base64.b64decode(firma_base64)
             imagen_pil = PILImage.open(BytesIO(imagen_bytes))
-            
+        
             # Convertir a RGB si es necesario (para PNG con transparencia)
             if imagen_pil.mode in ('RGBA', 'LA', 'P'):
                 fondo = PILImage.new('RGB', imagen_pil.size, (255, 255, 255))
@@ -8172,29 +8199,29 @@ def exportar_consentimiento_pdf(request, consentimiento_id):
                 imagen_pil = fondo
             elif imagen_pil.mode != 'RGB':
                 imagen_pil = imagen_pil.convert('RGB')
-            
+        
             # Redimensionar si es muy grande
             # Asumir que las imágenes del canvas tienen aproximadamente 96 DPI (estándar web)
             ancho_px, alto_px = imagen_pil.size
             # Convertir max_width y max_height de pulgadas a píxeles (asumiendo 96 DPI para web)
             max_width_px = (float(max_width) / inch) * 96
             max_height_px = (float(max_height) / inch) * 96
-            
+        
             # Calcular ratio para mantener proporción
             ratio_ancho = max_width_px / ancho_px if ancho_px > max_width_px else 1
             ratio_alto = max_height_px / alto_px if alto_px > max_height_px else 1
             ratio = min(ratio_ancho, ratio_alto)
-            
+        
             if ratio < 1:
                 nuevo_ancho = int(ancho_px * ratio)
                 nuevo_alto = int(alto_px * ratio)
                 imagen_pil = imagen_pil.resize((nuevo_ancho, nuevo_alto), PILImage.Resampling.LANCZOS)
-            
+        
             # Guardar en BytesIO
             img_buffer = BytesIO()
             imagen_pil.save(img_buffer, format='PNG')
             img_buffer.seek(0)
-            
+        
             # Crear Image de ReportLab
             # ReportLab usa puntos (72 puntos = 1 pulgada)
             # Convertir píxeles a pulgadas (asumiendo 96 DPI) y luego a puntos
@@ -8202,16 +8229,16 @@ def exportar_consentimiento_pdf(request, consentimiento_id):
             # Convertir píxeles a pulgadas (96 píxeles = 1 pulgada para imágenes web)
             width_inches = ancho_final / 96.0
             height_inches = alto_final / 96.0
-            
+        
             # Limitar al máximo permitido y convertir a puntos
             width_final = min(width_inches * inch, max_width)
             height_final = min(height_inches * inch, max_height)
-            
+        
             return Image(img_buffer, width=width_final, height=height_final)
         except Exception as e:
             logger.error(f"Error al convertir firma base64 a imagen: {str(e)}")
             return None
-    
+
     # Función para agregar marca de agua con logo de diente
     def add_watermark(canvas_obj, doc_obj):
         """Agregar marca de agua con logo de diente en todas las páginas"""
@@ -8225,7 +8252,7 @@ def exportar_consentimiento_pdf(request, consentimiento_id):
         # A4: 8.27 x 11.69 pulgadas
         canvas_obj.drawCentredString(4.5*inch, -2.5*inch, '🦷')
         canvas_obj.restoreState()
-    
+
     # Crear el documento PDF
     doc = SimpleDocTemplate(
         buffer,
@@ -8237,10 +8264,10 @@ def exportar_consentimiento_pdf(request, consentimiento_id):
         onFirstPage=add_watermark,
         onLaterPages=add_watermark
     )
-    
+
     # Estilos
     styles = getSampleStyleSheet()
-    
+
     # Estilo para el título principal
     title_style = ParagraphStyle(
         'ConsentimientoTitle',
@@ -8251,7 +8278,7 @@ def exportar_consentimiento_pdf(request, consentimiento_id):
         textColor=colors.HexColor('#1e293b'),
         fontName='Helvetica-Bold'
     )
-    
+
     # Estilo para subtítulos con color turquesa
     subtitle_style = ParagraphStyle(
         'ConsentimientoSubtitle',
@@ -8267,7 +8294,7 @@ def exportar_consentimiento_pdf(request, consentimiento_id):
         leftIndent=0,
         rightIndent=0,
     )
-    
+
     # Estilo para subtítulos de secciones (B.1, B.2, etc.)
     section_subtitle_style = ParagraphStyle(
         'SectionSubtitle',
@@ -8279,7 +8306,7 @@ def exportar_consentimiento_pdf(request, consentimiento_id):
         textColor=colors.HexColor('#0d9488'),  # Turquesa más oscuro
         fontName='Helvetica-Bold'
     )
-    
+
     # Estilo para encabezado de clínica
     clinic_header_style = ParagraphStyle(
         'ClinicHeader',
@@ -8290,7 +8317,7 @@ def exportar_consentimiento_pdf(request, consentimiento_id):
         fontName='Helvetica-Bold',
         spaceAfter=8
     )
-    
+
     # Estilo para información de la clínica
     clinic_info_style = ParagraphStyle(
         'ClinicInfo',
@@ -8300,7 +8327,7 @@ def exportar_consentimiento_pdf(request, consentimiento_id):
         textColor=colors.HexColor('#64748b'),
         spaceAfter=12
     )
-    
+
     # Estilo para texto normal
     normal_style = ParagraphStyle(
         'NormalConsentimiento',
@@ -8310,14 +8337,14 @@ def exportar_consentimiento_pdf(request, consentimiento_id):
         alignment=TA_LEFT,
         leading=14
     )
-    
+
     # Contenido del PDF - Estructura según Ley 20.584
     story = []
-    
+
     # A. ENCABEZADO - Información de la Clínica (mejorado)
     clinic_header = Paragraph(f"<b>{nombre_clinica}</b>", clinic_header_style)
     story.append(clinic_header)
-    
+
     header_info = []
     if direccion_clinica:
         header_info.append(direccion_clinica)
@@ -8326,7 +8353,7 @@ def exportar_consentimiento_pdf(request, consentimiento_id):
         contact_info.append(f"Teléfono: {telefono_clinica}")
     if email_clinica:
         contact_info.append(f"Email: {email_clinica}")
-    
+
     if header_info or contact_info:
         header_text = ""
         if header_info:
@@ -8335,17 +8362,17 @@ def exportar_consentimiento_pdf(request, consentimiento_id):
             if header_text:
                 header_text += "<br/>"
             header_text += " | ".join(contact_info)
-        header_text += f"<br/><b>Fecha de Generación:</b> {datetime.now().strftime('%d/%m/%Y %H:%M')}"
+        header_text += f"<br/><b>Fecha de Generación:</b> {datetime.now().strftime('%d/%m/%Y')}"
         header = Paragraph(header_text, clinic_info_style)
         story.append(header)
-    
+
     story.append(Spacer(1, 20))
-    
+
     # Título principal con línea decorativa
     title = Paragraph(f"<b>CONSENTIMIENTO INFORMADO</b>", title_style)
     story.append(title)
     story.append(Spacer(1, 8))
-    
+
     # Subtítulo del procedimiento
     if consentimiento.titulo:
         subtitle_proc = Paragraph(f"<i>{consentimiento.titulo}</i>", ParagraphStyle(
@@ -8360,21 +8387,21 @@ def exportar_consentimiento_pdf(request, consentimiento_id):
         story.append(subtitle_proc)
     else:
         story.append(Spacer(1, 16))
-    
+
     # A. IDENTIFICACIÓN Y ANTECEDENTES
     identificacion_title = Paragraph("<b>A. IDENTIFICACIÓN Y ANTECEDENTES</b>", subtitle_style)
     story.append(identificacion_title)
-    
+
     # Limpiar RUT para evitar símbolos extraños (como '$' de datos antiguos)
     rut_paciente = (consentimiento.cliente.rut or 'No especificado').replace('$', '')
-    
+
     paciente_data = [
         ['Nombre Completo del Paciente:', consentimiento.cliente.nombre_completo],
         ['RUT:', rut_paciente],
         ['Email:', consentimiento.cliente.email or 'No especificado'],
         ['Teléfono:', consentimiento.cliente.telefono or 'No especificado'],
     ]
-    
+
     paciente_table = Table(paciente_data, colWidths=[2.2*inch, 4.3*inch])
     paciente_table_style = TableStyle([
         ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#ecfeff')),  # Fondo turquesa muy claro
@@ -8396,12 +8423,12 @@ def exportar_consentimiento_pdf(request, consentimiento_id):
     paciente_table.setStyle(paciente_table_style)
     story.append(paciente_table)
     story.append(Spacer(1, 16))
-    
+
     # B. INFORMACIÓN DETALLADA DEL PROCEDIMIENTO
     info_title = Paragraph("<b>B. INFORMACIÓN DETALLADA DEL PROCEDIMIENTO</b>", subtitle_style)
     story.append(info_title)
     story.append(Spacer(1, 8))
-    
+
     # B.1. Diagnóstico y Justificación
     if consentimiento.diagnostico:
         diagnostico_title = Paragraph("<b>B.1. Diagnóstico y Justificación del Tratamiento</b>", section_subtitle_style)
@@ -8412,7 +8439,7 @@ def exportar_consentimiento_pdf(request, consentimiento_id):
             justificacion_text = Paragraph(consentimiento.justificacion or 'No especificado', normal_style)
             story.append(justificacion_text)
         story.append(Spacer(1, 12))
-    
+
     # B.2. Naturaleza y Objetivos del Tratamiento
     if consentimiento.naturaleza_procedimiento or consentimiento.objetivos_tratamiento:
         naturaleza_title = Paragraph("<b>B.2. Naturaleza y Objetivos del Tratamiento</b>", section_subtitle_style)
@@ -8424,7 +8451,7 @@ def exportar_consentimiento_pdf(request, consentimiento_id):
             objetivos_text = Paragraph(f"<b>Objetivos del Tratamiento:</b><br/>{consentimiento.objetivos_tratamiento or 'No especificado'}", normal_style)
             story.append(objetivos_text)
         story.append(Spacer(1, 12))
-    
+
     # B.3. Contenido General del Consentimiento
     if consentimiento.contenido:
         contenido_title = Paragraph("<b>B.3. Información General del Procedimiento</b>", section_subtitle_style)
@@ -8432,7 +8459,7 @@ def exportar_consentimiento_pdf(request, consentimiento_id):
         contenido_text = Paragraph(consentimiento.contenido or 'No especificado', normal_style)
         story.append(contenido_text)
         story.append(Spacer(1, 12))
-    
+
     # B.4. Alternativas de Tratamiento (OBLIGATORIO - Ley 20.584)
     if consentimiento.alternativas:
         alternativas_title = Paragraph("<b>B.4. Alternativas de Tratamiento</b>", section_subtitle_style)
@@ -8440,7 +8467,7 @@ def exportar_consentimiento_pdf(request, consentimiento_id):
         alternativas_text = Paragraph(consentimiento.alternativas or 'No especificado', normal_style)
         story.append(alternativas_text)
         story.append(Spacer(1, 12))
-    
+
     # B.5. Riesgos y Complicaciones Relevantes (OBLIGATORIO - Ley 20.584)
     if consentimiento.riesgos:
         riesgos_title = Paragraph("<b>B.5. Riesgos y Complicaciones Relevantes</b>", section_subtitle_style)
@@ -8448,7 +8475,7 @@ def exportar_consentimiento_pdf(request, consentimiento_id):
         riesgos_text = Paragraph(consentimiento.riesgos or 'No especificado', normal_style)
         story.append(riesgos_text)
         story.append(Spacer(1, 12))
-    
+
     # B.6. Beneficios Esperados
     if consentimiento.beneficios:
         beneficios_title = Paragraph("<b>B.6. Beneficios Esperados</b>", section_subtitle_style)
@@ -8456,7 +8483,7 @@ def exportar_consentimiento_pdf(request, consentimiento_id):
         beneficios_text = Paragraph(consentimiento.beneficios or 'No especificado', normal_style)
         story.append(beneficios_text)
         story.append(Spacer(1, 12))
-    
+
     # B.7. Pronóstico
     if consentimiento.pronostico:
         pronostico_title = Paragraph("<b>B.7. Pronóstico</b>", section_subtitle_style)
@@ -8464,7 +8491,7 @@ def exportar_consentimiento_pdf(request, consentimiento_id):
         pronostico_text = Paragraph(consentimiento.pronostico or 'No especificado', normal_style)
         story.append(pronostico_text)
         story.append(Spacer(1, 12))
-    
+
     # B.8. Cuidados Postoperatorios
     if consentimiento.cuidados_postoperatorios:
         cuidados_title = Paragraph("<b>B.8. Cuidados Postoperatorios</b>", section_subtitle_style)
@@ -8472,12 +8499,12 @@ def exportar_consentimiento_pdf(request, consentimiento_id):
         cuidados_text = Paragraph(consentimiento.cuidados_postoperatorios or 'No especificado', normal_style)
         story.append(cuidados_text)
         story.append(Spacer(1, 16))
-    
+
     # C. DECLARACIÓN DEL PACIENTE Y FIRMAS (Ley 20.584)
     declaracion_title = Paragraph("<b>C. DECLARACIÓN DEL PACIENTE Y FIRMAS</b>", subtitle_style)
     story.append(declaracion_title)
     story.append(Spacer(1, 10))
-    
+
     # Declaración de Comprensión (Ley 20.584) - con fondo turquesa
     declaracion_box_style = ParagraphStyle(
         'DeclaracionBox',
@@ -8499,7 +8526,7 @@ def exportar_consentimiento_pdf(request, consentimiento_id):
     )
     story.append(declaracion_text)
     story.append(Spacer(1, 10))
-    
+
     # Derecho de Revocación (Ley 20.584) - con fondo turquesa
     revocacion_text = Paragraph(
         "<b>DERECHO DE REVOCACIÓN:</b><br/>"
@@ -8508,12 +8535,12 @@ def exportar_consentimiento_pdf(request, consentimiento_id):
     )
     story.append(revocacion_text)
     story.append(Spacer(1, 16))
-    
+
     # Espacios para Firmas
     firmas_title = Paragraph("<b>FIRMAS</b>", subtitle_style)
     story.append(firmas_title)
     story.append(Spacer(1, 12))
-    
+
     # Estilo para títulos de sección de firmas
     firma_section_title_style = ParagraphStyle(
         'FirmaSectionTitle',
@@ -8524,26 +8551,26 @@ def exportar_consentimiento_pdf(request, consentimiento_id):
         spaceAfter=6,
         spaceBefore=0
     )
-    
+
     # Tabla de firmas - Estructura mejorada y organizada
     firmas_data = []
     row_idx = 0
     title_rows = []  # Filas que son títulos de sección (para aplicar SPAN)
-    
+
     # Paciente
     if consentimiento.esta_firmado:
         # Título de sección que ocupará ambas columnas
         firmas_data.append([Paragraph('<b>PACIENTE</b>', firma_section_title_style), ''])
         title_rows.append(row_idx)
         row_idx += 1
-        
+    
         firmas_data.append(['Nombre:', consentimiento.nombre_firmante or consentimiento.cliente.nombre_completo])
         row_idx += 1
-        
+    
         if consentimiento.rut_firmante:
             firmas_data.append(['RUT:', consentimiento.rut_firmante])
             row_idx += 1
-        
+    
         # Convertir firma base64 a imagen si es necesario
         firma_paciente_img = convertir_firma_base64_a_imagen(consentimiento.firma_paciente, max_width=2.5*inch, max_height=0.8*inch)
         if firma_paciente_img:
@@ -8551,56 +8578,56 @@ def exportar_consentimiento_pdf(request, consentimiento_id):
         else:
             firmas_data.append(['Firma:', consentimiento.firma_paciente or '_________________________'])
         row_idx += 1
-        
+    
         firmas_data.append(['Fecha y Hora:', consentimiento.fecha_firma.strftime('%d/%m/%Y %H:%M') if consentimiento.fecha_firma else ''])
         row_idx += 1
     else:
         firmas_data.append([Paragraph('<b>PACIENTE</b>', firma_section_title_style), Paragraph('<i>Pendiente de firma</i>', normal_style)])
         title_rows.append(row_idx)
         row_idx += 1
-    
+
     # Separador visual
     firmas_data.append(['', ''])
     row_idx += 1
-    
+
     # Profesional Tratante
     if consentimiento.dentista:
         # Título de sección que ocupará ambas columnas
         firmas_data.append([Paragraph('<b>PROFESIONAL TRATANTE</b>', firma_section_title_style), ''])
         title_rows.append(row_idx)
         row_idx += 1
-        
+    
         firmas_data.append(['Nombre:', consentimiento.dentista.nombre_completo])
         row_idx += 1
-        
+    
         if consentimiento.rut_dentista:
             firmas_data.append(['RUT:', consentimiento.rut_dentista])
             row_idx += 1
-        
+    
         if consentimiento.registro_superintendencia:
             firmas_data.append(['Registro Superintendencia de Salud:', consentimiento.registro_superintendencia])
             row_idx += 1
-        
+    
         firmas_data.append(['Firma:', '_________________________'])
         row_idx += 1
-        
+    
         # Espacio
         firmas_data.append(['', ''])
         row_idx += 1
-    
+
     # Testigo (opcional pero recomendado)
     if consentimiento.nombre_testigo:
         firmas_data.append([Paragraph('<b>TESTIGO</b>', firma_section_title_style), ''])
         title_rows.append(row_idx)
         row_idx += 1
-        
+    
         firmas_data.append(['Nombre:', consentimiento.nombre_testigo])
         row_idx += 1
-        
+    
         if consentimiento.rut_testigo:
             firmas_data.append(['RUT:', consentimiento.rut_testigo])
             row_idx += 1
-        
+    
         # Convertir firma testigo base64 a imagen si es necesario
         firma_testigo_img = convertir_firma_base64_a_imagen(consentimiento.firma_testigo, max_width=2.5*inch, max_height=0.8*inch)
         if firma_testigo_img:
@@ -8608,10 +8635,10 @@ def exportar_consentimiento_pdf(request, consentimiento_id):
         else:
             firmas_data.append(['Firma:', consentimiento.firma_testigo or '_________________________'])
         row_idx += 1
-    
+
     if firmas_data:
         firmas_table = Table(firmas_data, colWidths=[2.4*inch, 4.1*inch])
-        
+    
         # Construir lista de estilos
         style_list = [
             # Estilo base para la primera columna (etiquetas)
@@ -8619,28 +8646,28 @@ def exportar_consentimiento_pdf(request, consentimiento_id):
             ('TEXTCOLOR', (0, 0), (0, -1), colors.HexColor('#0d9488')),  # Texto turquesa oscuro
             ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
             ('FONTSIZE', (0, 0), (0, -1), 10),
-            
+        
             # Estilo para la segunda columna (valores)
             ('TEXTCOLOR', (1, 0), (1, -1), colors.HexColor('#374151')),
             ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
             ('FONTSIZE', (1, 0), (1, -1), 10),
-            
+        
             # Alineación
             ('ALIGN', (0, 0), (0, -1), 'LEFT'),
             ('ALIGN', (1, 0), (1, -1), 'LEFT'),
             ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-            
+        
             # Bordes
             ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#14b8a6')),  # Borde turquesa
             ('LINEBELOW', (0, 0), (-1, 0), 1.5, colors.HexColor('#14b8a6')),  # Línea superior más gruesa
-            
+        
             # Padding base
             ('LEFTPADDING', (0, 0), (-1, -1), 12),
             ('RIGHTPADDING', (0, 0), (-1, -1), 12),
             ('TOPPADDING', (0, 0), (-1, -1), 10),
             ('BOTTOMPADDING', (0, 0), (-1, -1), 10),
         ]
-        
+    
         # Aplicar SPAN a los títulos de sección para que ocupen ambas columnas
         for title_row in title_rows:
             style_list.append(('SPAN', (0, title_row), (1, title_row)))  # Ocupar ambas columnas
@@ -8648,26 +8675,26 @@ def exportar_consentimiento_pdf(request, consentimiento_id):
             style_list.append(('ALIGN', (0, title_row), (1, title_row), 'LEFT'))
             style_list.append(('TOPPADDING', (0, title_row), (1, title_row), 12))
             style_list.append(('BOTTOMPADDING', (0, title_row), (1, title_row), 12))
-        
+    
         # Aplicar estilos a filas vacías (separadores)
         for i, row in enumerate(firmas_data):
             if len(row) >= 2 and (row[0] == '' or row[0] is None) and (row[1] == '' or row[1] is None):
                 style_list.append(('BACKGROUND', (0, i), (1, i), colors.HexColor('#ffffff')))
                 style_list.append(('TOPPADDING', (0, i), (1, i), 4))
                 style_list.append(('BOTTOMPADDING', (0, i), (1, i), 4))
-        
+    
         firmas_table_style = TableStyle(style_list)
         firmas_table.setStyle(firmas_table_style)
         story.append(firmas_table)
         story.append(Spacer(1, 16))
-    
+
     # Footer con información legal (mejorado)
     story.append(Spacer(1, 12))
     footer_text = f"<b>Documento generado el:</b> {datetime.now().strftime('%d/%m/%Y %H:%M')}"
     if consentimiento.fecha_vencimiento:
         footer_text += f" | <b>Válido hasta:</b> {consentimiento.fecha_vencimiento.strftime('%d/%m/%Y')}"
     footer_text += "<br/><i>Este documento cumple con los requisitos de la <b>Ley N° 20.584</b> sobre Derechos y Deberes de las Personas en relación con las Acciones vinculadas a su Atención en Salud.</i>"
-    
+
     footer_style = ParagraphStyle(
         'FooterStyle',
         parent=clinic_info_style,
@@ -8681,19 +8708,41 @@ def exportar_consentimiento_pdf(request, consentimiento_id):
     )
     footer = Paragraph(footer_text, footer_style)
     story.append(footer)
-    
+
     # Construir el PDF
     try:
         doc.build(story)
-    except Exception as e:
-        logger.error(f"Error al construir PDF del consentimiento {consentimiento_id}: {str(e)}")
+    except Exception:
         buffer.close()
-        messages.error(request, f'Error al generar el PDF: {str(e)}')
-        return redirect('gestor_consentimientos')
-    
+        raise
+
     # Obtener el contenido del buffer
     pdf_content = buffer.getvalue()
     buffer.close()
+    guardar_pdf_cacheado('consentimiento', consentimiento.id, huella, pdf_content)
+    return pdf_content
+
+
+@login_required
+def exportar_consentimiento_pdf(request, consentimiento_id):
+    """Vista para exportar un consentimiento informado a PDF"""
+    try:
+        perfil = obtener_perfil(request)
+        if not (perfil.es_dentista() or perfil.es_administrativo()):
+            messages.error(request, 'No tienes permisos para exportar consentimientos.')
+            return redirect('panel_trabajador')
+    except Perfil.DoesNotExist:
+        messages.error(request, 'No tienes permisos para acceder a esta función.')
+        return redirect('login')
+    
+    consentimiento = get_object_or_404(ConsentimientoInformado, id=consentimiento_id)
+    
+    try:
+        pdf_content = generar_pdf_consentimiento(consentimiento)
+    except Exception as e:
+        logger.error(f"Error al construir PDF del consentimiento {consentimiento_id}: {str(e)}")
+        messages.error(request, f'Error al generar el PDF: {str(e)}')
+        return redirect('gestor_consentimientos')
     
     # Crear o actualizar el documento en la base de datos (usando consentimiento como referencia única)
     try:
@@ -8749,7 +8798,7 @@ def eliminar_consentimiento(request, consentimiento_id):
     from django.http import JsonResponse
     
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             return JsonResponse({'success': False, 'error': 'No tienes permisos para eliminar consentimientos.'}, status=403)
     except Perfil.DoesNotExist:
@@ -8780,7 +8829,7 @@ def firmar_consentimiento_recepcion(request, plan_id, consentimiento_id):
     import os
     
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             return JsonResponse({'success': False, 'error': 'No tienes permisos para subir documentos de consentimientos.'}, status=403)
     except Perfil.DoesNotExist:
@@ -8858,7 +8907,7 @@ def firmar_consentimiento_recepcion(request, plan_id, consentimiento_id):
 def descargar_documento_firmado_consentimiento(request, consentimiento_id):
     """Descarga el documento firmado físicamente de un consentimiento (solo administrativos)."""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'No tienes permisos para descargar documentos de consentimientos.')
             return redirect('gestor_consentimientos')
@@ -8897,7 +8946,7 @@ def descargar_documento_firmado_consentimiento(request, consentimiento_id):
 def obtener_plantilla_consentimiento(request, plantilla_id):
     """Vista AJAX para obtener datos de una plantilla de consentimiento"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             return JsonResponse({'error': 'No tienes permisos.'}, status=403)
     except Perfil.DoesNotExist:
@@ -8933,7 +8982,7 @@ def marcar_evaluacion_revisada(request, evaluacion_id):
     Marca una evaluación como revisada
     """
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
     except Perfil.DoesNotExist:
         messages.error(request, 'No tienes permisos para realizar esta acción.')
         return redirect('login')
@@ -8959,7 +9008,7 @@ def archivar_evaluacion(request, evaluacion_id):
     Archiva una evaluación
     """
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
     except Perfil.DoesNotExist:
         messages.error(request, 'No tienes permisos para realizar esta acción.')
         return redirect('login')
@@ -8981,7 +9030,7 @@ def eliminar_evaluacion(request, evaluacion_id):
     Elimina una evaluación (solo admin)
     """
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'No tienes permisos para eliminar evaluaciones.')
             return redirect('gestor_evaluaciones')
@@ -9009,7 +9058,7 @@ def gestor_finanzas(request):
     SOLO DISPONIBLE PARA ADMINISTRATIVOS
     """
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.activo:
             messages.error(request, 'Tu cuenta está desactivada.')
             return redirect('login')
@@ -9434,7 +9483,7 @@ def gestor_finanzas(request):
 def agregar_ingreso_manual(request):
     """Vista para agregar un ingreso manual"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'No tienes permisos para agregar ingresos manuales.')
             return redirect('gestor_finanzas')
@@ -9497,7 +9546,7 @@ def agregar_ingreso_manual(request):
 def eliminar_ingreso_manual(request, ingreso_id):
     """Vista para eliminar un ingreso manual"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'No tienes permisos para eliminar ingresos manuales.')
             return redirect('gestor_finanzas')
@@ -9530,7 +9579,7 @@ def eliminar_ingreso_manual(request, ingreso_id):
 def agregar_egreso_manual(request):
     """Vista para agregar un egreso manual"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'No tienes permisos para agregar egresos manuales.')
             return redirect('gestor_finanzas')
@@ -9593,7 +9642,7 @@ def agregar_egreso_manual(request):
 def eliminar_egreso_manual(request, egreso_id):
     """Vista para eliminar un egreso manual"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'No tienes permisos para eliminar egresos manuales.')
             return redirect('gestor_finanzas')
@@ -9630,7 +9679,7 @@ def eliminar_ingreso_cita(request, cita_id):
     SOLO DISPONIBLE PARA ADMINISTRATIVOS
     """
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'No tienes permisos para eliminar ingresos de citas.')
             return redirect('gestor_finanzas')
@@ -9676,7 +9725,7 @@ def eliminar_egreso_compra(request, movimiento_id):
     SOLO DISPONIBLE PARA ADMINISTRATIVOS
     """
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'No tienes permisos para eliminar egresos de compras.')
             return redirect('gestor_finanzas')
@@ -9723,7 +9772,7 @@ def eliminar_egreso_solicitud(request, solicitud_id):
     SOLO DISPONIBLE PARA ADMINISTRATIVOS
     """
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'No tienes permisos para eliminar egresos de solicitudes.')
             return redirect('gestor_finanzas')
@@ -9810,7 +9859,7 @@ def editar_informacion_clinica(request):
     Solo disponible para administrativos
     """
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'No tienes permisos para editar la información de la clínica.')
             return redirect('panel_trabajador')
@@ -9940,6 +9989,35 @@ def buscar_cliente_por_email(request):
         return JsonResponse({'existe': False})
 
 
+@perfil_requerido
+def buscar_clientes_autocomplete(request):
+    """
+    Vista AJAX de autocompletado de clientes para el modal de citas.
+    Devuelve como máximo 10 clientes activos que coinciden con ?q= (nombre sin importar
+    tildes, email, RUT o teléfono), primero los que empiezan con el texto buscado
+    (ver pacientes.busqueda.buscar_pacientes)
+    """
+    query = request.GET.get('q', '').strip()
+    if len(query) < 2:
+        return JsonResponse({'success': True, 'clientes': []})
+    
+    clientes = buscar_pacientes(query).values('id', 'nombre_completo', 'email', 'telefono', 'rut')
+    
+    return JsonResponse({
+        'success': True,
+        'clientes': [
+            {
+                'id': c['id'],
+                'nombre_completo': c['nombre_completo'],
+                'email': c['email'] or '',
+                'telefono': c['telefono'] or '',
+                'rut': c['rut'] or '',
+            }
+            for c in clientes
+        ],
+    })
+
+
 @login_required
 def validar_email(request):
     """
@@ -9977,22 +10055,13 @@ def validar_rut(request):
     if not rut:
         return JsonResponse({'existe': False})
     
-    # Limpiar el RUT (quitar puntos y guiones)
-    rut_limpio = rut.replace('.', '').replace('-', '').upper()
-    
-    # Validar formato básico (debe tener al menos 7 dígitos)
-    if not rut_limpio[:-1].isdigit() or len(rut_limpio) < 8:
+    # Normalizar y validar formato y dígito verificador (ver pacientes/rut.py)
+    rut_normalizado = normalizar_rut(rut)
+    if not rut_normalizado:
         return JsonResponse({'existe': False, 'invalido': True})
     
-    # Buscar en Cliente (comparar RUTs normalizados)
-    existe = False
-    clientes = Cliente.objects.filter(rut__isnull=False).exclude(rut='')
-    for cliente in clientes:
-        if cliente.rut:
-            rut_cliente_limpio = cliente.rut.replace('.', '').replace('-', '').upper()
-            if rut_cliente_limpio == rut_limpio:
-                existe = True
-                break
+    # Búsqueda por el índice de rut_normalizado
+    existe = Cliente.objects.filter(rut_normalizado=rut_normalizado).exists()
     
     return JsonResponse({'existe': existe})
 
@@ -10027,7 +10096,7 @@ def crear_cliente_presencial(request):
     Solo disponible para administrativos
     """
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'No tienes permisos para crear clientes.')
             return redirect('gestor_clientes')
@@ -10090,6 +10159,9 @@ def crear_cliente_presencial(request):
             if rut_existe:
                 messages.error(request, rut_error)
                 return redirect('gestor_clientes')
+            if not normalizar_rut(rut):
+                messages.error(request, 'El RUT no es válido. Revise el número y el dígito verificador.')
+                return redirect('gestor_clientes')
             
             telefono_existe, telefono_error = validar_telefono_cliente(telefono)
             if telefono_existe:
@@ -10297,7 +10369,7 @@ def crear_cliente_presencial(request):
                             # Obtener información de la clínica
                             try:
                                 from configuracion.models import InformacionClinica
-                                info_clinica = InformacionClinica.obtener()
+                                info_clinica = InformacionClinica.obtener_cacheada()
                                 nombre_clinica = info_clinica.nombre_clinica or "Clínica Dental San Felipe"
                                 direccion_clinica = info_clinica.direccion or ''
                                 telefono_clinica = info_clinica.telefono or ''
@@ -10408,6 +10480,65 @@ def crear_cliente_presencial(request):
     return redirect('gestor_clientes')
 
 
+@login_required
+def importar_clientes_archivo(request):
+    """
+    Importa pacientes desde un archivo CSV o XLSX subido en el gestor de clientes.
+    Retorna el resumen de la importación con los errores por fila (ver pacientes/importacion.py).
+    Solo disponible para administrativos.
+    """
+    from pacientes.importacion import MAXIMO_TAMANO_ARCHIVO, ArchivoInvalido, importar_clientes, leer_archivo
+    
+    try:
+        perfil = obtener_perfil(request)
+        if not perfil.es_administrativo():
+            return JsonResponse({
+                'success': False,
+                'error': 'No tienes permisos para importar clientes'
+            }, status=403)
+    except Perfil.DoesNotExist:
+        return JsonResponse({
+            'success': False,
+            'error': 'No tienes permisos'
+        }, status=403)
+    
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Método no permitido'}, status=405)
+    
+    archivo = request.FILES.get('archivo')
+    if not archivo:
+        return JsonResponse({'success': False, 'error': 'Debe seleccionar un archivo CSV o XLSX'}, status=400)
+    if archivo.size > MAXIMO_TAMANO_ARCHIVO:
+        return JsonResponse({
+            'success': False,
+            'error': f'El archivo supera el máximo de {MAXIMO_TAMANO_ARCHIVO // (1024 * 1024)} MB'
+        }, status=400)
+    
+    try:
+        filas = leer_archivo(archivo)
+    except ArchivoInvalido as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    
+    dry_run = request.POST.get('solo_validar') == 'on'
+    resumen = importar_clientes(filas, actualizar=request.POST.get('actualizar') == 'on', dry_run=dry_run)
+    
+    if not dry_run and (resumen['creados'] or resumen['actualizados']):
+        registrar_auditoria(
+            usuario=perfil,
+            accion='importar',
+            modulo='clientes',
+            descripcion=f'Importación de clientes desde {archivo.name}',
+            detalles=(
+                f'Filas: {resumen["filas"]}, Creados: {resumen["creados"]}, Actualizados: {resumen["actualizados"]}, '
+                f'Omitidos: {resumen["omitidos"]}, Errores: {len(resumen["errores"])}'
+            ),
+            tipo_objeto='Cliente',
+            request=request
+        )
+    
+    return JsonResponse({'success': True, 'resumen': resumen})
+
+
 @login_required
 def sincronizar_cliente_web(request):
     """
@@ -10415,7 +10546,7 @@ def sincronizar_cliente_web(request):
     Crea un Cliente en gestion_clinica basado en los datos de PerfilCliente.
     """
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             return JsonResponse({'success': False, 'error': 'No tienes permisos para realizar esta acción.'}, status=403)
     except Perfil.DoesNotExist:
@@ -10492,7 +10623,7 @@ def editar_cliente(request, cliente_id):
     También permite editar las credenciales web si existen
     """
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'No tienes permisos para editar clientes.')
             return redirect('gestor_clientes')
@@ -10513,8 +10644,14 @@ def editar_cliente(request, cliente_id):
             # Actualizar RUT
             rut = request.POST.get('rut', '').strip()
             if rut:
-                # Validar que el RUT no exista en otro cliente
-                if Cliente.objects.filter(rut=rut).exclude(id=cliente_id).exists():
+                # Validar el dígito verificador y que el RUT no exista en otro cliente activo
+                rut_normalizado = normalizar_rut(rut)
+                if not rut_normalizado and rut != cliente.rut:
+                    messages.error(request, 'El RUT no es válido. Revise el número y el dígito verificador.')
+                    return redirect('gestor_clientes')
+                if rut_normalizado and Cliente.objects.filter(
+                    activo=True, rut_normalizado=rut_normalizado
+                ).exclude(id=cliente_id).exists():
                     messages.error(request, 'Ya existe otro cliente con ese RUT.')
                     return redirect('gestor_clientes')
                 cliente.rut = rut
@@ -10783,7 +10920,7 @@ def toggle_estado_cliente(request, cliente_id):
     ÚTIL PARA BANEAR USUARIOS PROBLEMÁTICOS
     """
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             return JsonResponse({
                 'success': False,
@@ -10801,7 +10938,14 @@ def toggle_estado_cliente(request, cliente_id):
         cliente = Cliente.objects.get(id=cliente_id)
         nuevo_estado = not cliente.activo
         cliente.activo = nuevo_estado
-        cliente.save()
+        try:
+            cliente.save()
+        except RutDuplicado as e:
+            # Mientras estaba desactivado su RUT se registró en otro cliente
+            return JsonResponse({
+                'success': False,
+                'error': f'{e.message} No se puede activar este cliente; fusiónalo con el otro o corrige su RUT.'
+            }, status=400)
         
         # Buscar si existe un usuario web asociado (por email)
         try:
@@ -10836,7 +10980,7 @@ def eliminar_cliente(request, cliente_id):
     ESTA ACCIÓN ES PERMANENTE
     """
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             return JsonResponse({
                 'success': False,
@@ -11075,7 +11219,7 @@ def eliminar_cliente(request, cliente_id):
 def mis_pacientes(request, paciente_id=None, seccion=None):
     """Vista principal unificada para gestionar pacientes del dentista"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_dentista():
             messages.error(request, 'Solo los dentistas pueden acceder a esta sección.')
             return redirect('panel_trabajador')
@@ -11085,89 +11229,49 @@ def mis_pacientes(request, paciente_id=None, seccion=None):
 
     # Obtener pacientes vinculados al dentista
     pacientes_vinculados = perfil.get_pacientes_asignados()
-    clientes_ids = [p['id'] for p in pacientes_vinculados if 'id' in p and isinstance(p['id'], int)]
-    emails_vinculados = [p['email'] for p in pacientes_vinculados if 'email' in p]
     
     # Filtros de búsqueda
     search = request.GET.get('search', '')
     
     # Construir lista de pacientes con información consolidada
     pacientes_lista = []
-    
-    # Obtener clientes del sistema vinculados
-    clientes_sistema = Cliente.objects.filter(
-        id__in=clientes_ids,
-        activo=True
-    ).distinct()
-    
-    for cliente in clientes_sistema:
-        # Contar radiografías y odontogramas
-        radiografias_count = Radiografia.objects.filter(
-            Q(dentista=perfil) & (Q(cliente=cliente) | Q(paciente_email=cliente.email))
-        ).count()
-        
-        odontogramas_count = Odontograma.objects.filter(
-            Q(dentista=perfil) & (Q(cliente=cliente) | Q(paciente_email=cliente.email))
-        ).count()
-        
-        # Aplicar filtro de búsqueda
-        if search:
-            if not (search.lower() in cliente.nombre_completo.lower() or
-                    search.lower() in cliente.email.lower() or
-                    search.lower() in (cliente.telefono or '').lower()):
-                continue
-        
-        pacientes_lista.append({
-            'id': cliente.id,
-            'nombre_completo': cliente.nombre_completo,
-            'email': cliente.email,
-            'telefono': cliente.telefono or '',
-            'total_radiografias': radiografias_count,
-            'total_odontogramas': odontogramas_count,
-            'tiene_radiografias': radiografias_count > 0,
-            'tiene_odontogramas': odontogramas_count > 0,
-        })
-    
-    # Agregar pacientes vinculados que no están en el sistema pero tienen documentos
-    emails_procesados = [p['email'] for p in pacientes_lista]
-    
+    pacientes_por_cliente = {}
+    pacientes_por_email = {}
     for paciente_vinculado in pacientes_vinculados:
-        email_paciente = paciente_vinculado.get('email', '')
-        if not email_paciente or email_paciente in emails_procesados:
-            continue
-        
-        # Verificar si tiene radiografías u odontogramas
-        radiografias_count = Radiografia.objects.filter(
-            dentista=perfil,
-            paciente_email=email_paciente
-        ).count()
-        
-        odontogramas_count = Odontograma.objects.filter(
-            dentista=perfil,
-            paciente_email=email_paciente
-        ).count()
-        
-        # Solo agregar si tiene documentos o si no hay filtro de búsqueda
-        if radiografias_count == 0 and odontogramas_count == 0:
-            if search:
-                continue
-        
-        # Aplicar filtro de búsqueda
-        if search:
-            nombre = paciente_vinculado.get('nombre_completo', '')
-            if not (search.lower() in nombre.lower() or search.lower() in email_paciente.lower()):
-                continue
-        
-        pacientes_lista.append({
-            'id': paciente_vinculado.get('id'),
-            'nombre_completo': paciente_vinculado.get('nombre_completo', email_paciente),
-            'email': email_paciente,
-            'telefono': paciente_vinculado.get('telefono', ''),
-            'total_radiografias': radiografias_count,
-            'total_odontogramas': odontogramas_count,
-            'tiene_radiografias': radiografias_count > 0,
-            'tiene_odontogramas': odontogramas_count > 0,
-        })
+        paciente = {
+            'id': paciente_vinculado['id'],
+            'nombre_completo': paciente_vinculado['nombre_completo'],
+            'email': paciente_vinculado['email'],
+            'telefono': paciente_vinculado['telefono'],
+            'total_radiografias': 0,
+            'total_odontogramas': 0,
+        }
+        pacientes_lista.append(paciente)
+        if paciente_vinculado['cliente_id']:
+            pacientes_por_cliente[paciente_vinculado['cliente_id']] = paciente
+        if paciente['email']:
+            pacientes_por_email[paciente['email'].lower()] = paciente
+    
+    # Contar radiografías y odontogramas del dentista por paciente (una consulta por tipo,
+    # por cliente o por email igual que en el resto de las vistas)
+    for campo, modelo in (('total_radiografias', Radiografia), ('total_odontogramas', Odontograma)):
+        for cliente_id, email in modelo.objects.filter(dentista=perfil).values_list('cliente_id', 'paciente_email'):
+            paciente = pacientes_por_cliente.get(cliente_id) or pacientes_por_email.get((email or '').lower())
+            if paciente:
+                paciente[campo] += 1
+    
+    for paciente in pacientes_lista:
+        paciente['tiene_radiografias'] = paciente['total_radiografias'] > 0
+        paciente['tiene_odontogramas'] = paciente['total_odontogramas'] > 0
+    
+    # Aplicar filtro de búsqueda
+    if search:
+        pacientes_lista = [
+            p for p in pacientes_lista
+            if (search.lower() in p['nombre_completo'].lower() or
+                search.lower() in p['email'].lower() or
+                search.lower() in (p['telefono'] or '').lower())
+        ]
     
     # Ordenar por nombre
     pacientes_lista.sort(key=lambda x: x['nombre_completo'])
@@ -11266,7 +11370,7 @@ def mis_pacientes(request, paciente_id=None, seccion=None):
 def radiografias_listar(request):
     """Vista principal para listar pacientes vinculados con sus radiografías"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_dentista():
             messages.error(request, 'Solo los dentistas pueden gestionar radiografías.')
             return redirect('panel_trabajador')
@@ -11279,7 +11383,7 @@ def radiografias_listar(request):
     
     # Obtener pacientes vinculados al dentista
     pacientes_vinculados = perfil.get_pacientes_asignados()
-    clientes_ids = [p['id'] for p in pacientes_vinculados if 'id' in p and isinstance(p['id'], int)]
+    clientes_ids = {p['cliente_id'] for p in pacientes_vinculados if p['cliente_id']}
     emails_vinculados = [p['email'] for p in pacientes_vinculados if 'email' in p]
     
     # Obtener solo radiografías de pacientes vinculados
@@ -11289,98 +11393,33 @@ def radiografias_listar(request):
         Q(cliente_id__in=clientes_ids) | Q(paciente_email__in=emails_vinculados)
     ).select_related('cliente')
 
-    # Obtener todos los emails únicos de pacientes vinculados que tienen radiografías
-    emails_unicos = radiografias.values_list('paciente_email', flat=True).distinct()
-    
-    # Obtener clientes vinculados que tienen radiografías asociadas
-    clientes_con_radiografias = Cliente.objects.filter(
-        id__in=clientes_ids,
-        radiografias__dentista=perfil,
-        activo=True
-    ).distinct()
-    
-    # Crear diccionario de pacientes con radiografías
+    # Agrupar las radiografías por paciente vinculado en una sola pasada (la más reciente primero)
+    pacientes_por_cliente = {p['cliente_id']: p for p in pacientes_vinculados if p['cliente_id']}
+    pacientes_por_email = {p['email'].lower(): p for p in pacientes_vinculados if p.get('email')}
     pacientes_dict = {}
-    
-    # Primero procesar clientes vinculados del sistema que tienen radiografías
-    for cliente in clientes_con_radiografias:
-        # Obtener todas las radiografías de este cliente (por relación cliente o por email)
-        radiografias_cliente = radiografias.filter(
-            Q(cliente=cliente) | Q(paciente_email=cliente.email)
-        )
-        
-        if not radiografias_cliente.exists():
+    for radiografia in radiografias.order_by('-fecha_carga'):
+        paciente = pacientes_por_cliente.get(radiografia.cliente_id) or pacientes_por_email.get((radiografia.paciente_email or '').lower())
+        if paciente is None:
             continue
-        
-        # Usar la información actualizada del cliente
-        nombre_completo = cliente.nombre_completo
-        telefono = cliente.telefono or ''
-        email_actual = cliente.email
-        paciente_id = cliente.id
-        
-        # Aplicar filtro de búsqueda
-        if search:
-            if not (search.lower() in nombre_completo.lower() or
-                    search.lower() in email_actual.lower() or
-                    search.lower() in (telefono or '').lower()):
-                continue
-        
-        # Usar el email actual del cliente como clave
-        pacientes_dict[email_actual] = {
-            'id': paciente_id,
-            'nombre_completo': nombre_completo,
-            'email': email_actual,
-            'telefono': telefono,
-            'total_radiografias': radiografias_cliente.count(),
-            'ultima_radiografia': radiografias_cliente.order_by('-fecha_carga').first(),
-        }
+        datos = pacientes_dict.get(paciente['email'])
+        if datos is None:
+            datos = pacientes_dict[paciente['email']] = {
+                'id': paciente['id'],
+                'nombre_completo': paciente['nombre_completo'],
+                'email': paciente['email'],
+                'telefono': paciente['telefono'],
+                'total_radiografias': 0,
+                'ultima_radiografia': radiografia,
+            }
+        datos['total_radiografias'] += 1
     
-    # Luego procesar emails vinculados que no tienen cliente asociado en el sistema
-    for email in emails_unicos:
-        # Solo procesar si el email está en la lista de pacientes vinculados
-        if email not in emails_vinculados:
-            continue
-            
-        # Si ya procesamos este email (tiene cliente), saltar
-        if email in pacientes_dict:
-            continue
-        
-        # Buscar si existe un cliente vinculado en el sistema con este email
-        try:
-            cliente = Cliente.objects.get(email=email, id__in=clientes_ids, activo=True)
-            nombre_completo = cliente.nombre_completo
-            telefono = cliente.telefono or ''
-            paciente_id = cliente.id
-            email_actual = cliente.email
-        except Cliente.DoesNotExist:
-            # Si no existe cliente, obtener información de las radiografías
-            primera_radiografia = radiografias.filter(paciente_email=email).first()
-            if primera_radiografia:
-                nombre_completo = primera_radiografia.paciente_nombre
-                telefono = ''
-                # Buscar en pacientes vinculados para obtener el ID correcto
-                paciente_vinculado = next((p for p in pacientes_vinculados if p.get('email') == email), None)
-                paciente_id = paciente_vinculado['id'] if paciente_vinculado and 'id' in paciente_vinculado else hash(email) % 1000000
-                email_actual = email
-            else:
-                continue
-        
-        # Aplicar filtro de búsqueda
-        if search:
-            if not (search.lower() in nombre_completo.lower() or
-                    search.lower() in email_actual.lower()):
-                continue
-        
-        # Contar radiografías de este paciente
-        radiografias_paciente = radiografias.filter(paciente_email=email)
-        
-        pacientes_dict[email_actual] = {
-            'id': paciente_id,
-            'nombre_completo': nombre_completo,
-            'email': email_actual,
-            'telefono': telefono,
-            'total_radiografias': radiografias_paciente.count(),
-            'ultima_radiografia': radiografias_paciente.order_by('-fecha_carga').first(),
+    # Aplicar filtro de búsqueda
+    if search:
+        pacientes_dict = {
+            email: p for email, p in pacientes_dict.items()
+            if (search.lower() in p['nombre_completo'].lower() or
+                search.lower() in p['email'].lower() or
+                search.lower() in (p['telefono'] or '').lower())
         }
     
     # Convertir a lista y ordenar por nombre
@@ -11388,10 +11427,11 @@ def radiografias_listar(request):
     pacientes_con_radiografias.sort(key=lambda x: x['nombre_completo'])
     
     # Obtener pacientes vinculados que aún no tienen radiografías (para mostrar opción de agregar)
+    emails_con_radiografias = {p['email'] for p in pacientes_con_radiografias}
     pacientes_sin_radiografias = []
     for paciente_vinculado in pacientes_vinculados:
         email_paciente = paciente_vinculado.get('email', '')
-        if email_paciente and email_paciente not in [p['email'] for p in pacientes_con_radiografias]:
+        if email_paciente and email_paciente not in emails_con_radiografias:
             pacientes_sin_radiografias.append({
                 'id': paciente_vinculado.get('id'),
                 'nombre_completo': paciente_vinculado.get('nombre_completo', ''),
@@ -11439,7 +11479,7 @@ def radiografias_listar(request):
 def radiografias_paciente(request, paciente_id):
     """Vista para ver y gestionar radiografías de un paciente vinculado específico"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_dentista():
             messages.error(request, 'Solo los dentistas pueden gestionar radiografías.')
             return redirect('panel_trabajador')
@@ -11528,7 +11568,7 @@ def radiografias_paciente(request, paciente_id):
 def agregar_radiografia(request, paciente_id):
     """Vista para agregar una nueva radiografía - Solo pacientes vinculados"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_dentista():
             messages.error(request, 'Solo los dentistas pueden agregar radiografías.')
             return redirect('panel_trabajador')
@@ -11624,6 +11664,7 @@ def agregar_radiografia(request, paciente_id):
                 imagen=imagen,
                 fecha_tomada=fecha_tomada if fecha_tomada else None
             )
+            encolar_derivadas(radiografia)
             
             messages.success(request, 'Radiografía agregada correctamente.')
             # Redirigir a la nueva vista de Mis Pacientes con sección de radiografías
@@ -11646,7 +11687,7 @@ def agregar_radiografia(request, paciente_id):
 def editar_radiografia(request, radiografia_id):
     """Vista para editar una radiografía existente"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_dentista():
             messages.error(request, 'Solo los dentistas pueden editar radiografías.')
             return redirect('panel_trabajador')
@@ -11708,11 +11749,13 @@ def editar_radiografia(request, radiografia_id):
             if imagen:
                 radiografia.imagen = imagen
                 # Si hay nueva imagen, eliminar anotaciones anteriores
-                if radiografia.imagen_anotada:
-                    radiografia.imagen_anotada.delete()
-                    radiografia.imagen_anotada = None
+                limpiar_anotaciones(radiografia)
+                # Las derivadas de la imagen anterior ya no sirven
+                eliminar_derivadas(radiografia)
             
             radiografia.save()
+            if imagen:
+                encolar_derivadas(radiografia)
             
             messages.success(request, 'Radiografía actualizada correctamente.')
             # Redirigir a la nueva vista de Mis Pacientes con sección de radiografías
@@ -11734,9 +11777,13 @@ def editar_radiografia(request, radiografia_id):
 
 @login_required
 def guardar_anotaciones_radiografia(request, radiografia_id):
-    """Vista AJAX para guardar anotaciones de una radiografía"""
+    """
+    Vista AJAX para guardar anotaciones de una radiografía.
+    Recibe JSON con los cambios desde la última versión guardada:
+    {"version": 3, "cambios": [elementos], "eliminados": [ids], "limpiar": false}
+    """
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_dentista():
             return JsonResponse({'success': False, 'error': 'No tienes permisos para guardar anotaciones.'}, status=403)
     except Perfil.DoesNotExist:
@@ -11745,46 +11792,46 @@ def guardar_anotaciones_radiografia(request, radiografia_id):
     if request.method != 'POST':
         return JsonResponse({'success': False, 'error': 'Método no permitido.'}, status=405)
     
-    try:
-        radiografia = Radiografia.objects.get(id=radiografia_id, dentista=perfil)
-    except Radiografia.DoesNotExist:
+    if not Radiografia.objects.filter(id=radiografia_id, dentista=perfil).exists():
         return JsonResponse({'success': False, 'error': 'Radiografía no encontrada.'}, status=404)
     
     try:
-        from django.core.files.base import ContentFile
-        import base64
-        
-        # Obtener imagen base64 del canvas
-        imagen_data = request.POST.get('imagen_data', '')
-        if not imagen_data:
-            return JsonResponse({'success': False, 'error': 'No se proporcionó imagen.'}, status=400)
-        
-        # Decodificar imagen base64
-        if ',' in imagen_data:
-            imagen_data = imagen_data.split(',')[1]
-        
-        image_data = base64.b64decode(imagen_data)
-        image_file = ContentFile(image_data, name=f'radiografia_{radiografia_id}_anotada.png')
-        
-        # Eliminar imagen anterior si existe
-        if radiografia.imagen_anotada:
-            radiografia.imagen_anotada.delete()
-        
-        # Guardar nueva imagen con anotaciones
-        radiografia.imagen_anotada = image_file
-        radiografia.save()
-        
-        return JsonResponse({'success': True, 'message': 'Anotaciones guardadas correctamente.'})
-        
+        datos = json.loads(request.body or '{}')
+        cambios = datos.get('cambios') or []
+        eliminados = datos.get('eliminados') or []
+        if not isinstance(cambios, list) or not isinstance(eliminados, list):
+            raise ValueError('Formato de cambios inválido.')
+        version = aplicar_cambios_anotaciones(
+            radiografia_id,
+            datos.get('version'),
+            cambios=cambios,
+            eliminados=eliminados,
+            limpiar=bool(datos.get('limpiar')),
+        )
+        return JsonResponse({'success': True, 'version': version, 'message': 'Anotaciones guardadas correctamente.'})
+    
+    except ConflictoAnotaciones as e:
+        return JsonResponse({
+            'success': False,
+            'error': str(e),
+            'conflicto': True,
+            'version': e.version,
+            'elementos': e.elementos,
+        }, status=409)
+    except (ValueError, TypeError) as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
     except Exception as e:
         return JsonResponse({'success': False, 'error': f'Error al guardar anotaciones: {str(e)}'}, status=500)
 
 
 @login_required
 def obtener_anotaciones_radiografia(request, radiografia_id):
-    """Vista AJAX para obtener la imagen con anotaciones de una radiografía"""
+    """
+    Vista AJAX para obtener la capa de anotaciones de una radiografía.
+    Con ?imagen=1 devuelve además la URL de la imagen aplanada (se genera si hace falta).
+    """
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_dentista():
             return JsonResponse({'success': False, 'error': 'No tienes permisos.'}, status=403)
     except Perfil.DoesNotExist:
@@ -11793,16 +11840,17 @@ def obtener_anotaciones_radiografia(request, radiografia_id):
     try:
         radiografia = Radiografia.objects.get(id=radiografia_id, dentista=perfil)
         
-        if radiografia.imagen_anotada:
-            return JsonResponse({
-                'success': True,
-                'imagen_anotada': radiografia.imagen_anotada.url
-            })
-        else:
-            return JsonResponse({
-                'success': False,
-                'message': 'No hay anotaciones guardadas'
-            })
+        respuesta = {'success': True, **serializar_anotaciones(radiografia)}
+        if request.GET.get('imagen'):
+            imagen_anotada = obtener_imagen_anotada(radiografia)
+            respuesta['imagen_anotada'] = imagen_anotada.url if imagen_anotada else None
+        elif radiografia.imagen_anotada and radiografia.imagen_anotada_version == 0:
+            # Imagen anotada de antes de la capa vectorial: el visualizador la usa de fondo
+            respuesta['imagen_anotada'] = radiografia.imagen_anotada.url
+        fondo = (radiografia.anotaciones or {}).get('fondo')
+        if fondo:
+            respuesta['fondo'] = radiografia.imagen.storage.url(fondo)
+        return JsonResponse(respuesta)
             
     except Radiografia.DoesNotExist:
         return JsonResponse({'success': False, 'error': 'Radiografía no encontrada.'}, status=404)
@@ -11816,7 +11864,7 @@ def obtener_cita(request, cita_id):
     Vista AJAX para obtener los datos de una cita
     """
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.activo:
             return JsonResponse({'success': False, 'error': 'Cuenta desactivada'}, status=403)
     except Perfil.DoesNotExist:
@@ -11902,7 +11950,7 @@ def obtener_cita(request, cita_id):
 def eliminar_radiografia(request, radiografia_id):
     """Vista para eliminar una radiografía"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_dentista():
             messages.error(request, 'Solo los dentistas pueden eliminar radiografías.')
             return redirect('panel_trabajador')
@@ -11922,6 +11970,7 @@ def eliminar_radiografia(request, radiografia_id):
                 paciente_id = p['id']
                 break
         
+        eliminar_derivadas(radiografia)
         radiografia.delete()
         messages.success(request, 'Radiografía eliminada correctamente.')
         
@@ -11942,7 +11991,7 @@ def eliminar_radiografia(request, radiografia_id):
 def perfil_cliente(request, cliente_id):
     """Vista de perfil completo del cliente para administrativos con todos sus historiales"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'Solo los administrativos pueden ver perfiles de clientes.')
             return redirect('panel_trabajador')
@@ -11959,44 +12008,49 @@ def perfil_cliente(request, cliente_id):
     # Obtener historiales del cliente
     # Para odontogramas y radiografías, buscar tanto por cliente directo como por email
     # para incluir registros que no tienen cliente asociado pero tienen el mismo email
+    # Se evalúan una sola vez (con sus dentistas) y los totales salen de las listas;
+    # el historial completo y paginado está en la pestaña Línea de Tiempo
     from django.db.models import Q
-    odontogramas = Odontograma.objects.filter(
+    odontogramas = list(Odontograma.objects.filter(
         Q(cliente=cliente) | Q(paciente_email=cliente.email)
-    ).order_by('-fecha_creacion')
+    ).select_related('dentista').order_by('-fecha_creacion'))
     
-    radiografias = Radiografia.objects.filter(
+    radiografias = list(Radiografia.objects.filter(
         Q(cliente=cliente) | Q(paciente_email=cliente.email)
-    ).order_by('-fecha_carga')
+    ).select_related('dentista').order_by('-fecha_carga'))
     
     citas = Cita.objects.filter(cliente=cliente).order_by('-fecha_hora')
+    citas_recientes = list(citas.select_related('tipo_servicio', 'dentista')[:10])  # Últimas 10 citas
     
     # Obtener planes de tratamiento del cliente
-    planes_tratamiento = PlanTratamiento.objects.filter(cliente=cliente).order_by('-creado_el')
+    planes_tratamiento = list(PlanTratamiento.objects.filter(cliente=cliente).con_resumen().select_related('dentista').order_by('-creado_el'))
     
     # Agregar información de permisos de edición a cada plan
     for plan in planes_tratamiento:
         plan.puede_editar = plan.puede_ser_editado_por(perfil)
     
-    # Estadísticas
-    estadisticas = {
-        'total_citas': citas.count(),
-        'citas_completadas': citas.filter(estado='completada').count(),
-        'citas_no_asistidas': citas.filter(estado='no_show').count(),
-        'citas_pendientes': citas.filter(estado__in=['reservada', 'confirmada', 'en_espera', 'listo_para_atender', 'en_progreso', 'finalizada']).count(),
-        'total_odontogramas': odontogramas.count(),
-        'total_radiografias': radiografias.count(),
-        'total_planes_tratamiento': planes_tratamiento.count(),
-        'ultima_cita': citas.first(),
-        'ultimo_odontograma': odontogramas.first(),
-        'ultima_radiografia': radiografias.first(),
-    }
+    # Estadísticas (todos los conteos de citas en una consulta)
+    estadisticas = citas.aggregate(
+        total_citas=Count('id'),
+        citas_completadas=Count('id', filter=Q(estado='completada')),
+        citas_no_asistidas=Count('id', filter=Q(estado='no_show')),
+        citas_pendientes=Count('id', filter=Q(estado__in=['reservada', 'confirmada', 'en_espera', 'listo_para_atender', 'en_progreso', 'finalizada'])),
+    )
+    estadisticas.update({
+        'total_odontogramas': len(odontogramas),
+        'total_radiografias': len(radiografias),
+        'total_planes_tratamiento': len(planes_tratamiento),
+        'ultima_cita': citas_recientes[0] if citas_recientes else None,
+        'ultimo_odontograma': odontogramas[0] if odontogramas else None,
+        'ultima_radiografia': radiografias[0] if radiografias else None,
+    })
     
     context = {
         'perfil': perfil,
         'cliente': cliente,
         'odontogramas': odontogramas,
         'radiografias': radiografias,
-        'citas': citas[:10],  # Últimas 10 citas
+        'citas': citas_recientes,
         'planes_tratamiento': planes_tratamiento,
         'estadisticas': estadisticas,
         'es_admin': True
@@ -12005,11 +12059,52 @@ def perfil_cliente(request, cliente_id):
     return render(request, 'citas/clientes/perfil_cliente.html', context)
 
 
+@login_required
+def linea_tiempo_cliente(request, cliente_id):
+    """
+    Vista AJAX con la línea de tiempo clínica del cliente (ver citas/linea_tiempo.py).
+    
+    Parámetros GET:
+    - cursor: 'siguiente_cursor' de la página anterior (vacío para la primera)
+    - por_pagina: eventos por página (máximo 100)
+    - tipos: tipos de evento separados por coma (cita, odontograma, radiografia, plan, pago, consentimiento, documento)
+    """
+    try:
+        perfil = obtener_perfil(request)
+        if not (perfil.es_administrativo() or perfil.es_dentista()):
+            return JsonResponse({'success': False, 'error': 'No tienes permisos para ver el historial del cliente.'}, status=403)
+    except Perfil.DoesNotExist:
+        return JsonResponse({'success': False, 'error': 'No tienes permisos'}, status=403)
+    
+    try:
+        cliente = Cliente.objects.get(id=cliente_id)
+    except Cliente.DoesNotExist:
+        return JsonResponse({'success': False, 'error': 'Cliente no encontrado'}, status=404)
+    
+    tipos = [tipo for tipo in request.GET.get('tipos', '').split(',') if tipo in LINEA_TIEMPO_TIPOS]
+    por_pagina = request.GET.get('por_pagina', '')
+    try:
+        pagina = obtener_linea_tiempo(
+            cliente,
+            cursor=request.GET.get('cursor') or None,
+            por_pagina=int(por_pagina) if por_pagina.isdigit() else LINEA_TIEMPO_POR_PAGINA,
+            tipos=tipos,
+        )
+    except CursorInvalido:
+        return JsonResponse({'success': False, 'error': 'Cursor no válido'}, status=400)
+    
+    return JsonResponse({
+        'success': True,
+        'eventos': [serializar_evento(evento, con_url=True) for evento in pagina['eventos']],
+        'siguiente_cursor': pagina['siguiente_cursor'],
+    })
+
+
 @login_required
 def enviar_radiografia_por_correo(request, radiografia_id):
     """Vista para enviar una radiografía al correo del cliente"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'Solo los administrativos pueden enviar radiografías por correo.')
             return redirect('panel_trabajador')
@@ -12042,7 +12137,7 @@ def enviar_radiografia_por_correo(request, radiografia_id):
         # Obtener información de la clínica
         try:
             from configuracion.models import InformacionClinica
-            info_clinica = InformacionClinica.obtener()
+            info_clinica = InformacionClinica.obtener_cacheada()
             nombre_clinica = info_clinica.nombre_clinica
             email_clinica = info_clinica.email or settings.DEFAULT_FROM_EMAIL
             direccion_clinica = info_clinica.direccion or ''
@@ -12083,6 +12178,12 @@ def enviar_radiografia_por_correo(request, radiografia_id):
         try:
             if radiografia.imagen:
                 email.attach_file(radiografia.imagen.path)
+            # Y la versión anotada, que se aplana solo ahora si cambió desde el último envío
+            imagen_anotada = obtener_imagen_anotada(radiografia)
+            if imagen_anotada:
+                import os
+                with imagen_anotada.open('rb') as archivo:
+                    email.attach(os.path.basename(imagen_anotada.name), archivo.read(), 'image/png')
         except Exception as e:
             messages.warning(request, f'Error al adjuntar la imagen: {str(e)}')
         
@@ -12111,7 +12212,7 @@ def enviar_radiografia_por_correo(request, radiografia_id):
 def gestor_servicios(request):
     """Vista para gestionar tipos de servicios dentales"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'Solo los administrativos pueden gestionar servicios.')
             return redirect('panel_trabajador')
@@ -12175,7 +12276,7 @@ def gestor_servicios(request):
 def crear_servicio(request):
     """Vista para crear un nuevo servicio"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'Solo los administrativos pueden crear servicios.')
             return redirect('gestor_servicios')
@@ -12336,7 +12437,7 @@ def crear_servicio(request):
 def editar_servicio(request, servicio_id):
     """Vista para editar un servicio existente"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'Solo los administrativos pueden editar servicios.')
             return redirect('gestor_servicios')
@@ -12447,7 +12548,7 @@ def editar_servicio(request, servicio_id):
 def eliminar_servicio(request, servicio_id):
     """Vista para eliminar un servicio"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'Solo los administrativos pueden eliminar servicios.')
             return redirect('gestor_servicios')
@@ -12510,7 +12611,7 @@ def eliminar_servicio(request, servicio_id):
 def gestor_horarios(request):
     """Vista para que el administrador gestione horarios de dentistas"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'Solo los administrativos pueden gestionar horarios.')
             return redirect('panel_trabajador')
@@ -12539,7 +12640,7 @@ def gestor_horarios(request):
 def gestionar_horario_dentista(request, dentista_id):
     """Vista para que el administrador gestione el horario de un dentista específico"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'Solo los administrativos pueden gestionar horarios.')
             return redirect('panel_trabajador')
@@ -12568,7 +12669,7 @@ def gestionar_horario_dentista(request, dentista_id):
 def agregar_horario_ajax(request, dentista_id):
     """Vista AJAX para agregar un nuevo horario con validaciones"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             return JsonResponse({'success': False, 'error': 'No tienes permisos para realizar esta acción'}, status=403)
     except Perfil.DoesNotExist:
@@ -12654,7 +12755,7 @@ def agregar_horario_ajax(request, dentista_id):
 def editar_horario_ajax(request, horario_id):
     """Vista AJAX para editar un horario existente"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             return JsonResponse({'success': False, 'error': 'No tienes permisos para realizar esta acción'}, status=403)
     except Perfil.DoesNotExist:
@@ -12737,7 +12838,7 @@ def editar_horario_ajax(request, horario_id):
 def eliminar_horarios_ajax(request, dentista_id):
     """Vista AJAX para eliminar horarios"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             return JsonResponse({'success': False, 'error': 'No tienes permisos para realizar esta acción'}, status=403)
     except Perfil.DoesNotExist:
@@ -12774,7 +12875,7 @@ def eliminar_horarios_ajax(request, dentista_id):
 def ver_mi_horario(request):
     """Vista para que el dentista vea su horario (solo lectura)"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_dentista():
             messages.error(request, 'Solo los dentistas pueden ver su horario.')
             return redirect('panel_trabajador')
@@ -12804,7 +12905,7 @@ def ver_mi_horario(request):
 def listar_planes_tratamiento(request):
     """Lista todos los planes de tratamiento según el rol del usuario"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.activo:
             messages.error(request, 'Tu cuenta está desactivada.')
             return redirect('login')
@@ -12823,15 +12924,13 @@ def listar_planes_tratamiento(request):
             planes = planes.filter(dentista_id=dentista_filtro)
         
         # Estadísticas globales
-        from django.db.models import Sum
-        estadisticas = {
-            'total_planes': PlanTratamiento.objects.count(),
-            'planes_activos': PlanTratamiento.objects.filter(estado='en_progreso').count(),
-            'planes_completados': PlanTratamiento.objects.filter(estado='completado').count(),
-            'ingresos_estimados': PlanTratamiento.objects.filter(
-                estado__in=['aprobado', 'en_progreso']
-            ).aggregate(Sum('precio_final'))['precio_final__sum'] or 0,
-        }
+        estadisticas = PlanTratamiento.objects.aggregate(
+            total_planes=Count('id'),
+            planes_activos=Count('id', filter=Q(estado='en_progreso')),
+            planes_completados=Count('id', filter=Q(estado='completado')),
+            ingresos_estimados=Sum('precio_final', filter=Q(estado__in=['aprobado', 'en_progreso'])),
+        )
+        estadisticas['ingresos_estimados'] = estadisticas['ingresos_estimados'] or 0
         
         # Obtener dentistas para el filtro
         dentistas = Perfil.objects.filter(rol='dentista', activo=True).order_by('nombre_completo')
@@ -12839,8 +12938,7 @@ def listar_planes_tratamiento(request):
     elif perfil.es_dentista():
         # DENTISTA: Solo ve planes de SUS clientes vinculados
         # Obtener clientes vinculados al dentista
-        pacientes_dentista = perfil.get_pacientes_asignados()
-        clientes_ids = [p['id'] for p in pacientes_dentista if 'id' in p and isinstance(p['id'], int)]
+        clientes_ids = perfil.get_clientes_asignados_ids()
         
         # Filtrar planes por dentista Y por clientes vinculados
         planes = PlanTratamiento.objects.filter(
@@ -12868,9 +12966,7 @@ def listar_planes_tratamiento(request):
     if search:
         planes = planes.filter(
             Q(nombre__icontains=search) |
-            Q(cliente__nombre_completo__icontains=search) |
-            Q(cliente__email__icontains=search) |
-            Q(cliente__rut__icontains=search)
+            filtro_busqueda(search, prefijo='cliente__')
         )
     
     if estado_filtro:
@@ -12883,14 +12979,18 @@ def listar_planes_tratamiento(request):
         'creado_el': 'creado_el',
         '-precio_final': '-precio_final',
         'precio_final': 'precio_final',
-        '-progreso_porcentaje': '-progreso_porcentaje',
-        'progreso_porcentaje': 'progreso_porcentaje',
+        '-progreso_porcentaje': '-resumen_progreso',
+        'progreso_porcentaje': 'resumen_progreso',
         'nombre': 'nombre',
         '-nombre': '-nombre',
     }
     orden_seleccionado = ordenamientos_validos.get(orden, '-creado_el')
     
-    planes = planes.select_related('cliente', 'dentista', 'odontograma_inicial').prefetch_related('citas', 'consentimientos').order_by(orden_seleccionado)
+    # Progreso, citas y pagos anotados en la misma consulta (ver PlanTratamientoQuerySet.con_resumen)
+    planes = planes.con_resumen().select_related('cliente', 'dentista', 'odontograma_inicial').prefetch_related(
+        Prefetch('citas', queryset=Cita.objects.order_by('fecha_hora'), to_attr='citas_ordenadas'),
+        Prefetch('consentimientos', queryset=ConsentimientoInformado.objects.exclude(estado='firmado'), to_attr='consentimientos_pendientes'),
+    ).order_by(orden_seleccionado, '-id')
     
     # Paginación
     paginator = Paginator(planes, 20)
@@ -12902,25 +13002,20 @@ def listar_planes_tratamiento(request):
     except EmptyPage:
         planes_paginados = paginator.page(paginator.num_pages)
     
-    # Calcular última y próxima cita para cada plan
+    # Calcular última y próxima cita para cada plan (sobre las citas ya precargadas)
     from django.utils import timezone
+    ahora = timezone.now()
     for plan in planes_paginados:
-        citas_ordenadas = plan.citas.all().order_by('fecha_hora')
-        if citas_ordenadas.exists():
-            # Última cita (la más reciente)
-            plan.ultima_cita_obj = citas_ordenadas.last()
-            # Próxima cita (la primera futura con estado reservada o confirmada)
-            proximas = citas_ordenadas.filter(
-                fecha_hora__gte=timezone.now(),
-                estado__in=['reservada', 'confirmada']
-            ).first()
-            plan.proxima_cita_obj = proximas
-        else:
-            plan.ultima_cita_obj = None
-            plan.proxima_cita_obj = None
+        # Última cita (la más reciente)
+        plan.ultima_cita_obj = plan.citas_ordenadas[-1] if plan.citas_ordenadas else None
+        # Próxima cita (la primera futura con estado reservada o confirmada)
+        plan.proxima_cita_obj = next(
+            (cita for cita in plan.citas_ordenadas if cita.fecha_hora >= ahora and cita.estado in ('reservada', 'confirmada')),
+            None
+        )
         
         # Verificar si hay consentimientos pendientes
-        plan.tiene_consentimientos_pendientes = plan.consentimientos.exclude(estado='firmado').exists()
+        plan.tiene_consentimientos_pendientes = bool(plan.consentimientos_pendientes)
     
     context = {
         'perfil': perfil,
@@ -12946,7 +13041,7 @@ def listar_planes_tratamiento(request):
 def crear_plan_tratamiento(request):
     """Crea un nuevo plan de tratamiento"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.activo:
             messages.error(request, 'Tu cuenta está desactivada.')
             return redirect('login')
@@ -12965,8 +13060,7 @@ def crear_plan_tratamiento(request):
         # VERIFICACIONES DIFERENTES
         if perfil.es_dentista():
             # DENTISTA: Restricciones estrictas
-            pacientes_dentista = perfil.get_pacientes_asignados()
-            clientes_ids = [p['id'] for p in pacientes_dentista if 'id' in p and isinstance(p['id'], int)]
+            clientes_ids = perfil.get_clientes_asignados_ids()
             
             # 1. Solo puede crear para SUS clientes
             if int(cliente_id) not in clientes_ids:
@@ -13140,7 +13234,7 @@ def crear_plan_tratamiento(request):
 def detalle_plan_tratamiento(request, plan_id):
     """Muestra el detalle de un plan de tratamiento"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.activo:
             messages.error(request, 'Tu cuenta está desactivada.')
             return redirect('login')
@@ -13154,8 +13248,7 @@ def detalle_plan_tratamiento(request, plan_id):
         plan = get_object_or_404(PlanTratamiento, id=plan_id)
     elif perfil.es_dentista():
         # DENTISTA: Solo puede ver planes de SUS clientes
-        pacientes_dentista = perfil.get_pacientes_asignados()
-        clientes_ids = [p['id'] for p in pacientes_dentista if 'id' in p and isinstance(p['id'], int)]
+        clientes_ids = perfil.get_clientes_asignados_ids()
         
         plan = get_object_or_404(
             PlanTratamiento,
@@ -13261,7 +13354,7 @@ def aceptar_presupuesto_tratamiento(request, plan_id):
         return JsonResponse({'success': False, 'error': 'Método no permitido'}, status=405)
     
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.activo:
             return JsonResponse({'success': False, 'error': 'Tu cuenta está desactivada.'}, status=403)
     except Perfil.DoesNotExist:
@@ -13293,7 +13386,7 @@ def aprobar_tratamiento(request, plan_id):
         return JsonResponse({'success': False, 'error': 'Método no permitido'}, status=405)
     
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.activo:
             return JsonResponse({'success': False, 'error': 'Tu cuenta está desactivada.'}, status=403)
     except Perfil.DoesNotExist:
@@ -13347,7 +13440,7 @@ def finalizar_tratamiento(request, plan_id):
         return JsonResponse({'success': False, 'error': 'Método no permitido'}, status=405)
     
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.activo:
             return JsonResponse({'success': False, 'error': 'Tu cuenta está desactivada.'}, status=403)
     except Perfil.DoesNotExist:
@@ -13395,7 +13488,7 @@ def finalizar_tratamiento(request, plan_id):
 def crear_cita_desde_plan(request, plan_id):
     """Crea una cita asociada a un plan de tratamiento"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.activo:
             return JsonResponse({'success': False, 'error': 'Tu cuenta está desactivada.'}, status=403)
     except Perfil.DoesNotExist:
@@ -13405,8 +13498,7 @@ def crear_cita_desde_plan(request, plan_id):
     if perfil.es_administrativo():
         plan = get_object_or_404(PlanTratamiento, id=plan_id)
     elif perfil.es_dentista():
-        pacientes_dentista = perfil.get_pacientes_asignados()
-        clientes_ids = [p['id'] for p in pacientes_dentista if 'id' in p and isinstance(p['id'], int)]
+        clientes_ids = perfil.get_clientes_asignados_ids()
         plan = get_object_or_404(
             PlanTratamiento,
             id=plan_id,
@@ -13674,7 +13766,7 @@ def editar_plan_tratamiento(request, plan_id):
 def eliminar_plan_tratamiento(request, plan_id):
     """Elimina definitivamente un plan (SOLO ADMINISTRADOR)"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'Solo los administrativos pueden eliminar planes definitivamente.')
             return redirect('listar_planes_tratamiento')
@@ -13718,7 +13810,7 @@ def eliminar_plan_tratamiento(request, plan_id):
 def agregar_fase_tratamiento(request, plan_id):
     """Agrega una nueva fase a un plan de tratamiento existente"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.activo:
             return JsonResponse({'success': False, 'error': 'Tu cuenta está desactivada.'}, status=403)
     except Perfil.DoesNotExist:
@@ -13728,8 +13820,7 @@ def agregar_fase_tratamiento(request, plan_id):
     if perfil.es_administrativo():
         plan = get_object_or_404(PlanTratamiento, id=plan_id)
     elif perfil.es_dentista():
-        pacientes_dentista = perfil.get_pacientes_asignados()
-        clientes_ids = [p['id'] for p in pacientes_dentista if 'id' in p and isinstance(p['id'], int)]
+        clientes_ids = perfil.get_clientes_asignados_ids()
         plan = get_object_or_404(
             PlanTratamiento,
             id=plan_id,
@@ -13817,7 +13908,7 @@ def agregar_fase_tratamiento(request, plan_id):
 def editar_fase_tratamiento(request, plan_id, fase_id):
     """Edita una fase de un plan de tratamiento"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.activo:
             return JsonResponse({'success': False, 'error': 'Tu cuenta está desactivada.'}, status=403)
     except Perfil.DoesNotExist:
@@ -13827,8 +13918,7 @@ def editar_fase_tratamiento(request, plan_id, fase_id):
     if perfil.es_administrativo():
         plan = get_object_or_404(PlanTratamiento, id=plan_id)
     elif perfil.es_dentista():
-        pacientes_dentista = perfil.get_pacientes_asignados()
-        clientes_ids = [p['id'] for p in pacientes_dentista if 'id' in p and isinstance(p['id'], int)]
+        clientes_ids = perfil.get_clientes_asignados_ids()
         plan = get_object_or_404(
             PlanTratamiento,
             id=plan_id,
@@ -13925,7 +14015,7 @@ def editar_fase_tratamiento(request, plan_id, fase_id):
 def eliminar_fase_tratamiento(request, plan_id, fase_id):
     """Elimina una fase de un plan de tratamiento"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.activo:
             return JsonResponse({'success': False, 'error': 'Tu cuenta está desactivada.'}, status=403)
     except Perfil.DoesNotExist:
@@ -13935,8 +14025,7 @@ def eliminar_fase_tratamiento(request, plan_id, fase_id):
     if perfil.es_administrativo():
         plan = get_object_or_404(PlanTratamiento, id=plan_id)
     elif perfil.es_dentista():
-        pacientes_dentista = perfil.get_pacientes_asignados()
-        clientes_ids = [p['id'] for p in pacientes_dentista if 'id' in p and isinstance(p['id'], int)]
+        clientes_ids = perfil.get_clientes_asignados_ids()
         plan = get_object_or_404(
             PlanTratamiento,
             id=plan_id,
@@ -13988,7 +14077,7 @@ def eliminar_fase_tratamiento(request, plan_id, fase_id):
 def crear_cita_desde_fase(request, plan_id, fase_id):
     """Crea una cita específica para una fase de tratamiento"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.activo:
             return JsonResponse({'success': False, 'error': 'Tu cuenta está desactivada.'}, status=403)
     except Perfil.DoesNotExist:
@@ -13998,8 +14087,7 @@ def crear_cita_desde_fase(request, plan_id, fase_id):
     if perfil.es_administrativo():
         plan = get_object_or_404(PlanTratamiento, id=plan_id)
     elif perfil.es_dentista():
-        pacientes_dentista = perfil.get_pacientes_asignados()
-        clientes_ids = [p['id'] for p in pacientes_dentista if 'id' in p and isinstance(p['id'], int)]
+        clientes_ids = perfil.get_clientes_asignados_ids()
         plan = get_object_or_404(
             PlanTratamiento,
             id=plan_id,
@@ -14188,7 +14276,7 @@ def cancelar_plan_tratamiento(request, plan_id):
     from django.http import JsonResponse
     
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
     except Perfil.DoesNotExist:
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
             return JsonResponse({'success': False, 'error': 'No tienes permisos.'}, status=403)
@@ -14257,7 +14345,7 @@ def cancelar_plan_tratamiento(request, plan_id):
 def crear_plan_desde_odontograma(request, odontograma_id):
     """Crea un plan de tratamiento basado en un odontograma"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.activo:
             messages.error(request, 'Tu cuenta está desactivada.')
             return redirect('login')
@@ -14283,7 +14371,7 @@ def crear_plan_desde_odontograma(request, odontograma_id):
 def registrar_pago_tratamiento(request, plan_id):
     """Registra un pago parcial para un plan de tratamiento"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.activo:
             return JsonResponse({'success': False, 'error': 'Tu cuenta está desactivada.'}, status=403)
     except Perfil.DoesNotExist:
@@ -14293,8 +14381,7 @@ def registrar_pago_tratamiento(request, plan_id):
     if perfil.es_administrativo():
         plan = get_object_or_404(PlanTratamiento, id=plan_id)
     elif perfil.es_dentista():
-        pacientes_dentista = perfil.get_pacientes_asignados()
-        clientes_ids = [p['id'] for p in pacientes_dentista if 'id' in p and isinstance(p['id'], int)]
+        clientes_ids = perfil.get_clientes_asignados_ids()
         plan = get_object_or_404(
             PlanTratamiento,
             id=plan_id,
@@ -14383,7 +14470,7 @@ def registrar_pago_tratamiento(request, plan_id):
 def eliminar_pago_tratamiento(request, plan_id, pago_id):
     """Elimina un pago registrado (solo administrativos)"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             return JsonResponse({'success': False, 'error': 'Solo los administrativos pueden eliminar pagos.'}, status=403)
     except Perfil.DoesNotExist:
@@ -14415,7 +14502,7 @@ def eliminar_pago_tratamiento(request, plan_id, pago_id):
 def enviar_documentos_tratamiento(request, plan_id):
     """Vista para enviar presupuesto y consentimientos de un tratamiento por correo"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not (perfil.es_administrativo() or perfil.es_dentista()):
             return JsonResponse({'success': False, 'error': 'No tienes permisos para enviar documentos.'}, status=403)
     except Perfil.DoesNotExist:
@@ -14443,7 +14530,7 @@ def enviar_documentos_tratamiento(request, plan_id):
         # Obtener información de la clínica
         try:
             from configuracion.models import InformacionClinica
-            info_clinica = InformacionClinica.obtener()
+            info_clinica = InformacionClinica.obtener_cacheada()
             nombre_clinica = info_clinica.nombre_clinica
             email_clinica = info_clinica.email or getattr(settings, 'EMAIL_FROM', 'noreply@clinica.com')
         except:
@@ -14668,7 +14755,7 @@ def enviar_documentos_tratamiento(request, plan_id):
 def crear_cita_desde_fase(request, plan_id, fase_id):
     """Crea una cita específica para una fase de tratamiento"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.activo:
             return JsonResponse({'success': False, 'error': 'Tu cuenta está desactivada.'}, status=403)
     except Perfil.DoesNotExist:
@@ -14678,8 +14765,7 @@ def crear_cita_desde_fase(request, plan_id, fase_id):
     if perfil.es_administrativo():
         plan = get_object_or_404(PlanTratamiento, id=plan_id)
     elif perfil.es_dentista():
-        pacientes_dentista = perfil.get_pacientes_asignados()
-        clientes_ids = [p['id'] for p in pacientes_dentista if 'id' in p and isinstance(p['id'], int)]
+        clientes_ids = perfil.get_clientes_asignados_ids()
         plan = get_object_or_404(
             PlanTratamiento,
             id=plan_id,
@@ -14868,7 +14954,7 @@ def cancelar_plan_tratamiento(request, plan_id):
     from django.http import JsonResponse
     
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
     except Perfil.DoesNotExist:
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
             return JsonResponse({'success': False, 'error': 'No tienes permisos.'}, status=403)
@@ -14937,7 +15023,7 @@ def cancelar_plan_tratamiento(request, plan_id):
 def crear_plan_desde_odontograma(request, odontograma_id):
     """Crea un plan de tratamiento basado en un odontograma"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.activo:
             messages.error(request, 'Tu cuenta está desactivada.')
             return redirect('login')
@@ -14963,7 +15049,7 @@ def crear_plan_desde_odontograma(request, odontograma_id):
 def registrar_pago_tratamiento(request, plan_id):
     """Registra un pago parcial para un plan de tratamiento"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.activo:
             return JsonResponse({'success': False, 'error': 'Tu cuenta está desactivada.'}, status=403)
     except Perfil.DoesNotExist:
@@ -14973,8 +15059,7 @@ def registrar_pago_tratamiento(request, plan_id):
     if perfil.es_administrativo():
         plan = get_object_or_404(PlanTratamiento, id=plan_id)
     elif perfil.es_dentista():
-        pacientes_dentista = perfil.get_pacientes_asignados()
-        clientes_ids = [p['id'] for p in pacientes_dentista if 'id' in p and isinstance(p['id'], int)]
+        clientes_ids = perfil.get_clientes_asignados_ids()
         plan = get_object_or_404(
             PlanTratamiento,
             id=plan_id,
@@ -15063,7 +15148,7 @@ def registrar_pago_tratamiento(request, plan_id):
 def eliminar_pago_tratamiento(request, plan_id, pago_id):
     """Elimina un pago registrado (solo administrativos)"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             return JsonResponse({'success': False, 'error': 'Solo los administrativos pueden eliminar pagos.'}, status=403)
     except Perfil.DoesNotExist:
@@ -15095,7 +15180,7 @@ def eliminar_pago_tratamiento(request, plan_id, pago_id):
 def enviar_documentos_tratamiento(request, plan_id):
     """Vista para enviar presupuesto y consentimientos de un tratamiento por correo"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not (perfil.es_administrativo() or perfil.es_dentista()):
             return JsonResponse({'success': False, 'error': 'No tienes permisos para enviar documentos.'}, status=403)
     except Perfil.DoesNotExist:
@@ -15123,7 +15208,7 @@ def enviar_documentos_tratamiento(request, plan_id):
         # Obtener información de la clínica
         try:
             from configuracion.models import InformacionClinica
-            info_clinica = InformacionClinica.obtener()
+            info_clinica = InformacionClinica.obtener_cacheada()
             nombre_clinica = info_clinica.nombre_clinica
             email_clinica = info_clinica.email or getattr(settings, 'EMAIL_FROM', 'noreply@clinica.com')
         except:
@@ -15348,7 +15433,7 @@ def enviar_documentos_tratamiento(request, plan_id):
 def crear_cita_desde_fase(request, plan_id, fase_id):
     """Crea una cita específica para una fase de tratamiento"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.activo:
             return JsonResponse({'success': False, 'error': 'Tu cuenta está desactivada.'}, status=403)
     except Perfil.DoesNotExist:
@@ -15358,8 +15443,7 @@ def crear_cita_desde_fase(request, plan_id, fase_id):
     if perfil.es_administrativo():
         plan = get_object_or_404(PlanTratamiento, id=plan_id)
     elif perfil.es_dentista():
-        pacientes_dentista = perfil.get_pacientes_asignados()
-        clientes_ids = [p['id'] for p in pacientes_dentista if 'id' in p and isinstance(p['id'], int)]
+        clientes_ids = perfil.get_clientes_asignados_ids()
         plan = get_object_or_404(
             PlanTratamiento,
             id=plan_id,
@@ -15548,7 +15632,7 @@ def cancelar_plan_tratamiento(request, plan_id):
     from django.http import JsonResponse
     
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
     except Perfil.DoesNotExist:
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
             return JsonResponse({'success': False, 'error': 'No tienes permisos.'}, status=403)
@@ -15617,7 +15701,7 @@ def cancelar_plan_tratamiento(request, plan_id):
 def crear_plan_desde_odontograma(request, odontograma_id):
     """Crea un plan de tratamiento basado en un odontograma"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.activo:
             messages.error(request, 'Tu cuenta está desactivada.')
             return redirect('login')
@@ -15643,7 +15727,7 @@ def crear_plan_desde_odontograma(request, odontograma_id):
 def registrar_pago_tratamiento(request, plan_id):
     """Registra un pago parcial para un plan de tratamiento"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.activo:
             return JsonResponse({'success': False, 'error': 'Tu cuenta está desactivada.'}, status=403)
     except Perfil.DoesNotExist:
@@ -15653,8 +15737,7 @@ def registrar_pago_tratamiento(request, plan_id):
     if perfil.es_administrativo():
         plan = get_object_or_404(PlanTratamiento, id=plan_id)
     elif perfil.es_dentista():
-        pacientes_dentista = perfil.get_pacientes_asignados()
-        clientes_ids = [p['id'] for p in pacientes_dentista if 'id' in p and isinstance(p['id'], int)]
+        clientes_ids = perfil.get_clientes_asignados_ids()
         plan = get_object_or_404(
             PlanTratamiento,
             id=plan_id,
@@ -15743,7 +15826,7 @@ def registrar_pago_tratamiento(request, plan_id):
 def eliminar_pago_tratamiento(request, plan_id, pago_id):
     """Elimina un pago registrado (solo administrativos)"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             return JsonResponse({'success': False, 'error': 'Solo los administrativos pueden eliminar pagos.'}, status=403)
     except Perfil.DoesNotExist:
@@ -15775,7 +15858,7 @@ def eliminar_pago_tratamiento(request, plan_id, pago_id):
 def enviar_documentos_tratamiento(request, plan_id):
     """Vista para enviar presupuesto y consentimientos de un tratamiento por correo"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not (perfil.es_administrativo() or perfil.es_dentista()):
             return JsonResponse({'success': False, 'error': 'No tienes permisos para enviar documentos.'}, status=403)
     except Perfil.DoesNotExist:
@@ -15803,7 +15886,7 @@ def enviar_documentos_tratamiento(request, plan_id):
         # Obtener información de la clínica
         try:
             from configuracion.models import InformacionClinica
-            info_clinica = InformacionClinica.obtener()
+            info_clinica = InformacionClinica.obtener_cacheada()
             nombre_clinica = info_clinica.nombre_clinica
             email_clinica = info_clinica.email or getattr(settings, 'EMAIL_FROM', 'noreply@clinica.com')
         except:
@@ -16028,7 +16111,7 @@ def enviar_documentos_tratamiento(request, plan_id):
 def crear_cita_desde_fase(request, plan_id, fase_id):
     """Crea una cita específica para una fase de tratamiento"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.activo:
             return JsonResponse({'success': False, 'error': 'Tu cuenta está desactivada.'}, status=403)
     except Perfil.DoesNotExist:
@@ -16038,8 +16121,7 @@ def crear_cita_desde_fase(request, plan_id, fase_id):
     if perfil.es_administrativo():
         plan = get_object_or_404(PlanTratamiento, id=plan_id)
     elif perfil.es_dentista():
-        pacientes_dentista = perfil.get_pacientes_asignados()
-        clientes_ids = [p['id'] for p in pacientes_dentista if 'id' in p and isinstance(p['id'], int)]
+        clientes_ids = perfil.get_clientes_asignados_ids()
         plan = get_object_or_404(
             PlanTratamiento,
             id=plan_id,
@@ -16228,7 +16310,7 @@ def cancelar_plan_tratamiento(request, plan_id):
     from django.http import JsonResponse
     
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
     except Perfil.DoesNotExist:
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
             return JsonResponse({'success': False, 'error': 'No tienes permisos.'}, status=403)
@@ -16297,7 +16379,7 @@ def cancelar_plan_tratamiento(request, plan_id):
 def crear_plan_desde_odontograma(request, odontograma_id):
     """Crea un plan de tratamiento basado en un odontograma"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.activo:
             messages.error(request, 'Tu cuenta está desactivada.')
             return redirect('login')
@@ -16323,7 +16405,7 @@ def crear_plan_desde_odontograma(request, odontograma_id):
 def registrar_pago_tratamiento(request, plan_id):
     """Registra un pago parcial para un plan de tratamiento"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.activo:
             return JsonResponse({'success': False, 'error': 'Tu cuenta está desactivada.'}, status=403)
     except Perfil.DoesNotExist:
@@ -16333,8 +16415,7 @@ def registrar_pago_tratamiento(request, plan_id):
     if perfil.es_administrativo():
         plan = get_object_or_404(PlanTratamiento, id=plan_id)
     elif perfil.es_dentista():
-        pacientes_dentista = perfil.get_pacientes_asignados()
-        clientes_ids = [p['id'] for p in pacientes_dentista if 'id' in p and isinstance(p['id'], int)]
+        clientes_ids = perfil.get_clientes_asignados_ids()
         plan = get_object_or_404(
             PlanTratamiento,
             id=plan_id,
@@ -16423,7 +16504,7 @@ def registrar_pago_tratamiento(request, plan_id):
 def eliminar_pago_tratamiento(request, plan_id, pago_id):
     """Elimina un pago registrado (solo administrativos)"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             return JsonResponse({'success': False, 'error': 'Solo los administrativos pueden eliminar pagos.'}, status=403)
     except Perfil.DoesNotExist:
@@ -16455,7 +16536,7 @@ def eliminar_pago_tratamiento(request, plan_id, pago_id):
 def enviar_documentos_tratamiento(request, plan_id):
     """Vista para enviar presupuesto y consentimientos de un tratamiento por correo"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not (perfil.es_administrativo() or perfil.es_dentista()):
             return JsonResponse({'success': False, 'error': 'No tienes permisos para enviar documentos.'}, status=403)
     except Perfil.DoesNotExist:
@@ -16483,7 +16564,7 @@ def enviar_documentos_tratamiento(request, plan_id):
         # Obtener información de la clínica
         try:
             from configuracion.models import InformacionClinica
-            info_clinica = InformacionClinica.obtener()
+            info_clinica = InformacionClinica.obtener_cacheada()
             nombre_clinica = info_clinica.nombre_clinica
             email_clinica = info_clinica.email or getattr(settings, 'EMAIL_FROM', 'noreply@clinica.com')
         except:
@@ -16708,7 +16789,7 @@ def enviar_documentos_tratamiento(request, plan_id):
 def crear_cita_desde_fase(request, plan_id, fase_id):
     """Crea una cita específica para una fase de tratamiento"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.activo:
             return JsonResponse({'success': False, 'error': 'Tu cuenta está desactivada.'}, status=403)
     except Perfil.DoesNotExist:
@@ -16718,8 +16799,7 @@ def crear_cita_desde_fase(request, plan_id, fase_id):
     if perfil.es_administrativo():
         plan = get_object_or_404(PlanTratamiento, id=plan_id)
     elif perfil.es_dentista():
-        pacientes_dentista = perfil.get_pacientes_asignados()
-        clientes_ids = [p['id'] for p in pacientes_dentista if 'id' in p and isinstance(p['id'], int)]
+        clientes_ids = perfil.get_clientes_asignados_ids()
         plan = get_object_or_404(
             PlanTratamiento,
             id=plan_id,
@@ -16908,7 +16988,7 @@ def cancelar_plan_tratamiento(request, plan_id):
     from django.http import JsonResponse
     
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
     except Perfil.DoesNotExist:
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
             return JsonResponse({'success': False, 'error': 'No tienes permisos.'}, status=403)
@@ -16977,7 +17057,7 @@ def cancelar_plan_tratamiento(request, plan_id):
 def crear_plan_desde_odontograma(request, odontograma_id):
     """Crea un plan de tratamiento basado en un odontograma"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.activo:
             messages.error(request, 'Tu cuenta está desactivada.')
             return redirect('login')
@@ -17003,7 +17083,7 @@ def crear_plan_desde_odontograma(request, odontograma_id):
 def registrar_pago_tratamiento(request, plan_id):
     """Registra un pago parcial para un plan de tratamiento"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.activo:
             return JsonResponse({'success': False, 'error': 'Tu cuenta está desactivada.'}, status=403)
     except Perfil.DoesNotExist:
@@ -17013,8 +17093,7 @@ def registrar_pago_tratamiento(request, plan_id):
     if perfil.es_administrativo():
         plan = get_object_or_404(PlanTratamiento, id=plan_id)
     elif perfil.es_dentista():
-        pacientes_dentista = perfil.get_pacientes_asignados()
-        clientes_ids = [p['id'] for p in pacientes_dentista if 'id' in p and isinstance(p['id'], int)]
+        clientes_ids = perfil.get_clientes_asignados_ids()
         plan = get_object_or_404(
             PlanTratamiento,
             id=plan_id,
@@ -17103,7 +17182,7 @@ def registrar_pago_tratamiento(request, plan_id):
 def eliminar_pago_tratamiento(request, plan_id, pago_id):
     """Elimina un pago registrado (solo administrativos)"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             return JsonResponse({'success': False, 'error': 'Solo los administrativos pueden eliminar pagos.'}, status=403)
     except Perfil.DoesNotExist:
@@ -17135,7 +17214,7 @@ def eliminar_pago_tratamiento(request, plan_id, pago_id):
 def enviar_documentos_tratamiento(request, plan_id):
     """Vista para enviar presupuesto y consentimientos de un tratamiento por correo"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not (perfil.es_administrativo() or perfil.es_dentista()):
             return JsonResponse({'success': False, 'error': 'No tienes permisos para enviar documentos.'}, status=403)
     except Perfil.DoesNotExist:
@@ -17163,7 +17242,7 @@ def enviar_documentos_tratamiento(request, plan_id):
         # Obtener información de la clínica
         try:
             from configuracion.models import InformacionClinica
-            info_clinica = InformacionClinica.obtener()
+            info_clinica = InformacionClinica.obtener_cacheada()
             nombre_clinica = info_clinica.nombre_clinica
             email_clinica = info_clinica.email or getattr(settings, 'EMAIL_FROM', 'noreply@clinica.com')
         except:
@@ -17388,7 +17467,7 @@ def enviar_documentos_tratamiento(request, plan_id):
 def crear_cita_desde_fase(request, plan_id, fase_id):
     """Crea una cita específica para una fase de tratamiento"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.activo:
             return JsonResponse({'success': False, 'error': 'Tu cuenta está desactivada.'}, status=403)
     except Perfil.DoesNotExist:
@@ -17398,8 +17477,7 @@ def crear_cita_desde_fase(request, plan_id, fase_id):
     if perfil.es_administrativo():
         plan = get_object_or_404(PlanTratamiento, id=plan_id)
     elif perfil.es_dentista():
-        pacientes_dentista = perfil.get_pacientes_asignados()
-        clientes_ids = [p['id'] for p in pacientes_dentista if 'id' in p and isinstance(p['id'], int)]
+        clientes_ids = perfil.get_clientes_asignados_ids()
         plan = get_object_or_404(
             PlanTratamiento,
             id=plan_id,
@@ -17588,7 +17666,7 @@ def cancelar_plan_tratamiento(request, plan_id):
     from django.http import JsonResponse
     
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
     except Perfil.DoesNotExist:
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
             return JsonResponse({'success': False, 'error': 'No tienes permisos.'}, status=403)
@@ -17657,7 +17735,7 @@ def cancelar_plan_tratamiento(request, plan_id):
 def crear_plan_desde_odontograma(request, odontograma_id):
     """Crea un plan de tratamiento basado en un odontograma"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.activo:
             messages.error(request, 'Tu cuenta está desactivada.')
             return redirect('login')
@@ -17683,7 +17761,7 @@ def crear_plan_desde_odontograma(request, odontograma_id):
 def registrar_pago_tratamiento(request, plan_id):
     """Registra un pago parcial para un plan de tratamiento"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.activo:
             return JsonResponse({'success': False, 'error': 'Tu cuenta está desactivada.'}, status=403)
     except Perfil.DoesNotExist:
@@ -17693,8 +17771,7 @@ def registrar_pago_tratamiento(request, plan_id):
     if perfil.es_administrativo():
         plan = get_object_or_404(PlanTratamiento, id=plan_id)
     elif perfil.es_dentista():
-        pacientes_dentista = perfil.get_pacientes_asignados()
-        clientes_ids = [p['id'] for p in pacientes_dentista if 'id' in p and isinstance(p['id'], int)]
+        clientes_ids = perfil.get_clientes_asignados_ids()
         plan = get_object_or_404(
             PlanTratamiento,
             id=plan_id,
@@ -17783,7 +17860,7 @@ def registrar_pago_tratamiento(request, plan_id):
 def eliminar_pago_tratamiento(request, plan_id, pago_id):
     """Elimina un pago registrado (solo administrativos)"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             return JsonResponse({'success': False, 'error': 'Solo los administrativos pueden eliminar pagos.'}, status=403)
     except Perfil.DoesNotExist:
@@ -17815,7 +17892,7 @@ def eliminar_pago_tratamiento(request, plan_id, pago_id):
 def enviar_documentos_tratamiento(request, plan_id):
     """Vista para enviar presupuesto y consentimientos de un tratamiento por correo"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not (perfil.es_administrativo() or perfil.es_dentista()):
             return JsonResponse({'success': False, 'error': 'No tienes permisos para enviar documentos.'}, status=403)
     except Perfil.DoesNotExist:
@@ -17843,7 +17920,7 @@ def enviar_documentos_tratamiento(request, plan_id):
         # Obtener información de la clínica
         try:
             from configuracion.models import InformacionClinica
-            info_clinica = InformacionClinica.obtener()
+            info_clinica = InformacionClinica.obtener_cacheada()
             nombre_clinica = info_clinica.nombre_clinica
             email_clinica = info_clinica.email or getattr(settings, 'EMAIL_FROM', 'noreply@clinica.com')
         except:
@@ -18068,7 +18145,7 @@ def enviar_documentos_tratamiento(request, plan_id):
 def crear_cita_desde_fase(request, plan_id, fase_id):
     """Crea una cita específica para una fase de tratamiento"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.activo:
             return JsonResponse({'success': False, 'error': 'Tu cuenta está desactivada.'}, status=403)
     except Perfil.DoesNotExist:
@@ -18078,8 +18155,7 @@ def crear_cita_desde_fase(request, plan_id, fase_id):
     if perfil.es_administrativo():
         plan = get_object_or_404(PlanTratamiento, id=plan_id)
     elif perfil.es_dentista():
-        pacientes_dentista = perfil.get_pacientes_asignados()
-        clientes_ids = [p['id'] for p in pacientes_dentista if 'id' in p and isinstance(p['id'], int)]
+        clientes_ids = perfil.get_clientes_asignados_ids()
         plan = get_object_or_404(
             PlanTratamiento,
             id=plan_id,
@@ -18268,7 +18344,7 @@ def cancelar_plan_tratamiento(request, plan_id):
     from django.http import JsonResponse
     
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
     except Perfil.DoesNotExist:
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
             return JsonResponse({'success': False, 'error': 'No tienes permisos.'}, status=403)
@@ -18337,7 +18413,7 @@ def cancelar_plan_tratamiento(request, plan_id):
 def crear_plan_desde_odontograma(request, odontograma_id):
     """Crea un plan de tratamiento basado en un odontograma"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.activo:
             messages.error(request, 'Tu cuenta está desactivada.')
             return redirect('login')
@@ -18363,7 +18439,7 @@ def crear_plan_desde_odontograma(request, odontograma_id):
 def registrar_pago_tratamiento(request, plan_id):
     """Registra un pago parcial para un plan de tratamiento"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.activo:
             return JsonResponse({'success': False, 'error': 'Tu cuenta está desactivada.'}, status=403)
     except Perfil.DoesNotExist:
@@ -18373,8 +18449,7 @@ def registrar_pago_tratamiento(request, plan_id):
     if perfil.es_administrativo():
         plan = get_object_or_404(PlanTratamiento, id=plan_id)
     elif perfil.es_dentista():
-        pacientes_dentista = perfil.get_pacientes_asignados()
-        clientes_ids = [p['id'] for p in pacientes_dentista if 'id' in p and isinstance(p['id'], int)]
+        clientes_ids = perfil.get_clientes_asignados_ids()
         plan = get_object_or_404(
             PlanTratamiento,
             id=plan_id,
@@ -18463,7 +18538,7 @@ def registrar_pago_tratamiento(request, plan_id):
 def eliminar_pago_tratamiento(request, plan_id, pago_id):
     """Elimina un pago registrado (solo administrativos)"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             return JsonResponse({'success': False, 'error': 'Solo los administrativos pueden eliminar pagos.'}, status=403)
     except Perfil.DoesNotExist:
@@ -18495,7 +18570,7 @@ def eliminar_pago_tratamiento(request, plan_id, pago_id):
 def enviar_documentos_tratamiento(request, plan_id):
     """Vista para enviar presupuesto y consentimientos de un tratamiento por correo"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not (perfil.es_administrativo() or perfil.es_dentista()):
             return JsonResponse({'success': False, 'error': 'No tienes permisos para enviar documentos.'}, status=403)
     except Perfil.DoesNotExist:
@@ -18523,7 +18598,7 @@ def enviar_documentos_tratamiento(request, plan_id):
         # Obtener información de la clínica
         try:
             from configuracion.models import InformacionClinica
-            info_clinica = InformacionClinica.obtener()
+            info_clinica = InformacionClinica.obtener_cacheada()
             nombre_clinica = info_clinica.nombre_clinica
             email_clinica = info_clinica.email or getattr(settings, 'EMAIL_FROM', 'noreply@clinica.com')
         except:
@@ -6,6 +6,7 @@ from django.db.models import Q
 from django.utils import timezone
 from datetime import date
 from personal.models import Perfil
+from personal.cache_perfil import obtener_perfil
 from .models_auditoria import AuditoriaLog
 
 
@@ -13,7 +14,7 @@ from .models_auditoria import AuditoriaLog
 def gestor_auditoria(request):
     """Vista para gestionar el historial de auditoría del sistema"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'Solo los administrativos pueden acceder a la auditoría.')
             return redirect('panel_trabajador')
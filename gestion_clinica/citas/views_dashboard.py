@@ -13,6 +13,7 @@ from .models import Cita
 from pacientes.models import Cliente
 from inventario.models import Insumo, MovimientoInsumo
 from personal.models import Perfil
+from personal.cache_perfil import obtener_perfil
 from evaluaciones.models import Evaluacion
 
 # ========== VISTA PRINCIPAL DEL DASHBOARD ==========
@@ -20,7 +21,7 @@ from evaluaciones.models import Evaluacion
 def dashboard_reportes(request):
     """Vista principal del dashboard con estadísticas y gráficos"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'No tienes permisos para acceder al dashboard.')
             return redirect('panel_trabajador')
@@ -179,7 +180,7 @@ def dashboard_reportes(request):
 def exportar_excel_citas(request):
     """Exporta todas las citas a Excel"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             return HttpResponse('No tienes permisos', status=403)
     except Perfil.DoesNotExist:
@@ -248,7 +249,7 @@ def exportar_excel_citas(request):
 def exportar_excel_clientes(request):
     """Exporta todos los clientes a Excel"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             return HttpResponse('No tienes permisos', status=403)
     except Perfil.DoesNotExist:
@@ -312,7 +313,7 @@ def exportar_excel_clientes(request):
 def exportar_excel_insumos(request):
     """Exporta todos los insumos a Excel"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             return HttpResponse('No tienes permisos', status=403)
     except Perfil.DoesNotExist:
@@ -374,7 +375,7 @@ def exportar_excel_insumos(request):
 def exportar_excel_finanzas(request):
     """Exporta reporte financiero a Excel"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             return HttpResponse('No tienes permisos', status=403)
     except Perfil.DoesNotExist:
@@ -450,6 +451,7 @@ from .models import Cita
 from pacientes.models import Cliente
 from inventario.models import Insumo, MovimientoInsumo
 from personal.models import Perfil
+from personal.cache_perfil import obtener_perfil
 from evaluaciones.models import Evaluacion
 
 # ========== VISTA PRINCIPAL DEL DASHBOARD ==========
@@ -457,7 +459,7 @@ from evaluaciones.models import Evaluacion
 def dashboard_reportes(request):
     """Vista principal del dashboard con estadísticas y gráficos"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'No tienes permisos para acceder al dashboard.')
             return redirect('panel_trabajador')
@@ -616,7 +618,7 @@ def dashboard_reportes(request):
 def exportar_excel_citas(request):
     """Exporta todas las citas a Excel"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             return HttpResponse('No tienes permisos', status=403)
     except Perfil.DoesNotExist:
@@ -685,7 +687,7 @@ def exportar_excel_citas(request):
 def exportar_excel_clientes(request):
     """Exporta todos los clientes a Excel"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             return HttpResponse('No tienes permisos', status=403)
     except Perfil.DoesNotExist:
@@ -749,7 +751,7 @@ def exportar_excel_clientes(request):
 def exportar_excel_insumos(request):
     """Exporta todos los insumos a Excel"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             return HttpResponse('No tienes permisos', status=403)
     except Perfil.DoesNotExist:
@@ -811,7 +813,7 @@ def exportar_excel_insumos(request):
 def exportar_excel_finanzas(request):
     """Exporta reporte financiero a Excel"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             return HttpResponse('No tienes permisos', status=403)
     except Perfil.DoesNotExist:
@@ -887,6 +889,7 @@ from .models import Cita
 from pacientes.models import Cliente
 from inventario.models import Insumo, MovimientoInsumo
 from personal.models import Perfil
+from personal.cache_perfil import obtener_perfil
 from evaluaciones.models import Evaluacion
 
 # ========== VISTA PRINCIPAL DEL DASHBOARD ==========
@@ -894,7 +897,7 @@ from evaluaciones.models import Evaluacion
 def dashboard_reportes(request):
     """Vista principal del dashboard con estadísticas y gráficos"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'No tienes permisos para acceder al dashboard.')
             return redirect('panel_trabajador')
@@ -1053,7 +1056,7 @@ def dashboard_reportes(request):
 def exportar_excel_citas(request):
     """Exporta todas las citas a Excel"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             return HttpResponse('No tienes permisos', status=403)
     except Perfil.DoesNotExist:
@@ -1122,7 +1125,7 @@ def exportar_excel_citas(request):
 def exportar_excel_clientes(request):
     """Exporta todos los clientes a Excel"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             return HttpResponse('No tienes permisos', status=403)
     except Perfil.DoesNotExist:
@@ -1186,7 +1189,7 @@ def exportar_excel_clientes(request):
 def exportar_excel_insumos(request):
     """Exporta todos los insumos a Excel"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             return HttpResponse('No tienes permisos', status=403)
     except Perfil.DoesNotExist:
@@ -1248,7 +1251,7 @@ def exportar_excel_insumos(request):
 def exportar_excel_finanzas(request):
     """Exporta reporte financiero a Excel"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             return HttpResponse('No tienes permisos', status=403)
     except Perfil.DoesNotExist:
@@ -1324,6 +1327,7 @@ from .models import Cita
 from pacientes.models import Cliente
 from inventario.models import Insumo, MovimientoInsumo
 from personal.models import Perfil
+from personal.cache_perfil import obtener_perfil
 from evaluaciones.models import Evaluacion
 
 # ========== VISTA PRINCIPAL DEL DASHBOARD ==========
@@ -1331,7 +1335,7 @@ from evaluaciones.models import Evaluacion
 def dashboard_reportes(request):
     """Vista principal del dashboard con estadísticas y gráficos"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'No tienes permisos para acceder al dashboard.')
             return redirect('panel_trabajador')
@@ -1490,7 +1494,7 @@ def dashboard_reportes(request):
 def exportar_excel_citas(request):
     """Exporta todas las citas a Excel"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             return HttpResponse('No tienes permisos', status=403)
     except Perfil.DoesNotExist:
@@ -1559,7 +1563,7 @@ def exportar_excel_citas(request):
 def exportar_excel_clientes(request):
     """Exporta todos los clientes a Excel"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             return HttpResponse('No tienes permisos', status=403)
     except Perfil.DoesNotExist:
@@ -1623,7 +1627,7 @@ def exportar_excel_clientes(request):
 def exportar_excel_insumos(request):
     """Exporta todos los insumos a Excel"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             return HttpResponse('No tienes permisos', status=403)
     except Perfil.DoesNotExist:
@@ -1685,7 +1689,7 @@ def exportar_excel_insumos(request):
 def exportar_excel_finanzas(request):
     """Exporta reporte financiero a Excel"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             return HttpResponse('No tienes permisos', status=403)
     except Perfil.DoesNotExist:
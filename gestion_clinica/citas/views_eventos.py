@@ -0,0 +1,145 @@
+"""
+Stream de eventos de la agenda (Server-Sent Events con long-poll de respaldo).
+
+Las vistas son asíncronas: el despliegue las sirve con `gestion_clinica.asgi` (gunicorn
+con workers uvicorn, ver start.sh), así cada conexión abierta no ocupa un worker. Bajo
+un servidor WSGI cada stream retendría un worker hasta DURACION_MAXIMA_STREAM; no
+desplegar estas vistas con workers síncronos.
+"""
+import asyncio
+import json
+import time
+
+from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse, StreamingHttpResponse
+
+from personal.models import Perfil
+from .models import EventoAgenda
+
+# Frecuencia con la que se consulta el bus de eventos (segundos)
+INTERVALO_CONSULTA = 0.5
+# Comentario "ping" para que proxies y navegadores no cierren la conexión ociosa
+INTERVALO_HEARTBEAT = 15
+# El stream se cierra periódicamente; EventSource reconecta enviando Last-Event-ID
+DURACION_MAXIMA_STREAM = 300
+# Espera máxima de una petición long-poll antes de responder sin eventos
+ESPERA_MAXIMA_LONG_POLL = 25
+# Eventos máximos entregados por consulta
+LOTE_EVENTOS = 100
+
+
+async def _obtener_perfil_activo(request):
+    user = await request.auser()
+    return await Perfil.objects.filter(user=user, activo=True).afirst()
+
+
+def _eventos_visibles(perfil, request):
+    """Los dentistas solo reciben eventos de sus citas; recepción puede filtrar por dentista"""
+    eventos = EventoAgenda.objects.all()
+    if perfil.es_dentista():
+        return eventos.filter(dentista_id=perfil.id)
+    dentista_id = request.GET.get('dentista', '').strip()
+    if dentista_id.isdigit():
+        eventos = eventos.filter(dentista_id=int(dentista_id))
+    return eventos
+
+
+def _leer_ultimo_id(request):
+    """Cursor enviado por el cliente: cabecera Last-Event-ID (SSE) o parámetro ?ultimo_id="""
+    valor = request.headers.get('Last-Event-ID') or request.GET.get('ultimo_id', '')
+    valor = str(valor).strip()
+    return int(valor) if valor.isdigit() else None
+
+
+async def _ultimo_id_actual():
+    ultimo_id = await EventoAgenda.objects.order_by('-id').values_list('id', flat=True).afirst()
+    return ultimo_id or 0
+
+
+async def _eventos_desde(eventos, ultimo_id):
+    consulta = eventos.filter(id__gt=ultimo_id).order_by('id')[:LOTE_EVENTOS]
+    return [evento async for evento in consulta]
+
+
+async def _generar_stream(eventos, ultimo_id):
+    # Indicar al navegador cuánto esperar antes de reconectar
+    yield 'retry: 2000\n\n'
+    inicio = time.monotonic()
+    ultimo_envio = inicio
+    while time.monotonic() - inicio < DURACION_MAXIMA_STREAM:
+        nuevos = await _eventos_desde(eventos, ultimo_id)
+        for evento in nuevos:
+            ultimo_id = evento.id
+            datos = json.dumps(evento.como_dict(), ensure_ascii=False)
+            yield f'id: {evento.id}\ndata: {datos}\n\n'
+        ahora = time.monotonic()
+        if nuevos:
+            ultimo_envio = ahora
+        elif ahora - ultimo_envio >= INTERVALO_HEARTBEAT:
+            yield ': ping\n\n'
+            ultimo_envio = ahora
+        await asyncio.sleep(INTERVALO_CONSULTA)
+
+
+@login_required
+async def stream_eventos_agenda(request):
+    """
+    Stream SSE con los cambios de estado de las citas (reserva, llegada, listo para
+    atender, en progreso, finalizada, no show...). El cliente se conecta con
+    EventSource; al reconectar el navegador envía Last-Event-ID y recibe lo pendiente.
+    """
+    perfil = await _obtener_perfil_activo(request)
+    if perfil is None:
+        return JsonResponse({'error': 'Perfil no encontrado'}, status=404)
+
+    eventos = _eventos_visibles(perfil, request)
+    ultimo_id = _leer_ultimo_id(request)
+    if ultimo_id is None:
+        ultimo_id = await _ultimo_id_actual()
+
+    response = StreamingHttpResponse(_generar_stream(eventos, ultimo_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Evitar que nginx/proxies acumulen la respuesta en buffer
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@login_required
+async def eventos_agenda_long_poll(request):
+    """
+    Respaldo long-poll del stream de agenda para navegadores o despliegues sin SSE.
+
+    Parámetros GET:
+    - ultimo_id: último evento recibido (sin él se devuelve solo el cursor actual)
+    - dentista: filtrar por dentista (solo recepción)
+    - espera: segundos máximos de espera (por defecto y máximo 25)
+    """
+    perfil = await _obtener_perfil_activo(request)
+    if perfil is None:
+        return JsonResponse({'error': 'Perfil no encontrado'}, status=404)
+
+    ultimo_id = _leer_ultimo_id(request)
+    if ultimo_id is None:
+        # Primera llamada: entregar el cursor para empezar a escuchar desde ahora
+        return JsonResponse({'success': True, 'eventos': [], 'ultimo_id': await _ultimo_id_actual()})
+
+    try:
+        espera = min(float(request.GET.get('espera', ESPERA_MAXIMA_LONG_POLL)), ESPERA_MAXIMA_LONG_POLL)
+    except (TypeError, ValueError):
+        espera = ESPERA_MAXIMA_LONG_POLL
+
+    eventos = _eventos_visibles(perfil, request)
+    limite = time.monotonic() + max(espera, 0)
+    while True:
+        nuevos = await _eventos_desde(eventos, ultimo_id)
+        if nuevos or time.monotonic() >= limite:
+            break
+        await asyncio.sleep(INTERVALO_CONSULTA)
+
+    if nuevos:
+        ultimo_id = nuevos[-1].id
+    return JsonResponse({
+        'success': True,
+        'eventos': [evento.como_dict() for evento in nuevos],
+        'ultimo_id': ultimo_id,
+    })
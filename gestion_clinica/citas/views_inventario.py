@@ -2,19 +2,23 @@ from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.db.models import Q, F
+from django.http import Http404, JsonResponse
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.utils import timezone
 from datetime import timedelta, date
+from inventario.estadisticas import estadisticas_insumos, estadisticas_pedidos, estadisticas_proveedores
 from inventario.models import Insumo
+from inventario.vencimientos import MESES_PANEL, lotes_por_vencer, valor_en_riesgo_por_mes
 from proveedores.models import Proveedor, SolicitudInsumo, Pedido
 from personal.models import Perfil
+from personal.cache_perfil import obtener_perfil
 
 
 @login_required
 def gestor_inventario_unificado(request):
     """Vista unificada para gestionar insumos y proveedores"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'No tienes permisos para gestionar inventario.')
             return redirect('panel_trabajador')
@@ -178,13 +182,14 @@ from datetime import timedelta
 from inventario.models import Insumo
 from proveedores.models import Proveedor, SolicitudInsumo, Pedido
 from personal.models import Perfil
+from personal.cache_perfil import obtener_perfil
 
 
 @login_required
 def gestor_inventario_unificado(request):
     """Vista unificada para gestionar insumos y proveedores"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'No tienes permisos para gestionar inventario.')
             return redirect('panel_trabajador')
@@ -348,13 +353,14 @@ from datetime import timedelta
 from inventario.models import Insumo
 from proveedores.models import Proveedor, SolicitudInsumo, Pedido
 from personal.models import Perfil
+from personal.cache_perfil import obtener_perfil
 
 
 @login_required
 def gestor_inventario_unificado(request):
     """Vista unificada para gestionar insumos y proveedores"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'No tienes permisos para gestionar inventario.')
             return redirect('panel_trabajador')
@@ -518,13 +524,14 @@ from datetime import timedelta
 from inventario.models import Insumo
 from proveedores.models import Proveedor, SolicitudInsumo, Pedido
 from personal.models import Perfil
+from personal.cache_perfil import obtener_perfil
 
 
 @login_required
 def gestor_inventario_unificado(request):
     """Vista unificada para gestionar insumos y proveedores"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'No tienes permisos para gestionar inventario.')
             return redirect('panel_trabajador')
@@ -688,13 +695,14 @@ from datetime import timedelta
 from inventario.models import Insumo
 from proveedores.models import Proveedor, SolicitudInsumo, Pedido
 from personal.models import Perfil
+from personal.cache_perfil import obtener_perfil
 
 
 @login_required
 def gestor_inventario_unificado(request):
     """Vista unificada para gestionar insumos y proveedores"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'No tienes permisos para gestionar inventario.')
             return redirect('panel_trabajador')
@@ -858,13 +866,14 @@ from datetime import timedelta
 from inventario.models import Insumo
 from proveedores.models import Proveedor, SolicitudInsumo, Pedido
 from personal.models import Perfil
+from personal.cache_perfil import obtener_perfil
 
 
 @login_required
 def gestor_inventario_unificado(request):
     """Vista unificada para gestionar insumos y proveedores"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'No tienes permisos para gestionar inventario.')
             return redirect('panel_trabajador')
@@ -1028,28 +1037,21 @@ from datetime import timedelta
 from inventario.models import Insumo
 from proveedores.models import Proveedor, SolicitudInsumo, Pedido
 from personal.models import Perfil
+from personal.cache_perfil import obtener_perfil
 
 
-@login_required
-def gestor_inventario_unificado(request):
-    """Vista unificada para gestionar insumos y proveedores"""
-    try:
-        perfil = Perfil.objects.get(user=request.user)
-        if not perfil.es_administrativo():
-            messages.error(request, 'No tienes permisos para gestionar inventario.')
-            return redirect('panel_trabajador')
-    except Perfil.DoesNotExist:
-        return redirect('login')
-    
-    # Sección activa (por defecto insumos)
-    seccion = request.GET.get('seccion', 'insumos')
-    
-    # ========== DATOS PARA INSUMOS ==========
+# ========== SECCIONES DEL GESTOR ==========
+# Cada pestaña arma solo su propio contexto. La vista principal construye la sección
+# visible y las demás se cargan al abrirlas desde seccion_inventario (una plantilla
+# parcial por sección), así abrir el inventario no pagina ni cuenta pestañas ocultas.
+
+def _contexto_insumos(request):
     search_insumos = request.GET.get('search_insumos', '')
     categoria = request.GET.get('categoria', '')
     estado_insumo = request.GET.get('estado_insumo', '')
     
-    insumos = Insumo.objects.all()
+    # La tabla muestra el proveedor principal de cada insumo
+    insumos = Insumo.objects.select_related('proveedor_principal')
     
     if search_insumos:
         insumos = insumos.filter(
@@ -1079,27 +1081,26 @@ def gestor_inventario_unificado(request):
     except EmptyPage:
         insumos_pag = paginator_insumos.page(paginator_insumos.num_pages)
     
-    # Estadísticas de insumos
-    total_insumos = Insumo.objects.count()
-    insumos_stock_bajo = Insumo.objects.filter(cantidad_actual__lte=F('cantidad_minima')).count()
-    insumos_proximo_vencimiento = Insumo.objects.filter(
-        fecha_vencimiento__lte=timezone.now().date() + timedelta(days=30),
-        fecha_vencimiento__gte=timezone.now().date()
-    ).count()
-    insumos_agotados = Insumo.objects.filter(estado='agotado').count()
-    
-    estadisticas_insumos = {
-        'total_insumos': total_insumos,
-        'insumos_stock_bajo': insumos_stock_bajo,
-        'insumos_proximo_vencimiento': insumos_proximo_vencimiento,
-        'insumos_agotados': insumos_agotados,
+    return {
+        'insumos': insumos_pag,
+        # Una sola consulta con agregación condicional (ver inventario/estadisticas.py)
+        'estadisticas_insumos': estadisticas_insumos(),
+        'categorias': Insumo.CATEGORIA_CHOICES,
+        'estados_insumo': Insumo.ESTADO_CHOICES,
+        'search_insumos': search_insumos,
+        'categoria': categoria,
+        'estado_insumo': estado_insumo,
+        # Fecha actual para comparar vencimientos
+        'today': date.today(),
     }
-    
-    # ========== DATOS PARA PROVEEDORES ==========
+
+
+def _contexto_proveedores(request):
     search_proveedores = request.GET.get('search_proveedores', '')
     estado_proveedor = request.GET.get('estado_proveedor', '')
     
-    proveedores = Proveedor.objects.all()
+    # La tabla muestra cuántos insumos tiene cada proveedor: prefetch en vez de una consulta por fila
+    proveedores = Proveedor.objects.prefetch_related('insumos_principales')
     
     if search_proveedores:
         proveedores = proveedores.filter(
@@ -1115,77 +1116,98 @@ def gestor_inventario_unificado(request):
     elif estado_proveedor == 'inactivo':
         proveedores = proveedores.filter(activo=False)
     
-    proveedores = proveedores.order_by('nombre')
-    
-    # Estadísticas de proveedores
-    total_proveedores = Proveedor.objects.count()
-    proveedores_activos = Proveedor.objects.filter(activo=True).count()
-    proveedores_con_insumos = Proveedor.objects.filter(insumos_principales__isnull=False).distinct().count()
-    solicitudes_pendientes = SolicitudInsumo.objects.filter(estado='enviada').count()
-    
-    estadisticas_proveedores = {
-        'total_proveedores': total_proveedores,
-        'proveedores_activos': proveedores_activos,
-        'proveedores_con_insumos': proveedores_con_insumos,
-        'solicitudes_pendientes': solicitudes_pendientes,
+    return {
+        'proveedores': proveedores.order_by('nombre'),
+        'estadisticas_proveedores': estadisticas_proveedores(),
+        'search_proveedores': search_proveedores,
+        'estado_proveedor': estado_proveedor,
     }
-    
-    # ========== DATOS PARA PEDIDOS ==========
-    pedidos = Pedido.objects.select_related('proveedor', 'creado_por').prefetch_related('solicitudes').order_by('-fecha_pedido')[:10]
-    
-    total_pedidos = Pedido.objects.count()
-    pedidos_pendientes = Pedido.objects.filter(estado__in=['borrador', 'pendiente']).count()
-    pedidos_enviados = Pedido.objects.filter(estado='enviado').count()
-    pedidos_recibidos = Pedido.objects.filter(estado='recibido').count()
-    
-    estadisticas_pedidos = {
-        'total_pedidos': total_pedidos,
-        'pedidos_pendientes': pedidos_pendientes,
-        'pedidos_enviados': pedidos_enviados,
-        'pedidos_recibidos': pedidos_recibidos,
+
+
+def _contexto_pedidos(request):
+    return {
+        'pedidos': Pedido.objects.select_related('proveedor', 'creado_por').prefetch_related('solicitudes').order_by('-fecha_pedido')[:10],
+        'estadisticas_pedidos': estadisticas_pedidos(),
     }
+
+
+def _contexto_solicitudes(request):
+    return {
+        'solicitudes_recientes': SolicitudInsumo.objects.select_related('proveedor', 'insumo').order_by('-fecha_solicitud')[:10],
+    }
+
+
+def _contexto_vencimientos(request):
+    # Lotes con stock agrupados por mes de vencimiento (ver inventario/vencimientos.py)
+    vencimientos_por_mes = valor_en_riesgo_por_mes()
+    
+    return {
+        'vencimientos_por_mes': vencimientos_por_mes,
+        'lotes_por_vencer': lotes_por_vencer(),
+        'estadisticas_vencimientos': {
+            'meses': MESES_PANEL,
+            'unidades_vencidas': sum(fila['unidades'] for fila in vencimientos_por_mes if fila['vencido']),
+            'valor_vencido': sum(fila['valor'] for fila in vencimientos_por_mes if fila['vencido']),
+            'valor_en_riesgo': sum(fila['valor'] for fila in vencimientos_por_mes if not fila['vencido']),
+        },
+    }
+
+
+# Sección -> función que arma su contexto (plantilla citas/inventario/secciones/_<sección>.html)
+SECCIONES_INVENTARIO = {
+    'insumos': _contexto_insumos,
+    'proveedores': _contexto_proveedores,
+    'pedidos': _contexto_pedidos,
+    'solicitudes': _contexto_solicitudes,
+    'vencimientos': _contexto_vencimientos,
+}
+
+
+@login_required
+def gestor_inventario_unificado(request):
+    """Vista unificada para gestionar insumos y proveedores (solo arma la sección visible)"""
+    try:
+        perfil = obtener_perfil(request)
+        if not perfil.es_administrativo():
+            messages.error(request, 'No tienes permisos para gestionar inventario.')
+            return redirect('panel_trabajador')
+    except Perfil.DoesNotExist:
+        return redirect('login')
     
-    # ========== DATOS PARA SOLICITUDES ==========
-    solicitudes_recientes = SolicitudInsumo.objects.select_related('proveedor', 'insumo').order_by('-fecha_solicitud')[:10]
-    
-    # Obtener proveedores activos para formularios
-    proveedores_activos = Proveedor.objects.filter(activo=True).order_by('nombre')
+    # Sección activa (por defecto insumos)
+    seccion = request.GET.get('seccion', 'insumos')
+    if seccion not in SECCIONES_INVENTARIO:
+        seccion = 'insumos'
     
     context = {
         'perfil': perfil,
         'seccion': seccion,
         
-        # Insumos
-        'insumos': insumos_pag,
-        'estadisticas_insumos': estadisticas_insumos,
-        'categorias': Insumo.CATEGORIA_CHOICES,
-        'estados_insumo': Insumo.ESTADO_CHOICES,
-        'search_insumos': search_insumos,
-        'categoria': categoria,
-        'estado_insumo': estado_insumo,
-        
-        # Proveedores
-        'proveedores': proveedores,
-        'estadisticas_proveedores': estadisticas_proveedores,
-        'search_proveedores': search_proveedores,
-        'estado_proveedor': estado_proveedor,
-        'proveedores_activos': proveedores_activos,
-        
-        # Pedidos
-        'pedidos': pedidos,
-        'estadisticas_pedidos': estadisticas_pedidos,
-        
-        # Solicitudes
-        'solicitudes_recientes': solicitudes_recientes,
-        
-        # Insumos para solicitudes
-        'insumos_todos': Insumo.objects.all().order_by('nombre'),
-        
-        # Fecha actual para comparar vencimientos
-        'today': date.today(),
+        # Proveedores activos para el modal de nueva solicitud
+        'proveedores_activos': Proveedor.objects.filter(activo=True).order_by('nombre'),
         
         'es_admin': True
     }
+    context.update(SECCIONES_INVENTARIO[seccion](request))
     
     return render(request, 'citas/inventario/gestor_inventario_unificado.html', context)
 
+
+@login_required
+def seccion_inventario(request, seccion):
+    """Vista AJAX que devuelve el HTML de una sección del gestor de inventario"""
+    try:
+        perfil = obtener_perfil(request)
+        if not perfil.es_administrativo():
+            return JsonResponse({'success': False, 'message': 'No tienes permisos.'}, status=403)
+    except Perfil.DoesNotExist:
+        return JsonResponse({'success': False, 'message': 'No tienes permisos.'}, status=403)
+    
+    if seccion not in SECCIONES_INVENTARIO:
+        raise Http404('Sección no encontrada')
+    
+    return render(
+        request,
+        f'citas/inventario/secciones/_{seccion}.html',
+        SECCIONES_INVENTARIO[seccion](request),
+    )
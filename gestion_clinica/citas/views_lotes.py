@@ -0,0 +1,98 @@
+"""
+Vistas de los lotes de documentos PDF (ver citas/lotes_documentos.py).
+"""
+from django.contrib.auth.decorators import login_required
+from django.http import FileResponse, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+
+from personal.models import Perfil
+from personal.cache_perfil import obtener_perfil
+from .lotes_documentos import SELECCIONES, crear_lote, seleccionar_objetos
+from .models import LoteDocumentos
+
+
+def _perfil_administrativo(request):
+    try:
+        perfil = obtener_perfil(request)
+    except Perfil.DoesNotExist:
+        return None
+    return perfil if perfil.es_administrativo() else None
+
+
+def _datos_lote(lote):
+    datos = {
+        'id': lote.id,
+        'tipo': lote.get_tipo_display(),
+        'entrega': lote.entrega,
+        'estado': lote.estado,
+        'estado_display': lote.get_estado_display(),
+        'total': lote.total,
+        'procesados': lote.procesados,
+        'errores': lote.errores,
+        'detalle_errores': lote.detalle_errores[:10],
+        'correos_enviados': lote.correos_enviados,
+        'porcentaje': lote.porcentaje,
+        'terminado': lote.terminado,
+        'url_descarga': None,
+    }
+    if lote.estado == 'completado' and lote.archivo_zip:
+        datos['url_descarga'] = reverse('descargar_lote_documentos', args=[lote.id])
+    return datos
+
+
+@login_required
+def crear_lote_documentos(request):
+    """Crea un lote de presupuestos o consentimientos y lo procesa en segundo plano"""
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Método no permitido.'}, status=405)
+    perfil = _perfil_administrativo(request)
+    if perfil is None:
+        return JsonResponse({'success': False, 'error': 'Solo los administrativos pueden generar lotes de documentos.'}, status=403)
+
+    tipo = request.POST.get('tipo', '')
+    seleccion = request.POST.get('seleccion', '')
+    entrega = request.POST.get('entrega', 'zip')
+    if tipo not in SELECCIONES:
+        return JsonResponse({'success': False, 'error': 'Tipo de documento no válido.'}, status=400)
+    if seleccion != 'ids' and seleccion not in SELECCIONES[tipo]:
+        return JsonResponse({'success': False, 'error': 'Selección no válida.'}, status=400)
+    if entrega not in dict(LoteDocumentos.ENTREGA_CHOICES):
+        return JsonResponse({'success': False, 'error': 'Forma de entrega no válida.'}, status=400)
+
+    ids = [int(valor) for valor in request.POST.get('ids', '').split(',') if valor.strip().isdigit()]
+    objetos = seleccionar_objetos(tipo, seleccion, ids)
+    if not objetos:
+        return JsonResponse({'success': False, 'error': 'No hay documentos que coincidan con la selección.'}, status=400)
+
+    lote = crear_lote(perfil, tipo, objetos, entrega)
+    return JsonResponse({
+        'success': True,
+        'lote': _datos_lote(lote),
+        'url_estado': reverse('estado_lote_documentos', args=[lote.id]),
+    })
+
+
+@login_required
+def estado_lote_documentos(request, lote_id):
+    """Progreso de un lote (se consulta periódicamente desde el gestor de documentos)"""
+    if _perfil_administrativo(request) is None:
+        return JsonResponse({'success': False, 'error': 'No tienes permisos.'}, status=403)
+    lote = get_object_or_404(LoteDocumentos, id=lote_id)
+    return JsonResponse({'success': True, 'lote': _datos_lote(lote)})
+
+
+@login_required
+def descargar_lote_documentos(request, lote_id):
+    """Descarga el ZIP de un lote terminado"""
+    if _perfil_administrativo(request) is None:
+        return JsonResponse({'success': False, 'error': 'No tienes permisos.'}, status=403)
+    lote = get_object_or_404(LoteDocumentos, id=lote_id, estado='completado')
+    if not lote.archivo_zip:
+        return JsonResponse({'success': False, 'error': 'Este lote no tiene archivo ZIP.'}, status=404)
+    return FileResponse(
+        lote.archivo_zip.open('rb'),
+        as_attachment=True,
+        filename=f'documentos_{lote.tipo}_{lote.creado_el.strftime("%Y%m%d_%H%M")}.zip',
+        content_type='application/zip',
+    )
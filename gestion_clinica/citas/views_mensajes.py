@@ -5,6 +5,7 @@ from django.http import JsonResponse
 from django.db.models import Q, Count
 from comunicacion.models import Mensaje
 from personal.models import Perfil
+from personal.cache_perfil import obtener_perfil
 from historial_clinico.models import Odontograma
 from pacientes.models import Cliente
 
@@ -12,7 +13,7 @@ from pacientes.models import Cliente
 def obtener_mensajes(request):
     """API para obtener los mensajes del usuario actual"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
     except Perfil.DoesNotExist:
         return JsonResponse({'error': 'Perfil no encontrado'}, status=404)
     
@@ -77,7 +78,7 @@ def enviar_mensaje(request):
     """Vista para enviar un nuevo mensaje"""
     if request.method == 'POST':
         try:
-            perfil = Perfil.objects.get(user=request.user)
+            perfil = obtener_perfil(request)
             
             destinatario_id = request.POST.get('destinatario_id')
             tipo = request.POST.get('tipo', 'general')
@@ -150,7 +151,7 @@ def marcar_como_leido(request, mensaje_id):
     """Marca un mensaje como leído"""
     if request.method == 'POST':
         try:
-            perfil = Perfil.objects.get(user=request.user)
+            perfil = obtener_perfil(request)
             mensaje = get_object_or_404(Mensaje, id=mensaje_id, destinatario=perfil)
             mensaje.marcar_como_leido()
             return JsonResponse({'success': True})
@@ -164,7 +165,7 @@ def archivar_mensaje(request, mensaje_id):
     """Archiva un mensaje"""
     if request.method == 'POST':
         try:
-            perfil = Perfil.objects.get(user=request.user)
+            perfil = obtener_perfil(request)
             mensaje = get_object_or_404(Mensaje, id=mensaje_id)
             
             # Verificar que el usuario sea remitente o destinatario
@@ -183,7 +184,7 @@ def archivar_mensaje(request, mensaje_id):
 def obtener_usuarios_disponibles(request):
     """Obtiene la lista de usuarios disponibles para enviar mensajes"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         
         # Si es dentista, puede enviar a administradores
         # Si es admin, puede enviar a dentistas
@@ -4,14 +4,17 @@ from django.contrib import messages
 from django.core.mail import EmailMessage
 from django.conf import settings
 from django.utils import timezone
+from django.db import transaction
 from django.db.models import Q
 from django.http import JsonResponse
 from django.urls import reverse
 from datetime import datetime
 from decimal import Decimal
 from proveedores.models import Proveedor, SolicitudInsumo, Pedido
-from inventario.models import Insumo, MovimientoInsumo
+from inventario.models import Insumo
+from inventario.stock import aplicar_movimiento
 from personal.models import Perfil
+from personal.cache_perfil import obtener_perfil
 from finanzas.models import EgresoManual
 import unicodedata
 import re
@@ -29,7 +32,7 @@ def normalizar_texto(texto):
 def gestor_proveedores(request):
     """Vista para gestionar proveedores"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
     except Perfil.DoesNotExist:
         messages.error(request, 'No tienes permisos para acceder a esta función.')
         return redirect('login')
@@ -95,7 +98,7 @@ def crear_proveedor(request):
     """Vista para crear un nuevo proveedor"""
     if request.method == 'POST':
         try:
-            perfil = Perfil.objects.get(user=request.user)
+            perfil = obtener_perfil(request)
             
             # Verificar si es petición AJAX
             is_ajax = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
@@ -242,7 +245,7 @@ def crear_proveedor(request):
     
     # Si es GET, mostrar el formulario para crear proveedor
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
     except Perfil.DoesNotExist:
         return redirect('login')
     
@@ -398,7 +401,7 @@ def enviar_solicitud_insumo(request):
     """Vista para crear y enviar solicitudes de insumos por correo (múltiples insumos en una solicitud)"""
     if request.method == 'POST':
         try:
-            perfil = Perfil.objects.get(user=request.user)
+            perfil = obtener_perfil(request)
             
             # Obtener datos del formulario
             proveedor_id = request.POST.get('proveedor_id')
@@ -491,7 +494,7 @@ def enviar_solicitud_insumo(request):
             # Obtener información de la clínica
             try:
                 from configuracion.models import InformacionClinica
-                info_clinica = InformacionClinica.obtener()
+                info_clinica = InformacionClinica.obtener_cacheada()
                 nombre_clinica = info_clinica.nombre_clinica
                 email_clinica = info_clinica.email or settings.DEFAULT_FROM_EMAIL
                 direccion_clinica = info_clinica.direccion or ''
@@ -641,7 +644,7 @@ def obtener_insumos_proveedor(request, proveedor_id):
 def crear_pedido(request):
     """Vista para crear un nuevo pedido"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'No tienes permisos para crear pedidos.')
             return redirect(reverse('gestor_inventario_unificado') + '?seccion=pedidos')
@@ -734,7 +737,7 @@ def crear_pedido(request):
 def detalle_pedido(request, pedido_id):
     """Vista para ver y gestionar un pedido específico"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'No tienes permisos para ver pedidos.')
             return redirect(reverse('gestor_inventario_unificado') + '?seccion=pedidos')
@@ -762,7 +765,7 @@ def agregar_insumo_pedido(request, pedido_id):
     """Vista AJAX para agregar un insumo a un pedido"""
     if request.method == 'POST':
         try:
-            perfil = Perfil.objects.get(user=request.user)
+            perfil = obtener_perfil(request)
             if not perfil.es_administrativo():
                 return JsonResponse({'success': False, 'message': 'No tienes permisos.'}, status=403)
         except Perfil.DoesNotExist:
@@ -830,7 +833,7 @@ def enviar_pedido_correo(request, pedido_id):
     """Vista para enviar el pedido por correo al proveedor"""
     if request.method == 'POST':
         try:
-            perfil = Perfil.objects.get(user=request.user)
+            perfil = obtener_perfil(request)
             if not perfil.es_administrativo():
                 return JsonResponse({'success': False, 'message': 'No tienes permisos.'}, status=403)
         except Perfil.DoesNotExist:
@@ -925,7 +928,7 @@ Clinica Dental
             # Obtener información de la clínica
             try:
                 from configuracion.models import InformacionClinica
-                info_clinica = InformacionClinica.obtener()
+                info_clinica = InformacionClinica.obtener_cacheada()
                 nombre_clinica = info_clinica.nombre_clinica
                 email_clinica = info_clinica.email or settings.DEFAULT_FROM_EMAIL
                 direccion_clinica = info_clinica.direccion or ''
@@ -1013,7 +1016,7 @@ Clinica Dental
 def gestor_pedidos(request):
     """Vista principal para gestionar pedidos a proveedores"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'No tienes permisos para gestionar pedidos.')
             return redirect('panel_trabajador')
@@ -1104,7 +1107,7 @@ def obtener_insumos_proveedor(request, proveedor_id):
 def crear_pedido(request):
     """Vista para crear un nuevo pedido"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'No tienes permisos para crear pedidos.')
             return redirect(reverse('gestor_inventario_unificado') + '?seccion=pedidos')
@@ -1197,7 +1200,7 @@ def crear_pedido(request):
 def detalle_pedido(request, pedido_id):
     """Vista para ver y gestionar un pedido específico"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'No tienes permisos para ver pedidos.')
             return redirect(reverse('gestor_inventario_unificado') + '?seccion=pedidos')
@@ -1225,7 +1228,7 @@ def agregar_insumo_pedido(request, pedido_id):
     """Vista AJAX para agregar un insumo a un pedido"""
     if request.method == 'POST':
         try:
-            perfil = Perfil.objects.get(user=request.user)
+            perfil = obtener_perfil(request)
             if not perfil.es_administrativo():
                 return JsonResponse({'success': False, 'message': 'No tienes permisos.'}, status=403)
         except Perfil.DoesNotExist:
@@ -1293,7 +1296,7 @@ def enviar_pedido_correo(request, pedido_id):
     """Vista para enviar el pedido por correo al proveedor"""
     if request.method == 'POST':
         try:
-            perfil = Perfil.objects.get(user=request.user)
+            perfil = obtener_perfil(request)
             if not perfil.es_administrativo():
                 return JsonResponse({'success': False, 'message': 'No tienes permisos.'}, status=403)
         except Perfil.DoesNotExist:
@@ -1388,7 +1391,7 @@ Clinica Dental
             # Obtener información de la clínica
             try:
                 from configuracion.models import InformacionClinica
-                info_clinica = InformacionClinica.obtener()
+                info_clinica = InformacionClinica.obtener_cacheada()
                 nombre_clinica = info_clinica.nombre_clinica
                 email_clinica = info_clinica.email or settings.DEFAULT_FROM_EMAIL
                 direccion_clinica = info_clinica.direccion or ''
@@ -1476,7 +1479,7 @@ Clinica Dental
 def gestor_pedidos(request):
     """Vista principal para gestionar pedidos a proveedores"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'No tienes permisos para gestionar pedidos.')
             return redirect('panel_trabajador')
@@ -1567,7 +1570,7 @@ def obtener_insumos_proveedor(request, proveedor_id):
 def crear_pedido(request):
     """Vista para crear un nuevo pedido"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'No tienes permisos para crear pedidos.')
             return redirect(reverse('gestor_inventario_unificado') + '?seccion=pedidos')
@@ -1660,7 +1663,7 @@ def crear_pedido(request):
 def detalle_pedido(request, pedido_id):
     """Vista para ver y gestionar un pedido específico"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'No tienes permisos para ver pedidos.')
             return redirect(reverse('gestor_inventario_unificado') + '?seccion=pedidos')
@@ -1688,7 +1691,7 @@ def agregar_insumo_pedido(request, pedido_id):
     """Vista AJAX para agregar un insumo a un pedido"""
     if request.method == 'POST':
         try:
-            perfil = Perfil.objects.get(user=request.user)
+            perfil = obtener_perfil(request)
             if not perfil.es_administrativo():
                 return JsonResponse({'success': False, 'message': 'No tienes permisos.'}, status=403)
         except Perfil.DoesNotExist:
@@ -1756,7 +1759,7 @@ def enviar_pedido_correo(request, pedido_id):
     """Vista para enviar el pedido por correo al proveedor"""
     if request.method == 'POST':
         try:
-            perfil = Perfil.objects.get(user=request.user)
+            perfil = obtener_perfil(request)
             if not perfil.es_administrativo():
                 return JsonResponse({'success': False, 'message': 'No tienes permisos.'}, status=403)
         except Perfil.DoesNotExist:
@@ -1851,7 +1854,7 @@ Clinica Dental
             # Obtener información de la clínica
             try:
                 from configuracion.models import InformacionClinica
-                info_clinica = InformacionClinica.obtener()
+                info_clinica = InformacionClinica.obtener_cacheada()
                 nombre_clinica = info_clinica.nombre_clinica
                 email_clinica = info_clinica.email or settings.DEFAULT_FROM_EMAIL
                 direccion_clinica = info_clinica.direccion or ''
@@ -1939,7 +1942,7 @@ Clinica Dental
 def gestor_pedidos(request):
     """Vista principal para gestionar pedidos a proveedores"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'No tienes permisos para gestionar pedidos.')
             return redirect('panel_trabajador')
@@ -2030,7 +2033,7 @@ def obtener_insumos_proveedor(request, proveedor_id):
 def crear_pedido(request):
     """Vista para crear un nuevo pedido"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'No tienes permisos para crear pedidos.')
             return redirect(reverse('gestor_inventario_unificado') + '?seccion=pedidos')
@@ -2123,7 +2126,7 @@ def crear_pedido(request):
 def detalle_pedido(request, pedido_id):
     """Vista para ver y gestionar un pedido específico"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'No tienes permisos para ver pedidos.')
             return redirect(reverse('gestor_inventario_unificado') + '?seccion=pedidos')
@@ -2151,7 +2154,7 @@ def agregar_insumo_pedido(request, pedido_id):
     """Vista AJAX para agregar un insumo a un pedido"""
     if request.method == 'POST':
         try:
-            perfil = Perfil.objects.get(user=request.user)
+            perfil = obtener_perfil(request)
             if not perfil.es_administrativo():
                 return JsonResponse({'success': False, 'message': 'No tienes permisos.'}, status=403)
         except Perfil.DoesNotExist:
@@ -2219,7 +2222,7 @@ def enviar_pedido_correo(request, pedido_id):
     """Vista para enviar el pedido por correo al proveedor"""
     if request.method == 'POST':
         try:
-            perfil = Perfil.objects.get(user=request.user)
+            perfil = obtener_perfil(request)
             if not perfil.es_administrativo():
                 return JsonResponse({'success': False, 'message': 'No tienes permisos.'}, status=403)
         except Perfil.DoesNotExist:
@@ -2314,7 +2317,7 @@ Clinica Dental
             # Obtener información de la clínica
             try:
                 from configuracion.models import InformacionClinica
-                info_clinica = InformacionClinica.obtener()
+                info_clinica = InformacionClinica.obtener_cacheada()
                 nombre_clinica = info_clinica.nombre_clinica
                 email_clinica = info_clinica.email or settings.DEFAULT_FROM_EMAIL
                 direccion_clinica = info_clinica.direccion or ''
@@ -2402,7 +2405,7 @@ Clinica Dental
 def gestor_pedidos(request):
     """Vista principal para gestionar pedidos a proveedores"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'No tienes permisos para gestionar pedidos.')
             return redirect('panel_trabajador')
@@ -2493,7 +2496,7 @@ def obtener_insumos_proveedor(request, proveedor_id):
 def crear_pedido(request):
     """Vista para crear un nuevo pedido"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'No tienes permisos para crear pedidos.')
             return redirect(reverse('gestor_inventario_unificado') + '?seccion=pedidos')
@@ -2586,7 +2589,7 @@ def crear_pedido(request):
 def detalle_pedido(request, pedido_id):
     """Vista para ver y gestionar un pedido específico"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'No tienes permisos para ver pedidos.')
             return redirect(reverse('gestor_inventario_unificado') + '?seccion=pedidos')
@@ -2614,7 +2617,7 @@ def agregar_insumo_pedido(request, pedido_id):
     """Vista AJAX para agregar un insumo a un pedido"""
     if request.method == 'POST':
         try:
-            perfil = Perfil.objects.get(user=request.user)
+            perfil = obtener_perfil(request)
             if not perfil.es_administrativo():
                 return JsonResponse({'success': False, 'message': 'No tienes permisos.'}, status=403)
         except Perfil.DoesNotExist:
@@ -2682,7 +2685,7 @@ def enviar_pedido_correo(request, pedido_id):
     """Vista para enviar el pedido por correo al proveedor"""
     if request.method == 'POST':
         try:
-            perfil = Perfil.objects.get(user=request.user)
+            perfil = obtener_perfil(request)
             if not perfil.es_administrativo():
                 return JsonResponse({'success': False, 'message': 'No tienes permisos.'}, status=403)
         except Perfil.DoesNotExist:
@@ -2777,7 +2780,7 @@ Clinica Dental
             # Obtener información de la clínica
             try:
                 from configuracion.models import InformacionClinica
-                info_clinica = InformacionClinica.obtener()
+                info_clinica = InformacionClinica.obtener_cacheada()
                 nombre_clinica = info_clinica.nombre_clinica
                 email_clinica = info_clinica.email or settings.DEFAULT_FROM_EMAIL
                 direccion_clinica = info_clinica.direccion or ''
@@ -2865,7 +2868,7 @@ Clinica Dental
 def gestor_pedidos(request):
     """Vista principal para gestionar pedidos a proveedores"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'No tienes permisos para gestionar pedidos.')
             return redirect('panel_trabajador')
@@ -2956,7 +2959,7 @@ def obtener_insumos_proveedor(request, proveedor_id):
 def crear_pedido(request):
     """Vista para crear un nuevo pedido"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'No tienes permisos para crear pedidos.')
             return redirect(reverse('gestor_inventario_unificado') + '?seccion=pedidos')
@@ -3049,7 +3052,7 @@ def crear_pedido(request):
 def detalle_pedido(request, pedido_id):
     """Vista para ver y gestionar un pedido específico"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'No tienes permisos para ver pedidos.')
             return redirect(reverse('gestor_inventario_unificado') + '?seccion=pedidos')
@@ -3077,7 +3080,7 @@ def agregar_insumo_pedido(request, pedido_id):
     """Vista AJAX para agregar un insumo a un pedido"""
     if request.method == 'POST':
         try:
-            perfil = Perfil.objects.get(user=request.user)
+            perfil = obtener_perfil(request)
             if not perfil.es_administrativo():
                 return JsonResponse({'success': False, 'message': 'No tienes permisos.'}, status=403)
         except Perfil.DoesNotExist:
@@ -3145,7 +3148,7 @@ def enviar_pedido_correo(request, pedido_id):
     """Vista para enviar el pedido por correo al proveedor"""
     if request.method == 'POST':
         try:
-            perfil = Perfil.objects.get(user=request.user)
+            perfil = obtener_perfil(request)
             if not perfil.es_administrativo():
                 return JsonResponse({'success': False, 'message': 'No tienes permisos.'}, status=403)
         except Perfil.DoesNotExist:
@@ -3240,7 +3243,7 @@ Clinica Dental
             # Obtener información de la clínica
             try:
                 from configuracion.models import InformacionClinica
-                info_clinica = InformacionClinica.obtener()
+                info_clinica = InformacionClinica.obtener_cacheada()
                 nombre_clinica = info_clinica.nombre_clinica
                 email_clinica = info_clinica.email or settings.DEFAULT_FROM_EMAIL
                 direccion_clinica = info_clinica.direccion or ''
@@ -3328,7 +3331,7 @@ Clinica Dental
 def gestor_pedidos(request):
     """Vista principal para gestionar pedidos a proveedores"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'No tienes permisos para gestionar pedidos.')
             return redirect('panel_trabajador')
@@ -3419,7 +3422,7 @@ def obtener_insumos_proveedor(request, proveedor_id):
 def crear_pedido(request):
     """Vista para crear un nuevo pedido"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'No tienes permisos para crear pedidos.')
             return redirect(reverse('gestor_inventario_unificado') + '?seccion=pedidos')
@@ -3512,7 +3515,7 @@ def crear_pedido(request):
 def detalle_pedido(request, pedido_id):
     """Vista para ver y gestionar un pedido específico"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'No tienes permisos para ver pedidos.')
             return redirect(reverse('gestor_inventario_unificado') + '?seccion=pedidos')
@@ -3540,7 +3543,7 @@ def agregar_insumo_pedido(request, pedido_id):
     """Vista AJAX para agregar un insumo a un pedido"""
     if request.method == 'POST':
         try:
-            perfil = Perfil.objects.get(user=request.user)
+            perfil = obtener_perfil(request)
             if not perfil.es_administrativo():
                 return JsonResponse({'success': False, 'message': 'No tienes permisos.'}, status=403)
         except Perfil.DoesNotExist:
@@ -3608,7 +3611,7 @@ def enviar_pedido_correo(request, pedido_id):
     """Vista para enviar el pedido por correo al proveedor"""
     if request.method == 'POST':
         try:
-            perfil = Perfil.objects.get(user=request.user)
+            perfil = obtener_perfil(request)
             if not perfil.es_administrativo():
                 return JsonResponse({'success': False, 'message': 'No tienes permisos.'}, status=403)
         except Perfil.DoesNotExist:
@@ -3703,7 +3706,7 @@ Clinica Dental
             # Obtener información de la clínica
             try:
                 from configuracion.models import InformacionClinica
-                info_clinica = InformacionClinica.obtener()
+                info_clinica = InformacionClinica.obtener_cacheada()
                 nombre_clinica = info_clinica.nombre_clinica
                 email_clinica = info_clinica.email or settings.DEFAULT_FROM_EMAIL
                 direccion_clinica = info_clinica.direccion or ''
@@ -3788,48 +3791,52 @@ def marcar_solicitud_recibida(request, solicitud_id):
         return JsonResponse({'success': False, 'message': 'Método no permitido.'}, status=405)
     
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             return JsonResponse({'success': False, 'message': 'No tienes permisos para realizar esta acción.'}, status=403)
     except Perfil.DoesNotExist:
         return JsonResponse({'success': False, 'message': 'Perfil no encontrado.'}, status=404)
     
     try:
-        solicitud = get_object_or_404(SolicitudInsumo, id=solicitud_id)
-        
-        # Verificar que la solicitud no esté ya recibida o cancelada
-        if solicitud.estado == 'recibida':
-            return JsonResponse({'success': False, 'message': 'Esta solicitud ya fue marcada como recibida.'}, status=400)
-        
-        if solicitud.estado == 'cancelada':
-            return JsonResponse({'success': False, 'message': 'No se puede marcar como recibida una solicitud cancelada.'}, status=400)
-        
-        # Cambiar estado a recibida
-        solicitud.estado = 'recibida'
-        solicitud.save()
-        
-        # Registrar movimiento de entrada de stock
-        insumo = solicitud.insumo
-        cantidad_anterior = insumo.cantidad_actual
-        insumo.cantidad_actual += solicitud.cantidad_solicitada
-        
-        # Actualizar estado del insumo si estaba agotado
-        if insumo.estado == 'agotado' and insumo.cantidad_actual > 0:
-            insumo.estado = 'disponible'
-        
-        insumo.save()
-        
-        # Crear movimiento de stock
-        MovimientoInsumo.objects.create(
-            insumo=insumo,
-            tipo='entrada',
-            cantidad=solicitud.cantidad_solicitada,
-            cantidad_anterior=cantidad_anterior,
-            cantidad_nueva=insumo.cantidad_actual,
-            motivo=f'Recepción de solicitud #{solicitud.id}',
-            observaciones=f'Solicitud recibida de {solicitud.proveedor.nombre}. Cantidad solicitada: {solicitud.cantidad_solicitada} {insumo.unidad_medida}',
-            realizado_por=perfil
-        )
+        # Lote y vencimiento de lo recibido (opcionales)
+        fecha_vencimiento = None
+        if request.POST.get('fecha_vencimiento'):
+            try:
+                fecha_vencimiento = datetime.strptime(request.POST['fecha_vencimiento'], '%Y-%m-%d').date()
+            except ValueError:
+                return JsonResponse({'success': False, 'message': 'La fecha de vencimiento no es válida.'}, status=400)
+        
+        # La solicitud se bloquea para que dos clics simultáneos no sumen el stock dos veces,
+        # y el estado y el movimiento de entrada se guardan en la misma transacción
+        with transaction.atomic():
+            solicitud = get_object_or_404(
+                SolicitudInsumo.objects.select_for_update().select_related('insumo', 'proveedor'),
+                id=solicitud_id
+            )
+            
+            # Verificar que la solicitud no esté ya recibida o cancelada
+            if solicitud.estado == 'recibida':
+                return JsonResponse({'success': False, 'message': 'Esta solicitud ya fue marcada como recibida.'}, status=400)
+            
+            if solicitud.estado == 'cancelada':
+                return JsonResponse({'success': False, 'message': 'No se puede marcar como recibida una solicitud cancelada.'}, status=400)
+            
+            # Cambiar estado a recibida
+            solicitud.estado = 'recibida'
+            solicitud.save()
+            
+            # Registrar movimiento de entrada de stock (ver inventario/stock.py)
+            insumo = solicitud.insumo
+            movimiento = aplicar_movimiento(
+                insumo,
+                'entrada',
+                solicitud.cantidad_solicitada,
+                f'Recepción de solicitud #{solicitud.id}',
+                observaciones=f'Solicitud recibida de {solicitud.proveedor.nombre}. Cantidad solicitada: {solicitud.cantidad_solicitada} {insumo.unidad_medida}',
+                realizado_por=perfil,
+                lote=request.POST.get('lote', '').strip(),
+                fecha_vencimiento=fecha_vencimiento
+            )
         
         # Calcular monto si no está establecido (usar precio unitario de la solicitud o del insumo)
         monto_egreso = None
@@ -3862,7 +3869,7 @@ def marcar_solicitud_recibida(request, solicitud_id):
         
         return JsonResponse({
             'success': True,
-            'message': f'✅ Solicitud marcada como recibida. Stock de {insumo.nombre} actualizado: {cantidad_anterior} → {insumo.cantidad_actual} {insumo.unidad_medida}.{mensaje_egreso}'
+            'message': f'✅ Solicitud marcada como recibida. Stock de {insumo.nombre} actualizado: {movimiento.cantidad_anterior} → {movimiento.cantidad_nueva} {insumo.unidad_medida}.{mensaje_egreso}'
         })
         
     except SolicitudInsumo.DoesNotExist:
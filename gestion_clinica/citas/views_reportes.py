@@ -16,6 +16,7 @@ from .models import Cita, TipoServicio
 from pacientes.models import Cliente
 from inventario.models import Insumo, MovimientoInsumo
 from personal.models import Perfil
+from personal.cache_perfil import obtener_perfil
 from proveedores.models import Proveedor, SolicitudInsumo, Pedido
 from historial_clinico.models import PlanTratamiento
 from finanzas.models import IngresoManual, EgresoManual
@@ -31,7 +32,7 @@ TURQUESA_BG = "F0FDFA"
 def reportes(request):
     """Vista principal de Reportes - Solo descargas Excel"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'No tienes permisos para acceder a los reportes.')
             return redirect('panel_trabajador')
@@ -195,7 +196,7 @@ def _aplicar_estilo_turquesa(ws, fila_inicio, headers):
 def exportar_excel_citas(request):
     """Exporta todas las citas a Excel con diseño turquesa"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             return HttpResponse('No tienes permisos', status=403)
     except Perfil.DoesNotExist:
@@ -277,7 +278,7 @@ def exportar_excel_citas(request):
 def exportar_excel_clientes(request):
     """Exporta todos los clientes a Excel con diseño turquesa"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             return HttpResponse('No tienes permisos', status=403)
     except Perfil.DoesNotExist:
@@ -352,7 +353,7 @@ def exportar_excel_clientes(request):
 def exportar_excel_insumos(request):
     """Exporta todos los insumos a Excel con diseño turquesa"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             return HttpResponse('No tienes permisos', status=403)
     except Perfil.DoesNotExist:
@@ -428,7 +429,7 @@ def exportar_excel_insumos(request):
 def exportar_excel_finanzas(request):
     """Exporta reporte financiero a Excel con diseño turquesa"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             return HttpResponse('No tienes permisos', status=403)
     except Perfil.DoesNotExist:
@@ -978,7 +979,7 @@ def exportar_excel_finanzas(request):
 def exportar_excel_proveedores(request):
     """Exporta todos los proveedores a Excel con diseño turquesa"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             return HttpResponse('No tienes permisos', status=403)
     except Perfil.DoesNotExist:
@@ -1047,7 +1048,7 @@ def exportar_excel_proveedores(request):
 def exportar_excel_solicitudes(request):
     """Exporta todas las solicitudes a Excel con diseño turquesa"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             return HttpResponse('No tienes permisos', status=403)
     except Perfil.DoesNotExist:
@@ -1114,7 +1115,7 @@ def exportar_excel_solicitudes(request):
 def exportar_excel_personal(request):
     """Exporta todo el personal a Excel con diseño turquesa"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             return HttpResponse('No tienes permisos', status=403)
     except Perfil.DoesNotExist:
@@ -1182,7 +1183,7 @@ def exportar_excel_personal(request):
 def exportar_excel_servicios(request):
     """Exporta todos los servicios a Excel con diseño turquesa"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             return HttpResponse('No tienes permisos', status=403)
     except Perfil.DoesNotExist:
@@ -1248,7 +1249,7 @@ def exportar_excel_servicios(request):
 def exportar_excel_planes_tratamiento(request):
     """Exporta todos los planes de tratamiento a Excel con diseño turquesa"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             return HttpResponse('No tienes permisos', status=403)
     except Perfil.DoesNotExist:
@@ -1267,7 +1268,7 @@ def exportar_excel_planes_tratamiento(request):
         headers = ['ID', 'Nombre', 'Cliente', 'Dentista', 'Estado', 'Presupuesto Total', 'Descuento', 'Precio Final', 'Progreso %', 'Fecha Creación']
         fila_actual, border = _aplicar_estilo_turquesa(ws, fila_datos, headers)
         
-        planes = PlanTratamiento.objects.select_related('cliente', 'dentista').order_by('-creado_el')
+        planes = PlanTratamiento.objects.con_resumen().select_related('cliente', 'dentista').order_by('-creado_el')
         
         for plan in planes:
             try:
@@ -1315,7 +1316,7 @@ def exportar_excel_planes_tratamiento(request):
 def estadisticas(request):
     """Vista de Estadísticas con dashboards y gráficos importantes para administradores"""
     try:
-        perfil = Perfil.objects.get(user=request.user)
+        perfil = obtener_perfil(request)
         if not perfil.es_administrativo():
             messages.error(request, 'No tienes permisos para acceder a las estadísticas.')
             return redirect('panel_trabajador')
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-18 21:54
+
+import citas.almacenamiento
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('comunicacion', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='mensaje',
+            name='archivo_adjunto',
+            field=models.FileField(blank=True, null=True, storage=citas.almacenamiento.almacenamiento_clinico, upload_to='mensajes/archivos/%Y/%m/', verbose_name='Archivo Adjunto'),
+        ),
+    ]
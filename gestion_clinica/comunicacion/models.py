@@ -2,6 +2,7 @@ from django.db import models
 from personal.models import Perfil
 from historial_clinico.models import Odontograma
 from pacientes.models import Cliente
+from citas.almacenamiento import almacenamiento_clinico
 from django.utils import timezone
 
 
@@ -32,7 +33,7 @@ class Mensaje(models.Model):
     cliente = models.ForeignKey(Cliente, on_delete=models.SET_NULL, null=True, blank=True, related_name='mensajes', verbose_name="Cliente Relacionado")
     
     # Archivo adjunto
-    archivo_adjunto = models.FileField(upload_to='mensajes/archivos/%Y/%m/', null=True, blank=True, verbose_name="Archivo Adjunto")
+    archivo_adjunto = models.FileField(upload_to='mensajes/archivos/%Y/%m/', storage=almacenamiento_clinico, null=True, blank=True, verbose_name="Archivo Adjunto")
     
     # Fechas
     fecha_envio = models.DateTimeField(auto_now_add=True, verbose_name="Fecha de Envío")
@@ -1,8 +1,21 @@
+import copy
+import time
+
 from django.db import models
+from django.core.cache import cache
 from django.core.validators import RegexValidator
 from personal.models import Perfil
 
 
+# Caché de InformacionClinica: copia local del proceso (evita ir a la caché compartida en
+# cada render) respaldada por la caché de Django (compartida entre workers).
+CLAVE_CACHE_INFO_CLINICA = 'configuracion:informacion_clinica'
+TTL_CACHE_INFO_CLINICA = 60 * 60
+# Tiempo que otros workers pueden seguir usando su copia local tras una edición
+TTL_LOCAL_INFO_CLINICA = 60
+_info_clinica_local = {'obj': None, 'expira': 0}
+
+
 # Información de Contacto de la Clínica
 class InformacionClinica(models.Model):
     """
@@ -63,6 +76,12 @@ class InformacionClinica(models.Model):
             instance = InformacionClinica.objects.first()
             self.pk = instance.pk
         super().save(*args, **kwargs)
+        InformacionClinica.invalidar_cache()
+    
+    def delete(self, *args, **kwargs):
+        resultado = super().delete(*args, **kwargs)
+        InformacionClinica.invalidar_cache()
+        return resultado
     
     @classmethod
     def obtener(cls):
@@ -79,6 +98,33 @@ class InformacionClinica(models.Model):
         )
         return obj
     
+    @classmethod
+    def obtener_cacheada(cls):
+        """
+        Versión de solo lectura de obtener() para context processors, mensajes y PDFs.
+        Usa la copia local del proceso y, si expiró, la caché de Django; solo consulta
+        la base de datos cuando ninguna de las dos la tiene.
+        Para editar la información usar obtener().
+        """
+        ahora = time.monotonic()
+        obj = _info_clinica_local['obj']
+        if obj is None or ahora >= _info_clinica_local['expira']:
+            obj = cache.get(CLAVE_CACHE_INFO_CLINICA)
+            if obj is None:
+                obj = cls.obtener()
+                cache.set(CLAVE_CACHE_INFO_CLINICA, obj, TTL_CACHE_INFO_CLINICA)
+            _info_clinica_local['obj'] = obj
+            _info_clinica_local['expira'] = ahora + TTL_LOCAL_INFO_CLINICA
+        # Copia para que un llamador no modifique la instancia compartida
+        return copy.copy(obj)
+    
+    @classmethod
+    def invalidar_cache(cls):
+        """Descarta la información cacheada (se llama al guardar o eliminar)"""
+        _info_clinica_local['obj'] = None
+        _info_clinica_local['expira'] = 0
+        cache.delete(CLAVE_CACHE_INFO_CLINICA)
+    
     def __str__(self):
         return f"Información de Contacto - {self.nombre_clinica}"
     
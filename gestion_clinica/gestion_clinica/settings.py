@@ -4,6 +4,7 @@ Django settings for gestion_clinica project.
 
 from pathlib import Path
 import os
+import tempfile
 from decouple import config, Csv
 import dj_database_url
 
@@ -45,6 +46,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'personal.middleware.PerfilMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -69,6 +71,8 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'gestion_clinica.wsgi.application'
+# En producción se sirve por ASGI (start.sh / Procfile) para las vistas asíncronas de eventos
+ASGI_APPLICATION = 'gestion_clinica.asgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
@@ -105,6 +109,17 @@ else:
             }
         }
 
+# Caché
+# gunicorn corre con varios workers: la caché debe ser compartida entre procesos para que
+# las invalidaciones (p.ej. versión del perfil en sesión) lleguen a todos. Por defecto se
+# usa una caché en disco; en producción puede apuntarse a Redis/Memcached con CACHE_BACKEND.
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': config('CACHE_LOCATION', default=os.path.join(tempfile.gettempdir(), 'gestion_clinica_cache')),
+    }
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 AUTH_PASSWORD_VALIDATORS = [
@@ -141,6 +156,23 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Archivos clínicos (radiografías, PDFs, adjuntos) deduplicados por contenido, ver citas/almacenamiento.py
+ALMACENAMIENTO_DEDUPLICADO = config('ALMACENAMIENTO_DEDUPLICADO', default=True, cast=bool)
+
+# Derivadas de radiografías (miniatura / vista previa / web), ver historial_clinico/derivadas_radiografia.py
+# Con RADIOGRAFIAS_DERIVADAS_SINCRONO=True se generan dentro del request (útil en desarrollo)
+RADIOGRAFIAS_DERIVADAS_WORKERS = config('RADIOGRAFIAS_DERIVADAS_WORKERS', default=2, cast=int)
+RADIOGRAFIAS_DERIVADAS_SINCRONO = config('RADIOGRAFIAS_DERIVADAS_SINCRONO', default=False, cast=bool)
+
+# Caché de PDFs exportados (odontograma, presupuesto, consentimiento, inventario), ver citas/cache_pdf.py
+PDF_CACHE_ACTIVO = config('PDF_CACHE_ACTIVO', default=True, cast=bool)
+PDF_CACHE_DIR = config('PDF_CACHE_DIR', default=os.path.join(tempfile.gettempdir(), 'gestion_clinica_pdf'))
+
+# Lotes de documentos PDF, ver citas/lotes_documentos.py (0 = según CPUs, hasta 4 procesos)
+# Con LOTES_DOCUMENTOS_SINCRONO=True el lote se procesa dentro del request (útil en desarrollo)
+LOTES_DOCUMENTOS_PROCESOS = config('LOTES_DOCUMENTOS_PROCESOS', default=0, cast=int)
+LOTES_DOCUMENTOS_SINCRONO = config('LOTES_DOCUMENTOS_SINCRONO', default=False, cast=bool)
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
@@ -0,0 +1,306 @@
+"""
+Anotaciones vectoriales de las radiografías.
+
+Las anotaciones se guardan como una capa JSON en Radiografia.anotaciones:
+
+    {'elementos': {<id>: {'id': ..., 'tipo': 'trazo', 'color': '#ff0000', 'grosor': 0.004,
+                          'puntos': [[x, y], ...]}, ...}}
+
+Las coordenadas y el grosor están normalizados (0-1) respecto del ancho/alto de la imagen,
+así la misma capa sirve para el original, la vista previa o la versión web. Tipos:
+
+- trazo:               puntos
+- linea / flecha:      desde [x, y], hasta [x, y]
+- rectangulo / elipse: desde [x, y], hasta [x, y] (esquinas opuestas)
+- texto:               desde [x, y], texto, tamano (alto de letra normalizado)
+
+El visualizador envía solo los elementos nuevos o modificados y los ids eliminados junto
+con la versión sobre la que trabajó (control optimista: si otra pestaña guardó antes,
+se responde con la capa vigente). La imagen aplanada (imagen_anotada) se genera solo al
+pedirla (correo, portal del paciente) y se reutiliza mientras la versión no cambie.
+"""
+import logging
+import re
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+TIPOS_ELEMENTO = {'trazo', 'linea', 'flecha', 'rectangulo', 'elipse', 'texto'}
+MAX_ELEMENTOS = 2000
+MAX_PUNTOS_TRAZO = 5000
+MAX_TEXTO = 200
+GROSOR_POR_DEFECTO = 0.003
+
+_COLOR_RE = re.compile(r'^#[0-9a-fA-F]{6}$')
+_ID_RE = re.compile(r'^[\w\-]{1,64}$')
+
+
+class ConflictoAnotaciones(Exception):
+    """La versión enviada no es la vigente (otra sesión guardó cambios)"""
+
+    def __init__(self, version, elementos):
+        super().__init__('Las anotaciones fueron modificadas en otra sesión.')
+        self.version = version
+        self.elementos = elementos
+
+
+def _punto(valor):
+    if not isinstance(valor, (list, tuple)) or len(valor) != 2:
+        raise ValueError('Punto inválido.')
+    x, y = float(valor[0]), float(valor[1])
+    if not (-0.5 <= x <= 1.5 and -0.5 <= y <= 1.5):
+        raise ValueError('Punto fuera de la imagen.')
+    return [round(x, 5), round(y, 5)]
+
+
+def validar_elemento(datos):
+    """Devuelve una copia limpia del elemento o lanza ValueError"""
+    if not isinstance(datos, dict):
+        raise ValueError('Elemento inválido.')
+    id_elemento = str(datos.get('id', ''))
+    if not _ID_RE.match(id_elemento):
+        raise ValueError('Identificador de elemento inválido.')
+    tipo = datos.get('tipo')
+    if tipo not in TIPOS_ELEMENTO:
+        raise ValueError(f'Tipo de anotación no soportado: {tipo}')
+    color = datos.get('color') or '#ff0000'
+    if not _COLOR_RE.match(color):
+        raise ValueError('Color inválido.')
+    grosor = float(datos.get('grosor') or GROSOR_POR_DEFECTO)
+    if not 0 < grosor <= 0.1:
+        raise ValueError('Grosor inválido.')
+
+    elemento = {'id': id_elemento, 'tipo': tipo, 'color': color, 'grosor': round(grosor, 5)}
+    if tipo == 'trazo':
+        puntos = datos.get('puntos') or []
+        if not 1 <= len(puntos) <= MAX_PUNTOS_TRAZO:
+            raise ValueError('El trazo no tiene una cantidad de puntos válida.')
+        elemento['puntos'] = [_punto(p) for p in puntos]
+    else:
+        elemento['desde'] = _punto(datos.get('desde'))
+        if tipo == 'texto':
+            texto = str(datos.get('texto') or '').strip()
+            if not texto or len(texto) > MAX_TEXTO:
+                raise ValueError('El texto de la etiqueta es inválido.')
+            elemento['texto'] = texto
+            tamano = float(datos.get('tamano') or 0.03)
+            if not 0 < tamano <= 0.5:
+                raise ValueError('Tamaño de texto inválido.')
+            elemento['tamano'] = round(tamano, 5)
+        else:
+            elemento['hasta'] = _punto(datos.get('hasta'))
+    return elemento
+
+
+def serializar_anotaciones(radiografia):
+    """Capa vigente para el visualizador"""
+    elementos = (radiografia.anotaciones or {}).get('elementos') or {}
+    return {
+        'version': radiografia.anotaciones_version,
+        'elementos': list(elementos.values()),
+    }
+
+
+def aplicar_cambios_anotaciones(radiografia_id, version_base, cambios=(), eliminados=(), limpiar=False):
+    """
+    Aplica un guardado incremental y devuelve la nueva versión.
+    Lanza ConflictoAnotaciones si version_base no es la vigente y ValueError si algún
+    elemento es inválido. No modifica fecha_actualizacion ni la imagen anotada.
+    """
+    from .models import Radiografia
+
+    elementos_nuevos = [validar_elemento(datos) for datos in cambios]
+
+    with transaction.atomic():
+        radiografia = (
+            Radiografia.objects.select_for_update()
+            .only('id', 'anotaciones', 'anotaciones_version', 'imagen_anotada', 'imagen_anotada_version')
+            .get(pk=radiografia_id)
+        )
+        if version_base is not None and int(version_base) != radiografia.anotaciones_version:
+            raise ConflictoAnotaciones(radiografia.anotaciones_version, serializar_anotaciones(radiografia)['elementos'])
+
+        capa = dict(radiografia.anotaciones or {})
+        # La primera vez, una imagen anotada de antes de la capa vectorial pasa a ser el fondo
+        if radiografia.imagen_anotada and radiografia.imagen_anotada_version == 0 and 'fondo' not in capa:
+            capa['fondo'] = radiografia.imagen_anotada.name
+
+        elementos = {} if limpiar else dict(capa.get('elementos') or {})
+        for id_elemento in eliminados:
+            elementos.pop(str(id_elemento), None)
+        for elemento in elementos_nuevos:
+            elementos[elemento['id']] = elemento
+        if len(elementos) > MAX_ELEMENTOS:
+            raise ValueError(f'Se alcanzó el máximo de {MAX_ELEMENTOS} anotaciones por radiografía.')
+        capa['elementos'] = elementos
+
+        nueva_version = radiografia.anotaciones_version + 1
+        campos = {'anotaciones': capa, 'anotaciones_version': nueva_version}
+        if limpiar:
+            # Limpiar también descarta la imagen anotada antigua que servía de fondo
+            descartados = [capa.pop('fondo', None), radiografia.imagen_anotada.name if radiografia.imagen_anotada else None]
+            campos.update(imagen_anotada=None, imagen_anotada_version=0)
+            storage = radiografia.imagen_anotada.storage
+            transaction.on_commit(lambda: [storage.delete(nombre) for nombre in set(filter(None, descartados))])
+        Radiografia.objects.filter(pk=radiografia_id).update(**campos)
+    return nueva_version
+
+
+def limpiar_anotaciones(radiografia):
+    """
+    Descarta la capa y la imagen aplanada (p.ej. al reemplazar la imagen original).
+    Modifica la instancia; el llamador debe guardarla.
+    """
+    archivos = [(radiografia.anotaciones or {}).get('fondo')]
+    if radiografia.imagen_anotada:
+        archivos.append(radiografia.imagen_anotada.name)
+    storage = radiografia.imagen.storage
+    for nombre in filter(None, archivos):
+        try:
+            storage.delete(nombre)
+        except Exception as e:
+            logger.warning(f'No se pudo eliminar {nombre}: {e}')
+    radiografia.imagen_anotada = None
+    radiografia.anotaciones = {}
+    radiografia.anotaciones_version += 1
+    radiografia.imagen_anotada_version = 0
+
+
+def _imagen_base(radiografia):
+    """Fondo sobre el que se aplanan las anotaciones (derivada web si está al día)"""
+    fondo = (radiografia.anotaciones or {}).get('fondo')
+    if fondo and radiografia.imagen.storage.exists(fondo):
+        return radiografia.imagen.storage.open(fondo, 'rb')
+    if radiografia.imagen_web and radiografia.derivadas_vigentes():
+        return radiografia.imagen_web.open('rb')
+    return radiografia.imagen.open('rb')
+
+
+def _dibujar_elemento(draw, elemento, ancho, alto, fuentes):
+    from PIL import ImageFont
+
+    def px(punto):
+        return (punto[0] * ancho, punto[1] * alto)
+
+    color = elemento['color']
+    grosor = max(1, round(elemento.get('grosor', GROSOR_POR_DEFECTO) * ancho))
+    tipo = elemento['tipo']
+
+    if tipo == 'trazo':
+        puntos = [px(p) for p in elemento['puntos']]
+        if len(puntos) > 1:
+            draw.line(puntos, fill=color, width=grosor, joint='curve')
+        radio = grosor / 2
+        for x, y in (puntos[0], puntos[-1]):
+            draw.ellipse((x - radio, y - radio, x + radio, y + radio), fill=color)
+    elif tipo in ('linea', 'flecha'):
+        (x1, y1), (x2, y2) = px(elemento['desde']), px(elemento['hasta'])
+        draw.line((x1, y1, x2, y2), fill=color, width=grosor)
+        if tipo == 'flecha' and (x1, y1) != (x2, y2):
+            import math
+            angulo = math.atan2(y2 - y1, x2 - x1)
+            largo = grosor * 5
+            puntas = [
+                (x2 - largo * math.cos(angulo - math.pi / 6), y2 - largo * math.sin(angulo - math.pi / 6)),
+                (x2 - largo * math.cos(angulo + math.pi / 6), y2 - largo * math.sin(angulo + math.pi / 6)),
+            ]
+            draw.polygon([(x2, y2)] + puntas, fill=color)
+    elif tipo in ('rectangulo', 'elipse'):
+        (x1, y1), (x2, y2) = px(elemento['desde']), px(elemento['hasta'])
+        caja = (min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2))
+        if tipo == 'rectangulo':
+            draw.rectangle(caja, outline=color, width=grosor)
+        else:
+            draw.ellipse(caja, outline=color, width=grosor)
+    elif tipo == 'texto':
+        tamano = max(8, round(elemento.get('tamano', 0.03) * alto))
+        if tamano not in fuentes:
+            fuentes[tamano] = ImageFont.load_default(size=tamano)
+        draw.text(px(elemento['desde']), elemento['texto'], fill=color, font=fuentes[tamano],
+                  stroke_width=max(1, tamano // 12), stroke_fill='#000000')
+
+
+def renderizar_anotaciones(radiografia):
+    """PNG (bytes) con la capa de anotaciones aplanada sobre la radiografía"""
+    from PIL import Image, ImageDraw, ImageOps
+
+    with _imagen_base(radiografia) as archivo:
+        with Image.open(archivo) as imagen:
+            imagen = ImageOps.exif_transpose(imagen)
+            if imagen.mode in ('I;16', 'I;16B', 'I;16L', 'I', 'F'):
+                from .derivadas_radiografia import _normalizar_modo
+                imagen = _normalizar_modo(imagen)
+            lienzo = imagen.convert('RGB')
+
+    draw = ImageDraw.Draw(lienzo)
+    fuentes = {}
+    for elemento in ((radiografia.anotaciones or {}).get('elementos') or {}).values():
+        try:
+            _dibujar_elemento(draw, elemento, lienzo.width, lienzo.height, fuentes)
+        except Exception as e:
+            logger.warning(f'Anotación {elemento.get("id")} de la radiografía {radiografia.pk} no se pudo dibujar: {e}')
+
+    buffer = BytesIO()
+    lienzo.save(buffer, format='PNG', optimize=True)
+    return buffer.getvalue()
+
+
+def imagen_anotada_vigente(radiografia):
+    """
+    Imagen anotada (FieldFile) ya generada para la capa vigente, sin generarla.
+    Devuelve None si no hay anotaciones o si la imagen aplanada quedó atrás.
+    """
+    capa = radiografia.anotaciones or {}
+    if not capa.get('elementos') and not capa.get('fondo'):
+        # Sin capa vectorial: solo puede existir una imagen anotada antigua
+        if radiografia.imagen_anotada and radiografia.imagen_anotada_version == 0:
+            return radiografia.imagen_anotada
+        return None
+    if radiografia.imagen_anotada and radiografia.imagen_anotada_version == radiografia.anotaciones_version:
+        return radiografia.imagen_anotada
+    return None
+
+
+def obtener_imagen_anotada(radiografia):
+    """
+    Imagen anotada (FieldFile) al día con la capa vigente, generándola si hace falta.
+    Devuelve None si la radiografía no tiene anotaciones.
+    """
+    from .models import Radiografia
+
+    vigente = imagen_anotada_vigente(radiografia)
+    if vigente or not radiografia.tiene_anotaciones:
+        return vigente
+
+    capa = radiografia.anotaciones or {}
+    version = radiografia.anotaciones_version
+    contenido = renderizar_anotaciones(radiografia)
+    anterior = radiografia.imagen_anotada.name if radiografia.imagen_anotada else None
+    campo = radiografia.imagen_anotada
+    nombre = campo.field.generate_filename(radiografia, f'radiografia_{radiografia.pk}_anotada_v{version}.png')
+    nombre = campo.storage.save(nombre, ContentFile(contenido))
+
+    actualizadas = Radiografia.objects.filter(pk=radiografia.pk, anotaciones_version=version).update(
+        imagen_anotada=nombre, imagen_anotada_version=version
+    )
+    if not actualizadas:
+        # La capa cambió mientras se renderizaba: el archivo recién guardado no lo
+        # referencia nadie. Se borra y se vuelve a pedir con la capa nueva.
+        try:
+            campo.storage.delete(nombre)
+        except Exception:
+            pass
+        radiografia.refresh_from_db(fields=['anotaciones', 'anotaciones_version', 'imagen_anotada', 'imagen_anotada_version'])
+        return obtener_imagen_anotada(radiografia)
+    radiografia.imagen_anotada = nombre
+    radiografia.imagen_anotada_version = version
+    if anterior and anterior != capa.get('fondo'):
+        try:
+            campo.storage.delete(anterior)
+        except Exception:
+            pass
+    return radiografia.imagen_anotada
+
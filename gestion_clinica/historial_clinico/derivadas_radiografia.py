@@ -0,0 +1,221 @@
+"""
+Generación de versiones derivadas de las radiografías.
+
+Cada radiografía subida se guarda tal cual (puede ser un TIFF/PNG de decenas de MB) y
+a partir de ella se generan tres versiones JPEG:
+
+- miniatura:    lado mayor de MINIATURA_LADO px, para las grillas y listados
+- vista_previa: lado mayor de VISTA_PREVIA_LADO px, para el visualizador
+- web:          resolución completa (hasta WEB_LADO_MAXIMO px), JPEG progresivo
+
+Las derivadas se generan en segundo plano (un pool de hilos del propio proceso) una vez
+confirmada la transacción que guardó la radiografía, así la subida no espera a Pillow.
+Si el proceso se reinicia antes de terminar, la radiografía queda en 'pendiente' o
+'procesando' y el comando `generar_derivadas_radiografias` la completa.
+
+Mientras las derivadas no estén listas, Radiografia.url_miniatura (y compañía) devuelven
+la URL de la imagen original.
+"""
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
+
+MINIATURA_LADO = 320
+VISTA_PREVIA_LADO = 1600
+WEB_LADO_MAXIMO = 4096
+
+# (variante, campo del modelo, lado máximo, calidad JPEG)
+VARIANTES = (
+    ('web', 'imagen_web', WEB_LADO_MAXIMO, 85),
+    ('vista_previa', 'imagen_vista_previa', VISTA_PREVIA_LADO, 82),
+    ('miniatura', 'imagen_miniatura', MINIATURA_LADO, 75),
+)
+
+CAMPOS_DERIVADAS = [campo for _, campo, _, _ in VARIANTES]
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _obtener_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'RADIOGRAFIAS_DERIVADAS_WORKERS', 2),
+                thread_name_prefix='derivadas-radiografia',
+            )
+        return _executor
+
+
+def _normalizar_modo(imagen):
+    """Convierte la imagen a 'L' (escala de grises) o 'RGB' para guardarla como JPEG"""
+    from PIL import Image
+
+    if imagen.mode in ('I;16', 'I;16B', 'I;16L', 'I', 'F'):
+        # Radiografías de 16 bits: reescalar el rango real de la imagen a 0-255
+        if imagen.mode != 'F':
+            imagen = imagen.convert('I')
+        minimo, maximo = imagen.getextrema()
+        if maximo <= minimo:
+            return Image.new('L', imagen.size, 0)
+        escala = 255.0 / (maximo - minimo)
+        return imagen.point(lambda valor: (valor - minimo) * escala).convert('L')
+    if imagen.mode == '1':
+        return imagen.convert('L')
+    if imagen.mode in ('LA', 'RGBA', 'PA') or (imagen.mode == 'P' and 'transparency' in imagen.info):
+        fondo = Image.new('RGB', imagen.size, (255, 255, 255))
+        fondo.paste(imagen.convert('RGBA'), mask=imagen.convert('RGBA').getchannel('A'))
+        return fondo
+    if imagen.mode not in ('L', 'RGB'):
+        return imagen.convert('RGB')
+    return imagen
+
+
+def _reducir(imagen, lado_maximo):
+    if max(imagen.size) <= lado_maximo:
+        return imagen
+    from PIL import Image
+    copia = imagen.copy()
+    copia.thumbnail((lado_maximo, lado_maximo), Image.LANCZOS, reducing_gap=3.0)
+    return copia
+
+
+def _codificar_jpeg(imagen, calidad):
+    buffer = BytesIO()
+    imagen.save(buffer, format='JPEG', quality=calidad, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+def construir_derivadas(archivo):
+    """
+    Genera las derivadas de una imagen (objeto tipo archivo abierto).
+    Devuelve ({'original': {...}}, [(variante, campo, bytes_jpeg, ancho, alto), ...]).
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(archivo) as imagen:
+        # En JPEGs grandes, draft() decodifica directamente a una escala reducida
+        if imagen.format == 'JPEG' and max(imagen.size) > WEB_LADO_MAXIMO * 2:
+            imagen.draft(imagen.mode, (WEB_LADO_MAXIMO, WEB_LADO_MAXIMO))
+        original = {'ancho': imagen.width, 'alto': imagen.height}
+        imagen = ImageOps.exif_transpose(imagen)
+        imagen = _normalizar_modo(imagen)
+
+        resultados = []
+        # Cada variante se reduce a partir de la anterior (más grande), no del original
+        actual = imagen
+        for variante, campo, lado_maximo, calidad in VARIANTES:
+            actual = _reducir(actual, lado_maximo)
+            contenido = _codificar_jpeg(actual, calidad)
+            resultados.append((variante, campo, contenido, actual.width, actual.height))
+    return {'original': original}, resultados
+
+
+def eliminar_derivadas(radiografia, guardar=False):
+    """Borra los archivos derivados de la radiografía (p.ej. al reemplazar la imagen)"""
+    for campo in CAMPOS_DERIVADAS:
+        archivo = getattr(radiografia, campo)
+        if archivo:
+            try:
+                archivo.delete(save=False)
+            except Exception as e:
+                logger.warning(f'No se pudo eliminar {campo} de la radiografía {radiografia.pk}: {e}')
+        setattr(radiografia, campo, None)
+    radiografia.derivadas_estado = 'pendiente'
+    radiografia.derivadas_info = {}
+    if guardar and radiografia.pk:
+        type(radiografia).objects.filter(pk=radiografia.pk).update(
+            derivadas_estado='pendiente', derivadas_info={},
+            **{campo: None for campo in CAMPOS_DERIVADAS}
+        )
+
+
+def generar_derivadas(radiografia_id, regenerar=False):
+    """
+    Genera y guarda las derivadas de una radiografía. Devuelve True si se generaron.
+    Los cambios se guardan con update() para no modificar fecha_actualizacion.
+    """
+    from .models import Radiografia
+
+    # Reclamar la radiografía: evita que dos hilos/procesos la generen a la vez
+    reclamadas = Radiografia.objects.filter(pk=radiografia_id).exclude(derivadas_estado='procesando')
+    if not regenerar:
+        reclamadas = reclamadas.exclude(derivadas_estado='lista')
+    if not reclamadas.update(derivadas_estado='procesando'):
+        return False
+
+    radiografia = Radiografia.objects.get(pk=radiografia_id)
+    if not radiografia.imagen:
+        Radiografia.objects.filter(pk=radiografia_id).update(derivadas_estado='error')
+        return False
+
+    origen = radiografia.imagen.name
+    anteriores = [getattr(radiografia, campo).name for campo in CAMPOS_DERIVADAS if getattr(radiografia, campo)]
+    try:
+        with radiografia.imagen.open('rb') as archivo:
+            info, resultados = construir_derivadas(archivo)
+
+        base = os.path.splitext(os.path.basename(origen))[0]
+        cambios = {}
+        for variante, campo, contenido, ancho, alto in resultados:
+            archivo_campo = getattr(radiografia, campo)
+            nombre = archivo_campo.field.generate_filename(radiografia, f'{base}_{variante}.jpg')
+            cambios[campo] = archivo_campo.storage.save(nombre, ContentFile(contenido))
+            info[variante] = {'ancho': ancho, 'alto': alto, 'bytes': len(contenido)}
+        info['origen'] = origen
+
+        # Si la imagen se reemplazó mientras se procesaba, descartar lo generado
+        actualizadas = Radiografia.objects.filter(pk=radiografia_id, imagen=origen).update(
+            derivadas_estado='lista', derivadas_info=info, **cambios
+        )
+        if not actualizadas:
+            for nombre in cambios.values():
+                radiografia.imagen.storage.delete(nombre)
+            return False
+    except Exception as e:
+        logger.error(f'Error generando derivadas de la radiografía {radiografia_id}: {e}')
+        Radiografia.objects.filter(pk=radiografia_id, derivadas_estado='procesando').update(derivadas_estado='error')
+        return False
+
+    for nombre in anteriores:
+        if nombre not in cambios.values():
+            try:
+                radiografia.imagen.storage.delete(nombre)
+            except Exception:
+                pass
+    return True
+
+
+def _generar_en_segundo_plano(radiografia_id):
+    close_old_connections()
+    try:
+        generar_derivadas(radiografia_id)
+    except Exception as e:
+        logger.error(f'Error en el worker de derivadas (radiografía {radiografia_id}): {e}')
+    finally:
+        close_old_connections()
+
+
+def encolar_derivadas(radiografia):
+    """
+    Programa la generación de derivadas cuando se confirme la transacción actual.
+    Llamar después de guardar una radiografía con imagen nueva.
+    """
+    radiografia_id = radiografia.pk
+
+    def _encolar():
+        if getattr(settings, 'RADIOGRAFIAS_DERIVADAS_SINCRONO', False):
+            generar_derivadas(radiografia_id)
+        else:
+            _obtener_executor().submit(_generar_en_segundo_plano, radiografia_id)
+
+    transaction.on_commit(_encolar)
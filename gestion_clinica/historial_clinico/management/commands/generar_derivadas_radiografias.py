@@ -0,0 +1,104 @@
+"""
+Comando de gestión para generar las derivadas (miniatura, vista previa y versión web)
+de las radiografías existentes.
+
+Las radiografías nuevas o con imagen reemplazada generan sus derivadas en segundo plano
+al guardarse; este comando cubre las subidas antes de existir las derivadas, las que
+fallaron ('error') y las que quedaron a medias si el servidor se reinició.
+
+Uso:
+    python manage.py generar_derivadas_radiografias
+    python manage.py generar_derivadas_radiografias --dry-run        # Solo mostrar cuántas faltan
+    python manage.py generar_derivadas_radiografias --regenerar      # Regenerar todas
+    python manage.py generar_derivadas_radiografias --ids 12 15 20   # Solo estas radiografías
+    python manage.py generar_derivadas_radiografias --lote 200       # Tamaño de lote
+"""
+
+from django.core.management.base import BaseCommand
+
+from historial_clinico.derivadas_radiografia import generar_derivadas
+from historial_clinico.models import Radiografia
+
+
+class Command(BaseCommand):
+    help = 'Genera las miniaturas, vistas previas y versiones web de las radiografías que no las tienen'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Solo mostrar qué radiografías se procesarían sin generar archivos',
+        )
+        parser.add_argument(
+            '--regenerar',
+            action='store_true',
+            help='Regenerar las derivadas de todas las radiografías, aunque estén al día',
+        )
+        parser.add_argument(
+            '--ids',
+            nargs='+',
+            type=int,
+            help='Procesar solo las radiografías con estos IDs',
+        )
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=200,
+            help='Número de radiografías leídas por lote (por defecto: 200)',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        regenerar = options['regenerar']
+        tamano_lote = max(options['lote'], 1)
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING('MODO DRY-RUN: No se generarán archivos\n'))
+
+        radiografias = Radiografia.objects.exclude(imagen='').exclude(imagen__isnull=True)
+        if options['ids']:
+            radiografias = radiografias.filter(id__in=options['ids'])
+
+        pendientes = []
+        ultimo_id = 0
+        while True:
+            lote = list(
+                radiografias.filter(id__gt=ultimo_id).order_by('id').values(
+                    'id', 'imagen', 'derivadas_estado', 'derivadas_info'
+                )[:tamano_lote]
+            )
+            if not lote:
+                break
+            ultimo_id = lote[-1]['id']
+            for fila in lote:
+                vigente = (
+                    fila['derivadas_estado'] == 'lista'
+                    and (fila['derivadas_info'] or {}).get('origen') == fila['imagen']
+                )
+                if regenerar or not vigente:
+                    pendientes.append(fila['id'])
+
+        self.stdout.write(f'Radiografías a procesar: {len(pendientes):,}')
+        if dry_run or not pendientes:
+            if not pendientes:
+                self.stdout.write(self.style.SUCCESS('✓ Todas las radiografías tienen sus derivadas al día.'))
+            return
+
+        # Lo que quedó en 'procesando' es de un worker que no terminó (el comando corre aparte)
+        Radiografia.objects.filter(id__in=pendientes, derivadas_estado='procesando').update(derivadas_estado='pendiente')
+
+        generadas, fallidas = 0, []
+        for indice, radiografia_id in enumerate(pendientes, start=1):
+            if generar_derivadas(radiografia_id, regenerar=True):
+                generadas += 1
+            else:
+                fallidas.append(radiografia_id)
+            if indice % 50 == 0:
+                self.stdout.write(f'  ... {indice}/{len(pendientes)}')
+
+        self.stdout.write('\n' + '=' * 60)
+        self.stdout.write('RESUMEN:')
+        self.stdout.write(self.style.SUCCESS(f'  - Derivadas generadas: {generadas}'))
+        if fallidas:
+            muestra = ', '.join(str(i) for i in fallidas[:20]) + (' ...' if len(fallidas) > 20 else '')
+            self.stdout.write(self.style.ERROR(f'  - Fallidas: {len(fallidas)} (IDs {muestra})'))
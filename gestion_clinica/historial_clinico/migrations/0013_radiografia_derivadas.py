@@ -0,0 +1,38 @@
+# Generated by Django 5.2.5 on 2026-10-18 21:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('historial_clinico', '0012_agregar_documento_firmado_fisico'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='radiografia',
+            name='derivadas_estado',
+            field=models.CharField(choices=[('pendiente', 'Pendiente'), ('procesando', 'Procesando'), ('lista', 'Lista'), ('error', 'Error')], default='pendiente', max_length=20, verbose_name='Estado de las Derivadas'),
+        ),
+        migrations.AddField(
+            model_name='radiografia',
+            name='derivadas_info',
+            field=models.JSONField(blank=True, default=dict, verbose_name='Dimensiones de las Derivadas'),
+        ),
+        migrations.AddField(
+            model_name='radiografia',
+            name='imagen_miniatura',
+            field=models.ImageField(blank=True, help_text='Miniatura para listados (se genera automáticamente)', null=True, upload_to='radiografias/derivadas/%Y/%m/%d/', verbose_name='Miniatura'),
+        ),
+        migrations.AddField(
+            model_name='radiografia',
+            name='imagen_vista_previa',
+            field=models.ImageField(blank=True, help_text='Versión de ~1600px para el visualizador (se genera automáticamente)', null=True, upload_to='radiografias/derivadas/%Y/%m/%d/', verbose_name='Vista Previa'),
+        ),
+        migrations.AddField(
+            model_name='radiografia',
+            name='imagen_web',
+            field=models.ImageField(blank=True, help_text='JPEG progresivo a resolución completa (se genera automáticamente)', null=True, upload_to='radiografias/derivadas/%Y/%m/%d/', verbose_name='Imagen Optimizada para Web'),
+        ),
+    ]
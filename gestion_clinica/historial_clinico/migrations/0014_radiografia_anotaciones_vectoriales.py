@@ -0,0 +1,28 @@
+# Generated by Django 5.2.5 on 2026-10-18 21:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('historial_clinico', '0013_radiografia_derivadas'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='radiografia',
+            name='anotaciones',
+            field=models.JSONField(blank=True, default=dict, help_text='Trazos, formas y etiquetas dibujados sobre la radiografía', verbose_name='Anotaciones'),
+        ),
+        migrations.AddField(
+            model_name='radiografia',
+            name='anotaciones_version',
+            field=models.PositiveIntegerField(default=0, verbose_name='Versión de las Anotaciones'),
+        ),
+        migrations.AddField(
+            model_name='radiografia',
+            name='imagen_anotada_version',
+            field=models.PositiveIntegerField(default=0, verbose_name='Versión de las Anotaciones en la Imagen Anotada'),
+        ),
+    ]
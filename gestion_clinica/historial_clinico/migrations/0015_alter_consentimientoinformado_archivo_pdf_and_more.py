@@ -0,0 +1,34 @@
+# Generated by Django 5.2.5 on 2026-10-18 21:54
+
+import citas.almacenamiento
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('historial_clinico', '0014_radiografia_anotaciones_vectoriales'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='consentimientoinformado',
+            name='archivo_pdf',
+            field=models.FileField(blank=True, null=True, storage=citas.almacenamiento.almacenamiento_clinico, upload_to='consentimientos/%Y/%m/%d/', verbose_name='Archivo PDF'),
+        ),
+        migrations.AlterField(
+            model_name='consentimientoinformado',
+            name='documento_firmado_fisico',
+            field=models.FileField(blank=True, help_text='Documento escaneado o fotografiado que demuestra la firma física del paciente (PDF o imagen)', null=True, storage=citas.almacenamiento.almacenamiento_clinico, upload_to='consentimientos/firmados/%Y/%m/%d/', verbose_name='Documento Firmado Físicamente'),
+        ),
+        migrations.AlterField(
+            model_name='documentocliente',
+            name='archivo_pdf',
+            field=models.FileField(blank=True, null=True, storage=citas.almacenamiento.almacenamiento_clinico, upload_to='documentos/%Y/%m/%d/', verbose_name='Archivo PDF'),
+        ),
+        migrations.AlterField(
+            model_name='radiografia',
+            name='imagen',
+            field=models.ImageField(storage=citas.almacenamiento.almacenamiento_clinico, upload_to='radiografias/%Y/%m/%d/', verbose_name='Imagen de la Radiografía'),
+        ),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 5.2.5 on 2026-10-18 21:58
+
+import json
+
+from django.db import migrations, models
+
+PREFIJO_LEGADO = 'Datos del odontograma interactivo: '
+TAMANO_LOTE = 500
+
+
+def convertir_observaciones_legado(apps, schema_editor):
+    """Pasa los datos serializados en observaciones a los campos caras/metadata"""
+    EstadoDiente = apps.get_model('historial_clinico', 'EstadoDiente')
+    lote = []
+    for diente in EstadoDiente.objects.filter(observaciones__startswith=PREFIJO_LEGADO).iterator():
+        try:
+            datos = json.loads(diente.observaciones[len(PREFIJO_LEGADO):])
+        except ValueError:
+            continue
+        if not isinstance(datos, dict):
+            continue
+        if 'caras' in datos:
+            diente.caras = datos['caras'] if isinstance(datos['caras'], dict) else {}
+            diente.metadata = datos.get('metadata') if isinstance(datos.get('metadata'), dict) else {}
+        else:
+            # Formato más antiguo: directamente el diccionario de caras
+            diente.caras = datos
+        diente.observaciones = None
+        lote.append(diente)
+        if len(lote) >= TAMANO_LOTE:
+            EstadoDiente.objects.bulk_update(lote, ['caras', 'metadata', 'observaciones'])
+            lote = []
+    if lote:
+        EstadoDiente.objects.bulk_update(lote, ['caras', 'metadata', 'observaciones'])
+
+
+def restaurar_observaciones_legado(apps, schema_editor):
+    EstadoDiente = apps.get_model('historial_clinico', 'EstadoDiente')
+    lote = []
+    for diente in EstadoDiente.objects.exclude(caras={}).filter(observaciones__isnull=True).iterator():
+        datos = {'caras': diente.caras}
+        if diente.metadata:
+            datos['metadata'] = diente.metadata
+        diente.observaciones = f'{PREFIJO_LEGADO}{json.dumps(datos)}'
+        lote.append(diente)
+        if len(lote) >= TAMANO_LOTE:
+            EstadoDiente.objects.bulk_update(lote, ['observaciones'])
+            lote = []
+    if lote:
+        EstadoDiente.objects.bulk_update(lote, ['observaciones'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('historial_clinico', '0015_alter_consentimientoinformado_archivo_pdf_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='estadodiente',
+            name='caras',
+            field=models.JSONField(blank=True, default=dict, verbose_name='Condición por Cara'),
+        ),
+        migrations.AddField(
+            model_name='estadodiente',
+            name='metadata',
+            field=models.JSONField(blank=True, default=dict, verbose_name='Diagnóstico y Procedimiento por Cara'),
+        ),
+        migrations.RunPython(convertir_observaciones_legado, restaurar_observaciones_legado),
+    ]
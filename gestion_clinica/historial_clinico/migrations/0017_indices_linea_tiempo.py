@@ -0,0 +1,32 @@
+# Generated by Django 5.2.5 on 2026-10-18 22:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0052_indices_linea_tiempo'),
+        ('historial_clinico', '0016_estadodiente_caras_metadata'),
+        ('pacientes', '0003_add_user_field_to_cliente'),
+        ('personal', '0002_alter_perfil_telefono'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='plantratamiento',
+            name='historial_c_cliente_dce87b_idx',
+        ),
+        migrations.AddIndex(
+            model_name='odontograma',
+            index=models.Index(fields=['cliente', '-fecha_creacion'], name='historial_c_cliente_afb131_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='plantratamiento',
+            index=models.Index(fields=['cliente', '-creado_el'], name='historial_c_cliente_db0af9_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='radiografia',
+            index=models.Index(fields=['cliente', '-fecha_carga'], name='historial_c_cliente_541f82_idx'),
+        ),
+    ]
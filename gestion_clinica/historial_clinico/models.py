@@ -1,7 +1,11 @@
+from decimal import Decimal
+
 from django.db import models
+from django.db.models.functions import Coalesce
 from pacientes.models import Cliente
 from personal.models import Perfil
 from citas.models import Cita
+from citas.almacenamiento import almacenamiento_clinico
 
 
 # Odontograma - Ficha odontológica
@@ -85,6 +89,10 @@ class Odontograma(models.Model):
         verbose_name = "Odontograma"
         verbose_name_plural = "Odontogramas"
         ordering = ['-fecha_creacion']
+        indexes = [
+            # Historial del cliente (perfil y línea de tiempo clínica)
+            models.Index(fields=['cliente', '-fecha_creacion']),
+        ]
 
 
 # Estado de cada diente en el odontograma
@@ -97,6 +105,10 @@ class EstadoDiente(models.Model):
     # Estado del diente
     estado = models.CharField(max_length=20, choices=Odontograma.ESTADO_DIENTE_CHOICES, default='sano')
     
+    # Datos del odontograma interactivo (ver historial_clinico/odontograma_datos.py)
+    caras = models.JSONField(default=dict, blank=True, verbose_name="Condición por Cara")
+    metadata = models.JSONField(default=dict, blank=True, verbose_name="Diagnóstico y Procedimiento por Cara")
+    
     # Información adicional
     observaciones = models.TextField(blank=True, null=True, verbose_name="Observaciones del Diente")
     fecha_tratamiento = models.DateField(blank=True, null=True, verbose_name="Fecha del Tratamiento")
@@ -183,6 +195,7 @@ class Radiografia(models.Model):
     )
     imagen = models.ImageField(
         upload_to='radiografias/%Y/%m/%d/', 
+        storage=almacenamiento_clinico,
         verbose_name="Imagen de la Radiografía"
     )
     # Imagen con anotaciones persistentes (guardada como imagen procesada)
@@ -193,11 +206,69 @@ class Radiografia(models.Model):
         verbose_name="Imagen con Anotaciones",
         help_text="Imagen con las anotaciones guardadas (se genera automáticamente)"
     )
+    # Capa vectorial de anotaciones (ver historial_clinico/anotaciones_radiografia.py).
+    # imagen_anotada pasa a ser la versión aplanada, que se genera solo cuando se necesita
+    anotaciones = models.JSONField(
+        default=dict,
+        blank=True,
+        verbose_name="Anotaciones",
+        help_text="Trazos, formas y etiquetas dibujados sobre la radiografía"
+    )
+    anotaciones_version = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Versión de las Anotaciones"
+    )
+    imagen_anotada_version = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Versión de las Anotaciones en la Imagen Anotada"
+    )
     descripcion = models.TextField(
         blank=True, 
         null=True, 
         verbose_name="Descripción"
     )
+    
+    # Versiones derivadas de la imagen original (ver historial_clinico/derivadas_radiografia.py)
+    ESTADO_DERIVADAS_CHOICES = (
+        ('pendiente', 'Pendiente'),
+        ('procesando', 'Procesando'),
+        ('lista', 'Lista'),
+        ('error', 'Error'),
+    )
+    imagen_miniatura = models.ImageField(
+        upload_to='radiografias/derivadas/%Y/%m/%d/',
+        blank=True,
+        null=True,
+        verbose_name="Miniatura",
+        help_text="Miniatura para listados (se genera automáticamente)"
+    )
+    imagen_vista_previa = models.ImageField(
+        upload_to='radiografias/derivadas/%Y/%m/%d/',
+        blank=True,
+        null=True,
+        verbose_name="Vista Previa",
+        help_text="Versión de ~1600px para el visualizador (se genera automáticamente)"
+    )
+    imagen_web = models.ImageField(
+        upload_to='radiografias/derivadas/%Y/%m/%d/',
+        blank=True,
+        null=True,
+        verbose_name="Imagen Optimizada para Web",
+        help_text="JPEG progresivo a resolución completa (se genera automáticamente)"
+    )
+    derivadas_estado = models.CharField(
+        max_length=20,
+        choices=ESTADO_DERIVADAS_CHOICES,
+        default='pendiente',
+        verbose_name="Estado de las Derivadas"
+    )
+    # {'origen': <nombre de la imagen original>, 'original': {'ancho', 'alto'},
+    #  'miniatura': {'ancho', 'alto', 'bytes'}, 'vista_previa': {...}, 'web': {...}}
+    derivadas_info = models.JSONField(
+        default=dict,
+        blank=True,
+        verbose_name="Dimensiones de las Derivadas"
+    )
     fecha_tomada = models.DateField(
         blank=True, 
         null=True, 
@@ -212,6 +283,41 @@ class Radiografia(models.Model):
     def __str__(self):
         return f"Radiografía {self.get_tipo_display()} - {self.paciente_nombre} ({self.fecha_carga.strftime('%d/%m/%Y')})"
     
+    @property
+    def tiene_anotaciones(self):
+        capa = self.anotaciones or {}
+        if capa.get('elementos') or capa.get('fondo'):
+            return True
+        # Imagen anotada de antes de la capa vectorial
+        return bool(self.imagen_anotada) and self.imagen_anotada_version == 0
+    
+    def derivadas_vigentes(self):
+        """True si las derivadas corresponden a la imagen original actual"""
+        return (
+            self.derivadas_estado == 'lista'
+            and bool(self.imagen)
+            and (self.derivadas_info or {}).get('origen') == self.imagen.name
+        )
+    
+    def _url_derivada(self, campo):
+        archivo = getattr(self, campo)
+        if archivo and self.derivadas_vigentes():
+            return archivo.url
+        return self.imagen.url if self.imagen else ''
+    
+    @property
+    def url_miniatura(self):
+        """URL de la miniatura, o de la imagen original si aún no se ha generado"""
+        return self._url_derivada('imagen_miniatura')
+    
+    @property
+    def url_vista_previa(self):
+        return self._url_derivada('imagen_vista_previa')
+    
+    @property
+    def url_web(self):
+        return self._url_derivada('imagen_web')
+    
     class Meta:
         verbose_name = "Radiografía"
         verbose_name_plural = "Radiografías"
@@ -220,6 +326,7 @@ class Radiografia(models.Model):
             models.Index(fields=['paciente_email']),
             models.Index(fields=['-fecha_carga']),
             models.Index(fields=['dentista']),
+            models.Index(fields=['cliente', '-fecha_carga']),
         ]
 
 
@@ -227,6 +334,48 @@ class Radiografia(models.Model):
 # PLANES DE TRATAMIENTO
 # ==========================================
 
+class PlanTratamientoQuerySet(models.QuerySet):
+    def con_resumen(self):
+        """
+        Anota el avance y los pagos de cada plan para las listas de planes.
+
+        Sin esto, cada plan de la lista hace sus propias consultas: progreso_porcentaje
+        (tres), total_citas, citas_completadas y total_pagado (que recorre las citas), y
+        saldo_pendiente / porcentaje_pagado vuelven a calcular total_pagado. Con las
+        anotaciones todo sale en la misma consulta de la lista y las propiedades las leen
+        si están presentes.
+
+        Se usan subconsultas (una por conteo) y no JOIN + Count sobre fases y citas a la
+        vez, porque el JOIN de dos relaciones inversas multiplica las filas y falsea los
+        conteos y la suma.
+        """
+        def contar(modelo, campo, **filtros):
+            subconsulta = modelo.objects.filter(**{campo: models.OuterRef('pk')}, **filtros).order_by().values(campo).annotate(
+                total=models.Count('pk'),
+            ).values('total')
+            return Coalesce(models.Subquery(subconsulta, output_field=models.IntegerField()), 0)
+
+        pagado = Cita.objects.filter(plan_tratamiento=models.OuterRef('pk')).order_by().values('plan_tratamiento').annotate(
+            total=models.Sum('precio_cobrado'),
+        ).values('total')
+        monto = models.DecimalField(max_digits=12, decimal_places=2)
+
+        return self.annotate(
+            resumen_total_fases=contar(FaseTratamiento, 'plan'),
+            resumen_fases_completadas=contar(FaseTratamiento, 'plan', completada=True),
+            resumen_total_citas=contar(Cita, 'plan_tratamiento'),
+            resumen_citas_completadas=contar(Cita, 'plan_tratamiento', estado='completada'),
+            resumen_total_pagado=Coalesce(models.Subquery(pagado, output_field=monto), models.Value(Decimal('0.00')), output_field=monto),
+        ).annotate(
+            # División entera, igual que progreso_porcentaje; permite ordenar por progreso
+            resumen_progreso=models.Case(
+                models.When(resumen_total_fases=0, then=models.Value(0)),
+                default=models.F('resumen_fases_completadas') * 100 / models.F('resumen_total_fases'),
+                output_field=models.IntegerField(),
+            ),
+        )
+
+
 class PlanTratamiento(models.Model):
     ESTADO_CHOICES = (
         ('borrador', 'Borrador'),
@@ -376,6 +525,8 @@ class PlanTratamiento(models.Model):
         help_text="Notas que pueden ser visibles para el paciente"
     )
     
+    objects = PlanTratamientoQuerySet.as_manager()
+    
     def save(self, *args, **kwargs):
         """Calcula el precio final automáticamente"""
         self.precio_final = self.presupuesto_total - self.descuento
@@ -384,23 +535,29 @@ class PlanTratamiento(models.Model):
     @property
     def progreso_porcentaje(self):
         """Calcula el porcentaje de progreso del plan"""
-        fases = self.fases.all()
-        if not fases.exists():
+        if hasattr(self, 'resumen_progreso'):
+            return self.resumen_progreso
+
+        conteo = self.fases.aggregate(
+            total=models.Count('id'),
+            completadas=models.Count('id', filter=models.Q(completada=True)),
+        )
+        if not conteo['total']:
             return 0
-        
-        fases_completadas = fases.filter(completada=True).count()
-        total_fases = fases.count()
-        
-        return int((fases_completadas / total_fases) * 100) if total_fases > 0 else 0
+        return conteo['completadas'] * 100 // conteo['total']
     
     @property
     def total_citas(self):
         """Retorna el total de citas vinculadas al plan"""
+        if hasattr(self, 'resumen_total_citas'):
+            return self.resumen_total_citas
         return self.citas.count()
     
     @property
     def citas_completadas(self):
         """Retorna el número de citas completadas"""
+        if hasattr(self, 'resumen_citas_completadas'):
+            return self.resumen_citas_completadas
         return self.citas.filter(estado='completada').count()
     
     def puede_ser_editado_por(self, perfil):
@@ -422,13 +579,9 @@ class PlanTratamiento(models.Model):
     @property
     def total_pagado(self):
         """Calcula el total pagado del tratamiento basado en precios de citas"""
-        from decimal import Decimal
-        total = Decimal('0.00')
-        # Sumar precios de todas las citas del tratamiento
-        for cita in self.citas.all():
-            if cita.precio_cobrado:
-                total += Decimal(str(cita.precio_cobrado))
-        return total
+        if hasattr(self, 'resumen_total_pagado'):
+            return self.resumen_total_pagado
+        return self.citas.aggregate(total=models.Sum('precio_cobrado'))['total'] or Decimal('0.00')
     
     @property
     def saldo_pendiente(self):
@@ -458,7 +611,7 @@ class PlanTratamiento(models.Model):
             models.Index(fields=['-creado_el']),
             models.Index(fields=['estado']),
             models.Index(fields=['dentista', 'estado']),
-            models.Index(fields=['cliente']),
+            models.Index(fields=['cliente', '-creado_el']),
         ]
 
 
@@ -703,6 +856,7 @@ class DocumentoCliente(models.Model):
     # Archivo PDF generado
     archivo_pdf = models.FileField(
         upload_to='documentos/%Y/%m/%d/',
+        storage=almacenamiento_clinico,
         blank=True,
         null=True,
         verbose_name="Archivo PDF"
@@ -1103,6 +1257,7 @@ class ConsentimientoInformado(models.Model):
     # Archivo PDF generado
     archivo_pdf = models.FileField(
         upload_to='consentimientos/%Y/%m/%d/',
+        storage=almacenamiento_clinico,
         blank=True,
         null=True,
         verbose_name="Archivo PDF"
@@ -1133,6 +1288,7 @@ class ConsentimientoInformado(models.Model):
     # Documento firmado físicamente (carga de archivo)
     documento_firmado_fisico = models.FileField(
         upload_to='consentimientos/firmados/%Y/%m/%d/',
+        storage=almacenamiento_clinico,
         blank=True,
         null=True,
         verbose_name="Documento Firmado Físicamente",
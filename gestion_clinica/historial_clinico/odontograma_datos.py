@@ -0,0 +1,129 @@
+"""
+Guardado de los datos del odontograma interactivo.
+
+El formulario de crear/editar odontograma envía dos campos ocultos en JSON:
+
+- odontograma_data:          {"11": {"oclusal": "caries", "mesial": "sano"}, ...}
+- odontograma_data_extended: {"11": {"oclusal": {"diagnostico": ..., "procedimiento": ...}}, ...}
+
+Cada diente se guarda en un EstadoDiente con la condición por cara en `caras` y el
+diagnóstico/procedimiento en `metadata` (JSONField), y el estado general del diente se
+deduce de sus caras. Antes estos datos se serializaban como texto en `observaciones`
+("Datos del odontograma interactivo: {...}") y había que volver a parsearlos en cada
+vista; la migración 0016 convirtió esos textos una sola vez.
+
+Guardar el odontograma completo son a lo sumo tres consultas (leer los dientes
+existentes, un bulk_create y un bulk_update) en vez de una o dos por diente.
+"""
+import json
+
+from django.db import transaction
+
+from .models import EstadoDiente
+
+# Condición de cara -> estado general del diente, en orden de prioridad
+PRIORIDAD_CONDICIONES = (
+    ('ausente', 'perdido'),
+    ('caries', 'cariado'),
+    ('obturado', 'obturado'),
+    ('corona', 'corona'),
+    ('endodoncia', 'endodoncia'),
+    ('protesis', 'protesis'),
+    ('implante', 'implante'),
+    ('fractura', 'cariado'),
+    ('sellante', 'obturado'),
+)
+
+
+def estado_general_desde_caras(caras):
+    """Estado del diente (Odontograma.ESTADO_DIENTE_CHOICES) según las condiciones de sus caras"""
+    condiciones = set(caras.values())
+    for condicion, estado in PRIORIDAD_CONDICIONES:
+        if condicion in condiciones:
+            if condicion == 'fractura' and 'extraccion' in condiciones:
+                return 'extraccion'
+            return estado
+    return 'sano'
+
+
+def leer_datos_formulario(datos_post):
+    """
+    Devuelve (dientes_data, extended_data) desde el POST. Lanza ValueError si
+    odontograma_data no es JSON válido; los datos extendidos son opcionales.
+    """
+    odontograma_data = datos_post.get('odontograma_data', '')
+    if not odontograma_data:
+        return {}, {}
+    dientes_data = json.loads(odontograma_data)
+    if not isinstance(dientes_data, dict):
+        raise ValueError('odontograma_data debe ser un objeto JSON')
+
+    extended_data = {}
+    odontograma_data_extended = datos_post.get('odontograma_data_extended', '')
+    if odontograma_data_extended:
+        try:
+            extended_data = json.loads(odontograma_data_extended)
+        except ValueError:
+            extended_data = {}
+    if not isinstance(extended_data, dict):
+        extended_data = {}
+    return dientes_data, extended_data
+
+
+def guardar_dientes_odontograma(odontograma, dientes_data, extended_data=None, nuevo=False):
+    """
+    Crea o actualiza los EstadoDiente del odontograma a partir de los datos del
+    formulario. Con `nuevo=True` (odontograma recién creado) no se consultan los
+    dientes existentes. Al editar, un diente sin datos extendidos conserva su metadata.
+
+    Devuelve (creados, actualizados).
+    """
+    extended_data = extended_data or {}
+    dientes = {}
+    for numero, caras in dientes_data.items():
+        if not isinstance(caras, dict):
+            raise ValueError(f'Datos inválidos para el diente {numero}')
+        dientes[int(numero)] = (caras, extended_data.get(str(numero)))
+
+    with transaction.atomic():
+        existentes = {}
+        if not nuevo:
+            existentes = {
+                diente.numero_diente: diente
+                for diente in EstadoDiente.objects.filter(odontograma=odontograma, numero_diente__in=dientes)
+            }
+
+        por_crear = []
+        por_actualizar = []
+        for numero, (caras, metadata) in dientes.items():
+            estado = estado_general_desde_caras(caras)
+            diente = existentes.get(numero)
+            if diente is None:
+                por_crear.append(EstadoDiente(
+                    odontograma=odontograma,
+                    numero_diente=numero,
+                    estado=estado,
+                    caras=caras,
+                    metadata=metadata or {},
+                ))
+            else:
+                diente.estado = estado
+                diente.caras = caras
+                if metadata is not None:
+                    diente.metadata = metadata
+                por_actualizar.append(diente)
+
+        if por_crear:
+            EstadoDiente.objects.bulk_create(por_crear)
+        if por_actualizar:
+            EstadoDiente.objects.bulk_update(por_actualizar, ['estado', 'caras', 'metadata'])
+
+    return len(por_crear), len(por_actualizar)
+
+
+def dientes_para_plantilla(dientes):
+    """{numero: {'estado', 'caras'}} para pasar a las plantillas con json_script"""
+    return {
+        str(diente.numero_diente): {'estado': diente.estado, 'caras': diente.caras}
+        for diente in dientes
+    }
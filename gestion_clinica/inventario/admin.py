@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Insumo, MovimientoInsumo
+from .models import Insumo, LoteInsumo, MovimientoInsumo
 
 
 @admin.register(Insumo)
@@ -10,9 +10,18 @@ class InsumoAdmin(admin.ModelAdmin):
     readonly_fields = ['creado_el', 'actualizado_el']
 
 
+@admin.register(LoteInsumo)
+class LoteInsumoAdmin(admin.ModelAdmin):
+    list_display = ['insumo', 'codigo', 'cantidad', 'fecha_vencimiento', 'creado_el']
+    list_filter = ['fecha_vencimiento', 'insumo__categoria']
+    search_fields = ['insumo__nombre', 'codigo']
+    # La cantidad de un lote solo cambia con movimientos de stock (inventario/stock.py)
+    readonly_fields = ['cantidad', 'creado_el']
+
+
 @admin.register(MovimientoInsumo)
 class MovimientoInsumoAdmin(admin.ModelAdmin):
-    list_display = ['insumo', 'tipo', 'cantidad', 'cantidad_anterior', 'cantidad_nueva', 'realizado_por', 'fecha_movimiento']
+    list_display = ['insumo', 'lote', 'tipo', 'cantidad', 'cantidad_anterior', 'cantidad_nueva', 'realizado_por', 'fecha_movimiento']
     list_filter = ['tipo', 'fecha_movimiento', 'realizado_por']
     search_fields = ['insumo__nombre', 'motivo']
     readonly_fields = ['fecha_movimiento']
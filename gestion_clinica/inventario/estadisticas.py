@@ -0,0 +1,61 @@
+"""
+Estadísticas del gestor de inventario unificado.
+
+La vista hacía unas quince consultas count() independientes para las tarjetas de
+estadísticas (total de insumos, stock bajo, próximos a vencer, agotados, proveedores
+activos, proveedores con insumos con un JOIN + DISTINCT, cuatro conteos de pedidos por
+estado, ...), cada una recorriendo la tabla completa.
+
+Aquí cada tabla se cuenta una sola vez con agregación condicional: un aggregate() con
+un Count(filter=...) por tarjeta, que la base de datos resuelve en una sola pasada.
+Los proveedores con insumos se cuentan con un EXISTS correlacionado en vez del JOIN
+con DISTINCT.
+
+Las claves de los diccionarios son las mismas que usan las plantillas de las secciones.
+"""
+from datetime import timedelta
+
+from django.db.models import Count, Exists, F, OuterRef, Q
+from django.utils import timezone
+
+from proveedores.models import Pedido, Proveedor, SolicitudInsumo
+
+from .models import Insumo
+
+# Días hacia adelante para la tarjeta "próximos a vencer"
+DIAS_PROXIMO_VENCIMIENTO = 30
+
+
+def estadisticas_insumos(hoy=None):
+    hoy = hoy or timezone.localdate()
+    return Insumo.objects.aggregate(
+        total_insumos=Count('id'),
+        insumos_stock_bajo=Count('id', filter=Q(cantidad_actual__lte=F('cantidad_minima'))),
+        insumos_proximo_vencimiento=Count('id', filter=Q(
+            fecha_vencimiento__gte=hoy,
+            fecha_vencimiento__lte=hoy + timedelta(days=DIAS_PROXIMO_VENCIMIENTO),
+        )),
+        insumos_agotados=Count('id', filter=Q(estado='agotado')),
+    )
+
+
+def estadisticas_proveedores():
+    """Tarjetas de proveedores; las solicitudes pendientes son una consulta aparte (otra tabla)"""
+    estadisticas = Proveedor.objects.aggregate(
+        total_proveedores=Count('id'),
+        proveedores_activos=Count('id', filter=Q(activo=True)),
+        proveedores_con_insumos=Count('id', filter=Q(
+            Exists(Insumo.objects.filter(proveedor_principal=OuterRef('pk')))
+        )),
+    )
+    estadisticas['solicitudes_pendientes'] = SolicitudInsumo.objects.filter(estado='enviada').count()
+    return estadisticas
+
+
+def estadisticas_pedidos():
+    return Pedido.objects.aggregate(
+        total_pedidos=Count('id'),
+        pedidos_pendientes=Count('id', filter=Q(estado__in=['borrador', 'pendiente'])),
+        pedidos_enviados=Count('id', filter=Q(estado='enviado')),
+        pedidos_recibidos=Count('id', filter=Q(estado='recibido')),
+    )
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-18 21:54
+
+import citas.almacenamiento
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventario', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='insumo',
+            name='imagen',
+            field=models.ImageField(blank=True, null=True, storage=citas.almacenamiento.almacenamiento_clinico, upload_to='insumos/imagenes/', verbose_name='Imagen del Insumo'),
+        ),
+    ]
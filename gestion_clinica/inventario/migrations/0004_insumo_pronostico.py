@@ -0,0 +1,28 @@
+# Generated by Django 5.2.5 on 2026-10-18 22:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventario', '0003_alter_insumo_imagen'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='insumo',
+            name='consumo_diario',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True, verbose_name='Consumo Diario Estimado'),
+        ),
+        migrations.AddField(
+            model_name='insumo',
+            name='dias_para_agotarse',
+            field=models.PositiveIntegerField(blank=True, help_text='Vacío si el stock alcanza para todo el horizonte del pronóstico', null=True, verbose_name='Días para Agotarse'),
+        ),
+        migrations.AddField(
+            model_name='insumo',
+            name='pronostico_actualizado_el',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.5 on 2026-10-18 22:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def crear_lotes_iniciales(apps, schema_editor):
+    """El stock existente queda en un lote sin código con el vencimiento que tenía el insumo"""
+    Insumo = apps.get_model('inventario', 'Insumo')
+    LoteInsumo = apps.get_model('inventario', 'LoteInsumo')
+    LoteInsumo.objects.bulk_create(
+        [
+            LoteInsumo(insumo_id=insumo_id, cantidad=cantidad, fecha_vencimiento=fecha_vencimiento)
+            for insumo_id, cantidad, fecha_vencimiento in Insumo.objects.filter(cantidad_actual__gt=0)
+            .values_list('id', 'cantidad_actual', 'fecha_vencimiento').iterator()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventario', '0004_insumo_pronostico'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LoteInsumo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('codigo', models.CharField(blank=True, default='', help_text='Vacío para el stock sin lote informado', max_length=100, verbose_name='Código de Lote')),
+                ('cantidad', models.PositiveIntegerField(default=0, verbose_name='Cantidad en Stock')),
+                ('fecha_vencimiento', models.DateField(blank=True, null=True, verbose_name='Fecha de Vencimiento')),
+                ('creado_el', models.DateTimeField(auto_now_add=True)),
+                ('insumo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lotes', to='inventario.insumo')),
+            ],
+            options={
+                'verbose_name': 'Lote de Insumo',
+                'verbose_name_plural': 'Lotes de Insumos',
+                'ordering': ['insumo', 'fecha_vencimiento', 'id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='movimientoinsumo',
+            name='lote',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='movimientos', to='inventario.loteinsumo'),
+        ),
+        migrations.AddIndex(
+            model_name='loteinsumo',
+            index=models.Index(fields=['insumo', 'fecha_vencimiento', 'id'], name='lote_insumo_fefo_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loteinsumo',
+            index=models.Index(condition=models.Q(('cantidad__gt', 0)), fields=['fecha_vencimiento'], name='lote_vencimiento_idx'),
+        ),
+        migrations.RunPython(crear_lotes_iniciales, migrations.RunPython.noop),
+    ]
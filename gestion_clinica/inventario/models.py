@@ -1,5 +1,6 @@
 from django.db import models
 from personal.models import Perfil
+from citas.almacenamiento import almacenamiento_clinico
 from datetime import date, timedelta
 
 
@@ -23,18 +24,24 @@ class Insumo(models.Model):
     nombre = models.CharField(max_length=200)
     categoria = models.CharField(max_length=20, choices=CATEGORIA_CHOICES)
     descripcion = models.TextField(blank=True, null=True)
-    imagen = models.ImageField(upload_to='insumos/imagenes/', null=True, blank=True, verbose_name="Imagen del Insumo")
+    imagen = models.ImageField(upload_to='insumos/imagenes/', storage=almacenamiento_clinico, null=True, blank=True, verbose_name="Imagen del Insumo")
     cantidad_actual = models.PositiveIntegerField(default=0)
     cantidad_minima = models.PositiveIntegerField(default=1)
     unidad_medida = models.CharField(max_length=50, default='unidad')
     precio_unitario = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     proveedor_principal = models.ForeignKey('proveedores.Proveedor', on_delete=models.SET_NULL, null=True, blank=True, related_name='insumos_principales', verbose_name="Proveedor Principal")
     proveedor_texto = models.CharField(max_length=200, blank=True, null=True, verbose_name="Proveedor (Texto Legacy)")
+    # Con lotes, es el vencimiento más próximo entre los lotes con stock (lo mantiene inventario/stock.py)
     fecha_vencimiento = models.DateField(null=True, blank=True)
     estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='disponible')
     ubicacion = models.CharField(max_length=100, blank=True, null=True)
     notas = models.TextField(blank=True, null=True)
-    
+
+    # Pronóstico de consumo (lo actualiza cada noche el comando pronosticar_insumos, ver inventario/pronostico.py)
+    consumo_diario = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, verbose_name="Consumo Diario Estimado")
+    dias_para_agotarse = models.PositiveIntegerField(null=True, blank=True, verbose_name="Días para Agotarse", help_text="Vacío si el stock alcanza para todo el horizonte del pronóstico")
+    pronostico_actualizado_el = models.DateTimeField(null=True, blank=True)
+
     # Campos de auditoría
     creado_el = models.DateTimeField(auto_now_add=True)
     actualizado_el = models.DateTimeField(auto_now=True)
@@ -61,6 +68,35 @@ class Insumo(models.Model):
         ordering = ['nombre']
 
 
+# Lotes de un insumo (cada compra puede tener un vencimiento distinto)
+class LoteInsumo(models.Model):
+    insumo = models.ForeignKey(Insumo, on_delete=models.CASCADE, related_name='lotes')
+    codigo = models.CharField(max_length=100, blank=True, default='', verbose_name="Código de Lote", help_text="Vacío para el stock sin lote informado")
+    cantidad = models.PositiveIntegerField(default=0, verbose_name="Cantidad en Stock")
+    fecha_vencimiento = models.DateField(null=True, blank=True, verbose_name="Fecha de Vencimiento")
+    creado_el = models.DateTimeField(auto_now_add=True)
+
+    @property
+    def vencido(self):
+        return self.fecha_vencimiento is not None and self.fecha_vencimiento < date.today()
+
+    def __str__(self):
+        codigo = self.codigo or 'sin lote'
+        vencimiento = self.fecha_vencimiento.strftime('%d/%m/%Y') if self.fecha_vencimiento else 'sin vencimiento'
+        return f"{self.insumo.nombre} - {codigo} ({self.cantidad}, {vencimiento})"
+
+    class Meta:
+        verbose_name = "Lote de Insumo"
+        verbose_name_plural = "Lotes de Insumos"
+        ordering = ['insumo', 'fecha_vencimiento', 'id']
+        indexes = [
+            # Lotes de un insumo en orden de vencimiento (consumo FEFO)
+            models.Index(fields=['insumo', 'fecha_vencimiento', 'id'], name='lote_insumo_fefo_idx'),
+            # Lotes con stock por vencimiento (panel de vencimientos)
+            models.Index(fields=['fecha_vencimiento'], name='lote_vencimiento_idx', condition=models.Q(cantidad__gt=0)),
+        ]
+
+
 # Movimientos de stock (entradas y salidas)
 class MovimientoInsumo(models.Model):
     TIPO_CHOICES = (
@@ -70,6 +106,7 @@ class MovimientoInsumo(models.Model):
     )
     
     insumo = models.ForeignKey(Insumo, on_delete=models.CASCADE, related_name='movimientos')
+    lote = models.ForeignKey(LoteInsumo, on_delete=models.SET_NULL, null=True, blank=True, related_name='movimientos')
     tipo = models.CharField(max_length=10, choices=TIPO_CHOICES)
     cantidad = models.PositiveIntegerField()
     cantidad_anterior = models.PositiveIntegerField()
@@ -0,0 +1,374 @@
+"""
+Pronóstico de consumo de insumos y sugerencias de reposición.
+
+`cantidad_minima` es un número fijo que alguien escribió al crear el insumo: no sabe si
+el insumo se gasta de a uno por mes o de a veinte por día, ni que la próxima semana hay
+diez endodoncias agendadas. Por eso los quiebres de stock se descubrían en medio de una
+atención. Este módulo calcula, para cada insumo:
+
+- Tasa de consumo diaria: a partir de las salidas de MovimientoInsumo (que incluyen los
+  usos en odontogramas) agregadas por día en la base de datos, con dos ventanas móviles
+  (VENTANA_CORTA y VENTANA_LARGA días). Se usa la mayor de las dos medias, para reaccionar
+  rápido a un aumento sin olvidar el consumo habitual.
+- Estacionalidad semanal: cuánto se consume cada día de la semana respecto al promedio,
+  sobre todo el historial (los lunes no se atiende igual que los sábados).
+- Stock de seguridad: lo que la peor semana de VENTANA_LARGA superó al consumo medio.
+- Demanda reservada: las citas agendadas en los próximos HORIZONTE días, por tipo de
+  servicio, multiplicadas por lo que ese servicio consume en promedio de cada insumo
+  (según InsumoOdontograma de las fichas asociadas a citas de ese servicio).
+
+Con eso se proyecta el stock día por día (cada día se descuenta lo mayor entre el consumo
+esperado y lo reservado) y se obtienen los días para agotarse. Si el stock más lo que ya
+está pedido no alcanza para cubrir el plazo de entrega con margen (punto de reorden), se
+sugiere pedir lo necesario para DIAS_COBERTURA días más.
+
+Las sugerencias se crean como Pedido en estado 'borrador' (uno por proveedor principal)
+con sus SolicitudInsumo, y se regeneran en cada ejecución: los borradores sugeridos que
+nadie tocó se reemplazan. Cada uno guarda la huella de su contenido (huella_sugerencia);
+si ya no coincide, alguien lo editó: se conserva y sus cantidades cuentan como pedidas.
+Lo corre cada noche el comando pronosticar_insumos.
+
+Todo se calcula con un puñado de consultas agregadas (una fila por insumo y día, no por
+movimiento), así que recorrer el historial completo no crece con el número de movimientos
+sino con el de insumos y días.
+"""
+import hashlib
+import json
+import math
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, Min, Sum
+from django.db.models.functions import ExtractWeekDay, TruncDate
+from django.utils import timezone
+
+from .models import Insumo, MovimientoInsumo
+
+# Ventanas móviles de consumo (días)
+VENTANA_CORTA = 28
+VENTANA_LARGA = 90
+VENTANA_PICO = 7
+
+# Días que se proyectan hacia adelante
+HORIZONTE = 60
+
+# Días que tarda un proveedor en entregar y días de consumo que debe cubrir un pedido
+PLAZO_ENTREGA = 7
+DIAS_COBERTURA = 30
+
+# Historial mínimo para confiar en la estacionalidad semanal
+MINIMO_DIAS_ESTACIONALIDAD = 28
+
+# Citas que todavía se van a atender
+ESTADOS_RESERVADOS = ('reservada', 'en_espera', 'listo_para_atender', 'en_progreso')
+
+# Los pedidos sugeridos se reconocen por este prefijo en numero_pedido
+PREFIJO_SUGERENCIA = 'SUG-'
+
+
+def _dia_semana(fecha):
+    """Día de la semana con la numeración de ExtractWeekDay (1 = domingo ... 7 = sábado)"""
+    return fecha.isoweekday() % 7 + 1
+
+
+def _consumo_diario(hoy):
+    """{insumo_id: [salidas por día]} de los últimos VENTANA_LARGA días (el último es ayer)"""
+    inicio = hoy - timedelta(days=VENTANA_LARGA)
+    series = defaultdict(lambda: [0] * VENTANA_LARGA)
+    filas = (
+        MovimientoInsumo.objects
+        .filter(tipo='salida', fecha_movimiento__date__gte=inicio, fecha_movimiento__date__lt=hoy)
+        .annotate(dia=TruncDate('fecha_movimiento'))
+        .values('insumo_id', 'dia')
+        .annotate(total=Sum('cantidad'))
+    )
+    for fila in filas:
+        series[fila['insumo_id']][(fila['dia'] - inicio).days] = fila['total']
+    return series
+
+
+def _historial(hoy):
+    """
+    ({insumo_id: días desde la primera salida}, {insumo_id: {día de la semana: factor}})
+
+    El factor es el consumo de ese día de la semana sobre el promedio diario; 1 si no hay
+    historial suficiente.
+    """
+    antiguedad = {
+        fila['insumo_id']: (hoy - timezone.localtime(fila['primera']).date()).days
+        for fila in MovimientoInsumo.objects.filter(tipo='salida')
+        .values('insumo_id').annotate(primera=Min('fecha_movimiento'))
+    }
+    por_dia = defaultdict(dict)
+    filas = (
+        MovimientoInsumo.objects.filter(tipo='salida', fecha_movimiento__date__lt=hoy)
+        .annotate(dia_semana=ExtractWeekDay('fecha_movimiento'))
+        .values('insumo_id', 'dia_semana')
+        .annotate(total=Sum('cantidad'))
+    )
+    for fila in filas:
+        por_dia[fila['insumo_id']][fila['dia_semana']] = fila['total']
+
+    factores = {}
+    for insumo_id, totales in por_dia.items():
+        total = sum(totales.values())
+        if antiguedad.get(insumo_id, 0) < MINIMO_DIAS_ESTACIONALIDAD or not total:
+            continue
+        factores[insumo_id] = {dia: totales.get(dia, 0) * 7 / total for dia in range(1, 8)}
+    return antiguedad, factores
+
+
+def _uso_por_servicio():
+    """{(tipo_servicio_id, insumo_id): cantidad media usada por cita de ese servicio}"""
+    from historial_clinico.models import InsumoOdontograma, Odontograma
+
+    citas_por_servicio = dict(
+        Odontograma.objects.filter(cita__tipo_servicio__isnull=False)
+        .values_list('cita__tipo_servicio_id')
+        .annotate(citas=Count('cita', distinct=True))
+    )
+    uso = {}
+    filas = (
+        InsumoOdontograma.objects.filter(odontograma__cita__tipo_servicio__isnull=False)
+        .values('odontograma__cita__tipo_servicio_id', 'insumo_id')
+        .annotate(total=Sum('cantidad_utilizada'))
+    )
+    for fila in filas:
+        servicio_id = fila['odontograma__cita__tipo_servicio_id']
+        uso[(servicio_id, fila['insumo_id'])] = fila['total'] / citas_por_servicio[servicio_id]
+    return uso
+
+
+def _demanda_reservada(hoy):
+    """{insumo_id: [cantidad reservada por día]} de los próximos HORIZONTE días"""
+    from citas.models import Cita
+
+    uso = _uso_por_servicio()
+    insumos_por_servicio = defaultdict(list)
+    for (servicio_id, insumo_id), cantidad in uso.items():
+        insumos_por_servicio[servicio_id].append((insumo_id, cantidad))
+
+    demanda = defaultdict(lambda: [0.0] * HORIZONTE)
+    if not insumos_por_servicio:
+        return demanda
+    filas = (
+        Cita.objects.filter(
+            estado__in=ESTADOS_RESERVADOS,
+            tipo_servicio_id__in=insumos_por_servicio,
+            fecha_hora__date__gte=hoy,
+            fecha_hora__date__lt=hoy + timedelta(days=HORIZONTE),
+        )
+        .annotate(dia=TruncDate('fecha_hora'))
+        .values('dia', 'tipo_servicio_id')
+        .annotate(citas=Count('id'))
+    )
+    for fila in filas:
+        for insumo_id, cantidad in insumos_por_servicio[fila['tipo_servicio_id']]:
+            demanda[insumo_id][(fila['dia'] - hoy).days] += fila['citas'] * cantidad
+    return demanda
+
+
+def _huellas_sugerencias(pedidos):
+    """{pedido_id: (huella guardada, huella del contenido actual)} de un queryset de Pedido"""
+    from proveedores.models import SolicitudInsumo
+
+    contenido = {
+        pedido['id']: [pedido, []]
+        for pedido in pedidos.values(
+            'id', 'huella_sugerencia', 'proveedor_id', 'fecha_entrega_esperada', 'observaciones', 'registrar_como_egreso',
+        )
+    }
+    solicitudes = SolicitudInsumo.objects.filter(pedido_id__in=contenido).order_by('id').values_list(
+        'pedido_id', 'insumo_id', 'proveedor_id', 'cantidad_solicitada', 'fecha_entrega_esperada', 'estado',
+        'observaciones', 'precio_unitario',
+    )
+    for solicitud in solicitudes:
+        contenido[solicitud[0]][1].append(solicitud[1:])
+
+    huellas = {}
+    for pedido_id, (pedido, filas) in contenido.items():
+        guardada = pedido.pop('huella_sugerencia')
+        datos = json.dumps([pedido, filas], default=str, sort_keys=True)
+        huellas[pedido_id] = (guardada, hashlib.sha256(datos.encode('utf-8')).hexdigest())
+    return huellas
+
+
+def _sugerencias_sin_editar():
+    """IDs de los borradores sugeridos que nadie modificó desde que se generaron"""
+    from proveedores.models import Pedido
+
+    borradores = Pedido.objects.filter(estado='borrador', numero_pedido__startswith=PREFIJO_SUGERENCIA)
+    # Los de antes de huella_sugerencia no tienen huella: se reemplazan como antes
+    return [
+        pedido_id for pedido_id, (guardada, actual) in _huellas_sugerencias(borradores).items()
+        if not guardada or guardada == actual
+    ]
+
+
+def _en_camino():
+    """{insumo_id: cantidad} de solicitudes abiertas, sin contar los borradores sugeridos sin editar"""
+    from proveedores.models import SolicitudInsumo
+
+    return dict(
+        SolicitudInsumo.objects.filter(estado__in=('pendiente', 'enviada'))
+        .exclude(pedido__estado='cancelado')
+        .exclude(pedido_id__in=_sugerencias_sin_editar())
+        .values_list('insumo_id')
+        .annotate(total=Sum('cantidad_solicitada'))
+    )
+
+
+def _media(serie, dias, antiguedad):
+    """Media de los últimos `dias` valores, sin contar los días antes de la primera salida"""
+    dias = max(1, min(dias, antiguedad))
+    return sum(serie[-dias:]) / dias
+
+
+def _pico(serie, ventana):
+    """Mayor suma móvil de `ventana` días consecutivos"""
+    suma = sum(serie[:ventana])
+    maximo = suma
+    for i in range(ventana, len(serie)):
+        suma += serie[i] - serie[i - ventana]
+        maximo = max(maximo, suma)
+    return maximo
+
+
+def pronosticar(hoy=None):
+    """
+    Pronóstico de todos los insumos.
+
+    Retorna una lista de dicts con 'insumo', 'tasa_diaria', 'stock_seguridad',
+    'dias_para_agotarse' (None si alcanza para todo el horizonte), 'demanda_reservada',
+    'en_camino', 'punto_reorden' y 'cantidad_sugerida' (0 si no hace falta pedir).
+    """
+    hoy = hoy or timezone.localdate()
+    series = _consumo_diario(hoy)
+    antiguedad, factores = _historial(hoy)
+    reservas = _demanda_reservada(hoy)
+    en_camino = _en_camino()
+    sin_consumo = [0] * VENTANA_LARGA
+    sin_reservas = [0.0] * HORIZONTE
+    dias_semana = [_dia_semana(hoy + timedelta(days=i)) for i in range(HORIZONTE)]
+
+    pronosticos = []
+    for insumo in Insumo.objects.select_related('proveedor_principal'):
+        serie = series.get(insumo.id, sin_consumo)
+        dias_historial = antiguedad.get(insumo.id, 0)
+        tasa = max(
+            _media(serie, VENTANA_CORTA, dias_historial),
+            _media(serie, VENTANA_LARGA, dias_historial),
+        )
+        seguridad = max(0.0, _pico(serie, VENTANA_PICO) - tasa * VENTANA_PICO)
+
+        factor = factores.get(insumo.id)
+        reservado = reservas.get(insumo.id, sin_reservas)
+        demanda = [
+            max(tasa * (factor[dia] if factor else 1), reservado[i])
+            for i, dia in enumerate(dias_semana)
+        ]
+
+        dias_para_agotarse = None
+        acumulado = 0.0
+        for i, cantidad in enumerate(demanda):
+            acumulado += cantidad
+            if acumulado > insumo.cantidad_actual:
+                dias_para_agotarse = i
+                break
+
+        pedido = en_camino.get(insumo.id, 0)
+        disponible = insumo.cantidad_actual + pedido
+        punto_reorden = sum(demanda[:PLAZO_ENTREGA]) + seguridad + insumo.cantidad_minima
+        objetivo = sum(demanda[:PLAZO_ENTREGA + DIAS_COBERTURA]) + seguridad + insumo.cantidad_minima
+        cantidad_sugerida = 0
+        if disponible < punto_reorden or disponible <= insumo.cantidad_minima:
+            cantidad_sugerida = max(math.ceil(objetivo - disponible), insumo.cantidad_minima, 1)
+
+        pronosticos.append({
+            'insumo': insumo,
+            'tasa_diaria': tasa,
+            'stock_seguridad': seguridad,
+            'dias_para_agotarse': dias_para_agotarse,
+            'demanda_reservada': sum(reservado),
+            'en_camino': pedido,
+            'punto_reorden': punto_reorden,
+            'cantidad_sugerida': cantidad_sugerida,
+        })
+    return pronosticos
+
+
+def guardar_pronosticos(pronosticos):
+    """Guarda consumo_diario y dias_para_agotarse en cada Insumo (un bulk_update)"""
+    ahora = timezone.now()
+    insumos = []
+    for pronostico in pronosticos:
+        insumo = pronostico['insumo']
+        insumo.consumo_diario = Decimal(str(round(pronostico['tasa_diaria'], 2)))
+        insumo.dias_para_agotarse = pronostico['dias_para_agotarse']
+        insumo.pronostico_actualizado_el = ahora
+        insumos.append(insumo)
+    Insumo.objects.bulk_update(
+        insumos, ['consumo_diario', 'dias_para_agotarse', 'pronostico_actualizado_el'], batch_size=500
+    )
+
+
+def generar_sugerencias(pronosticos, usuario=None, hoy=None):
+    """
+    Reemplaza los pedidos sugeridos en borrador que nadie editó por los de este pronóstico.
+
+    Crea un Pedido 'borrador' por proveedor principal con una SolicitudInsumo por insumo a
+    reponer. Retorna {'pedidos': [Pedido], 'sin_proveedor': [pronósticos de insumos a
+    reponer que no tienen proveedor principal]}.
+    """
+    from proveedores.models import Pedido, SolicitudInsumo
+
+    hoy = hoy or timezone.localdate()
+    por_proveedor = defaultdict(list)
+    sin_proveedor = []
+    for pronostico in pronosticos:
+        if not pronostico['cantidad_sugerida']:
+            continue
+        proveedor = pronostico['insumo'].proveedor_principal
+        if proveedor is None:
+            sin_proveedor.append(pronostico)
+        else:
+            por_proveedor[proveedor].append(pronostico)
+
+    pedidos = []
+    sello = timezone.localtime().strftime('%Y%m%d%H%M%S')
+    with transaction.atomic():
+        Pedido.objects.filter(id__in=_sugerencias_sin_editar()).delete()
+        for proveedor, sugerencias in por_proveedor.items():
+            pedido = Pedido.objects.create(
+                numero_pedido=f'{PREFIJO_SUGERENCIA}{sello}-{proveedor.id}',
+                proveedor=proveedor,
+                fecha_entrega_esperada=hoy + timedelta(days=PLAZO_ENTREGA),
+                observaciones='Pedido sugerido automáticamente según el pronóstico de consumo.',
+                creado_por=usuario,
+            )
+            for pronostico in sugerencias:
+                insumo = pronostico['insumo']
+                agotamiento = (
+                    f'se agota en {pronostico["dias_para_agotarse"]} días'
+                    if pronostico['dias_para_agotarse'] is not None
+                    else f'alcanza para más de {HORIZONTE} días'
+                )
+                SolicitudInsumo.objects.create(
+                    pedido=pedido,
+                    proveedor=proveedor,
+                    insumo=insumo,
+                    cantidad_solicitada=pronostico['cantidad_sugerida'],
+                    fecha_entrega_esperada=pedido.fecha_entrega_esperada,
+                    observaciones=(
+                        f'Consumo estimado {pronostico["tasa_diaria"]:.2f} {insumo.unidad_medida}/día; '
+                        f'stock {insumo.cantidad_actual}, {agotamiento}.'
+                    ),
+                    solicitado_por=usuario,
+                )
+            pedido.save()
+            pedido.huella_sugerencia = _huellas_sugerencias(Pedido.objects.filter(pk=pedido.pk))[pedido.pk][1]
+            Pedido.objects.filter(pk=pedido.pk).update(huella_sugerencia=pedido.huella_sugerencia)
+            pedidos.append(pedido)
+    return {'pedidos': pedidos, 'sin_proveedor': sin_proveedor}
@@ -0,0 +1,277 @@
+"""
+Libro de movimientos de stock de insumos.
+
+Antes cada vista leía `insumo.cantidad_actual`, sumaba o restaba en Python, guardaba el
+insumo y después creaba el MovimientoInsumo, sin transacción ni bloqueo: si dos
+dentistas terminaban una atención al mismo tiempo, uno de los dos descuentos se perdía
+(ambos leían 10, ambos guardaban 9) y el movimiento quedaba con cantidades que no
+calzaban con el stock real.
+
+Todos los cambios de stock pasan ahora por `aplicar_movimientos`, que en una sola
+transacción:
+
+1. Bloquea las filas de los insumos involucrados con select_for_update, siempre en el
+   mismo orden (por id) para que dos lotes con los mismos insumos no se bloqueen
+   mutuamente, y después sus lotes con stock.
+2. Valida las salidas contra el stock bloqueado y calcula cantidad_anterior y
+   cantidad_nueva de cada movimiento (varios movimientos del mismo insumo se encadenan).
+3. Aplica todos los cambios con un único UPDATE `cantidad_actual = F('cantidad_actual')
+   ± n`, con el estado (agotado / disponible) y el próximo vencimiento resueltos en el
+   mismo UPDATE, y otro igual para los lotes.
+4. Inserta todos los MovimientoInsumo con un bulk_create.
+
+Lotes: el stock de un insumo está repartido en LoteInsumo (código, cantidad,
+vencimiento). Una entrada suma a su lote (el mismo código y vencimiento, o uno nuevo);
+una salida se reparte FEFO (first-expire-first-out: primero el lote que vence antes, los
+lotes sin vencimiento al final) y genera un movimiento por cada lote que toca. Si los
+lotes no alcanzan (stock anterior a los lotes), el resto sale sin lote.
+Insumo.fecha_vencimiento queda como el vencimiento más próximo de sus lotes con stock,
+para las pantallas que ya lo usan.
+
+Un procedimiento que consume diez insumos son entonces unas pocas consultas, no
+treinta, y si algo falla no queda ni el stock descontado ni el movimiento a medias.
+"""
+from collections import defaultdict
+from datetime import date
+
+from django.db import transaction
+from django.db.models import Case, DateField, F, IntegerField, Value, When
+from django.utils import timezone
+
+from .models import Insumo, LoteInsumo, MovimientoInsumo
+
+TIPOS_MOVIMIENTO = {tipo for tipo, _ in MovimientoInsumo.TIPO_CHOICES}
+
+
+class StockInsuficiente(ValueError):
+    """Una salida pide más de lo que hay en stock"""
+
+    def __init__(self, insumo, disponible, solicitado):
+        self.insumo = insumo
+        self.disponible = disponible
+        self.solicitado = solicitado
+        super().__init__(
+            f'{insumo.nombre}: Stock insuficiente (disponible: {disponible}, solicitado: {solicitado})'
+        )
+
+
+def _nuevo_estado(estado, cantidad):
+    if cantidad == 0:
+        return 'agotado'
+    if estado == 'agotado':
+        return 'disponible'
+    return estado
+
+
+def _orden_fefo(lote):
+    """Primero el que vence antes; los lotes sin vencimiento al final"""
+    return (lote.fecha_vencimiento is None, lote.fecha_vencimiento or date.max, lote.id)
+
+
+def _lote_entrada(insumo, codigo, fecha_vencimiento, lotes, saldos):
+    """Lote al que suma una entrada: uno con el mismo código y vencimiento, o uno nuevo"""
+    for lote in lotes[insumo.id]:
+        if lote.codigo == codigo and lote.fecha_vencimiento == fecha_vencimiento:
+            return lote
+    lote = LoteInsumo.objects.filter(
+        insumo=insumo, codigo=codigo, fecha_vencimiento=fecha_vencimiento
+    ).order_by('id').first()
+    if lote is None:
+        lote = LoteInsumo.objects.create(insumo=insumo, codigo=codigo, fecha_vencimiento=fecha_vencimiento)
+    saldos[lote.id] = lote.cantidad
+    lotes[insumo.id].append(lote)
+    lotes[insumo.id].sort(key=_orden_fefo)
+    return lote
+
+
+def _descontar_fefo(lotes, saldos, cantidad):
+    """Reparte `cantidad` entre los lotes en orden FEFO; [(lote o None, cantidad)]"""
+    partes = []
+    for lote in lotes:
+        if cantidad == 0:
+            break
+        tomado = min(saldos[lote.id], cantidad)
+        if tomado:
+            saldos[lote.id] -= tomado
+            cantidad -= tomado
+            partes.append((lote, tomado))
+    if cantidad:
+        partes.append((None, cantidad))
+    return partes
+
+
+def aplicar_movimientos(movimientos, realizado_por=None, parcial=False):
+    """
+    Aplica un lote de movimientos de stock de forma atómica.
+
+    `movimientos` es una lista de dicts con 'insumo' (Insumo o id), 'tipo' ('entrada',
+    'salida' o 'ajuste'), 'cantidad', 'motivo' y opcionalmente 'observaciones'. En un
+    ajuste, 'cantidad' es el nuevo stock. Una entrada puede indicar 'lote' (código) y
+    'fecha_vencimiento'.
+
+    Si una salida no tiene stock suficiente se lanza StockInsuficiente y no se aplica
+    nada; con parcial=True esa salida se omite y el resto del lote se aplica.
+
+    Retorna {'movimientos': [MovimientoInsumo creados], 'rechazados': [StockInsuficiente]}.
+    Una salida que toca varios lotes genera un movimiento por lote. Los Insumo recibidos
+    como objeto quedan con cantidad_actual, estado y fecha_vencimiento actualizados.
+    """
+    for movimiento in movimientos:
+        if movimiento['tipo'] not in TIPOS_MOVIMIENTO:
+            raise ValueError(f"Tipo de movimiento no válido: {movimiento['tipo']}")
+        if movimiento['cantidad'] < 0 or (movimiento['cantidad'] == 0 and movimiento['tipo'] != 'ajuste'):
+            raise ValueError('La cantidad debe ser mayor a 0.')
+
+    ids = sorted({getattr(m['insumo'], 'pk', m['insumo']) for m in movimientos})
+    if not ids:
+        return {'movimientos': [], 'rechazados': []}
+
+    with transaction.atomic():
+        bloqueados = {
+            insumo.id: insumo
+            for insumo in Insumo.objects.select_for_update().filter(id__in=ids).order_by('id')
+        }
+        faltantes = set(ids) - set(bloqueados)
+        if faltantes:
+            raise Insumo.DoesNotExist(f'Insumos no encontrados: {sorted(faltantes)}')
+
+        lotes = defaultdict(list)
+        saldos = {}
+        for lote in LoteInsumo.objects.select_for_update().filter(insumo_id__in=ids, cantidad__gt=0).order_by('id'):
+            lotes[lote.insumo_id].append(lote)
+            saldos[lote.id] = lote.cantidad
+        for lista in lotes.values():
+            lista.sort(key=_orden_fefo)
+        con_lotes = set(lotes)
+
+        stock = {insumo_id: insumo.cantidad_actual for insumo_id, insumo in bloqueados.items()}
+        nuevos = []
+        rechazados = []
+        for movimiento in movimientos:
+            insumo = bloqueados[getattr(movimiento['insumo'], 'pk', movimiento['insumo'])]
+            tipo, cantidad = movimiento['tipo'], movimiento['cantidad']
+            anterior = stock[insumo.id]
+
+            if tipo == 'entrada':
+                lote = _lote_entrada(
+                    insumo, movimiento.get('lote') or '', movimiento.get('fecha_vencimiento'), lotes, saldos
+                )
+                saldos[lote.id] += cantidad
+                partes = [(lote, cantidad)]
+                nueva = anterior + cantidad
+            elif tipo == 'salida':
+                if cantidad > anterior:
+                    error = StockInsuficiente(insumo, anterior, cantidad)
+                    if not parcial:
+                        raise error
+                    rechazados.append(error)
+                    continue
+                partes = _descontar_fefo(lotes[insumo.id], saldos, cantidad)
+                nueva = anterior - cantidad
+            else:
+                # El ajuste es un solo movimiento: lo que sobra va al lote sin código y lo que
+                # falta se descuenta FEFO (lo que se bota primero es lo que vence antes)
+                if cantidad > anterior:
+                    lote = _lote_entrada(insumo, '', None, lotes, saldos)
+                    saldos[lote.id] += cantidad - anterior
+                    partes = [(lote, cantidad)]
+                else:
+                    tocados = _descontar_fefo(lotes[insumo.id], saldos, anterior - cantidad)
+                    partes = [(tocados[0][0] if len(tocados) == 1 else None, cantidad)]
+                nueva = cantidad
+
+            for lote, parte in partes:
+                nueva_parte = anterior - parte if tipo == 'salida' else nueva
+                nuevos.append(MovimientoInsumo(
+                    insumo=insumo,
+                    lote=lote,
+                    tipo=tipo,
+                    cantidad=parte,
+                    cantidad_anterior=anterior,
+                    cantidad_nueva=nueva_parte,
+                    motivo=movimiento.get('motivo', ''),
+                    observaciones=movimiento.get('observaciones') or None,
+                    realizado_por=realizado_por,
+                ))
+                anterior = nueva_parte
+            stock[insumo.id] = nueva
+
+        cambios = {
+            insumo_id: nueva - bloqueados[insumo_id].cantidad_actual
+            for insumo_id, nueva in stock.items()
+            if nueva != bloqueados[insumo_id].cantidad_actual
+        }
+        estados = {
+            insumo_id: _nuevo_estado(insumo.estado, stock[insumo_id]) if insumo_id in cambios else insumo.estado
+            for insumo_id, insumo in bloqueados.items()
+        }
+        # Próximo vencimiento: solo para los insumos que tienen (o tenían) lotes con stock
+        vencimientos = {}
+        for insumo_id, lista in lotes.items():
+            fechas = [lote.fecha_vencimiento for lote in lista if saldos[lote.id] > 0 and lote.fecha_vencimiento]
+            if fechas or insumo_id in con_lotes:
+                vencimientos[insumo_id] = min(fechas) if fechas else None
+        vencimientos = {
+            insumo_id: fecha for insumo_id, fecha in vencimientos.items()
+            if fecha != bloqueados[insumo_id].fecha_vencimiento
+        }
+
+        if cambios or vencimientos:
+            Insumo.objects.filter(id__in=set(cambios) | set(vencimientos)).update(
+                cantidad_actual=Case(
+                    *[When(id=insumo_id, then=F('cantidad_actual') + Value(delta)) for insumo_id, delta in cambios.items()],
+                    default=F('cantidad_actual'),
+                    output_field=IntegerField(),
+                ),
+                estado=Case(
+                    *[When(id=insumo_id, then=Value(estados[insumo_id])) for insumo_id in cambios],
+                    default=F('estado'),
+                ),
+                fecha_vencimiento=Case(
+                    *[When(id=insumo_id, then=Value(fecha)) for insumo_id, fecha in vencimientos.items()],
+                    default=F('fecha_vencimiento'),
+                    output_field=DateField(),
+                ),
+                actualizado_el=timezone.now(),
+            )
+
+        originales = {lote.id: lote.cantidad for lista in lotes.values() for lote in lista}
+        cambios_lotes = {
+            lote_id: saldo - originales[lote_id]
+            for lote_id, saldo in saldos.items()
+            if saldo != originales[lote_id]
+        }
+        if cambios_lotes:
+            LoteInsumo.objects.filter(id__in=cambios_lotes).update(
+                cantidad=Case(
+                    *[When(id=lote_id, then=F('cantidad') + Value(delta)) for lote_id, delta in cambios_lotes.items()],
+                    output_field=IntegerField(),
+                ),
+            )
+        creados = MovimientoInsumo.objects.bulk_create(nuevos)
+
+    # Reflejar el resultado en los objetos que recibió quien llamó
+    for movimiento in movimientos:
+        insumo = movimiento['insumo']
+        if isinstance(insumo, Insumo):
+            insumo.cantidad_actual = stock[insumo.pk]
+            insumo.estado = estados[insumo.pk]
+            insumo.fecha_vencimiento = vencimientos.get(insumo.pk, bloqueados[insumo.pk].fecha_vencimiento)
+
+    return {'movimientos': creados, 'rechazados': rechazados}
+
+
+def aplicar_movimiento(insumo, tipo, cantidad, motivo, observaciones=None, realizado_por=None, lote=None,
+                       fecha_vencimiento=None):
+    """
+    Un solo movimiento; retorna el primer MovimientoInsumo creado (una salida que toca
+    varios lotes crea uno por lote) o lanza StockInsuficiente
+    """
+    resultado = aplicar_movimientos(
+        [{
+            'insumo': insumo, 'tipo': tipo, 'cantidad': cantidad, 'motivo': motivo,
+            'observaciones': observaciones, 'lote': lote, 'fecha_vencimiento': fecha_vencimiento,
+        }],
+        realizado_por=realizado_por,
+    )
+    return resultado['movimientos'][0]
@@ -0,0 +1,76 @@
+"""
+Panel de vencimientos de insumos por lote.
+
+Con un solo vencimiento por insumo no se podía saber cuánto de un anestésico vence este
+mes y cuánto el próximo. Ahora cada lote (LoteInsumo) tiene su vencimiento y el panel
+agrupa en una sola consulta los lotes con stock por mes de vencimiento, con las unidades
+y el valor en riesgo (cantidad del lote × precio unitario del insumo). Los meses ya
+pasados son stock vencido que todavía no se ha dado de baja.
+
+Las consultas usan el índice parcial lote_vencimiento_idx (vencimiento de los lotes con
+stock), así que no recorren los lotes ya consumidos.
+"""
+from datetime import timedelta
+
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .models import LoteInsumo
+
+# Meses hacia adelante que muestra el panel
+MESES_PANEL = 6
+
+# Lotes que se listan en detalle
+DIAS_DETALLE = 90
+MAXIMO_LOTES_DETALLE = 50
+
+VALOR_LOTE = ExpressionWrapper(
+    F('cantidad') * F('insumo__precio_unitario'), output_field=DecimalField(max_digits=14, decimal_places=2)
+)
+
+
+def _sumar_meses(fecha, meses):
+    """Primer día del mes que está `meses` después del de `fecha`"""
+    mes = fecha.month - 1 + meses
+    return fecha.replace(year=fecha.year + mes // 12, month=mes % 12 + 1, day=1)
+
+
+def valor_en_riesgo_por_mes(hoy=None, meses=MESES_PANEL):
+    """
+    Lotes con stock que vencen antes de `meses` meses (incluidos los ya vencidos),
+    agrupados por mes de vencimiento.
+
+    Retorna una lista de dicts {'mes', 'lotes', 'insumos', 'unidades', 'valor',
+    'vencido'} ordenada por mes.
+    """
+    hoy = hoy or timezone.localdate()
+    limite = _sumar_meses(hoy, meses)
+    mes_actual = hoy.replace(day=1)
+    filas = list(
+        LoteInsumo.objects.filter(cantidad__gt=0, fecha_vencimiento__lt=limite)
+        .annotate(mes=TruncMonth('fecha_vencimiento'))
+        .values('mes')
+        .annotate(
+            lotes=Count('id'),
+            insumos=Count('insumo', distinct=True),
+            unidades=Sum('cantidad'),
+            valor=Sum(VALOR_LOTE),
+        )
+        .order_by('mes')
+    )
+    for fila in filas:
+        fila['valor'] = fila['valor'] or 0
+        fila['vencido'] = fila['mes'] < mes_actual
+    return filas
+
+
+def lotes_por_vencer(hoy=None, dias=DIAS_DETALLE, limite=MAXIMO_LOTES_DETALLE):
+    """Lotes con stock vencidos o que vencen dentro de `dias`, el más próximo primero"""
+    hoy = hoy or timezone.localdate()
+    return list(
+        LoteInsumo.objects.filter(cantidad__gt=0, fecha_vencimiento__lt=hoy + timedelta(days=dias))
+        .select_related('insumo')
+        .annotate(valor=VALOR_LOTE)
+        .order_by('fecha_vencimiento', 'id')[:limite]
+    )
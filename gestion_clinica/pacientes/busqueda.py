@@ -0,0 +1,171 @@
+"""
+Búsqueda de pacientes (Cliente) por nombre, RUT, email y teléfono.
+
+Antes cada pantalla filtraba con icontains sobre nombre_completo, email, telefono y rut
+unidos con OR: la base de datos debía aplicar UPPER() a cada columna de cada fila, sin
+poder usar índices, y "gonzalez" no encontraba a "González".
+
+Ahora Cliente guarda columnas de búsqueda normalizadas (se calculan en Cliente.save()):
+
+- busqueda_nombre: nombre en minúsculas, sin tildes ni signos ("María José Muñoz" ->
+  "maria jose munoz").
+- busqueda_rut: solo dígitos y K ("12.345.678-k" -> "12345678K").
+- busqueda_telefono: solo dígitos ("+56920589344" -> "56920589344").
+
+Índices:
+- En PostgreSQL, la migración crea índices GIN de trigramas (pg_trgm) sobre
+  busqueda_nombre, busqueda_telefono y UPPER(email), que sirven para LIKE '%texto%'
+  (contains / icontains) con 3 o más caracteres.
+- En todas las bases hay índices B-tree sobre las tres columnas; el RUT se busca por
+  prefijo como rango (>= prefijo y < prefijo + '\\uffff'), que usa el B-tree también en
+  SQLite. En SQLite las búsquedas por nombre o teléfono recorren la tabla, pero sobre las
+  columnas ya normalizadas.
+
+Uso:
+    Cliente.objects.filter(filtro_busqueda(texto))                  # Listas
+    Cita.objects.filter(filtro_busqueda(texto, prefijo='cliente__'))  # Por relación
+    buscar_pacientes(texto, limite=10)                               # Autocompletado
+"""
+import re
+import unicodedata
+
+from django.db.models import Case, IntegerField, Q, Value, When
+
+from .rut import limpiar_rut
+
+# Caracteres que se conservan en el texto normalizado (el resto pasa a ser un espacio)
+_NO_PERMITIDOS = re.compile(r'[^a-z0-9@._+\-]+')
+
+# Un texto con solo dígitos, puntos, guiones, espacios, K, + o paréntesis es un RUT o un teléfono
+_RUT_O_TELEFONO = re.compile(r'[\d\s.\-+()kK]+')
+
+# Dígitos mínimos para buscar por teléfono (menos encuentran a casi todos)
+MINIMO_DIGITOS_TELEFONO = 4
+
+# Máximo de resultados del autocompletado
+LIMITE_AUTOCOMPLETADO = 10
+
+
+def normalizar_texto(texto):
+    """Minúsculas, sin tildes (ñ -> n) y sin signos; espacios simples"""
+    if not texto:
+        return ''
+    texto = unicodedata.normalize('NFKD', str(texto))
+    texto = ''.join(caracter for caracter in texto if not unicodedata.combining(caracter)).lower()
+    return ' '.join(_NO_PERMITIDOS.sub(' ', texto).split())
+
+
+def solo_digitos(texto):
+    return re.sub(r'\D', '', str(texto or ''))
+
+
+def normalizar_rut_busqueda(rut):
+    """Dígitos y dígito verificador K en mayúscula, sin puntos, guion ni ceros a la izquierda"""
+    return limpiar_rut(rut)
+
+
+def columnas_busqueda(nombre_completo, rut, telefono):
+    """Valores de las columnas de búsqueda de un Cliente"""
+    return {
+        'busqueda_nombre': normalizar_texto(nombre_completo)[:150],
+        'busqueda_rut': normalizar_rut_busqueda(rut)[:12],
+        'busqueda_telefono': solo_digitos(telefono)[:20],
+    }
+
+
+def _es_rut_o_telefono(texto):
+    return bool(_RUT_O_TELEFONO.fullmatch(texto)) and any(caracter.isdigit() for caracter in texto)
+
+
+def _prefijo(campo, valor):
+    """campo empieza con valor, como rango para que use el índice B-tree"""
+    return Q(**{f'{campo}__gte': valor, f'{campo}__lt': valor + '\uffff'})
+
+
+def filtro_busqueda(texto, prefijo=''):
+    """
+    Q que filtra clientes por el texto buscado.
+
+    - Si el texto parece RUT o teléfono, busca por prefijo de RUT o por dígitos del teléfono.
+    - Si no, cada palabra debe aparecer en el nombre o en el email (sin importar tildes
+      ni mayúsculas).
+
+    prefijo: ruta hasta el cliente cuando se filtra otro modelo (p.ej. 'cliente__').
+    """
+    texto = (texto or '').strip()
+    if not texto:
+        return Q()
+
+    if _es_rut_o_telefono(texto):
+        condicion = Q(pk__in=[])
+        rut = normalizar_rut_busqueda(texto)
+        if rut:
+            condicion |= _prefijo(f'{prefijo}busqueda_rut', rut)
+        digitos = solo_digitos(texto)
+        if len(digitos) >= MINIMO_DIGITOS_TELEFONO:
+            condicion |= Q(**{f'{prefijo}busqueda_telefono__contains': digitos})
+        return condicion
+
+    condicion = Q()
+    for palabra in normalizar_texto(texto).split():
+        condicion &= Q(**{f'{prefijo}busqueda_nombre__contains': palabra}) | Q(**{f'{prefijo}email__icontains': palabra})
+    return condicion
+
+
+def coincide_busqueda(texto, nombre='', email='', telefono='', rut=''):
+    """Mismo criterio que filtro_busqueda, para listas ya cargadas en memoria"""
+    texto = (texto or '').strip()
+    if not texto:
+        return True
+
+    if _es_rut_o_telefono(texto):
+        rut_buscado = normalizar_rut_busqueda(texto)
+        digitos = solo_digitos(texto)
+        return bool(
+            (rut_buscado and normalizar_rut_busqueda(rut).startswith(rut_buscado))
+            or (len(digitos) >= MINIMO_DIGITOS_TELEFONO and digitos in solo_digitos(telefono))
+        )
+
+    nombre = normalizar_texto(nombre)
+    email = (email or '').lower()
+    return all(palabra in nombre or palabra in email for palabra in normalizar_texto(texto).split())
+
+
+def buscar_pacientes(texto, limite=LIMITE_AUTOCOMPLETADO, solo_activos=True):
+    """
+    Clientes que coinciden con el texto, los más relevantes primero:
+
+    0. el nombre empieza con el texto, o el RUT empieza con él;
+    1. alguna palabra del nombre empieza con la primera palabra buscada;
+    2. el resto (el texto aparece dentro del nombre, email o teléfono).
+
+    A igual relevancia se ordena por nombre.
+    """
+    from pacientes.models import Cliente
+
+    texto = (texto or '').strip()
+    if not normalizar_texto(texto):
+        return Cliente.objects.none()
+
+    clientes = Cliente.objects.filter(filtro_busqueda(texto))
+    if solo_activos:
+        clientes = clientes.filter(activo=True)
+
+    if _es_rut_o_telefono(texto):
+        rut = normalizar_rut_busqueda(texto)
+        exacto = _prefijo('busqueda_rut', rut) if rut else Q(pk__in=[])
+        palabra = Q(pk__in=[])
+    else:
+        normalizado = normalizar_texto(texto)
+        primera = normalizado.split()[0]
+        exacto = Q(busqueda_nombre__startswith=normalizado)
+        palabra = Q(busqueda_nombre__startswith=primera) | Q(busqueda_nombre__contains=f' {primera}')
+
+    return clientes.annotate(
+        relevancia=Case(
+            When(exacto, then=Value(0)),
+            When(palabra, then=Value(1)),
+            default=Value(2),
+            output_field=IntegerField(),
+        ),
+    ).order_by('relevancia', 'nombre_completo', 'id')[:limite]
@@ -0,0 +1,310 @@
+"""
+Detección y fusión de pacientes (Cliente) duplicados.
+
+Un mismo paciente puede quedar registrado dos veces: al registrarse en el portal web y
+al crearlo en recepción (crear_cliente_presencial), o al sincronizar citas antiguas que
+solo tenían email y nombre. Compararlos todos contra todos no es viable con miles de
+pacientes, así que la detección usa claves de bloqueo:
+
+- rut: RUT normalizado (con dígito verificador válido); para los clientes que la
+  migración 0005 dejó sin rut_normalizado por repetir el RUT de otro se calcula aquí;
+- email: email en minúsculas (la unicidad de la base distingue mayúsculas);
+- telefono: últimos 8 dígitos del teléfono;
+- nombre: primer nombre + cada una de las otras palabras del nombre normalizado
+  ("Juan Carlos Pérez" -> "juan carlos", "juan perez"), para que "Juan Pérez" y
+  "Juan Carlos Pérez González" compartan una clave.
+
+Solo se comparan los clientes que comparten al menos una clave; los bloques con más de
+MAXIMO_BLOQUE clientes (un teléfono de la clínica cargado a muchos pacientes, "maria
+gonzalez") se descartan. Cada par candidato recibe un puntaje (ver PUNTAJES):
+
+- suma por RUT, email, teléfono y fecha de nacimiento iguales, y por la proporción de
+  palabras del nombre en común (sobre el nombre más corto);
+- RUT válidos distintos: no son la misma persona (el par se descarta);
+- fechas de nacimiento distintas restan.
+
+Los pares con puntaje >= UMBRAL_CANDIDATO se informan; con puntaje >=
+UMBRAL_FUSION_AUTOMATICA se pueden fusionar sin revisión (p.ej. mismo RUT y mismo nombre).
+
+La fusión (fusionar_clientes) es una transacción: traspasa al cliente principal todas
+las filas que apuntan al duplicado (citas, odontogramas, radiografías, planes de
+tratamiento, consentimientos, documentos, mensajes, evaluación) con un UPDATE por tabla,
+completa los datos que le falten al principal con los del duplicado, elimina el duplicado
+y recalcula la relación dentista-paciente.
+
+Se usa desde el comando `detectar_duplicados`.
+"""
+from collections import defaultdict
+
+from django.db import models, transaction
+from django.utils import timezone
+
+from .busqueda import normalizar_texto
+from .models import Cliente
+from .rut import normalizar_rut
+
+# Bloques más grandes que esto no se comparan (no identifican a una persona)
+MAXIMO_BLOQUE = 50
+
+# Dígitos del teléfono que se comparan (el número sin código de país ni prefijo móvil)
+DIGITOS_TELEFONO = 8
+
+PUNTAJES = {
+    'rut': 50,
+    'email': 40,
+    'telefono': 20,
+    'fecha_nacimiento': 10,
+    'nombre': 30,  # Multiplicado por la proporción de palabras en común
+}
+PENALIZACION_FECHA_NACIMIENTO = 25
+
+UMBRAL_CANDIDATO = 40
+UMBRAL_FUSION_AUTOMATICA = 80
+
+# Nombres de relleno que no identifican a nadie
+NOMBRES_GENERICOS = {'sin nombre', 'paciente', 'cliente'}
+
+# Modelos que no se traspasan: se recalculan después de la fusión
+MODELOS_RECALCULADOS = {'citas.DentistaPaciente'}
+
+CAMPOS_CLIENTE = (
+    'id', 'nombre_completo', 'email', 'busqueda_telefono', 'rut', 'rut_normalizado',
+    'fecha_nacimiento', 'activo', 'user_id', 'fecha_registro',
+)
+
+
+def _palabras_nombre(nombre):
+    normalizado = normalizar_texto(nombre)
+    if normalizado in NOMBRES_GENERICOS:
+        return []
+    return [palabra for palabra in normalizado.split() if len(palabra) > 1]
+
+
+def claves_bloqueo(cliente):
+    """Claves de bloqueo de un cliente (diccionario de values(CAMPOS_CLIENTE))"""
+    claves = set()
+    if cliente['rut_normalizado']:
+        claves.add(('rut', cliente['rut_normalizado']))
+    if cliente['email']:
+        claves.add(('email', cliente['email'].strip().lower()))
+    if len(cliente['busqueda_telefono']) >= DIGITOS_TELEFONO:
+        claves.add(('telefono', cliente['busqueda_telefono'][-DIGITOS_TELEFONO:]))
+    palabras = _palabras_nombre(cliente['nombre_completo'])
+    for palabra in palabras[1:]:
+        claves.add(('nombre', f'{palabras[0]} {palabra}'))
+    return claves
+
+
+def similitud_nombre(nombre_a, nombre_b):
+    """Proporción (0 a 1) de palabras del nombre más corto que están en el otro"""
+    palabras_a = set(_palabras_nombre(nombre_a))
+    palabras_b = set(_palabras_nombre(nombre_b))
+    if not palabras_a or not palabras_b:
+        return 0
+    return len(palabras_a & palabras_b) / min(len(palabras_a), len(palabras_b))
+
+
+def puntuar(a, b):
+    """(puntaje, motivos) de un par de clientes; puntaje None si no pueden ser la misma persona"""
+    if a['rut_normalizado'] and b['rut_normalizado'] and a['rut_normalizado'] != b['rut_normalizado']:
+        return None, []
+
+    puntaje = 0
+    motivos = []
+    if a['rut_normalizado'] and a['rut_normalizado'] == b['rut_normalizado']:
+        puntaje += PUNTAJES['rut']
+        motivos.append('RUT')
+    if a['email'].strip().lower() == b['email'].strip().lower():
+        puntaje += PUNTAJES['email']
+        motivos.append('email')
+    telefono_a = a['busqueda_telefono'][-DIGITOS_TELEFONO:]
+    if len(telefono_a) == DIGITOS_TELEFONO and telefono_a == b['busqueda_telefono'][-DIGITOS_TELEFONO:]:
+        puntaje += PUNTAJES['telefono']
+        motivos.append('teléfono')
+    if a['fecha_nacimiento'] and b['fecha_nacimiento']:
+        if a['fecha_nacimiento'] == b['fecha_nacimiento']:
+            puntaje += PUNTAJES['fecha_nacimiento']
+            motivos.append('fecha de nacimiento')
+        else:
+            puntaje -= PENALIZACION_FECHA_NACIMIENTO
+    similitud = similitud_nombre(a['nombre_completo'], b['nombre_completo'])
+    if similitud:
+        puntaje += round(PUNTAJES['nombre'] * similitud)
+        motivos.append(f'nombre ({similitud:.0%})')
+    return puntaje, motivos
+
+
+def _prioridad_principal(cliente):
+    """Orden para elegir el principal: activo, con usuario web, con RUT, el más antiguo"""
+    return (not cliente['activo'], cliente['user_id'] is None, not cliente['rut_normalizado'], cliente['fecha_registro'], cliente['id'])
+
+
+def detectar_duplicados(minimo=UMBRAL_CANDIDATO, clientes=None):
+    """
+    Pares de clientes probablemente duplicados, de mayor a menor puntaje:
+    [{'principal': {...}, 'duplicado': {...}, 'puntaje': n, 'motivos': [...]}]
+    `principal` es el que se sugiere conservar. Recorre toda la tabla en una consulta.
+    """
+    if clientes is None:
+        clientes = Cliente.objects.order_by().values(*CAMPOS_CLIENTE).iterator(chunk_size=2000)
+
+    por_id = {}
+    bloques = defaultdict(list)
+    for cliente in clientes:
+        if not cliente['rut_normalizado'] and cliente['rut']:
+            cliente['rut_normalizado'] = normalizar_rut(cliente['rut'])
+        por_id[cliente['id']] = cliente
+        for clave in claves_bloqueo(cliente):
+            bloques[clave].append(cliente['id'])
+
+    pares = set()
+    for ids in bloques.values():
+        if 1 < len(ids) <= MAXIMO_BLOQUE:
+            ids = sorted(ids)
+            for posicion, id_a in enumerate(ids):
+                for id_b in ids[posicion + 1:]:
+                    pares.add((id_a, id_b))
+
+    candidatos = []
+    for id_a, id_b in pares:
+        puntaje, motivos = puntuar(por_id[id_a], por_id[id_b])
+        if puntaje is None or puntaje < minimo:
+            continue
+        principal, duplicado = sorted((por_id[id_a], por_id[id_b]), key=_prioridad_principal)
+        candidatos.append({'principal': principal, 'duplicado': duplicado, 'puntaje': puntaje, 'motivos': motivos})
+    candidatos.sort(key=lambda candidato: (-candidato['puntaje'], candidato['principal']['id'], candidato['duplicado']['id']))
+    return candidatos
+
+
+def agrupar(candidatos):
+    """
+    Agrupa pares encadenados (A-B, B-C) en grupos de fusión:
+    [(principal, [duplicados])] con el principal elegido entre todos los del grupo.
+    """
+    padre = {}
+
+    def raiz(cliente_id):
+        while padre.setdefault(cliente_id, cliente_id) != cliente_id:
+            padre[cliente_id] = padre[padre[cliente_id]]
+            cliente_id = padre[cliente_id]
+        return cliente_id
+
+    clientes = {}
+    for candidato in candidatos:
+        a, b = candidato['principal'], candidato['duplicado']
+        clientes[a['id']], clientes[b['id']] = a, b
+        padre[raiz(a['id'])] = raiz(b['id'])
+
+    grupos = defaultdict(list)
+    for cliente_id, cliente in clientes.items():
+        grupos[raiz(cliente_id)].append(cliente)
+    resultado = []
+    for miembros in grupos.values():
+        miembros.sort(key=_prioridad_principal)
+        resultado.append((miembros[0], miembros[1:]))
+    resultado.sort(key=lambda grupo: grupo[0]['id'])
+    return resultado
+
+
+# ============================================================================
+# FUSIÓN
+# ============================================================================
+
+def _es_unica(modelo, campo):
+    """True si el modelo admite una sola fila por cliente"""
+    if modelo._meta.get_field(campo).unique:
+        return True
+    if any(tuple(campos) == (campo,) for campos in modelo._meta.unique_together):
+        return True
+    return any(
+        isinstance(restriccion, models.UniqueConstraint) and tuple(restriccion.fields) == (campo,) and restriccion.condition is None
+        for restriccion in modelo._meta.constraints
+    )
+
+
+def _sin_dato(valor):
+    return not valor or normalizar_texto(valor) in ('ninguna', 'ninguno', 'no', 'sin alergias', 'no tiene')
+
+
+def _completar_datos(principal, duplicado):
+    """Completa el principal con los datos del duplicado que le faltan; retorna los campos cambiados"""
+    cambios = []
+    for campo in ('rut', 'fecha_nacimiento', 'telefono', 'dentista_asignado_id', 'user_id'):
+        if not getattr(principal, campo) and getattr(duplicado, campo):
+            setattr(principal, campo, getattr(duplicado, campo))
+            cambios.append(campo)
+
+    # Las alergias no se pierden nunca: si ambos tienen, se juntan
+    if not _sin_dato(duplicado.alergias):
+        if _sin_dato(principal.alergias):
+            principal.alergias = duplicado.alergias
+            cambios.append('alergias')
+        elif normalizar_texto(duplicado.alergias) not in normalizar_texto(principal.alergias):
+            principal.alergias = f'{principal.alergias}; {duplicado.alergias}'
+            cambios.append('alergias')
+
+    if duplicado.activo and not principal.activo:
+        principal.activo = True
+        cambios.append('activo')
+
+    nota = f'Fusionado con el cliente #{duplicado.id} ({duplicado.nombre_completo}, {duplicado.email}) el {timezone.localdate().strftime("%d/%m/%Y")}.'
+    if duplicado.notas:
+        nota += f' Notas del cliente fusionado: {duplicado.notas}'
+    principal.notas = f'{principal.notas}\n{nota}' if principal.notas else nota
+    return cambios
+
+
+def fusionar_clientes(principal, duplicado, usuario=None):
+    """
+    Fusiona `duplicado` en `principal` en una transacción y elimina el duplicado.
+
+    Retorna {'traspasados': {modelo: filas}, 'descartados': {modelo: filas}, 'campos': [...]}.
+    Una fila única por cliente (p.ej. la evaluación) solo se traspasa si el principal no
+    tiene una; si la tiene, la del duplicado se elimina junto con él.
+    Si el RUT que recibe el principal ya lo tiene otro cliente activo se lanza
+    RutDuplicado y no se fusiona nada.
+    """
+    from citas.asignaciones import recalcular_asignaciones_cliente
+    from citas.models_auditoria import registrar_auditoria
+
+    if principal.pk == duplicado.pk:
+        raise ValueError('No se puede fusionar un cliente consigo mismo')
+
+    resumen = {'traspasados': {}, 'descartados': {}, 'campos': []}
+    with transaction.atomic():
+        bloqueados = Cliente.objects.select_for_update().in_bulk([principal.pk, duplicado.pk])
+        principal, duplicado = bloqueados[principal.pk], bloqueados[duplicado.pk]
+
+        for relacion in Cliente._meta.related_objects:
+            modelo = relacion.related_model
+            if modelo._meta.label in MODELOS_RECALCULADOS:
+                continue
+            campo = relacion.field.name
+            filas = modelo.objects.filter(**{campo: duplicado})
+            if _es_unica(modelo, campo) and modelo.objects.filter(**{campo: principal}).exists():
+                descartadas = filas.count()
+                if descartadas:
+                    resumen['descartados'][modelo._meta.verbose_name_plural] = descartadas
+                continue
+            traspasadas = filas.update(**{campo: principal})
+            if traspasadas:
+                resumen['traspasados'][modelo._meta.verbose_name_plural] = traspasadas
+
+        resumen['campos'] = _completar_datos(principal, duplicado)
+        datos_duplicado = f'#{duplicado.id} {duplicado.nombre_completo} ({duplicado.email})'
+
+        # Primero se elimina el duplicado: el RUT y el usuario web son únicos
+        duplicado.delete()
+        principal.save()
+        recalcular_asignaciones_cliente(principal)
+
+    registrar_auditoria(
+        usuario=usuario,
+        accion='editar',
+        modulo='clientes',
+        descripcion=f'Cliente {datos_duplicado} fusionado en #{principal.id} {principal.nombre_completo}',
+        detalles=f'Traspasados: {resumen["traspasados"]}, Descartados: {resumen["descartados"]}, Campos completados: {resumen["campos"]}',
+        objeto_id=principal.id,
+        tipo_objeto='Cliente',
+    )
+    return resumen
@@ -0,0 +1,428 @@
+"""
+Importación masiva de pacientes (Cliente) desde archivos CSV o XLSX.
+
+Antes los comandos creaban pacientes de a uno con get_or_create() y save(): dos o tres
+consultas por fila y, en algunos casos, todo dentro de una única transacción gigante.
+Importar la lista de otra clínica (decenas de miles de pacientes) tomaba horas.
+
+El proceso ahora es:
+
+1. Lectura: CSV (separador detectado: coma, punto y coma o tabulación; UTF-8 o Latin-1)
+   o XLSX (openpyxl en modo solo lectura). Los encabezados se reconocen por sinónimos
+   sin importar tildes ni mayúsculas (ver ENCABEZADOS).
+2. Normalización de todas las filas en memoria, antes de tocar la base de datos:
+   teléfono con normalizar_telefono_chileno_modelo, RUT con su dígito verificador
+   (pacientes/rut.py), email, fecha de nacimiento. Las filas con errores y las repetidas
+   dentro del mismo archivo van al reporte de errores con su número de fila.
+3. Una consulta (por cada 1000 valores) para traer los clientes que ya existen con esos
+   emails y los RUT ya usados por clientes activos.
+4. Escritura con bulk_create / bulk_update en lotes de TAMANO_LOTE, cada lote en su propia
+   transacción: si el proceso se corta, lo ya escrito queda guardado y volver a importar
+   el archivo omite (o actualiza) esos pacientes. Si un lote choca con un registro creado
+   mientras tanto, ese lote se guarda fila por fila para identificar la fila en conflicto.
+
+Un paciente existente se reconoce por su email. Por defecto se omite; con actualizar=True
+se actualizan sus datos (ver importar_clientes).
+
+Se usa desde el gestor de clientes (importar_clientes_archivo) y desde el comando
+`importar_clientes`.
+"""
+import csv
+import io
+from datetime import date, datetime
+
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import IntegrityError, transaction
+from django.db.models.functions import Upper
+from django.utils import timezone
+
+from .busqueda import normalizar_texto
+from .models import Cliente, RutDuplicado, normalizar_telefono_chileno_modelo
+from .rut import formatear_rut, normalizar_rut
+
+# Filas por bulk_create / bulk_update (y valores por consulta IN)
+TAMANO_LOTE = 1000
+
+# Tamaño máximo del archivo subido desde el gestor de clientes
+MAXIMO_TAMANO_ARCHIVO = 10 * 1024 * 1024
+
+EXTENSIONES_CSV = ('.csv', '.txt')
+EXTENSIONES_XLSX = ('.xlsx', '.xlsm')
+
+# Campo de Cliente -> encabezados aceptados (se comparan normalizados)
+ENCABEZADOS = {
+    'nombre_completo': ('nombre_completo', 'nombre completo', 'nombre', 'paciente', 'nombre paciente'),
+    'email': ('email', 'correo', 'correo electronico', 'e-mail', 'mail'),
+    'telefono': ('telefono', 'celular', 'fono', 'movil', 'telefono celular'),
+    'rut': ('rut', 'run', 'rut paciente'),
+    'fecha_nacimiento': ('fecha_nacimiento', 'fecha nacimiento', 'fecha de nacimiento', 'nacimiento'),
+    'alergias': ('alergias', 'alergia'),
+    'notas': ('notas', 'observaciones', 'comentarios'),
+}
+OBLIGATORIOS = ('nombre_completo', 'email', 'telefono')
+
+FORMATOS_FECHA = ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%d.%m.%Y')
+
+# Campos que se pueden actualizar en un paciente existente
+CAMPOS_ACTUALIZABLES = ('nombre_completo', 'telefono', 'rut', 'fecha_nacimiento', 'alergias', 'notas')
+
+
+class ArchivoInvalido(ValueError):
+    """El archivo no se puede leer o le faltan columnas obligatorias"""
+
+
+def _trozos(elementos, tamano):
+    for inicio in range(0, len(elementos), tamano):
+        yield elementos[inicio:inicio + tamano]
+
+
+def _texto(valor):
+    if valor is None:
+        return ''
+    if isinstance(valor, float) and valor.is_integer():
+        # Excel guarda los teléfonos y RUT sin formato como números
+        valor = int(valor)
+    return str(valor).strip()
+
+
+# ============================================================================
+# LECTURA
+# ============================================================================
+
+def _filas_csv(contenido):
+    if isinstance(contenido, bytes):
+        try:
+            contenido = contenido.decode('utf-8-sig')
+        except UnicodeDecodeError:
+            contenido = contenido.decode('latin-1')
+    try:
+        dialecto = csv.Sniffer().sniff(contenido[:4096], delimiters=',;\t')
+    except csv.Error:
+        dialecto = csv.excel
+    return csv.reader(io.StringIO(contenido), dialecto)
+
+
+def _filas_xlsx(archivo):
+    from openpyxl import load_workbook
+
+    try:
+        libro = load_workbook(archivo, read_only=True, data_only=True)
+    except Exception as e:
+        raise ArchivoInvalido(f'No se pudo leer el archivo Excel: {e}') from e
+    return libro.active.iter_rows(values_only=True)
+
+
+def _columnas(encabezados):
+    """Índice de columna -> campo de Cliente, según los encabezados del archivo"""
+    sinonimos = {normalizar_texto(alias): campo for campo, aliases in ENCABEZADOS.items() for alias in aliases}
+    columnas = {}
+    for indice, encabezado in enumerate(encabezados):
+        campo = sinonimos.get(normalizar_texto(_texto(encabezado)))
+        if campo and campo not in columnas.values():
+            columnas[indice] = campo
+    faltantes = [campo for campo in OBLIGATORIOS if campo not in columnas.values()]
+    if faltantes:
+        raise ArchivoInvalido(
+            'Faltan columnas obligatorias: ' + ', '.join(faltantes)
+            + '. Encabezados aceptados: ' + '; '.join(f'{campo}: {", ".join(ENCABEZADOS[campo])}' for campo in faltantes)
+        )
+    return columnas
+
+
+def leer_archivo(archivo, nombre=None):
+    """
+    Lista de (número de fila, {campo: valor}) de un archivo CSV o XLSX.
+    La fila 1 son los encabezados; las filas vacías se saltan.
+    """
+    nombre = (nombre or getattr(archivo, 'name', '') or '').lower()
+    if nombre.endswith(EXTENSIONES_XLSX):
+        filas = _filas_xlsx(archivo)
+    elif nombre.endswith(EXTENSIONES_CSV):
+        filas = _filas_csv(archivo.read())
+    else:
+        raise ArchivoInvalido('Formato no soportado. Use un archivo CSV o XLSX.')
+
+    filas = iter(filas)
+    encabezados = next(filas, None)
+    if not encabezados:
+        raise ArchivoInvalido('El archivo está vacío.')
+    columnas = _columnas(encabezados)
+
+    resultado = []
+    for numero, fila in enumerate(filas, start=2):
+        if not fila or not any(_texto(valor) for valor in fila):
+            continue
+        resultado.append((numero, {campo: fila[indice] if indice < len(fila) else None for indice, campo in columnas.items()}))
+    return resultado
+
+
+# ============================================================================
+# NORMALIZACIÓN
+# ============================================================================
+
+def _fecha(valor):
+    if isinstance(valor, datetime):
+        return valor.date()
+    if isinstance(valor, date):
+        return valor
+    texto = _texto(valor)
+    for formato in FORMATOS_FECHA:
+        try:
+            return datetime.strptime(texto, formato).date()
+        except ValueError:
+            continue
+    raise ValueError(texto)
+
+
+def normalizar_fila(datos):
+    """({campo: valor normalizado}, [errores]) de una fila leída con leer_archivo"""
+    errores = []
+    valores = {
+        'nombre_completo': ' '.join(_texto(datos.get('nombre_completo')).split())[:150],
+        'email': _texto(datos.get('email')).lower(),
+        'alergias': _texto(datos.get('alergias')),
+        'notas': _texto(datos.get('notas')),
+        'telefono': '',
+        'rut': None,
+        'rut_normalizado': None,
+        'fecha_nacimiento': None,
+    }
+
+    if not valores['nombre_completo']:
+        errores.append('Falta el nombre')
+
+    if not valores['email']:
+        errores.append('Falta el email')
+    else:
+        try:
+            validate_email(valores['email'])
+        except ValidationError:
+            errores.append(f'Email no válido: {valores["email"]}')
+
+    telefono = _texto(datos.get('telefono'))
+    if not telefono:
+        errores.append('Falta el teléfono')
+    else:
+        valores['telefono'] = normalizar_telefono_chileno_modelo(telefono)
+        if not valores['telefono']:
+            errores.append(f'Teléfono no válido: {telefono}')
+
+    rut = _texto(datos.get('rut'))
+    if rut:
+        valores['rut_normalizado'] = normalizar_rut(rut)
+        if valores['rut_normalizado']:
+            valores['rut'] = formatear_rut(rut)
+        else:
+            errores.append(f'RUT no válido: {rut}')
+
+    if _texto(datos.get('fecha_nacimiento')):
+        try:
+            valores['fecha_nacimiento'] = _fecha(datos['fecha_nacimiento'])
+        except ValueError:
+            errores.append(f'Fecha de nacimiento no válida: {_texto(datos["fecha_nacimiento"])} (use AAAA-MM-DD o DD/MM/AAAA)')
+        else:
+            if valores['fecha_nacimiento'] > timezone.localdate():
+                errores.append('La fecha de nacimiento es futura')
+
+    return valores, errores
+
+
+# ============================================================================
+# IMPORTACIÓN
+# ============================================================================
+
+def clientes_por_email(emails):
+    """{email en minúsculas: Cliente} de los clientes con esos emails (los activos primero)"""
+    existentes = {}
+    for lote in _trozos(sorted(emails), TAMANO_LOTE):
+        # UPPER(email) usa el índice cliente_email_upper_idx
+        clientes = Cliente.objects.annotate(email_mayusculas=Upper('email')).filter(
+            email_mayusculas__in=[email.upper() for email in lote]
+        ).order_by('-activo', 'id')
+        for cliente in clientes:
+            existentes.setdefault(cliente.email.lower(), cliente)
+    return existentes
+
+
+def _ruts_activos(ruts):
+    ruts_activos = {}
+    for lote in _trozos(sorted(ruts), TAMANO_LOTE):
+        filas = Cliente.objects.filter(activo=True, rut_normalizado__in=lote).values_list('rut_normalizado', 'id', 'nombre_completo')
+        for rut_normalizado, cliente_id, nombre in filas:
+            ruts_activos[rut_normalizado] = (cliente_id, nombre)
+    return ruts_activos
+
+
+def _aplicar_cambios(cliente, valores, sobrescribir):
+    """Copia los valores de la fila al cliente; retorna los campos modificados"""
+    cambios = []
+    for campo in CAMPOS_ACTUALIZABLES:
+        nuevo = valores[campo]
+        if nuevo in (None, ''):
+            continue
+        actual = getattr(cliente, campo)
+        if campo not in sobrescribir and actual not in (None, ''):
+            continue
+        if campo == 'rut' and valores['rut_normalizado'] == normalizar_rut(actual):
+            continue
+        if actual != nuevo:
+            setattr(cliente, campo, nuevo)
+            cambios.append(campo)
+    return cambios
+
+
+def _error(resumen, numero, valores, mensaje):
+    resumen['errores'].append({
+        'fila': numero,
+        'nombre': valores.get('nombre_completo', ''),
+        'email': valores.get('email', ''),
+        'error': mensaje,
+    })
+
+
+def _guardar_lote(lote, resumen, campos=None):
+    """bulk_create (campos=None) o bulk_update del lote [(número de fila, cliente)] en una transacción"""
+    clientes = [cliente for _, cliente in lote]
+    ahora = timezone.now()
+    for cliente in clientes:
+        cliente.normalizar_campos()
+        # bulk_update no aplica auto_now
+        cliente.actualizado_el = ahora
+    clave = 'creados' if campos is None else 'actualizados'
+    try:
+        with transaction.atomic():
+            if campos is None:
+                Cliente.objects.bulk_create(clientes)
+            else:
+                Cliente.objects.bulk_update(clientes, campos)
+        resumen[clave] += len(clientes)
+        return [cliente for cliente in clientes if cliente.pk]
+    except IntegrityError:
+        pass
+
+    # Algún registro chocó con otro guardado mientras tanto: de a uno para identificarlo
+    guardados = []
+    for numero, cliente in lote:
+        try:
+            with transaction.atomic():
+                if campos is None:
+                    cliente.pk = None
+                    cliente.save(force_insert=True)
+                else:
+                    cliente.save(update_fields=campos)
+            resumen[clave] += 1
+            guardados.append(cliente)
+        except (IntegrityError, RutDuplicado):
+            _error(resumen, numero, {'nombre_completo': cliente.nombre_completo, 'email': cliente.email},
+                   'El email o el RUT ya está registrado en otro cliente')
+    return guardados
+
+
+def _recalcular_asignaciones(clientes):
+    """Los pacientes nuevos pueden tener citas antiguas registradas solo con su email"""
+    from citas.asignaciones import recalcular_asignaciones_cliente
+    from citas.models import DentistaPaciente
+
+    por_email = {cliente.email.lower(): cliente for cliente in clientes}
+    for lote in _trozos(sorted(por_email), TAMANO_LOTE):
+        emails = DentistaPaciente.objects.filter(cliente__isnull=True, paciente_email__in=lote).values_list('paciente_email', flat=True).distinct()
+        for email in emails:
+            recalcular_asignaciones_cliente(por_email[email])
+
+
+def importar_clientes(filas, actualizar=False, sobrescribir=None, valores_nuevos=None, dry_run=False, tamano_lote=TAMANO_LOTE):
+    """
+    Importa las filas [(número de fila, {campo: valor})] de leer_archivo().
+
+    actualizar: si es False, los pacientes que ya existen (mismo email) se omiten. Si es
+        True, se actualizan: los campos de `sobrescribir` (por defecto todos) se reemplazan
+        con los del archivo y el resto solo se completa si está vacío.
+    valores_nuevos: valores adicionales para los pacientes creados (p.ej. dentista_asignado).
+    dry_run: solo validar; cuenta lo que se crearía/actualizaría sin escribir.
+
+    Retorna {'filas', 'creados', 'actualizados', 'omitidos', 'errores': [{'fila', 'nombre',
+    'email', 'error'}], 'dry_run'}.
+    """
+    sobrescribir = set(CAMPOS_ACTUALIZABLES if sobrescribir is None else sobrescribir)
+    valores_nuevos = valores_nuevos or {}
+    resumen = {'filas': 0, 'creados': 0, 'actualizados': 0, 'omitidos': 0, 'errores': [], 'dry_run': dry_run}
+
+    # 1. Normalizar todas las filas y detectar repetidos dentro del archivo
+    validas = []
+    fila_por_email = {}
+    fila_por_rut = {}
+    for numero, datos in filas:
+        resumen['filas'] += 1
+        valores, errores = normalizar_fila(datos)
+        if not errores:
+            if valores['email'] in fila_por_email:
+                errores.append(f'Email repetido en el archivo (fila {fila_por_email[valores["email"]]})')
+            elif valores['rut_normalizado'] and valores['rut_normalizado'] in fila_por_rut:
+                errores.append(f'RUT repetido en el archivo (fila {fila_por_rut[valores["rut_normalizado"]]})')
+        if errores:
+            _error(resumen, numero, valores, '; '.join(errores))
+            continue
+        fila_por_email[valores['email']] = numero
+        if valores['rut_normalizado']:
+            fila_por_rut[valores['rut_normalizado']] = numero
+        validas.append((numero, valores))
+
+    # 2. Clientes existentes con esos emails y RUT ocupados (consultas por lotes)
+    existentes = clientes_por_email(fila_por_email)
+    ruts_activos = _ruts_activos(fila_por_rut)
+
+    # 3. Clasificar en nuevos / a actualizar / omitidos
+    nuevos = []
+    modificados = []
+    campos_modificados = set()
+    for numero, valores in validas:
+        existente = existentes.get(valores['email'])
+        dueno_rut = ruts_activos.get(valores['rut_normalizado'])
+        if existente is None:
+            if dueno_rut:
+                _error(resumen, numero, valores, f'El RUT ya pertenece al cliente {dueno_rut[1]}')
+                continue
+            campos = {campo: valores[campo] for campo in CAMPOS_ACTUALIZABLES}
+            campos['alergias'] = campos['alergias'] or None
+            campos['notas'] = campos['notas'] or None
+            nuevos.append((numero, Cliente(email=valores['email'], activo=True, **campos, **valores_nuevos)))
+        elif not actualizar:
+            resumen['omitidos'] += 1
+        else:
+            if dueno_rut and dueno_rut[0] != existente.id and valores['rut_normalizado'] != existente.rut_normalizado:
+                _error(resumen, numero, valores, f'El RUT ya pertenece al cliente {dueno_rut[1]}')
+                continue
+            cambios = _aplicar_cambios(existente, valores, sobrescribir)
+            if cambios:
+                modificados.append((numero, existente))
+                campos_modificados.update(cambios)
+            else:
+                resumen['omitidos'] += 1
+
+    if dry_run:
+        resumen['creados'] = len(nuevos)
+        resumen['actualizados'] = len(modificados)
+    else:
+        # 4. Escribir en lotes, cada uno en su propia transacción
+        creados = []
+        for lote in _trozos(nuevos, tamano_lote):
+            creados.extend(_guardar_lote(lote, resumen))
+        campos = sorted(campos_modificados | set(Cliente.CAMPOS_NORMALIZADOS) | {'actualizado_el'})
+        for lote in _trozos(modificados, tamano_lote):
+            _guardar_lote(lote, resumen, campos=campos)
+        if creados:
+            _recalcular_asignaciones(creados)
+
+    resumen['errores'].sort(key=lambda error: error['fila'])
+    return resumen
+
+
+def reporte_errores_csv(resumen):
+    """Reporte de errores por fila como texto CSV"""
+    salida = io.StringIO()
+    escritor = csv.writer(salida)
+    escritor.writerow(['fila', 'nombre', 'email', 'error'])
+    for error in resumen['errores']:
+        escritor.writerow([error['fila'], error['nombre'], error['email'], error['error']])
+    return salida.getvalue()
@@ -0,0 +1,121 @@
+# Generated by Django 5.2.5 on 2026-10-18 22:23
+
+import re
+import unicodedata
+
+import django.db.models.functions.text
+from django.conf import settings
+from django.db import migrations, models
+
+TAMANO_LOTE = 500
+
+# Índices de trigramas (solo PostgreSQL): nombre de índice -> expresión indexada
+INDICES_TRIGRAMAS = {
+    'cliente_busqueda_nombre_trgm': 'busqueda_nombre',
+    'cliente_busqueda_tel_trgm': 'busqueda_telefono',
+    'cliente_email_upper_trgm': 'UPPER(email)',
+}
+
+
+# Copia de la normalización de pacientes/busqueda.py tal como era al crear esta
+# migración: si aquel módulo cambia, la migración sigue calculando lo mismo.
+_NO_PERMITIDOS = re.compile(r'[^a-z0-9@._+\-]+')
+
+
+def _normalizar_texto(texto):
+    if not texto:
+        return ''
+    texto = unicodedata.normalize('NFKD', str(texto))
+    texto = ''.join(caracter for caracter in texto if not unicodedata.combining(caracter)).lower()
+    return ' '.join(_NO_PERMITIDOS.sub(' ', texto).split())
+
+
+def _columnas_busqueda(nombre_completo, rut, telefono):
+    return {
+        'busqueda_nombre': _normalizar_texto(nombre_completo)[:150],
+        'busqueda_rut': re.sub(r'[^0-9K]', '', str(rut or '').upper())[:12],
+        'busqueda_telefono': re.sub(r'\D', '', str(telefono or ''))[:20],
+    }
+
+
+def calcular_columnas_busqueda(apps, schema_editor):
+    """Llena las columnas de búsqueda de los clientes existentes"""
+    Cliente = apps.get_model('pacientes', 'Cliente')
+    campos = ['busqueda_nombre', 'busqueda_rut', 'busqueda_telefono']
+    lote = []
+    for cliente in Cliente.objects.only('id', 'nombre_completo', 'rut', 'telefono').iterator(chunk_size=TAMANO_LOTE):
+        for campo, valor in _columnas_busqueda(cliente.nombre_completo, cliente.rut, cliente.telefono).items():
+            setattr(cliente, campo, valor)
+        lote.append(cliente)
+        if len(lote) >= TAMANO_LOTE:
+            Cliente.objects.bulk_update(lote, campos)
+            lote = []
+    if lote:
+        Cliente.objects.bulk_update(lote, campos)
+
+
+def crear_indices_trigramas(apps, schema_editor):
+    """
+    En PostgreSQL crea la extensión pg_trgm y los índices GIN para LIKE '%texto%'.
+    Si el usuario de la base no puede crear la extensión, la migración falla: hay que
+    crearla una vez como superusuario (CREATE EXTENSION pg_trgm) y volver a migrar.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for nombre, expresion in INDICES_TRIGRAMAS.items():
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {nombre} ON pacientes_cliente USING gin ({expresion} gin_trgm_ops)'
+        )
+
+
+def eliminar_indices_trigramas(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for nombre in INDICES_TRIGRAMAS:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {nombre}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pacientes', '0003_add_user_field_to_cliente'),
+        ('personal', '0002_alter_perfil_telefono'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cliente',
+            name='busqueda_nombre',
+            field=models.CharField(blank=True, default='', editable=False, max_length=150),
+        ),
+        migrations.AddField(
+            model_name='cliente',
+            name='busqueda_rut',
+            field=models.CharField(blank=True, default='', editable=False, max_length=12),
+        ),
+        migrations.AddField(
+            model_name='cliente',
+            name='busqueda_telefono',
+            field=models.CharField(blank=True, default='', editable=False, max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='cliente',
+            index=models.Index(fields=['busqueda_nombre'], name='cliente_busqueda_nombre_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cliente',
+            index=models.Index(fields=['busqueda_rut'], name='cliente_busqueda_rut_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cliente',
+            index=models.Index(fields=['busqueda_telefono'], name='cliente_busqueda_tel_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cliente',
+            index=models.Index(django.db.models.functions.text.Upper('email'), name='cliente_email_upper_idx'),
+        ),
+        migrations.RunPython(calcular_columnas_busqueda, migrations.RunPython.noop),
+        migrations.RunPython(crear_indices_trigramas, eliminar_indices_trigramas),
+    ]
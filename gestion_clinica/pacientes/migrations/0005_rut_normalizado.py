@@ -0,0 +1,87 @@
+# Generated by Django 5.2.5 on 2026-10-18 22:26
+
+import re
+
+from django.conf import settings
+from django.db import migrations, models
+
+TAMANO_LOTE = 500
+
+
+# Copia de pacientes/rut.py tal como era al crear esta migración: si aquel módulo
+# cambia, la migración sigue calculando lo mismo.
+def _limpiar_rut(rut):
+    return re.sub(r'[^0-9K]', '', str(rut or '').upper()).lstrip('0')
+
+
+def _calcular_digito_verificador(cuerpo):
+    suma = 0
+    factor = 2
+    for digito in reversed(str(cuerpo)):
+        suma += int(digito) * factor
+        factor = 2 if factor == 7 else factor + 1
+    resto = 11 - suma % 11
+    if resto == 11:
+        return '0'
+    if resto == 10:
+        return 'K'
+    return str(resto)
+
+
+def _normalizar_rut(rut):
+    limpio = _limpiar_rut(rut)
+    cuerpo, digito = limpio[:-1], limpio[-1:]
+    if not cuerpo.isdigit() or not 7 <= len(cuerpo) <= 8:
+        return None
+    if _calcular_digito_verificador(cuerpo) != digito:
+        return None
+    return limpio
+
+
+def calcular_rut_normalizado(apps, schema_editor):
+    """
+    Llena rut_normalizado (y recalcula busqueda_rut, que ahora quita los ceros a la
+    izquierda). Si dos clientes activos tienen el mismo RUT escrito de distinta forma,
+    solo el más antiguo queda con rut_normalizado; los demás aparecen como pares con el
+    mismo RUT en `python manage.py detectar_duplicados` para revisarlos.
+    """
+    Cliente = apps.get_model('pacientes', 'Cliente')
+    vistos = set()
+    lote = []
+    clientes = Cliente.objects.exclude(rut__isnull=True).exclude(rut='').only('id', 'rut', 'activo')
+    for cliente in clientes.order_by('id').iterator(chunk_size=TAMANO_LOTE):
+        cliente.busqueda_rut = _limpiar_rut(cliente.rut)[:12]
+        cliente.rut_normalizado = _normalizar_rut(cliente.rut)
+        if cliente.rut_normalizado and cliente.activo:
+            if cliente.rut_normalizado in vistos:
+                cliente.rut_normalizado = None
+            else:
+                vistos.add(cliente.rut_normalizado)
+        lote.append(cliente)
+        if len(lote) >= TAMANO_LOTE:
+            Cliente.objects.bulk_update(lote, ['busqueda_rut', 'rut_normalizado'])
+            lote = []
+    if lote:
+        Cliente.objects.bulk_update(lote, ['busqueda_rut', 'rut_normalizado'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pacientes', '0004_busqueda_normalizada'),
+        ('personal', '0002_alter_perfil_telefono'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cliente',
+            name='rut_normalizado',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=9, null=True, verbose_name='RUT Normalizado'),
+        ),
+        migrations.RunPython(calcular_rut_normalizado, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cliente',
+            constraint=models.UniqueConstraint(condition=models.Q(('activo', True)), fields=('rut_normalizado',), name='cliente_rut_normalizado_unico'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.5 on 2026-10-18 23:40
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pacientes', '0005_rut_normalizado'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cliente',
+            name='actualizado_el',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name='cliente',
+            index=models.Index(fields=['actualizado_el', 'id'], name='cliente_actualizado_idx'),
+        ),
+    ]
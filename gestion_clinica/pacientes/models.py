@@ -1,8 +1,13 @@
 from django.db import models
 from django.core.validators import RegexValidator
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.db.models.functions import Coalesce, Upper
 import re
 
+from .busqueda import columnas_busqueda
+from .rut import normalizar_rut
+
 
 def normalizar_telefono_chileno_modelo(telefono):
     """
@@ -49,6 +54,39 @@ def normalizar_telefono_chileno_modelo(telefono):
     return None
 
 
+class RutDuplicado(ValidationError):
+    """Guardar el cliente activo dejaría su RUT repetido con el de otro cliente activo"""
+
+    def __init__(self, rut, cliente_id):
+        self.cliente_id = cliente_id
+        super().__init__(f'El RUT {rut} ya está registrado en otro cliente activo.', code='rut_duplicado')
+
+
+class ClienteQuerySet(models.QuerySet):
+    def con_contadores(self):
+        """
+        Anota total_citas, total_odontogramas y total_radiografias de cada cliente.
+
+        Antes el gestor de clientes usaba Count(..., distinct=True) sobre las tres relaciones
+        en la misma consulta: el JOIN genera citas x odontogramas x radiografías filas por
+        cliente antes del DISTINCT, y un paciente con historial largo hacía la página cada
+        vez más lenta. Con una subconsulta por conteo cada una usa el índice de cliente_id,
+        y con LIMIT solo se calculan para los clientes de la página.
+        """
+        def contar(relacion):
+            campo = self.model._meta.get_field(relacion).field
+            subconsulta = campo.model.objects.filter(**{campo.name: models.OuterRef('pk')}).order_by().values(campo.name).annotate(
+                total=models.Count('pk'),
+            ).values('total')
+            return Coalesce(models.Subquery(subconsulta, output_field=models.IntegerField()), 0)
+
+        return self.annotate(
+            total_citas=contar('citas'),
+            total_odontogramas=contar('odontogramas'),
+            total_radiografias=contar('radiografias'),
+        )
+
+
 class Cliente(models.Model):
     nombre_completo = models.CharField(max_length=150)
     email = models.EmailField(unique=True)
@@ -62,6 +100,15 @@ class Cliente(models.Model):
         verbose_name="RUT",
         help_text="RUT en formato: 12345678-9 (opcional pero recomendado)"
     )
+    # RUT canónico con dígito verificador válido (ver pacientes/rut.py); se calcula en save()
+    rut_normalizado = models.CharField(
+        max_length=9,
+        null=True,
+        blank=True,
+        editable=False,
+        db_index=True,
+        verbose_name="RUT Normalizado"
+    )
     
     telefono = models.CharField(
         max_length=20,
@@ -91,6 +138,8 @@ class Cliente(models.Model):
     )
     
     fecha_registro = models.DateTimeField(auto_now_add=True)
+    # Marca de agua de la sincronización incremental (ver citas/sincronizacion_clientes.py)
+    actualizado_el = models.DateTimeField(auto_now=True)
     activo = models.BooleanField(default=True)
     notas = models.TextField(blank=True, null=True)
     
@@ -116,14 +165,87 @@ class Cliente(models.Model):
         verbose_name="Dentista Asignado"
     )
     
-    def save(self, *args, **kwargs):
-        """Normaliza el teléfono automáticamente antes de guardar"""
+    # Columnas de búsqueda normalizadas (ver pacientes/busqueda.py); se calculan en save()
+    busqueda_nombre = models.CharField(max_length=150, blank=True, default='', editable=False)
+    busqueda_rut = models.CharField(max_length=12, blank=True, default='', editable=False)
+    busqueda_telefono = models.CharField(max_length=20, blank=True, default='', editable=False)
+    
+    objects = ClienteQuerySet.as_manager()
+    
+    # Campos que calcula normalizar_campos() a partir de nombre, RUT y teléfono
+    CAMPOS_NORMALIZADOS = ('rut_normalizado', 'busqueda_nombre', 'busqueda_rut', 'busqueda_telefono')
+    
+    def normalizar_campos(self):
+        """
+        Normaliza el teléfono y calcula el RUT normalizado y las columnas de búsqueda.
+        Lo llama save(); quien use bulk_create/bulk_update debe llamarlo antes.
+        """
         if self.telefono:
             telefono_normalizado = normalizar_telefono_chileno_modelo(self.telefono)
             if telefono_normalizado:
                 self.telefono = telefono_normalizado
             # Si no se puede normalizar, mantener el valor original (el validador lo rechazará)
+        rut_normalizado = normalizar_rut(self.rut)
+        # La migración 0005 dejó sin rut_normalizado a los clientes activos que repetían el
+        # RUT de otro, para revisarlos con detectar_duplicados: siguen así mientras no cambie su RUT (save() lo
+        # completa cuando el otro ya no está activo)
+        if not self._rut_duplicado_pendiente():
+            self.rut_normalizado = rut_normalizado
+        for campo, valor in columnas_busqueda(self.nombre_completo, self.rut, self.telefono).items():
+            setattr(self, campo, valor)
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        # RUT y estado con que está guardado, para saber si cambió la unicidad del RUT
+        instancia._rut_guardado = tuple(instancia.__dict__.get(campo) for campo in ('rut', 'rut_normalizado', 'activo'))
+        return instancia
+    
+    def _rut_duplicado_pendiente(self):
+        """Guardado sin rut_normalizado aunque su RUT es válido, y sin cambiar el RUT"""
+        guardado = getattr(self, '_rut_guardado', None)
+        return bool(
+            guardado and guardado[1] is None and self.rut == guardado[0] and normalizar_rut(self.rut)
+        )
+    
+    def _verificar_rut_unico(self, update_fields):
+        """
+        Lanza RutDuplicado antes de guardar un RUT repetido entre clientes activos (nuevo,
+        cambiado o al reactivar el cliente), en vez de dejar que el INSERT/UPDATE choque
+        con cliente_rut_normalizado_unico.
+        """
+        if update_fields and not {'rut', 'activo', 'rut_normalizado'} & set(update_fields):
+            return
+        pendiente = self._rut_duplicado_pendiente()
+        rut_normalizado = normalizar_rut(self.rut) if pendiente else self.rut_normalizado
+        if not self.activo or not rut_normalizado:
+            return
+        guardado = getattr(self, '_rut_guardado', None)
+        if not pendiente and guardado and guardado[1:] == (rut_normalizado, True):
+            return
+        otro_id = Cliente.objects.filter(
+            activo=True, rut_normalizado=rut_normalizado
+        ).exclude(pk=self.pk).values_list('id', flat=True).first()
+        if pendiente:
+            # Sigue repetido: queda pendiente de revisión; si no, se completa
+            if otro_id is None:
+                self.rut_normalizado = rut_normalizado
+            return
+        if otro_id is not None:
+            raise RutDuplicado(self.rut, otro_id)
+    
+    def save(self, *args, **kwargs):
+        """Normaliza el teléfono automáticamente antes de guardar"""
+        self.normalizar_campos()
+        update_fields = kwargs.get('update_fields')
+        self._verificar_rut_unico(update_fields)
+        if update_fields:
+            # auto_now solo se guarda si está en update_fields
+            kwargs['update_fields'] = set(update_fields) | {'actualizado_el'}
+            if {'nombre_completo', 'rut', 'telefono'} & set(update_fields):
+                kwargs['update_fields'] |= set(self.CAMPOS_NORMALIZADOS)
         super().save(*args, **kwargs)
+        self._rut_guardado = (self.rut, self.rut_normalizado, self.activo)
     
     def __str__(self):
         if self.rut:
@@ -170,3 +292,20 @@ class Cliente(models.Model):
         verbose_name = "Cliente"
         verbose_name_plural = "Clientes"
         ordering = ['nombre_completo']
+        constraints = [
+            # Los clientes eliminados (activo=False) conservan su RUT y no bloquean uno nuevo
+            models.UniqueConstraint(
+                fields=['rut_normalizado'],
+                condition=models.Q(activo=True),
+                name='cliente_rut_normalizado_unico',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['busqueda_nombre'], name='cliente_busqueda_nombre_idx'),
+            models.Index(fields=['busqueda_rut'], name='cliente_busqueda_rut_idx'),
+            models.Index(fields=['busqueda_telefono'], name='cliente_busqueda_tel_idx'),
+            # email__iexact se traduce a UPPER(email) = UPPER(%s) en PostgreSQL
+            models.Index(Upper('email'), name='cliente_email_upper_idx'),
+            # Recorrido incremental de la sincronización (marca de agua sobre actualizado_el)
+            models.Index(fields=['actualizado_el', 'id'], name='cliente_actualizado_idx'),
+        ]
@@ -0,0 +1,92 @@
+"""
+Paginación por cursor (keyset) de la lista de clientes.
+
+Con Paginator, la página N hace OFFSET N*10: la base de datos recorre y descarta todas
+las filas anteriores, y además el gestor de clientes cargaba la lista completa en
+memoria para ordenarla. Ahora los clientes se ordenan por (busqueda_nombre, id), el
+nombre normalizado sin tildes con índice, y cada página pide "los 10 siguientes a
+este cliente" (o "los 10 anteriores"), con costo constante sin importar la página.
+
+El cursor codifica el (busqueda_nombre, id) de la primera o la última fila de la página.
+Los enlaces son: primera página (sin cursor), anterior (antes=<cursor de la primera
+fila>), siguiente (despues=<cursor de la última fila>) y última (ultima=1).
+
+codificar_cursor / decodificar_cursor / CursorInvalido son genéricos: la línea de
+tiempo clínica (citas/linea_tiempo.py) arma sus cursores con ellos.
+"""
+import base64
+import binascii
+
+from django.db.models import Q
+
+POR_PAGINA = 10
+
+
+class CursorInvalido(ValueError):
+    pass
+
+
+def codificar_cursor(*valores):
+    """Cursor para la URL con los valores de la fila (el último puede contener '|')"""
+    valor = '|'.join(str(parte) for parte in valores)
+    return base64.urlsafe_b64encode(valor.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decodificar_cursor(cursor, partes):
+    """Los `partes` valores (como texto) de un cursor generado por codificar_cursor"""
+    try:
+        valor = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise CursorInvalido(f'Cursor no válido: {cursor}') from e
+    valores = valor.split('|', partes - 1)
+    if len(valores) != partes:
+        raise CursorInvalido(f'Cursor no válido: {cursor}')
+    return valores
+
+
+def _cursor_cliente(cliente):
+    return codificar_cursor(cliente.id, cliente.busqueda_nombre)
+
+
+def _leer_cursor_cliente(cursor):
+    """(busqueda_nombre, id) de un cursor generado por _cursor_cliente"""
+    cliente_id, nombre = decodificar_cursor(cursor, 2)
+    if not cliente_id.isdigit():
+        raise CursorInvalido(f'Cursor no válido: {cursor}')
+    return nombre, int(cliente_id)
+
+
+def paginar_clientes(clientes, despues=None, antes=None, ultima=False, por_pagina=POR_PAGINA):
+    """
+    Una página de `clientes` (queryset) ordenada por nombre.
+
+    Retorna {'clientes': [...], 'cursor_anterior': str | None, 'cursor_siguiente': str | None,
+    'es_primera': bool, 'es_ultima': bool}. Los cursores son None si no hay página anterior
+    o siguiente. Lanza CursorInvalido si el cursor no se puede leer.
+    """
+    if despues:
+        nombre, cliente_id = _leer_cursor_cliente(despues)
+        filas = list(clientes.filter(
+            Q(busqueda_nombre__gt=nombre) | Q(busqueda_nombre=nombre, id__gt=cliente_id)
+        ).order_by('busqueda_nombre', 'id')[:por_pagina + 1])
+        hay_anterior, hay_siguiente = True, len(filas) > por_pagina
+        filas = filas[:por_pagina]
+    elif antes or ultima:
+        if antes:
+            nombre, cliente_id = _leer_cursor_cliente(antes)
+            clientes = clientes.filter(Q(busqueda_nombre__lt=nombre) | Q(busqueda_nombre=nombre, id__lt=cliente_id))
+        filas = list(clientes.order_by('-busqueda_nombre', '-id')[:por_pagina + 1])
+        hay_anterior, hay_siguiente = len(filas) > por_pagina, bool(antes)
+        filas = filas[:por_pagina][::-1]
+    else:
+        filas = list(clientes.order_by('busqueda_nombre', 'id')[:por_pagina + 1])
+        hay_anterior, hay_siguiente = False, len(filas) > por_pagina
+        filas = filas[:por_pagina]
+
+    return {
+        'clientes': filas,
+        'cursor_anterior': _cursor_cliente(filas[0]) if filas and hay_anterior else None,
+        'cursor_siguiente': _cursor_cliente(filas[-1]) if filas and hay_siguiente else None,
+        'es_primera': not hay_anterior,
+        'es_ultima': not hay_siguiente,
+    }
@@ -0,0 +1,58 @@
+"""
+Normalización y validación del RUT chileno.
+
+El RUT se guarda como lo escribió quien lo ingresó ("12.345.678-5", "12345678-5",
+"123456785"...). Para comparar, Cliente guarda además `rut_normalizado`: solo dígitos
+y el dígito verificador (K en mayúscula), sin ceros a la izquierda, y únicamente si el
+dígito verificador es correcto ("12.345.678-5" -> "123456785"). Se calcula una vez en
+Cliente.save() y tiene un índice único entre los clientes activos, de modo que
+verificar si un RUT ya existe es una búsqueda por índice.
+"""
+import re
+
+# Largo del cuerpo del RUT (sin dígito verificador)
+MINIMO_DIGITOS_CUERPO = 7
+MAXIMO_DIGITOS_CUERPO = 8
+
+
+def limpiar_rut(rut):
+    """Dígitos y K en mayúscula, sin puntos, guion ni ceros a la izquierda"""
+    return re.sub(r'[^0-9K]', '', str(rut or '').upper()).lstrip('0')
+
+
+def calcular_digito_verificador(cuerpo):
+    """Dígito verificador (módulo 11) del cuerpo numérico de un RUT"""
+    suma = 0
+    factor = 2
+    for digito in reversed(str(cuerpo)):
+        suma += int(digito) * factor
+        factor = 2 if factor == 7 else factor + 1
+    resto = 11 - suma % 11
+    if resto == 11:
+        return '0'
+    if resto == 10:
+        return 'K'
+    return str(resto)
+
+
+def normalizar_rut(rut):
+    """
+    RUT canónico ("123456785") o None si está vacío, tiene mal formato o el dígito
+    verificador no corresponde.
+    """
+    limpio = limpiar_rut(rut)
+    cuerpo, digito = limpio[:-1], limpio[-1:]
+    if not cuerpo.isdigit() or not MINIMO_DIGITOS_CUERPO <= len(cuerpo) <= MAXIMO_DIGITOS_CUERPO:
+        return None
+    if calcular_digito_verificador(cuerpo) != digito:
+        return None
+    return limpio
+
+
+def formatear_rut(rut):
+    """RUT con puntos y guion ("123456785" -> "12.345.678-5"); '' si no es válido"""
+    normalizado = normalizar_rut(rut)
+    if not normalizado:
+        return ''
+    cuerpo, digito = normalizado[:-1], normalizado[-1]
+    return f'{int(cuerpo):,}'.replace(',', '.') + f'-{digito}'
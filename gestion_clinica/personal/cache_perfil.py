@@ -0,0 +1,114 @@
+"""
+Caché del Perfil del usuario autenticado.
+
+El Perfil se guarda en la sesión junto con un número de versión. La versión vigente
+de cada perfil vive en la caché de Django y se renueva cada vez que el perfil se
+guarda o elimina (Perfil.save / Perfil.delete), por ejemplo desde `editar_personal`
+o `toggle_estado_personal`. Si la versión de la sesión no coincide, o la copia tiene
+más de TTL_SESION_PERFIL segundos, el perfil se vuelve a leer de la base de datos.
+"""
+import time
+import uuid
+
+from django.core.cache import cache
+
+CLAVE_SESION_PERFIL = '_perfil_cache'
+
+# Vida máxima de la copia en sesión (cubre cambios hechos sin pasar por save())
+TTL_SESION_PERFIL = 300
+
+
+def _clave_version(perfil_id):
+    return f'perfil_version:{perfil_id}'
+
+
+def obtener_version_perfil(perfil_id):
+    """Versión vigente del perfil (se crea si la caché no la tiene)"""
+    return cache.get_or_set(_clave_version(perfil_id), lambda: uuid.uuid4().hex, None)
+
+
+def invalidar_cache_perfil(perfil_id):
+    """Invalida las copias en sesión del perfil en todas las sesiones abiertas"""
+    if perfil_id:
+        cache.set(_clave_version(perfil_id), uuid.uuid4().hex, None)
+
+
+def _serializar_perfil(perfil):
+    datos = {}
+    for campo in perfil._meta.concrete_fields:
+        valor = campo.value_from_object(perfil)
+        datos[campo.attname] = None if valor is None else campo.value_to_string(perfil)
+    return datos
+
+
+def _deserializar_perfil(datos, user):
+    from .models import Perfil
+    campos = {}
+    for campo in Perfil._meta.concrete_fields:
+        valor = datos.get(campo.attname)
+        campos[campo.attname] = None if valor is None else campo.to_python(valor)
+    perfil = Perfil(**campos)
+    perfil._state.adding = False
+    perfil._state.db = 'default'
+    # Evitar la consulta al acceder a perfil.user
+    perfil.user = user
+    return perfil
+
+
+def cargar_perfil(request):
+    """
+    Devuelve el Perfil del usuario autenticado (o None), usando la copia en sesión
+    cuando su versión sigue vigente.
+    """
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return None
+
+    session = getattr(request, 'session', None)
+    if session is not None:
+        copia = session.get(CLAVE_SESION_PERFIL)
+        if (
+            copia
+            and copia.get('user_id') == user.pk
+            and time.time() - copia.get('guardado', 0) < TTL_SESION_PERFIL
+            and copia.get('version') == obtener_version_perfil(copia['datos']['id'])
+        ):
+            try:
+                return _deserializar_perfil(copia['datos'], user)
+            except Exception:
+                # Copia corrupta o de una versión anterior del modelo: leer de la BD
+                pass
+
+    from .models import Perfil
+    perfil = Perfil.objects.filter(user=user).first()
+
+    if session is not None:
+        if perfil is None:
+            session.pop(CLAVE_SESION_PERFIL, None)
+        else:
+            session[CLAVE_SESION_PERFIL] = {
+                'user_id': user.pk,
+                'version': obtener_version_perfil(perfil.id),
+                'guardado': time.time(),
+                'datos': _serializar_perfil(perfil),
+            }
+    return perfil
+
+
+def perfil_de_request(request):
+    """Resuelve el perfil una sola vez por request (None si no hay perfil)"""
+    if not hasattr(request, '_perfil_resuelto'):
+        request._perfil_resuelto = cargar_perfil(request)
+    return request._perfil_resuelto
+
+
+def obtener_perfil(request):
+    """
+    Reemplazo de `Perfil.objects.get(user=request.user)` que reutiliza el perfil ya
+    resuelto en el request. Lanza Perfil.DoesNotExist si el usuario no tiene perfil.
+    """
+    from .models import Perfil
+    perfil = perfil_de_request(request)
+    if perfil is None:
+        raise Perfil.DoesNotExist('El usuario no tiene un perfil asociado.')
+    return perfil
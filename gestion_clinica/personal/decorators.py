@@ -0,0 +1,78 @@
+"""
+Decoradores de acceso para las vistas del personal.
+
+Usan el perfil resuelto por PerfilMiddleware (`request.perfil`), así que no hacen
+consultas adicionales. Las peticiones AJAX reciben JSON con 'success'/'error'; el
+resto un mensaje y una redirección, igual que las vistas existentes.
+"""
+from functools import wraps
+
+from django.contrib import messages
+from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse
+from django.shortcuts import redirect
+
+from .cache_perfil import perfil_de_request
+
+
+def _es_ajax(request):
+    return (
+        request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+        or 'application/json' in request.headers.get('Accept', '')
+    )
+
+
+def _denegar(request, mensaje, redirigir_a, status=403):
+    if _es_ajax(request):
+        return JsonResponse({'success': False, 'error': mensaje}, status=status)
+    messages.error(request, mensaje)
+    return redirect(redirigir_a)
+
+
+def _verificar_acceso(verificacion, mensaje, redirigir_a):
+    """Construye un decorador que exige un perfil activo que cumpla `verificacion`"""
+    def decorador(view_func):
+        @login_required
+        @wraps(view_func)
+        def _vista(request, *args, **kwargs):
+            perfil = perfil_de_request(request)
+            if perfil is None:
+                return _denegar(request, 'No tienes permisos para acceder a este panel.', 'login')
+            if not perfil.activo:
+                return _denegar(request, 'Tu cuenta está desactivada.', 'login')
+            if verificacion is not None and not verificacion(perfil):
+                return _denegar(request, mensaje, redirigir_a)
+            return view_func(request, *args, **kwargs)
+        return _vista
+    return decorador
+
+
+def perfil_requerido(view_func):
+    """Exige un usuario autenticado con Perfil activo"""
+    return _verificar_acceso(None, '', 'login')(view_func)
+
+
+def rol_requerido(*roles, redirigir_a='panel_trabajador', mensaje='No tienes permisos para acceder a esta sección.'):
+    """
+    Exige que el perfil tenga alguno de los roles indicados.
+    'administrativo' incluye al rol 'general', igual que Perfil.es_administrativo().
+
+    Uso:
+        @rol_requerido('administrativo')
+        @rol_requerido('dentista', 'general')
+    """
+    def verificacion(perfil):
+        if 'administrativo' in roles and perfil.es_administrativo():
+            return True
+        return perfil.rol in roles
+    return _verificar_acceso(verificacion, mensaje, redirigir_a)
+
+
+def permiso_requerido(permiso, redirigir_a='panel_trabajador', mensaje='No tienes permisos para realizar esta acción.'):
+    """
+    Exige un permiso específico del perfil (ver Perfil.tiene_permiso).
+
+    Uso:
+        @permiso_requerido('puede_ver_reportes')
+    """
+    return _verificar_acceso(lambda perfil: perfil.tiene_permiso(permiso), mensaje, redirigir_a)
@@ -0,0 +1,20 @@
+from django.utils.functional import SimpleLazyObject
+
+from .cache_perfil import perfil_de_request
+
+
+class PerfilMiddleware:
+    """
+    Expone `request.perfil` con el Perfil del usuario autenticado (o None).
+
+    Se resuelve de forma perezosa la primera vez que se usa y se reutiliza durante todo
+    el request; entre requests se toma de la copia en sesión mientras su versión siga
+    vigente (ver personal.cache_perfil). Debe ir después de AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.perfil = SimpleLazyObject(lambda: perfil_de_request(request))
+        return self.get_response(request)
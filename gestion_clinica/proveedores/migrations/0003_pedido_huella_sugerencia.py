@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 23:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('proveedores', '0002_remove_solicitudinsumo_correo_enviado_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pedido',
+            name='huella_sugerencia',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64, verbose_name='Huella de la Sugerencia'),
+        ),
+    ]
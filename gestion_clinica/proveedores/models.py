@@ -59,6 +59,10 @@ class Pedido(models.Model):
     recibido_por = models.ForeignKey(Perfil, on_delete=models.SET_NULL, null=True, blank=True, related_name='pedidos_recibidos')
     fecha_recepcion = models.DateTimeField(null=True, blank=True, verbose_name="Fecha de Recepción")
     
+    # Pedidos sugeridos por el pronóstico (inventario/pronostico.py): huella del contenido
+    # con que se generó; si ya no coincide, alguien lo editó y no se reemplaza
+    huella_sugerencia = models.CharField(max_length=64, blank=True, default='', editable=False, verbose_name="Huella de la Sugerencia")
+    
     def calcular_monto_total(self):
         """Calcula el monto total del pedido basado en las solicitudes"""
         total = 0
@@ -7,9 +7,11 @@ cd /app/gestion_clinica
 echo "Running migrations..."
 python manage.py migrate --noinput
 
-# Iniciar Gunicorn
-echo "Starting Gunicorn..."
-exec gunicorn gestion_clinica.wsgi:application \
+# Iniciar Gunicorn con workers uvicorn (ASGI): los streams de eventos de la agenda
+# (citas/views_eventos.py) son vistas asíncronas y no deben ocupar un worker cada uno
+echo "Starting Gunicorn (ASGI)..."
+exec gunicorn gestion_clinica.asgi:application \
+    --worker-class uvicorn_worker.UvicornWorker \
     --bind 0.0.0.0:${PORT:-8080} \
     --workers 2 \
     --timeout 120 \